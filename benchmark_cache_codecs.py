@@ -0,0 +1,202 @@
+# benchmark_cache_codecs.py
+"""
+快取編碼器效能比較 - 每個 codec 的資料大小、SQLite 檔案大小與編碼/解碼時間
+
+用法：
+    python benchmark_cache_codecs.py                 # 使用內建範例資料
+    python benchmark_cache_codecs.py --db cache.db   # 使用既有 cache.db 的資料列
+    python benchmark_cache_codecs.py --rows 2000 --repeat 5
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from modules import cache_codecs
+from modules.sqlite_cache_manager import SQLiteCacheManager
+
+_FOODS = ["拉麵", "牛肉麵", "便當", "火鍋", "壽司", "咖哩", "滷肉飯", "水餃", "義大利麵", "早午餐"]
+_AREAS = ["信義區", "大安區", "中山區", "板橋區", "泰山區", "西屯區", "前鎮區"]
+_ROADS = ["忠孝東路", "信義路", "明志路一段", "中山北路", "文化路二段", "民生路"]
+
+
+def _sample_restaurants(rng: random.Random, n: int = 8) -> list:
+    results = []
+    for _ in range(n):
+        food = rng.choice(_FOODS)
+        name = f"{rng.choice(['阿', '老', '小', '大'])}{rng.choice(['陳', '林', '王', '張'])}{food}"
+        results.append({
+            "name": name,
+            "address": f"{rng.choice(_AREAS)}{rng.choice(_ROADS)}{rng.randint(1, 300)}號",
+            "rating": round(rng.uniform(3.5, 4.9), 1),
+            "price_level": rng.choice(["$50-150", "$150-400", None]),
+            "maps_url": f"https://www.google.com/maps/place/{name}/@25.0{rng.randint(10000, 99999)},121.5{rng.randint(10000, 99999)},17z",
+            "food_type": food,
+            "source": "google_maps",
+            "open_now": rng.choice([True, False, None]),
+            "hours_status": rng.choice(["營業中 · 打烊時間：20:30", "休息中 · 開始營業時間：11:00", ""]),
+        })
+    return results
+
+
+def _sample_observation(rng: random.Random) -> dict:
+    return {
+        "station_name": rng.choice(["信義", "大安森林", "板橋", "臺中", "高雄"]),
+        "temperature": round(rng.uniform(18, 36), 1),
+        "humidity": rng.randint(40, 95),
+        "wind_speed": round(rng.uniform(0, 6), 1),
+        "distance_km": round(rng.uniform(0.2, 8), 2),
+        "data_time": "2026-07-01T12:00:00+08:00",
+        "is_real_data": True,
+        "rain_probability": {"probability": f"{rng.randint(0, 10) * 10}%", "source": "中央氣象署"},
+    }
+
+
+def _sample_cwa_snapshot(rng: random.Random, stations: int = 400) -> dict:
+    return {
+        "success": "true",
+        "records": {"Station": [
+            {
+                "StationName": f"測站{i}",
+                "StationId": f"C0A{i:03d}",
+                "ObsTime": {"DateTime": "2026-07-01T12:00:00+08:00"},
+                "GeoInfo": {"Coordinates": [
+                    {"CoordinateName": "TWD67", "StationLatitude": 25.0, "StationLongitude": 121.5},
+                    {"CoordinateName": "WGS84",
+                     "StationLatitude": round(rng.uniform(22, 25.3), 4),
+                     "StationLongitude": round(rng.uniform(120, 122), 4)},
+                ]},
+                "WeatherElement": {
+                    "AirTemperature": f"{rng.uniform(18, 36):.1f}",
+                    "RelativeHumidity": str(rng.randint(40, 95)),
+                    "WindSpeed": f"{rng.uniform(0, 6):.1f}",
+                },
+            }
+            for i in range(stations)
+        ]},
+    }
+
+
+def _sample_intent(rng: random.Random) -> dict:
+    food = rng.choice(_FOODS)
+    return {
+        "location": rng.choice(_AREAS),
+        "food_preferences": [food],
+        "keywords": [food, f"{food}推薦"],
+        "budget": {"min": 100, "max": rng.choice([200, 300, 500])},
+        "intent": "search_food_type",
+        "confidence": round(rng.uniform(0.6, 0.99), 2),
+    }
+
+
+def sample_payloads(rows: int, seed: int = 42) -> list:
+    """(cache_type, data) 範例：餐廳列表、天氣觀測、AI 分析，外加一份 CWA 全測站回應。"""
+    rng = random.Random(seed)
+    makers = [
+        ("restaurant", _sample_restaurants),
+        ("weather", _sample_observation),
+        ("ai", _sample_intent),
+    ]
+    payloads = [("weather", _sample_cwa_snapshot(rng))]
+    for i in range(rows):
+        cache_type, make = makers[i % len(makers)]
+        payloads.append((cache_type, make(rng)))
+    return payloads
+
+
+def payloads_from_db(db_path: str) -> list:
+    """讀取既有 cache.db 的每一列（依 codec 標籤解碼）。"""
+    conn = sqlite3.connect(db_path)
+    try:
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(cache_items)")}
+        codec_col = "codec" if "codec" in columns else "NULL"
+        rows = conn.execute(f"SELECT cache_type, data, {codec_col} FROM cache_items").fetchall()
+    finally:
+        conn.close()
+    payloads = []
+    for cache_type, raw, codec in rows:
+        try:
+            payloads.append((cache_type, cache_codecs.decode(raw, codec)))
+        except Exception as e:
+            print(f"略過無法解碼的資料列 ({codec}): {e}")
+    return payloads
+
+
+def _encoded_size(value) -> int:
+    return len(value.encode("utf-8")) if isinstance(value, str) else len(value)
+
+
+def _db_file_size(codec_name: str, payloads: list) -> int:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = os.path.join(tmpdir, "cache.db")
+        manager = SQLiteCacheManager(db_path=db_path, max_size=len(payloads) + 1, codec=codec_name)
+        for i, (cache_type, data) in enumerate(payloads):
+            manager.set_item(cache_type, (i,), data, ttl_minutes=60)
+        manager.close()
+        conn = sqlite3.connect(db_path)
+        conn.execute("VACUUM")
+        conn.close()
+        return os.path.getsize(db_path)
+
+
+def benchmark(payloads: list, repeat: int = 3) -> list:
+    results = []
+    for name, codec in cache_codecs.available_codecs().items():
+        encoded = [codec.encode(data) for _cache_type, data in payloads]
+        size = sum(_encoded_size(value) for value in encoded)
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for _cache_type, data in payloads:
+                codec.encode(data)
+        encode_us = (time.perf_counter() - start) / (repeat * len(payloads)) * 1e6
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for value in encoded:
+                codec.decode(value)
+        decode_us = (time.perf_counter() - start) / (repeat * len(payloads)) * 1e6
+
+        results.append({
+            "codec": name,
+            "bytes": size,
+            "db_bytes": _db_file_size(name, payloads),
+            "encode_us": encode_us,
+            "decode_us": decode_us,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較快取編碼器的大小與速度")
+    parser.add_argument("--db", help="使用既有 cache.db 的資料列作為測試資料")
+    parser.add_argument("--rows", type=int, default=600, help="範例資料列數（未指定 --db 時）")
+    parser.add_argument("--repeat", type=int, default=3, help="編碼/解碼重複次數")
+    args = parser.parse_args()
+
+    payloads = payloads_from_db(args.db) if args.db else sample_payloads(args.rows)
+    if not payloads:
+        print("沒有可測試的資料列")
+        return 1
+
+    print(f"測試資料：{len(payloads)} 列，預設編碼器：{cache_codecs.DEFAULT_CODEC}")
+    results = benchmark(payloads, args.repeat)
+    baseline = next(r for r in results if r["codec"] == cache_codecs.LEGACY_CODEC)
+
+    print(f"{'codec':<16}{'資料大小':>12}{'比例':>8}{'DB 檔案':>12}{'編碼 µs/列':>14}{'解碼 µs/列':>14}")
+    for r in results:
+        print(
+            f"{r['codec']:<16}{r['bytes']:>12,}{r['bytes'] / baseline['bytes']:>8.2f}"
+            f"{r['db_bytes']:>12,}{r['encode_us']:>14.1f}{r['decode_us']:>14.1f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
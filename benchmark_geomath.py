@@ -0,0 +1,96 @@
+# benchmark_geomath.py
+"""
+距離計算效能比較 - 逐對 geopy.geodesic 迴圈 vs. modules.geo.geomath
+
+用法：
+    python benchmark_geomath.py                       # 1 x 15（一次搜尋的餐廳數）與 1 x 500
+    python benchmark_geomath.py --points 2000 --origins 50 --repeat 5
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from modules.geo import geomath
+
+try:
+    from geopy.distance import geodesic
+except ImportError:
+    geodesic = None
+
+
+def _random_points(rng: random.Random, n: int, center=(25.04, 121.55), spread=0.05) -> list:
+    return [
+        (center[0] + rng.uniform(-spread, spread), center[1] + rng.uniform(-spread, spread))
+        for _ in range(n)
+    ]
+
+
+def _time_us(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def benchmark(origins: list, points: list, repeat: int) -> list:
+    """(方法, 每次呼叫 µs, 與 geodesic 的最大相對誤差)"""
+    origin = origins[0]
+    results = []
+
+    reference = None
+    if geodesic is not None:
+        reference = [geodesic(origin, p).kilometers for p in points]
+        results.append(("geopy.geodesic 逐對 (1xN)", _time_us(
+            lambda: [geodesic(origin, p).kilometers for p in points], repeat), 0.0))
+
+    def max_error(values):
+        if reference is None:
+            return None
+        return max(abs(v - r) / r for v, r in zip(geomath.to_list(values), reference) if r > 0)
+
+    scalar = [geomath.haversine_km(origin[0], origin[1], lat, lng) for lat, lng in points]
+    results.append(("haversine_km 逐對 (1xN)", _time_us(
+        lambda: [geomath.haversine_km(origin[0], origin[1], lat, lng) for lat, lng in points], repeat),
+        max_error(scalar)))
+
+    results.append(("haversine_many NumPy (1xN)", _time_us(
+        lambda: geomath.haversine_many(origin, points), repeat),
+        max_error(geomath.haversine_many(origin, points))))
+
+    if geodesic is not None:
+        results.append((f"geopy.geodesic 逐對 ({len(origins)}xN)", _time_us(
+            lambda: [[geodesic(o, p).kilometers for p in points] for o in origins], 1), 0.0))
+    results.append((f"haversine_matrix NumPy ({len(origins)}xN)", _time_us(
+        lambda: geomath.haversine_matrix(origins, points), repeat), None))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較距離計算方法的速度與誤差")
+    parser.add_argument("--points", type=int, nargs="+", default=[15, 500], help="每個起點的目標點數")
+    parser.add_argument("--origins", type=int, default=20, help="距離矩陣的起點數")
+    parser.add_argument("--repeat", type=int, default=20, help="重複次數")
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    if geodesic is None:
+        print("未安裝 geopy，略過 geodesic 基準")
+
+    for n in args.points:
+        origins = _random_points(rng, args.origins)
+        points = _random_points(rng, n)
+        print(f"\n目標點數 N = {n}")
+        print(f"{'方法':<36}{'µs/次':>14}{'最大相對誤差':>16}")
+        for name, us, err in benchmark(origins, points, args.repeat):
+            err_str = f"{err:.4%}" if err is not None else "-"
+            print(f"{name:<36}{us:>14,.1f}{err_str:>16}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
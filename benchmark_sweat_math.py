@@ -0,0 +1,106 @@
+# benchmark_sweat_math.py
+"""
+流汗指數 / 體感溫度效能比較 - 逐筆純量函式 vs. modules.sweat_math 向量化
+
+用法：
+    python benchmark_sweat_math.py                              # 模擬全台測站資料（約 900 站）與 10000 筆
+    python benchmark_sweat_math.py --payload O-A0003-001.json   # 使用實際下載的 CWA 觀測資料
+    python benchmark_sweat_math.py --stations 900 50000 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from modules import sweat_math
+from modules.station_index import StationIndex
+from modules.sweat_index import calculate_heat_index, estimate_sweat_index, get_comfort_level
+
+
+def _random_payload(rng: random.Random, n: int) -> dict:
+    """與 O-A0003-001 同格式的模擬測站資料"""
+    stations = []
+    for i in range(n):
+        stations.append({
+            "StationName": f"測站{i}",
+            "StationId": f"C{i:05d}",
+            "GeoInfo": {"Coordinates": [{
+                "CoordinateName": "WGS84",
+                "StationLatitude": rng.uniform(21.9, 25.3),
+                "StationLongitude": rng.uniform(120.0, 122.0),
+            }]},
+            "WeatherElement": {
+                "AirTemperature": f"{rng.uniform(15, 38):.1f}",
+                "RelativeHumidity": str(rng.randint(40, 100)),
+                "WindSpeed": f"{rng.uniform(0, 8):.1f}",
+            },
+        })
+    return {"success": "true", "records": {"Station": stations}}
+
+
+def _time_us(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def benchmark(index: StationIndex, repeat: int) -> list:
+    """(方法, 每次呼叫 µs, 與純量版本不一致的筆數)"""
+    temps, humidities, winds = index.temperatures, index.humidities, index.wind_speeds
+    rows = range(len(index))
+
+    def scalar():
+        sweat = [estimate_sweat_index(temps[i], humidities[i], winds[i]) for i in rows]
+        heat = [calculate_heat_index(temps[i], humidities[i]) for i in rows]
+        levels = [get_comfort_level(s)["level"] for s in sweat]
+        return sweat, heat, levels
+
+    def vectorized():
+        profile = sweat_math.sweat_profile_many(temps, humidities, winds)
+        levels = [sweat_math.COMFORT_LEVELS[b] for b in sweat_math.to_list(profile["comfort_bucket"])]
+        return sweat_math.to_list(profile["sweat_index"]), sweat_math.to_list(profile["heat_index"]), levels
+
+    expected = scalar()
+    got = vectorized()
+    mismatches = sum(
+        1 for i in rows
+        if (got[0][i], got[1][i], got[2][i]) != (expected[0][i], expected[1][i], expected[2][i])
+    )
+
+    return [
+        ("純量函式逐筆", _time_us(scalar, repeat), 0),
+        ("sweat_profile_many NumPy", _time_us(vectorized, repeat), mismatches),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較流汗指數計算方法的速度與一致性")
+    parser.add_argument("--payload", help="CWA O-A0003-001 JSON 檔（省略時使用模擬資料）")
+    parser.add_argument("--stations", type=int, nargs="+", default=[900, 10000], help="模擬測站數")
+    parser.add_argument("--repeat", type=int, default=20, help="重複次數")
+    args = parser.parse_args()
+
+    if args.payload:
+        with open(args.payload, encoding="utf-8") as f:
+            datasets = [(args.payload, json.load(f))]
+    else:
+        rng = random.Random(42)
+        datasets = [(f"模擬 {n} 站", _random_payload(rng, n)) for n in args.stations]
+
+    for name, payload in datasets:
+        index = StationIndex.from_payload(payload)
+        print(f"\n{name}：{index.station_count} 站，{len(index)} 站有效")
+        print(f"{'方法':<30}{'µs/次':>14}{'不一致筆數':>12}")
+        for method, us, mismatches in benchmark(index, args.repeat):
+            print(f"{method:<30}{us:>14,.1f}{mismatches:>12}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+# cwa_test_data.py
+"""
+測試用 CWA 資料產生器 - 與氣象署 API 同格式的假資料
+
+- O-A0003-001 測站觀測：station() / observation_payload() / random_observation_payload()
+- F-D0047 鄉鎮預報：forecast_element() / forecast_location() / forecast_document()
+"""
+
+import random
+
+
+def station(name, lat, lng, temp="30.0", humidity="70", wind="1.5", station_id=None, wgs84=True):
+    """單一測站；TWD67 座標放在前面並略為偏移，wgs84=False 時只有 TWD67"""
+    coordinates = [{"CoordinateName": "TWD67", "StationLatitude": lat + 0.002, "StationLongitude": lng - 0.008}]
+    if wgs84:
+        coordinates.append({"CoordinateName": "WGS84", "StationLatitude": lat, "StationLongitude": lng})
+    return {
+        "StationName": name,
+        "StationId": station_id or f"ID-{name}",
+        "ObsTime": {"DateTime": "2026-07-01T12:00:00+08:00"},
+        "GeoInfo": {"Coordinates": coordinates},
+        "WeatherElement": {"AirTemperature": temp, "RelativeHumidity": humidity, "WindSpeed": wind},
+    }
+
+
+def observation_payload(stations):
+    """O-A0003-001 回應"""
+    return {"success": "true", "records": {"Station": stations}}
+
+
+def random_observation_payload(n, seed=7):
+    """散佈在全台範圍內的 n 個模擬測站"""
+    rng = random.Random(seed)
+    return observation_payload([
+        station(f"測站{i}", rng.uniform(21.9, 25.3), rng.uniform(120.0, 122.0),
+                temp=f"{rng.uniform(18, 36):.1f}", humidity=str(rng.randint(40, 95)))
+        for i in range(n)
+    ])
+
+
+def forecast_element(name, key, times, values, time_key="DataTime"):
+    """單一預報要素（如 溫度 / Temperature），times 與 values 一一對應"""
+    return {"ElementName": name, "Time": [
+        {time_key: t, "ElementValue": [{key: v}]} for t, v in zip(times, values)
+    ]}
+
+
+def forecast_location(name, elements):
+    """單一鄉鎮的預報"""
+    return {"LocationName": name, "WeatherElement": list(elements)}
+
+
+def forecast_document(*locations):
+    """F-D0047 縣市預報回應"""
+    return {"success": "true", "records": {"Locations": [{"Location": list(locations)}]}}
@@ -16,7 +16,7 @@ import logging
 logger = logging.getLogger(__name__)
 
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import FileResponse, HTMLResponse, StreamingResponse
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 import os
@@ -35,6 +35,33 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.on_event("startup")
+def _start_pipeline_executors():
+    """Create the shared, bounded executors used by the SSE pipeline stages."""
+    from modules.pipeline import start_executors
+    start_executors()
+
+
+@app.on_event("startup")
+def _start_forecast_prefetch():
+    """Keep every city's township forecast (rain odds) loaded in memory."""
+    if os.getenv("CWB_API_KEY") and os.getenv("CWA_FORECAST_PREFETCH", "1") != "0":
+        from modules.forecast_store import forecast_store
+        forecast_store.start_prefetch()
+
+
+@app.on_event("shutdown")
+def _shutdown_pipeline_executors():
+    from modules.pipeline import shutdown_executors
+    shutdown_executors()
+
+
+@app.on_event("shutdown")
+def _stop_forecast_prefetch():
+    from modules.forecast_store import forecast_store
+    forecast_store.stop_prefetch(timeout=1)
+
 # 掛載 frontend 靜態檔案到 /static
 
 
@@ -114,6 +141,22 @@ async def keys_usage():
 # API 路由
 # ---------------------------------------------------------------------------
 
+@app.get("/api/sweat-timeline")
+async def sweat_timeline(location: str = None, hours: int = 24):
+    """Sweat index, rain probability and walking radius per forecast slot of the next *hours*."""
+    if not location:
+        raise HTTPException(status_code=400, detail="Missing location")
+    import asyncio
+    from modules import pipeline
+    try:
+        result = await pipeline.fetch_sweat_timeline(location, hours)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="流汗指數時間軸查詢超時")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"查詢流汗指數時間軸失敗: {e}")
+    if "error" in result:
+        raise HTTPException(status_code=404, detail=result["error"])
+    return result
 
 
 # ---------------------------------------------------------------------------
@@ -146,21 +189,29 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
         import json
         import asyncio
         import time
+        from modules import pipeline
+        from modules.metrics import metrics
+
+        stream_start = time.perf_counter()
+        stream_outcome = "ok"
 
         def send_event(event_type, data):
             return f"event: {event_type}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
-        loop = asyncio.get_event_loop()
-
         # Step 1: Intent Analysis
         yield send_event("thinking", {"step": "intent", "message": "分析您的需求..."})
 
+        pending_tasks = []
+        # Speculative mode: start Maps + geocode from the regex intent right away,
+        # overlapping weather and Gemini intent; reconciled once the real intent arrives.
+        speculation = pipeline.SpeculativeSearch.from_message(message)
         try:
-            from modules.ai.intent_analyzer import analyze_intent
-            from modules.sweat_index import query_sweat_index_by_location
             from modules.recommendation_engine import _extract_weather_data
             from datetime import datetime
 
+            if speculation is not None:
+                speculation.start()
+
             current_hour = datetime.now().hour
             weather_data = None
             sweat_index = None
@@ -174,12 +225,7 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
                 if _loc_match:
                     weather_location = _loc_match.group(1)
 
-                sweat_result = await asyncio.wait_for(
-                    loop.run_in_executor(
-                        None, lambda: query_sweat_index_by_location(weather_location)
-                    ),
-                    timeout=8,
-                )
+                sweat_result = await pipeline.fetch_weather(weather_location)
                 if "error" not in sweat_result:
                     weather_data, sweat_index = _extract_weather_data(sweat_result)
                     rain_prob = weather_data.get("rain_probability")
@@ -188,6 +234,7 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
                         "humidity": weather_data.get("humidity"),
                         "sweat_index": sweat_index,
                         "rain_probability": rain_prob,
+                        "stale": bool(sweat_result.get("stale")),
                     })
                 else:
                     yield send_event("thinking", {"step": "weather", "message": "天氣查詢無資料"})
@@ -198,17 +245,7 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
 
             # Intent (12s timeout — Gemini can hang if API is slow or keys exhausted)
             try:
-                intent = await asyncio.wait_for(
-                    loop.run_in_executor(
-                        None,
-                        lambda: analyze_intent(
-                            user_input=message,
-                            weather_data=weather_data,
-                            current_hour=current_hour,
-                        ),
-                    ),
-                    timeout=12,
-                )
+                intent = await pipeline.analyze_intent_async(message, weather_data, current_hour)
             except asyncio.TimeoutError:
                 yield send_event("thinking", {"step": "intent", "message": "意圖分析超時，使用快速模式"})
                 from modules.ai.intent_analyzer import _fallback_analysis
@@ -231,20 +268,15 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
             search_location = location or "台北"
             kw_preview = ", ".join(keywords[:3]) if keywords else "餐廳"
 
-            # Calculate search distance: max 10min walk (good) / 5min walk (bad)
-            # 10min walk ≈ 800m, 5min walk ≈ 400m
-            rain_prob = weather_data.get("rain_probability", 0) if weather_data else 0
-            max_distance_km = 0.8  # default: good weather, 10min walk
-            distance_reason = "舒適天氣，步行10分鐘內 (800m)"
-            if sweat_index is not None and sweat_index >= 7:
-                max_distance_km = 0.4
-                distance_reason = f"流汗指數 {sweat_index} (不舒適)，步行5分鐘內 (400m)"
-            elif rain_prob and float(rain_prob) >= 50:
-                max_distance_km = 0.4
-                distance_reason = f"降雨機率 {rain_prob}%，步行5分鐘內 (400m)"
-            elif sweat_index is not None and sweat_index >= 5:
-                max_distance_km = 0.6
-                distance_reason = f"流汗指數 {sweat_index} (普通)，步行8分鐘內 (600m)"
+            # Search distance: max 10min walk (good) / 5min walk (bad), precomputed
+            # per station with the sweat index; recomputed only without a weather result
+            from modules.sweat_grid import recommend_walking_radius
+            radius = sweat_result.get("walking_radius") if weather_data else None
+            if radius is None:
+                rain_prob = weather_data.get("rain_probability") if weather_data else None
+                radius = recommend_walking_radius(sweat_index, rain_prob)
+            max_distance_km = radius["max_distance_km"]
+            distance_reason = radius["reason"]
 
             yield send_event("analysis", {
                 "distance_reason": distance_reason,
@@ -253,9 +285,8 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
 
             yield send_event("thinking", {"step": "search", "message": f"搜尋 {search_location} 的 {kw_preview}..."})
 
-            from modules.fast_search import search_restaurants_fast, enrich_with_gemini, search_social_mentions
+            from modules.scraper.ubereats import match_ubereats_to_restaurants
             from urllib.parse import quote
-            from concurrent.futures import ThreadPoolExecutor, as_completed as _as_completed
 
             all_restaurants = []
 
@@ -266,45 +297,42 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
 
             yield send_event("thinking", {"step": "search", "message": f"Google Maps + Uber Eats 搜尋中（{len(search_kws)} 個關鍵字並行）..."})
 
-            # Geocode search_location for Uber Eats (needs lat/lng)
-            ue_lat, ue_lng = None, None
-            try:
-                from geopy.geocoders import ArcGIS
-                _geolocator = ArcGIS(timeout=5)
-                for _variant in [search_location, search_location + " 台灣", search_location + " Taiwan"]:
-                    _geo_result = _geolocator.geocode(_variant)
-                    if _geo_result:
-                        ue_lat, ue_lng = _geo_result.latitude, _geo_result.longitude
-                        break
-            except Exception as e:
-                logger.warning("ArcGIS geocode for Uber Eats failed: %s", e)
-
-            # Parallel Selenium searches + Uber Eats with longer timeout (30s)
-            ue_worker_count = 1 if ue_lat is not None else 0
-            selenium_pool = ThreadPoolExecutor(max_workers=min(3, len(search_kws)) + ue_worker_count)
-
-            # Submit Google Maps futures
-            selenium_futures = {
-                selenium_pool.submit(search_restaurants_fast, kw, search_location, 8): kw
-                for kw in search_kws
-            }
-
-            # Submit Uber Eats future in parallel (if geocoding succeeded)
-            ue_future = None
-            if ue_lat is not None and ue_lng is not None:
-                from modules.scraper.ubereats import search_ubereats, match_ubereats_to_restaurants
+            async def _maps_for(kw):
+                return kw, await pipeline.search_maps(kw, search_location, 8)
+
+            if speculation is not None:
+                # Keep matching speculative searches, cancel stale ones, add missing ones
+                maps_by_kw, geocode_task = speculation.reconcile(search_location, search_kws)
+                maps_tasks = list(maps_by_kw.values())
+                kept = speculation.stats["kept"]
+                if kept:
+                    yield send_event("thinking", {
+                        "step": "speculative",
+                        "message": f"沿用預先搜尋的 {kept} 個關鍵字結果",
+                    })
+            else:
+                # Google Maps searches start right away on the shared Selenium pool
+                maps_tasks = [asyncio.ensure_future(_maps_for(kw)) for kw in search_kws]
+                geocode_task = asyncio.ensure_future(pipeline.geocode_location(search_location))
+            pending_tasks.extend(maps_tasks)
+            pending_tasks.append(geocode_task)
+
+            # Geocode search_location for Uber Eats (needs lat/lng) while Maps runs
+            ue_task = None
+            ue_coords = await geocode_task
+            if ue_coords is not None:
                 ue_keyword = keywords[0] if keywords else ""
-                ue_future = selenium_pool.submit(
-                    search_ubereats, ue_keyword, ue_lat, ue_lng, search_location, 20
+                ue_task = asyncio.ensure_future(
+                    pipeline.search_ubereats(ue_keyword, ue_coords[0], ue_coords[1], search_location, 20)
                 )
+                pending_tasks.append(ue_task)
 
             seen_names = set()
             ubereats_results = []
             try:
-                for future in _as_completed(selenium_futures, timeout=30):
-                    kw = selenium_futures[future]
+                for next_done in asyncio.as_completed(maps_tasks, timeout=pipeline.STAGE_TIMEOUTS["maps"]):
                     try:
-                        results = future.result(timeout=1)
+                        kw, results = await next_done
                         for r in results:
                             name = r.get("name", "").strip()
                             if name and name not in seen_names:
@@ -317,15 +345,17 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
                             "step": "search_progress",
                             "message": f"「{kw}」找到 {len(results)} 間（累計 {len(all_restaurants)} 間）",
                         })
+                    except asyncio.TimeoutError:
+                        raise
                     except Exception as e:
-                        logger.warning("Selenium search failed for '%s': %s", kw, e)
-            except Exception:
+                        logger.warning("Selenium search failed: %s", e)
+            except asyncio.TimeoutError:
                 logger.warning("Some Selenium searches timed out")
 
-            # Collect Uber Eats results (non-blocking — if not done yet, wait up to 5s)
-            if ue_future is not None:
+            # Collect Uber Eats results (if not done yet, wait up to 5s)
+            if ue_task is not None:
                 try:
-                    ubereats_results = ue_future.result(timeout=5)
+                    ubereats_results = await asyncio.wait_for(ue_task, timeout=5)
                     if ubereats_results:
                         yield send_event("thinking", {
                             "step": "ubereats_done",
@@ -334,8 +364,6 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
                 except Exception as e:
                     logger.warning("Uber Eats search failed: %s", e)
 
-            selenium_pool.shutdown(wait=False)
-
             # Merge Uber Eats data into Google Maps results
             if ubereats_results and all_restaurants:
                 try:
@@ -389,12 +417,9 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
             if all_restaurants:
                 yield send_event("thinking", {"step": "enrich", "message": "AI 補充推薦理由..."})
                 try:
-                    all_restaurants = await loop.run_in_executor(
-                        None,
-                        lambda: enrich_with_gemini(
-                            all_restaurants, message, search_location,
-                            keywords, budget, weather_data,
-                        ),
+                    all_restaurants = await pipeline.enrich(
+                        all_restaurants, message, search_location,
+                        keywords, budget, weather_data,
                     )
                 except Exception as e:
                     logger.warning("Gemini enrichment failed: %s", e)
@@ -412,10 +437,8 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
                 # Phase 3a: Calculate real distances
                 yield send_event("thinking", {"step": "distance", "message": "計算步行距離..."})
                 try:
-                    from modules.fast_search import calculate_real_distances
-                    all_restaurants = await loop.run_in_executor(
-                        None,
-                        lambda: calculate_real_distances(all_restaurants, search_location, user_coords=user_coords),
+                    all_restaurants = await pipeline.calculate_distances(
+                        all_restaurants, search_location, user_coords=user_coords,
                     )
                     # Filter by max distance + sort
                     # Filter: try preferred distance, expand if nothing found
@@ -447,10 +470,7 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
 
                 try:
                     restaurant_names = [r.get("name", "") for r in all_restaurants if r.get("name")]
-                    social_mentions = await loop.run_in_executor(
-                        None,
-                        lambda: search_social_mentions(restaurant_names, search_location),
-                    )
+                    social_mentions = await pipeline.search_social(restaurant_names, search_location)
                     # Attach social mentions to restaurants
                     for r in all_restaurants:
                         name = r.get("name", "")
@@ -473,6 +493,7 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
                 })
 
                 # Sort: open first, then distance (nearest), then social proof, then rating
+                scoring_start = time.perf_counter()
                 all_restaurants.sort(
                     key=lambda r: (
                         0 if r.get("open_now") is True else (1 if r.get("open_now") is None else 2),
@@ -481,6 +502,8 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
                         -(r.get("rating") or 0),
                     ),
                 )
+                metrics.observe_stage("scoring", time.perf_counter() - scoring_start)
+                metrics.observe_stage("time_to_first_restaurant", time.perf_counter() - stream_start)
 
                 for i, restaurant in enumerate(all_restaurants):
                     yield send_event("restaurant", {"index": i, "restaurant": restaurant})
@@ -488,14 +511,28 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
 
                 yield send_event("done", {
                     "total": len(all_restaurants),
+                    "stale": any(r.get("stale") for r in all_restaurants),
                 })
             else:
                 yield send_event("error", {"message": "沒有找到餐廳，請換個說法試試"})
 
         except asyncio.TimeoutError:
+            stream_outcome = "timeout"
             yield send_event("error", {"message": "搜尋超時，請稍後再試"})
+        except (GeneratorExit, asyncio.CancelledError):
+            stream_outcome = "cancelled"
+            raise
         except Exception as e:
+            stream_outcome = "error"
             yield send_event("error", {"message": f"推薦失敗: {str(e)}"})
+        finally:
+            # Client disconnects / errors must not leave stage tasks running
+            if speculation is not None:
+                speculation.cancel()
+            for task in pending_tasks:
+                if not task.done():
+                    task.cancel()
+            metrics.observe_stage("stream_total", time.perf_counter() - stream_start, stream_outcome)
 
     return StreamingResponse(
         event_stream(),
@@ -507,6 +544,27 @@ async def chat_recommendation_stream(message: str = None, lat: float = None, lng
     )
 
 
+# ---------------------------------------------------------------------------
+# Metrics
+# ---------------------------------------------------------------------------
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus text exposition of stage latency, cache, browser pool and Gemini metrics."""
+    from modules.metrics import metrics
+    return PlainTextResponse(
+        metrics.render_prometheus(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
+@app.get("/metrics/summary")
+def metrics_summary():
+    """JSON summary of the same metrics with p50 / p95 / p99 estimates."""
+    from modules.metrics import metrics
+    return metrics.summary()
+
+
 # 健康檢查 API 端點
 @app.get("/health")
 def health_check():
@@ -525,15 +583,21 @@ def health_check():
         except Exception:
             gemini_key_count = 0
 
+        from modules.singleflight import get_stats as get_singleflight_stats
+
         return {
             "status": "healthy",
             "service": "AI Lunch Mind",
             "version": "5.1.0",
             "cwb_api_key": api_key_status,
             "gemini_keys": gemini_key_count,
+            "singleflight": get_singleflight_stats(),
             "endpoints": [
                 "/chat-recommendation-stream?message=訊息 - SSE 串流推薦",
+                "/api/sweat-timeline?location=地點&hours=24 - 流汗指數時間軸",
                 "/api/keys/* - Gemini 金鑰管理",
+                "/metrics - Prometheus 指標",
+                "/metrics/summary - 指標摘要 (JSON)",
                 "/health"
             ],
             "pages": [
@@ -0,0 +1,166 @@
+# modules/ai/gemini_client.py
+"""
+Shared Gemini client layer - one ``genai.Client`` per API key.
+
+Building a fresh ``genai.Client`` for every call throws away the HTTP
+connection pool (and its TLS sessions).  Clients are cached here per key
+and reused by both the sync and the ``aio`` interfaces.
+
+Usage::
+
+    @gemini_pool.auto_retry
+    def call(prompt, *, api_key=None):
+        return gemini_client.generate_content(api_key, model, prompt, config, timeout=15)
+
+    @gemini_pool.auto_retry
+    async def call_async(prompt, *, api_key=None):
+        return await gemini_client.agenerate_content(api_key, model, prompt, config, timeout=15)
+
+``timeout`` is in seconds.  On the async path it is enforced with
+``asyncio.wait_for`` so a cancelled or timed-out SSE stage releases the
+awaiting coroutine immediately and never holds an executor thread.
+
+Both calls remember the response's ``usage_metadata`` in a context
+variable; ``auto_retry`` collects it with ``take_usage()`` so the pool
+charges each key its real token count, whatever the wrapped function
+returns.
+"""
+
+import asyncio
+import copy
+import logging
+import os
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on cached clients (keys removed from the pool are dropped eagerly)
+MAX_CACHED_CLIENTS = int(os.environ.get("GEMINI_MAX_CLIENTS", "64"))
+
+# Client-level HTTP timeout (ms), a safety net under the per-call timeouts
+DEFAULT_HTTP_TIMEOUT_MS = int(os.environ.get("GEMINI_HTTP_TIMEOUT_MS", "30000"))
+
+_clients: "OrderedDict[str, Any]" = OrderedDict()
+_clients_lock = threading.Lock()
+
+
+class Usage(NamedTuple):
+    model: Optional[str]
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+
+
+# Usage of the last response in this thread / task, until take_usage() reads it
+_last_usage: ContextVar[Optional[Usage]] = ContextVar("gemini_last_usage", default=None)
+
+
+def get_client(api_key: str):
+    """Return the cached ``genai.Client`` for *api_key*, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is not None:
+            _clients.move_to_end(api_key)
+            return client
+
+    from google import genai
+
+    client = genai.Client(api_key=api_key, http_options={"timeout": DEFAULT_HTTP_TIMEOUT_MS})
+    with _clients_lock:
+        existing = _clients.get(api_key)
+        if existing is not None:
+            return existing
+        _clients[api_key] = client
+        while len(_clients) > MAX_CACHED_CLIENTS:
+            _clients.popitem(last=False)
+    logger.debug("Gemini client created for key ...%s", api_key[-4:])
+    return client
+
+
+def drop_client(api_key: str):
+    """Forget the cached client for *api_key* (e.g. after the key is removed)."""
+    with _clients_lock:
+        _clients.pop(api_key, None)
+
+
+def clear_clients():
+    """Forget every cached client."""
+    with _clients_lock:
+        _clients.clear()
+
+
+def cached_client_count() -> int:
+    with _clients_lock:
+        return len(_clients)
+
+
+def usage_of(response, model: Optional[str] = None) -> Optional[Usage]:
+    """Token counts from ``response.usage_metadata`` (``None`` if absent)."""
+    meta = getattr(response, "usage_metadata", None)
+    if meta is None:
+        return None
+    prompt = getattr(meta, "prompt_token_count", None) or 0
+    completion = getattr(meta, "candidates_token_count", None) or 0
+    # total_token_count also covers thinking / tool-use tokens
+    total = getattr(meta, "total_token_count", None) or prompt + completion
+    return Usage(model, prompt, completion, total)
+
+
+def take_usage() -> Optional[Usage]:
+    """Usage of the last call made in this thread / task, then forget it."""
+    usage = _last_usage.get()
+    _last_usage.set(None)
+    return usage
+
+
+def _with_timeout(config, timeout: Optional[float]):
+    """Copy of *config* with a per-request HTTP timeout, when the SDK supports it.
+
+    The caller's config (often a module-level constant) is left untouched.
+    """
+    if timeout is None or config is None or not hasattr(config, "http_options"):
+        return config
+    from google.genai import types
+    config = copy.copy(config)
+    options = copy.copy(config.http_options) if config.http_options is not None else types.HttpOptions()
+    options.timeout = int(timeout * 1000)
+    config.http_options = options
+    return config
+
+
+def generate_content(
+    api_key: str,
+    model: str,
+    contents: Any,
+    config: Any = None,
+    timeout: Optional[float] = None,
+):
+    """Blocking ``models.generate_content`` on the cached client for *api_key*."""
+    client = get_client(api_key)
+    response = client.models.generate_content(
+        model=model, contents=contents, config=_with_timeout(config, timeout),
+    )
+    _last_usage.set(usage_of(response, model))
+    return response
+
+
+async def agenerate_content(
+    api_key: str,
+    model: str,
+    contents: Any,
+    config: Any = None,
+    timeout: Optional[float] = None,
+):
+    """Async ``aio.models.generate_content`` on the cached client for *api_key*.
+
+    Raises ``asyncio.TimeoutError`` after *timeout* seconds; cancelling the
+    awaiting task cancels the underlying HTTP request.
+    """
+    client = get_client(api_key)
+    request = client.aio.models.generate_content(model=model, contents=contents, config=config)
+    response = await asyncio.wait_for(request, timeout=timeout)
+    _last_usage.set(usage_of(response, model))
+    return response
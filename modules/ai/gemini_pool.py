@@ -4,15 +4,31 @@ Gemini API Key Pool Manager - SQLite-based key rotation with cooldown and usage
 
 Features:
 1. SQLite-based API key storage (shares cache.db with existing cache manager)
-2. Random key selection from active, non-cooldown keys
+2. Random key selection from active, non-cooldown keys (in memory, O(1))
 3. Automatic 429/ResourceExhausted retry with key rotation
 4. Bad key cooldown (default 2 minutes)
-5. Per-key usage tracking (suffix only for security)
+5. Per-key usage tracking (suffix only for security), queued and written in
+   batches, with a per-key/per-day summary table for O(1) status queries
 6. Thread-safe for concurrent search threads
 7. auto_retry decorator for transparent key management
+8. Per-key token buckets (RPM / TPM): auto_retry picks the key with the most
+   headroom and briefly waits for capacity instead of provoking a 429
+9. Adaptive cooldowns: honour the API's retryDelay, otherwise back off
+   exponentially per key, and learn a lower RPM for keys that 429 early
+10. Write-behind persistence: cooldowns are written to SQLite by a background
+   thread, and periodically re-synced so other processes sharing cache.db
+   still see each other's cooldowns
+11. auto_retry also wraps coroutine functions (for the shared async
+   client in gemini_client)
+12. Opt-in hedging for latency-critical async calls: a duplicate is fired on
+   another key once the first call exceeds a percentile of recent latency;
+   the first response wins and the loser is cancelled
 """
 
+import asyncio
+import atexit
 import functools
+import heapq
 import logging
 import os
 import random
@@ -20,7 +36,11 @@ import re
 import sqlite3
 import threading
 import time
-from typing import Callable, Dict, List, Optional, Set
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from modules.ai import gemini_client
+from modules.metrics import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -34,19 +54,147 @@ KEY_MIN_LENGTH = 20
 # Default cooldown for rate-limited keys
 DEFAULT_COOLDOWN_SECONDS = 120
 
+# Per-key quota (free tier gemini-2.5-flash: 10 RPM / 250k TPM)
+KEY_RPM_LIMIT = float(os.environ.get("GEMINI_KEY_RPM", "10"))
+KEY_TPM_LIMIT = float(os.environ.get("GEMINI_KEY_TPM", "250000"))
+# Tokens reserved per call before the real count is known
+ESTIMATED_TOKENS_PER_CALL = 1500
+# Longest auto_retry will wait for bucket capacity before trying anyway
+MAX_THROTTLE_WAIT_SECONDS = 2.0
+# Adaptive cooldown after a 429 without a retryDelay hint: BASE * 2^(n-1), capped
+BASE_COOLDOWN_SECONDS = 15
+MAX_COOLDOWN_SECONDS = 600
+# Learned RPM: shrink on an unexpected 429, recover slowly on success
+RPM_BACKOFF_FACTOR = 0.8
+RPM_RECOVERY_STEP = 0.1
+# Up to this many ready keys are scanned for the best headroom; beyond it two
+# random candidates are compared (power of two choices, O(1))
+HEADROOM_SCAN_LIMIT = 16
+# Keys whose headroom differs by less than this are treated as tied
+HEADROOM_TIE = 0.02
+
+# Write-behind: flush pending cooldowns every N seconds
+PERSIST_INTERVAL_SECONDS = 1.0
+# Re-read api_keys every N seconds to pick up other processes' changes
+SYNC_INTERVAL_SECONDS = 30.0
+# Wake the writer early once this many usage records are queued
+USAGE_BATCH_SIZE = 200
+# Hedging: fire a duplicate on another key once the first call is slower than
+# this percentile of the call type's recent latencies
+HEDGING_ENABLED = os.environ.get("GEMINI_HEDGING", "1") != "0"
+HEDGE_PERCENTILE = float(os.environ.get("GEMINI_HEDGE_PERCENTILE", "0.95"))
+# Latency samples kept per call type, and needed before the percentile is trusted
+LATENCY_WINDOW = 200
+HEDGE_MIN_SAMPLES = 20
+# Hedge delay while there are too few samples, and its lower bound
+HEDGE_DEFAULT_DELAY_SECONDS = 4.0
+HEDGE_MIN_DELAY_SECONDS = 0.3
+# Random draws tried before falling back to a scan in get_key_excluding_all
+_SAMPLE_ATTEMPTS = 8
+
 
 class GeminiPoolExhausted(Exception):
     """Raised when all API keys in the pool have been exhausted (rate-limited or unavailable)."""
     pass
 
 
+class _TokenBucket:
+    """Continuous-refill token bucket; ``tokens`` may go negative (debt)."""
+
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.time()
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def level(self, now: float) -> float:
+        """Fraction of capacity currently available (<= 1.0)."""
+        self._refill(now)
+        return self.tokens / self.capacity if self.capacity else 0.0
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until *amount* tokens are available (0 if already)."""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate else float("inf")
+
+    def consume(self, amount: float, now: float):
+        self._refill(now)
+        self.tokens -= amount
+
+    def set_capacity(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = min(self.tokens, per_minute)
+
+
+class _KeyState:
+    """In-memory mirror of one ``api_keys`` row plus its rate-limit state."""
+
+    __slots__ = ("api_key", "status", "cooldown_until", "rpm", "tpm", "strikes")
+
+    def __init__(self, api_key: str, status: str = "active", cooldown_until: float = 0.0):
+        self.api_key = api_key
+        self.status = status
+        self.cooldown_until = cooldown_until or 0.0
+        self.rpm = _TokenBucket(KEY_RPM_LIMIT)
+        self.tpm = _TokenBucket(KEY_TPM_LIMIT)
+        self.strikes = 0  # consecutive 429s
+
+    def headroom(self, now: float) -> float:
+        return min(self.rpm.level(now), self.tpm.level(now))
+
+    def wait_time(self, tokens: float, now: float) -> float:
+        return max(self.rpm.wait_time(1, now), self.tpm.wait_time(tokens, now))
+
+
 class GeminiKeyPool:
-    """Thread-safe Gemini API key pool with SQLite storage, random selection, and cooldown."""
+    """Thread-safe Gemini API key pool with SQLite storage, random selection, and cooldown.
+
+    The key set and cooldown deadlines live in memory:
+
+    - ``_ready`` / ``_ready_pos``: active, usable keys in a list with an index
+      map, so insertion and removal are O(1); selection compares RPM/TPM
+      headroom over at most ``HEADROOM_SCAN_LIMIT`` keys (O(1) beyond that)
+    - ``_cooling``: min-heap of ``(cooldown_until, key)``; expired entries are
+      moved back to ``_ready`` lazily on the next selection
+
+    ``mark_bad`` only updates memory and queues the new deadline; a background
+    writer flushes queued deadlines to SQLite every
+    ``PERSIST_INTERVAL_SECONDS``.  Key management (add / remove / invalidate)
+    still writes through synchronously.
+    """
 
     def __init__(self, db_path: str = DB_PATH):
         self.db_path = db_path
         self._lock = threading.Lock()
+        self._keys: Dict[str, _KeyState] = {}  # insertion order == api_keys.id order
+        self._ready: List[str] = []
+        self._ready_pos: Dict[str, int] = {}
+        self._cooling: List[Tuple[float, str]] = []
+        self._pending_cooldowns: Dict[str, float] = {}
+        # Usage rows not yet written, plus their per (suffix, day) aggregates
+        self._pending_usage: List[tuple] = []
+        self._pending_daily: Dict[Tuple[str, str], List[int]] = {}
+        # Recent successful-call latencies and hedge counters per call type
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._hedge_stats: Dict[str, Dict[str, int]] = {}
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._writer: Optional[threading.Thread] = None
         self._init_database()
+        self._load_keys()
+        self._start_writer()
+        atexit.register(self.close)
 
     # ------------------------------------------------------------------
     # Database initialisation
@@ -94,110 +242,479 @@ class GeminiKeyPool:
                     CREATE INDEX IF NOT EXISTS idx_api_key_usage_created
                     ON api_key_usage(created_at)
                 """)
+                has_daily = cursor.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'api_key_usage_daily'"
+                ).fetchone()
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS api_key_usage_daily (
+                        key_suffix TEXT NOT NULL,
+                        day TEXT NOT NULL,
+                        calls INTEGER DEFAULT 0,
+                        prompt_tokens INTEGER DEFAULT 0,
+                        completion_tokens INTEGER DEFAULT 0,
+                        total_tokens INTEGER DEFAULT 0,
+                        PRIMARY KEY (key_suffix, day)
+                    )
+                """)
+                # Status / stats read by day; also added to databases created before it
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_api_key_usage_daily_day
+                    ON api_key_usage_daily(day)
+                """)
+                if not has_daily:
+                    # One-off backfill from rows logged before the summary table existed
+                    cursor.execute("""
+                        INSERT INTO api_key_usage_daily
+                            (key_suffix, day, calls, prompt_tokens, completion_tokens, total_tokens)
+                        SELECT key_suffix, date(created_at), COUNT(*),
+                               COALESCE(SUM(prompt_tokens), 0),
+                               COALESCE(SUM(completion_tokens), 0),
+                               COALESCE(SUM(total_tokens), 0)
+                        FROM api_key_usage
+                        GROUP BY key_suffix, date(created_at)
+                    """)
                 conn.commit()
             finally:
                 conn.close()
 
     # ------------------------------------------------------------------
-    # Key selection
+    # In-memory key index
     # ------------------------------------------------------------------
 
-    def _available_keys_query(
-        self,
-        exclude_key: Optional[str] = None,
-        exclude_keys: Optional[Set[str]] = None,
-    ) -> tuple:
-        """Build query and params for selecting available keys."""
+    def _load_keys(self):
+        """Load every key from SQLite into memory (replaces the in-memory state)."""
+        conn = self._get_conn()
+        try:
+            rows = conn.execute(
+                "SELECT api_key, status, cooldown_until FROM api_keys ORDER BY id"
+            ).fetchall()
+        finally:
+            conn.close()
+        with self._lock:
+            self._keys = {}
+            self._ready = []
+            self._ready_pos = {}
+            self._cooling = []
+            now = time.time()
+            for row in rows:
+                state = _KeyState(row["api_key"], row["status"], row["cooldown_until"])
+                self._keys[state.api_key] = state
+                self._place(state, now)
+        logger.info("GeminiKeyPool: 載入 %d 個 key", len(rows))
+
+    # -- in-memory index helpers (caller holds self._lock) --------------
+
+    def _ready_add(self, key: str):
+        if key not in self._ready_pos:
+            self._ready_pos[key] = len(self._ready)
+            self._ready.append(key)
+
+    def _ready_remove(self, key: str):
+        pos = self._ready_pos.pop(key, None)
+        if pos is None:
+            return
+        last = self._ready.pop()
+        if last != key:
+            self._ready[pos] = last
+            self._ready_pos[last] = pos
+
+    def _place(self, state: _KeyState, now: float):
+        """Put *state* in the ready list or the cooling heap according to its fields."""
+        self._ready_remove(state.api_key)
+        if state.status != "active":
+            return
+        if state.cooldown_until < now:
+            self._ready_add(state.api_key)
+        else:
+            heapq.heappush(self._cooling, (state.cooldown_until, state.api_key))
+
+    def _release_expired(self, now: float):
+        """Move keys whose cooldown has expired back into the ready list."""
+        while self._cooling and self._cooling[0][0] < now:
+            until, key = heapq.heappop(self._cooling)
+            state = self._keys.get(key)
+            # Skip stale heap entries (key removed, re-cooled or deactivated)
+            if state is None or state.status != "active" or state.cooldown_until != until:
+                continue
+            self._ready_add(key)
+
+    def _choose(self, exclude: Optional[Set[str]] = None) -> Optional[str]:
+        """Ready key not in *exclude* with the most RPM/TPM headroom (caller holds self._lock).
+
+        Ties are broken randomly, so idle keys are still spread evenly.
+        """
         now = time.time()
-        conditions = ["status = 'active'", "cooldown_until < ?"]
-        params: list = [now]
-
-        if exclude_key:
-            conditions.append("api_key != ?")
-            params.append(exclude_key)
-
-        if exclude_keys:
-            placeholders = ",".join("?" for _ in exclude_keys)
-            conditions.append(f"api_key NOT IN ({placeholders})")
-            params.extend(exclude_keys)
+        self._release_expired(now)
+        if not self._ready:
+            return None
+
+        if len(self._ready) <= HEADROOM_SCAN_LIMIT:
+            best: List[str] = []
+            best_room = float("-inf")
+            for key in self._ready:
+                if exclude and key in exclude:
+                    continue
+                room = self._keys[key].headroom(now)
+                if room > best_room + HEADROOM_TIE:
+                    best, best_room = [key], room
+                elif room >= best_room - HEADROOM_TIE:
+                    best.append(key)
+                    best_room = max(best_room, room)
+            return random.choice(best) if best else None
+
+        # Large pools: power of two choices keeps selection O(1)
+        picks: List[str] = []
+        for _ in range(_SAMPLE_ATTEMPTS):
+            key = random.choice(self._ready)
+            if not exclude or key not in exclude:
+                picks.append(key)
+                if len(picks) == 2:
+                    break
+        if not picks:
+            candidates = [key for key in self._ready if key not in exclude]
+            if not candidates:
+                return None
+            picks = random.sample(candidates, min(2, len(candidates)))
+        return max(picks, key=lambda k: self._keys[k].headroom(now))
 
-        sql = "SELECT api_key FROM api_keys WHERE " + " AND ".join(conditions)
-        return sql, tuple(params)
+    # ------------------------------------------------------------------
+    # Key selection
+    # ------------------------------------------------------------------
 
     def get_key(self) -> Optional[str]:
-        """Randomly select an active, non-cooldown key. Returns None if none available."""
+        """Select an active, non-cooldown key with the most headroom (random among ties).
+
+        Returns None if none available.  Does not reserve budget; use
+        ``acquire_key`` for that.
+        """
         with self._lock:
-            conn = self._get_conn()
-            try:
-                sql, params = self._available_keys_query()
-                rows = conn.execute(sql, params).fetchall()
-                if not rows:
-                    logger.warning("GeminiKeyPool: 沒有可用的 API key")
-                    return None
-                chosen = random.choice(rows)["api_key"]
-                logger.debug("GeminiKeyPool: 選擇 key ...%s", chosen[-4:])
-                return chosen
-            finally:
-                conn.close()
+            chosen = self._choose()
+        if chosen is None:
+            logger.warning("GeminiKeyPool: 沒有可用的 API key")
+            return None
+        logger.debug("GeminiKeyPool: 選擇 key ...%s", chosen[-4:])
+        return chosen
 
     def get_key_excluding(self, failed_key: str) -> Optional[str]:
         """Randomly select an active key, excluding *failed_key*."""
         with self._lock:
-            conn = self._get_conn()
-            try:
-                sql, params = self._available_keys_query(exclude_key=failed_key)
-                rows = conn.execute(sql, params).fetchall()
-                if not rows:
-                    logger.warning("GeminiKeyPool: 排除 ...%s 後沒有可用 key", failed_key[-4:])
-                    return None
-                chosen = random.choice(rows)["api_key"]
-                logger.debug("GeminiKeyPool: 替換為 key ...%s", chosen[-4:])
-                return chosen
-            finally:
-                conn.close()
+            chosen = self._choose({failed_key})
+        if chosen is None:
+            logger.warning("GeminiKeyPool: 排除 ...%s 後沒有可用 key", failed_key[-4:])
+            return None
+        logger.debug("GeminiKeyPool: 替換為 key ...%s", chosen[-4:])
+        return chosen
 
     def get_key_excluding_all(self, tried_keys: Set[str]) -> Optional[str]:
         """Randomly select an active key, excluding ALL keys in *tried_keys*. Thread-safe."""
         with self._lock:
-            conn = self._get_conn()
-            try:
-                sql, params = self._available_keys_query(exclude_keys=tried_keys)
-                rows = conn.execute(sql, params).fetchall()
-                if not rows:
-                    logger.warning(
-                        "GeminiKeyPool: 排除 %d 個已嘗試 key 後沒有可用 key",
-                        len(tried_keys),
-                    )
-                    return None
-                chosen = random.choice(rows)["api_key"]
-                logger.debug("GeminiKeyPool: 選擇 key ...%s (已排除 %d 個)", chosen[-4:], len(tried_keys))
-                return chosen
-            finally:
-                conn.close()
+            chosen = self._choose(tried_keys)
+        if chosen is None:
+            logger.warning(
+                "GeminiKeyPool: 排除 %d 個已嘗試 key 後沒有可用 key",
+                len(tried_keys),
+            )
+            return None
+        logger.debug("GeminiKeyPool: 選擇 key ...%s (已排除 %d 個)", chosen[-4:], len(tried_keys))
+        return chosen
 
     # ------------------------------------------------------------------
     # Cooldown / mark bad
     # ------------------------------------------------------------------
 
     def mark_bad(self, key: str, cooldown_seconds: int = DEFAULT_COOLDOWN_SECONDS):
-        """Put a key into cooldown for *cooldown_seconds*."""
+        """Put a key into cooldown for *cooldown_seconds*.
+
+        Memory is updated immediately; the deadline reaches SQLite on the
+        next write-behind flush.
+        """
         until = time.time() + cooldown_seconds
         with self._lock:
-            conn = self._get_conn()
-            try:
-                conn.execute(
-                    "UPDATE api_keys SET cooldown_until = ? WHERE api_key = ?",
-                    (until, key),
-                )
-                conn.commit()
-                logger.info(
-                    "GeminiKeyPool: key ...%s 冷卻 %ds",
-                    key[-4:],
-                    cooldown_seconds,
-                )
-            finally:
+            state = self._keys.get(key)
+            if state is None:
+                return
+            state.cooldown_until = until
+            self._place(state, time.time())
+            self._pending_cooldowns[key] = until
+        logger.info(
+            "GeminiKeyPool: key ...%s 冷卻 %ds",
+            key[-4:],
+            cooldown_seconds,
+        )
+
+    # ------------------------------------------------------------------
+    # Rate limiting
+    # ------------------------------------------------------------------
+
+    def acquire_key(
+        self,
+        exclude: Optional[Set[str]] = None,
+        tokens: float = ESTIMATED_TOKENS_PER_CALL,
+        max_wait: float = MAX_THROTTLE_WAIT_SECONDS,
+    ) -> Optional[str]:
+        """Pick the key with the most headroom and reserve one request + *tokens*.
+
+        If even the best key is out of budget, wait up to *max_wait* seconds
+        for its bucket to refill; past that the key is returned anyway and
+        the API gets the final say.
+        """
+        deadline = time.time() + max_wait
+        while True:
+            key, wait = self._reserve(exclude, tokens, deadline)
+            if wait <= 0:
+                return key
+            logger.debug("GeminiKeyPool: key ...%s 額度不足，等待 %.2fs", key[-4:], wait)
+            time.sleep(wait)
+
+    async def acquire_key_async(
+        self,
+        exclude: Optional[Set[str]] = None,
+        tokens: float = ESTIMATED_TOKENS_PER_CALL,
+        max_wait: float = MAX_THROTTLE_WAIT_SECONDS,
+    ) -> Optional[str]:
+        """Like :meth:`acquire_key`, but waits for capacity without blocking the loop."""
+        deadline = time.time() + max_wait
+        while True:
+            key, wait = self._reserve(exclude, tokens, deadline)
+            if wait <= 0:
+                return key
+            logger.debug("GeminiKeyPool: key ...%s 額度不足，等待 %.2fs", key[-4:], wait)
+            await asyncio.sleep(wait)
+
+    def _reserve(
+        self, exclude: Optional[Set[str]], tokens: float, deadline: float,
+    ) -> Tuple[Optional[str], float]:
+        """Reserve the best key, or return it with the time to wait for capacity.
+
+        Returns ``(key, 0)`` once reserved (``(None, 0)`` if no key is ready)
+        and ``(key, wait)`` when the caller should wait and try again.
+        """
+        with self._lock:
+            key = self._choose(exclude)
+            if key is None:
+                return None, 0.0
+            state = self._keys[key]
+            now = time.time()
+            wait = state.wait_time(tokens, now)
+            if wait <= 0 or now + wait > deadline:
+                state.rpm.consume(1, now)
+                state.tpm.consume(tokens, now)
+                return key, 0.0
+            return key, wait
+
+    def report_success(self, key: str, tokens: int = 0):
+        """Reset the key's 429 streak and let its learned RPM recover."""
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                return
+            state.strikes = 0
+            if state.rpm.capacity < KEY_RPM_LIMIT:
+                state.rpm.set_capacity(min(KEY_RPM_LIMIT, state.rpm.capacity + RPM_RECOVERY_STEP))
+            if tokens > ESTIMATED_TOKENS_PER_CALL:
+                # Charge the part of the real usage the reservation did not cover
+                state.tpm.consume(tokens - ESTIMATED_TOKENS_PER_CALL, time.time())
+
+    def report_rate_limited(self, key: str, exc: Optional[Exception] = None) -> float:
+        """Adaptive cooldown for a key that returned 429; returns the cooldown used.
+
+        Uses the API's ``retryDelay`` hint when present, otherwise backs off
+        exponentially with the key's 429 streak.  A 429 that arrives while the
+        RPM bucket still had budget means our limit is too optimistic for this
+        key, so its learned RPM is lowered.
+        """
+        hint = self._retry_delay(exc) if exc is not None else None
+        with self._lock:
+            state = self._keys.get(key)
+            if state is None:
+                return 0.0
+            state.strikes += 1
+            if hint is not None:
+                cooldown = min(MAX_COOLDOWN_SECONDS, hint)
+            else:
+                cooldown = min(MAX_COOLDOWN_SECONDS, BASE_COOLDOWN_SECONDS * 2 ** (state.strikes - 1))
+            now = time.time()
+            if state.rpm.level(now) > 0:
+                state.rpm.set_capacity(max(1.0, state.rpm.capacity * RPM_BACKOFF_FACTOR))
+            state.rpm.tokens = 0.0
+            state.rpm.updated = now
+        self.mark_bad(key, cooldown_seconds=cooldown)
+        return cooldown
+
+    _RETRY_DELAY_PATTERN = re.compile(
+        r"retry[_ ]?delay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", re.IGNORECASE,
+    )
+
+    @classmethod
+    def _retry_delay(cls, exc: Exception) -> Optional[float]:
+        """Extract the server-suggested retry delay (seconds) from a 429 error."""
+        match = cls._RETRY_DELAY_PATTERN.search(str(exc))
+        return float(match.group(1)) if match else None
+
+    # ------------------------------------------------------------------
+    # Write-behind persistence
+    # ------------------------------------------------------------------
+
+    def _start_writer(self):
+        self._writer = threading.Thread(
+            target=self._writer_loop, name="gemini-pool-writer", daemon=True,
+        )
+        self._writer.start()
+
+    def _writer_loop(self):
+        """Flush queued cooldowns and periodically re-sync from SQLite."""
+        conn = self._get_conn()  # reused for the writer's lifetime
+        last_sync = time.time()
+        try:
+            while not self._stop.is_set():
+                self._wake.wait(PERSIST_INTERVAL_SECONDS)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                try:
+                    if not os.path.exists(self.db_path):
+                        # Database removed underneath us: recreate it from memory
+                        logger.warning("GeminiKeyPool: %s 不存在，重新建立資料庫", self.db_path)
+                        if conn is not None:
+                            conn.close()
+                            conn = None
+                        self._restore_database()
+                    if conn is None:
+                        conn = self._get_conn()
+                    self._flush(conn)
+                    self._flush_usage(conn)
+                    if time.time() - last_sync >= SYNC_INTERVAL_SECONDS:
+                        self._sync_from_db(conn)
+                        last_sync = time.time()
+                except sqlite3.Error as e:
+                    logger.warning("GeminiKeyPool: 背景寫入失敗: %s", e)
+                    if conn is not None:
+                        conn.close()
+                        conn = None
+        finally:
+            if conn is not None:
                 conn.close()
 
+    def _restore_database(self):
+        """Recreate the tables and write the in-memory keys back.
+
+        Without the keys the next ``_sync_from_db`` would read an empty
+        ``api_keys`` table and drop every key from memory.
+        """
+        self._init_database()
+        with self._lock:
+            rows = [(s.api_key, s.status, s.cooldown_until) for s in self._keys.values()]
+        conn = self._get_conn()
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO api_keys (api_key, status, cooldown_until) VALUES (?, ?, ?)",
+                rows,
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _flush(self, conn: sqlite3.Connection):
+        """Persist queued cooldown deadlines in one transaction."""
+        with self._lock:
+            pending, self._pending_cooldowns = self._pending_cooldowns, {}
+        if not pending:
+            return
+        try:
+            conn.executemany(
+                "UPDATE api_keys SET cooldown_until = ? WHERE api_key = ?",
+                [(until, key) for key, until in pending.items()],
+            )
+            conn.commit()
+        except sqlite3.Error:
+            # Re-queue so the next flush retries (newer deadlines win)
+            with self._lock:
+                for key, until in pending.items():
+                    self._pending_cooldowns.setdefault(key, until)
+            raise
+
+    def _sync_from_db(self, conn: sqlite3.Connection):
+        """Merge api_keys rows written by other processes into memory."""
+        rows = conn.execute(
+            "SELECT api_key, status, cooldown_until FROM api_keys ORDER BY id"
+        ).fetchall()
+        now = time.time()
+        with self._lock:
+            seen = set()
+            for row in rows:
+                key = row["api_key"]
+                seen.add(key)
+                state = self._keys.get(key)
+                if state is None:
+                    state = self._keys[key] = _KeyState(key, row["status"], row["cooldown_until"])
+                else:
+                    state.status = row["status"]
+                    state.cooldown_until = max(state.cooldown_until, row["cooldown_until"] or 0.0)
+                self._place(state, now)
+            for key in [k for k in self._keys if k not in seen]:
+                self._ready_remove(key)
+                del self._keys[key]
+
+    def _flush_usage(self, conn: sqlite3.Connection):
+        """Write queued usage rows and fold them into the daily summary, in one transaction."""
+        with self._lock:
+            rows, self._pending_usage = self._pending_usage, []
+            daily, self._pending_daily = self._pending_daily, {}
+        if not rows:
+            return
+        try:
+            conn.executemany(
+                """
+                INSERT INTO api_key_usage
+                    (key_suffix, model, call_type, prompt_tokens, completion_tokens, total_tokens, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            )
+            conn.executemany(
+                """
+                INSERT INTO api_key_usage_daily
+                    (key_suffix, day, calls, prompt_tokens, completion_tokens, total_tokens)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key_suffix, day) DO UPDATE SET
+                    calls = calls + excluded.calls,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = completion_tokens + excluded.completion_tokens,
+                    total_tokens = total_tokens + excluded.total_tokens
+                """,
+                [(suffix, day, *counts) for (suffix, day), counts in daily.items()],
+            )
+            conn.commit()
+            logger.debug("GeminiKeyPool: 批次寫入 %d 筆用量", len(rows))
+        except sqlite3.Error:
+            conn.rollback()
+            with self._lock:
+                self._pending_usage[:0] = rows
+                for day_key, counts in daily.items():
+                    _add_counts(self._pending_daily, day_key, counts)
+            raise
+
+    def flush(self):
+        """Synchronously write pending cooldowns and usage records to SQLite."""
+        conn = self._get_conn()
+        try:
+            self._flush(conn)
+            self._flush_usage(conn)
+        finally:
+            conn.close()
+
+    def close(self):
+        """Stop the background writer and flush what is still pending."""
+        self._stop.set()
+        self._wake.set()
+        if self._writer is not None and self._writer is not threading.current_thread():
+            self._writer.join(timeout=2)
+        if (self._pending_cooldowns or self._pending_usage) and os.path.exists(self.db_path):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.warning("GeminiKeyPool: 關閉時寫入失敗: %s", e)
+
     # ------------------------------------------------------------------
     # Key management
     # ------------------------------------------------------------------
@@ -239,6 +756,9 @@ class GeminiKeyPool:
                             "INSERT INTO api_keys (api_key) VALUES (?)",
                             (raw_key,),
                         )
+                        state = _KeyState(raw_key)
+                        self._keys[raw_key] = state
+                        self._place(state, time.time())
                         added += 1
                         logger.info("GeminiKeyPool: 新增 key ...%s", raw_key[-4:])
                     except sqlite3.IntegrityError:
@@ -275,6 +795,10 @@ class GeminiKeyPool:
                                 (key,),
                             )
                             conn.commit()
+                            state = self._keys.get(key)
+                            if state is not None:
+                                state.status = "invalid"
+                                self._place(state, time.time())
                             logger.warning("GeminiKeyPool: key ...%s 驗證失敗，已停用", key[-4:])
                         finally:
                             conn.close()
@@ -315,9 +839,14 @@ class GeminiKeyPool:
                     raise ValueError(
                         f"後綴 '{suffix}' 匹配到 {len(rows)} 個 key，請提供更具體的後綴"
                     )
-                conn.execute("DELETE FROM api_keys WHERE api_key = ?", (rows[0]["api_key"],))
-                logger.info("GeminiKeyPool: 移除 key ...%s", rows[0]["api_key"][-4:])
+                removed = rows[0]["api_key"]
+                conn.execute("DELETE FROM api_keys WHERE api_key = ?", (removed,))
+                logger.info("GeminiKeyPool: 移除 key ...%s", removed[-4:])
                 conn.commit()
+                self._ready_remove(removed)
+                self._keys.pop(removed, None)
+                self._pending_cooldowns.pop(removed, None)
+                gemini_client.drop_client(removed)
             finally:
                 conn.close()
 
@@ -326,83 +855,95 @@ class GeminiKeyPool:
     # ------------------------------------------------------------------
 
     def get_key_status(self) -> List[Dict]:
-        """Return status for every key: suffix, status, cooldown remaining, today's usage."""
+        """Return status for every key: suffix, status, cooldown remaining, today's usage,
+        current RPM/TPM headroom (0-1) and learned RPM limit."""
         now = time.time()
         with self._lock:
-            conn = self._get_conn()
-            try:
-                rows = conn.execute(
-                    "SELECT api_key, status, cooldown_until FROM api_keys ORDER BY id"
-                ).fetchall()
-
-                result = []
-                for row in rows:
-                    suffix = row["api_key"][-4:]
-                    cooldown_remaining = max(0, row["cooldown_until"] - now)
-
-                    # Today's usage count
-                    usage_row = conn.execute(
-                        """
-                        SELECT COUNT(*) as cnt FROM api_key_usage
-                        WHERE key_suffix = ? AND date(created_at) = date('now')
-                        """,
-                        (suffix,),
-                    ).fetchone()
-                    usage_today = usage_row["cnt"] if usage_row else 0
-
-                    result.append({
-                        "suffix": suffix,
-                        "status": row["status"],
-                        "cooldown_remaining": round(cooldown_remaining, 1),
-                        "usage_today": usage_today,
-                    })
-                return result
-            finally:
-                conn.close()
-
-    def get_usage_stats(self) -> Dict:
-        """Aggregated usage counts for today, last 7 days, and last 30 days."""
+            snapshot = [
+                (state.api_key, state.status, state.cooldown_until,
+                 round(state.headroom(now), 2), round(state.rpm.capacity, 1))
+                for state in self._keys.values()
+            ]
+
+        # One read of today's summary rows via idx_api_key_usage_daily_day, outside the lock
+        today = _utc_day()
+        conn = self._get_conn()
+        try:
+            rows = conn.execute(
+                "SELECT key_suffix, calls FROM api_key_usage_daily WHERE day = ?",
+                (today,),
+            ).fetchall()
+        finally:
+            conn.close()
+        usage = {row["key_suffix"]: row["calls"] for row in rows}
         with self._lock:
-            conn = self._get_conn()
-            try:
-                def _count(days: int) -> int:
-                    row = conn.execute(
-                        """
-                        SELECT COUNT(*) as cnt FROM api_key_usage
-                        WHERE created_at >= datetime('now', ?)
-                        """,
-                        (f"-{days} days",),
-                    ).fetchone()
-                    return row["cnt"] if row else 0
-
-                today = conn.execute(
-                    "SELECT COUNT(*) as cnt FROM api_key_usage WHERE date(created_at) = date('now')"
-                ).fetchone()
+            for (suffix, day), counts in self._pending_daily.items():
+                if day == today:
+                    usage[suffix] = usage.get(suffix, 0) + counts[0]
+
+        result = []
+        for api_key, status, cooldown_until, headroom, learned_rpm in snapshot:
+            suffix = api_key[-4:]
+            result.append({
+                "suffix": suffix,
+                "status": status,
+                "cooldown_remaining": round(max(0, cooldown_until - now), 1),
+                "usage_today": usage.get(suffix, 0),
+                "headroom": headroom,
+                "learned_rpm": learned_rpm,
+            })
+        return result
 
-                # Token totals
-                token_row = conn.execute(
-                    """
-                    SELECT
-                        COALESCE(SUM(prompt_tokens), 0) as prompt,
-                        COALESCE(SUM(completion_tokens), 0) as completion,
-                        COALESCE(SUM(total_tokens), 0) as total
-                    FROM api_key_usage
-                    WHERE date(created_at) = date('now')
-                    """
-                ).fetchone()
+    def get_usage_stats(self) -> Dict:
+        """Aggregated usage counts for today, the last 7 and the last 30 days.
 
-                return {
-                    "today": today["cnt"] if today else 0,
-                    "last_7_days": _count(7),
-                    "last_30_days": _count(30),
-                    "today_tokens": {
-                        "prompt": token_row["prompt"],
-                        "completion": token_row["completion"],
-                        "total": token_row["total"],
-                    },
-                }
-            finally:
-                conn.close()
+        Read from ``api_key_usage_daily`` through its ``day`` index (at most
+        keys x 30 rows, already in day order for the GROUP BY), so the cost
+        grows with neither ``api_key_usage`` nor the summary table's history.  Windows are UTC
+        calendar days including today.
+        """
+        conn = self._get_conn()
+        try:
+            rows = conn.execute(
+                """
+                SELECT day,
+                       SUM(calls) AS calls,
+                       SUM(prompt_tokens) AS prompt,
+                       SUM(completion_tokens) AS completion,
+                       SUM(total_tokens) AS total
+                FROM api_key_usage_daily
+                WHERE day >= date('now', '-29 days')
+                GROUP BY day
+                """
+            ).fetchall()
+        finally:
+            conn.close()
+
+        per_day: Dict[str, List[int]] = {
+            row["day"]: [row["calls"], row["prompt"], row["completion"], row["total"]]
+            for row in rows
+        }
+        with self._lock:
+            for (_suffix, day), counts in self._pending_daily.items():
+                totals = per_day.setdefault(day, [0, 0, 0, 0])
+                for i, n in enumerate(counts):
+                    totals[i] += n
+
+        today = _utc_day()
+        week_start = _utc_day(days_ago=6)
+        month_start = _utc_day(days_ago=29)
+        today_counts = per_day.get(today, [0, 0, 0, 0])
+        return {
+            "today": today_counts[0],
+            "last_7_days": sum(c[0] for d, c in per_day.items() if d >= week_start),
+            "last_30_days": sum(c[0] for d, c in per_day.items() if d >= month_start),
+            "today_tokens": {
+                "prompt": today_counts[1],
+                "completion": today_counts[2],
+                "total": today_counts[3],
+            },
+            "hedging": self.get_hedge_stats(),
+        }
 
     # ------------------------------------------------------------------
     # Usage tracking
@@ -415,29 +956,38 @@ class GeminiKeyPool:
         call_type: Optional[str] = None,
         prompt_tokens: int = 0,
         completion_tokens: int = 0,
+        total_tokens: Optional[int] = None,
     ):
-        """Insert a usage record. Only stores the key suffix for security."""
+        """Queue a usage record. Only stores the key suffix for security.
+
+        *total_tokens* defaults to prompt + completion; pass the API's own
+        total when it also counts thinking tokens.
+
+        Records are written in batches by the background writer; nothing
+        touches SQLite on the caller's thread.
+        """
         suffix = key[-4:] if key else "????"
-        total_tokens = prompt_tokens + completion_tokens
+        if total_tokens is None:
+            total_tokens = prompt_tokens + completion_tokens
+        now = time.gmtime()
+        created_at = time.strftime("%Y-%m-%d %H:%M:%S", now)
 
         with self._lock:
-            conn = self._get_conn()
-            try:
-                conn.execute(
-                    """
-                    INSERT INTO api_key_usage
-                        (key_suffix, model, call_type, prompt_tokens, completion_tokens, total_tokens)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                    """,
-                    (suffix, model, call_type, prompt_tokens, completion_tokens, total_tokens),
-                )
-                conn.commit()
-                logger.debug(
-                    "GeminiKeyPool: 記錄用量 ...%s model=%s tokens=%d",
-                    suffix, model, total_tokens,
-                )
-            finally:
-                conn.close()
+            self._pending_usage.append(
+                (suffix, model, call_type, prompt_tokens, completion_tokens, total_tokens, created_at)
+            )
+            _add_counts(
+                self._pending_daily,
+                (suffix, created_at[:10]),
+                (1, prompt_tokens, completion_tokens, total_tokens),
+            )
+            queued = len(self._pending_usage)
+        if queued >= USAGE_BATCH_SIZE:
+            self._wake.set()
+        logger.debug(
+            "GeminiKeyPool: 記錄用量 ...%s model=%s tokens=%d",
+            suffix, model, total_tokens,
+        )
 
     # ------------------------------------------------------------------
     # Key validation
@@ -467,7 +1017,13 @@ class GeminiKeyPool:
     # auto_retry decorator
     # ------------------------------------------------------------------
 
-    def auto_retry(self, func: Optional[Callable] = None):
+    def auto_retry(
+        self,
+        func: Optional[Callable] = None,
+        *,
+        hedge: bool = False,
+        hedge_percentile: float = HEDGE_PERCENTILE,
+    ):
         """Decorator that injects ``api_key`` kwarg and retries on 429 / ResourceExhausted.
 
         Usage::
@@ -478,43 +1034,209 @@ class GeminiKeyPool:
                 ...
 
         The decorator will:
-        1. Pick an available key and pass it as ``api_key``.
-        2. On 429 or ResourceExhausted, mark the key bad, pick another, retry.
+        1. Reserve the key with the most RPM/TPM headroom (waiting briefly
+           for capacity) and pass it as ``api_key``.
+        2. On 429 or ResourceExhausted, cool the key down adaptively, pick
+           another, retry.
         3. Loop until no new key can be obtained.
         4. Raise GeminiPoolExhausted if all keys are exhausted.
+        5. Queue a usage record (``call_type`` = function name) on success,
+           with the token counts of the response the call received through
+           ``gemini_client``, and charge them to the key's TPM bucket.
+
+        Coroutine functions get an async wrapper: key acquisition waits with
+        ``asyncio.sleep`` and the call is awaited, so no thread is held.
+
+        ``@auto_retry(hedge=True)`` (coroutine functions only) additionally
+        hedges: if the call has not returned after the *hedge_percentile* of
+        recent latencies for this function, a duplicate is started on a
+        different key; the first successful response wins and the other is
+        cancelled.  See ``get_hedge_stats()``.
         """
-        # Support both @auto_retry and @auto_retry() syntax
+        # Support both @auto_retry and @auto_retry(...) syntax
         if func is None:
-            return self.auto_retry  # called as @auto_retry() — return self
+            return functools.partial(self.auto_retry, hedge=hedge, hedge_percentile=hedge_percentile)
+
+        call_type = func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            if hedge:
+                @functools.wraps(func)
+                async def hedged_wrapper(*args, **kwargs):
+                    return await self._call_hedged(func, args, kwargs, hedge_percentile)
+
+                return hedged_wrapper
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await self._call_async(func, args, kwargs, set())
+
+            return async_wrapper
+
+        if hedge:
+            raise TypeError("GeminiKeyPool: hedging requires a coroutine function (cancellation)")
 
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             tried_keys: Set[str] = set()
 
             while True:
-                key = self.get_key_excluding_all(tried_keys)
-                if key is None:
-                    raise GeminiPoolExhausted(
-                        f"GeminiKeyPool: 所有 API key 都已耗盡 (已嘗試 {len(tried_keys)} 個)"
-                    )
-                tried_keys.add(key)
-
+                key = self._checked_key(self.acquire_key(tried_keys), tried_keys)
                 kwargs["api_key"] = key
+                gemini_client.take_usage()
+                start = time.perf_counter()
                 try:
-                    return func(*args, **kwargs)
+                    result = func(*args, **kwargs)
                 except Exception as exc:
-                    if not self._is_rate_limit_error(exc):
-                        raise
-                    logger.warning(
-                        "GeminiKeyPool: key ...%s 遭遇 429/ResourceExhausted (已嘗試 %d 個 key)",
-                        key[-4:],
-                        len(tried_keys),
-                    )
-                    self.mark_bad(key)
+                    self._handle_failure(key, exc, tried_keys)
                     continue
+                self._handle_success(key, call_type, time.perf_counter() - start,
+                                     gemini_client.take_usage())
+                return result
 
         return wrapper
 
+    async def _call_async(self, func: Callable, args: tuple, kwargs: dict, tried_keys: Set[str]):
+        """Async retry loop behind ``auto_retry``; *tried_keys* may be shared by hedge legs."""
+        kwargs = dict(kwargs)
+        while True:
+            key = self._checked_key(await self.acquire_key_async(tried_keys), tried_keys)
+            kwargs["api_key"] = key
+            gemini_client.take_usage()
+            start = time.perf_counter()
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as exc:
+                self._handle_failure(key, exc, tried_keys)
+                continue
+            self._handle_success(key, func.__name__, time.perf_counter() - start,
+                                 gemini_client.take_usage())
+            return result
+
+    async def _call_hedged(self, func: Callable, args: tuple, kwargs: dict, percentile: float):
+        """Run the primary call and, if it is slow, a hedge on another key."""
+        call_type = func.__name__
+        tried_keys: Set[str] = set()
+        primary = asyncio.ensure_future(self._call_async(func, args, kwargs, tried_keys))
+        legs = [primary]
+        self._count_hedge(call_type, "calls")
+        try:
+            if HEDGING_ENABLED:
+                done, _ = await asyncio.wait(legs, timeout=self.hedge_delay(call_type, percentile))
+                if not done and self._has_spare_key(tried_keys):
+                    legs.append(asyncio.ensure_future(self._call_async(func, args, kwargs, tried_keys)))
+                    self._count_hedge(call_type, "hedged")
+                    logger.info("GeminiKeyPool: %s 超過延遲門檻，對沖至另一個 key", call_type)
+
+            pending = set(legs)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for leg in done:
+                    if leg.exception() is None:
+                        if leg is not primary:
+                            self._count_hedge(call_type, "hedge_wins")
+                        return leg.result()
+            # Every leg failed: surface the primary's error
+            raise primary.exception()
+        finally:
+            for leg in legs:
+                if not leg.done():
+                    leg.cancel()
+                    metrics.record_gemini("cancelled")
+
+    def _has_spare_key(self, tried_keys: Set[str]) -> bool:
+        with self._lock:
+            return self._choose(tried_keys) is not None
+
+    # ------------------------------------------------------------------
+    # Latency tracking / hedging stats
+    # ------------------------------------------------------------------
+
+    def record_latency(self, call_type: str, seconds: float):
+        with self._lock:
+            window = self._latencies.get(call_type)
+            if window is None:
+                window = self._latencies[call_type] = deque(maxlen=LATENCY_WINDOW)
+            window.append(seconds)
+
+    def hedge_delay(self, call_type: str, percentile: float = HEDGE_PERCENTILE) -> float:
+        """Seconds to wait before hedging: *percentile* of recent latencies."""
+        with self._lock:
+            samples = sorted(self._latencies.get(call_type, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return HEDGE_DEFAULT_DELAY_SECONDS
+        return max(HEDGE_MIN_DELAY_SECONDS, _percentile(samples, percentile))
+
+    def _count_hedge(self, call_type: str, field: str):
+        with self._lock:
+            counts = self._hedge_stats.setdefault(
+                call_type, {"calls": 0, "hedged": 0, "hedge_wins": 0},
+            )
+            counts[field] += 1
+
+    def get_hedge_stats(self) -> Dict[str, Dict]:
+        """Per hedged call type: calls, hedges fired / won, and latency p50 / p99.
+
+        ``hedge_rate`` approximates the extra quota spent on hedging;
+        compare it with the p99 it buys.
+        """
+        with self._lock:
+            counters = {name: dict(c) for name, c in self._hedge_stats.items()}
+            windows = {name: sorted(self._latencies.get(name, ())) for name in counters}
+        stats = {}
+        for name, counts in counters.items():
+            samples = windows[name]
+            calls = counts["calls"]
+            stats[name] = {
+                **counts,
+                "hedge_rate": round(counts["hedged"] / calls, 4) if calls else 0.0,
+                "hedge_win_rate": round(counts["hedge_wins"] / counts["hedged"], 4) if counts["hedged"] else 0.0,
+                "latency_p50_ms": round(_percentile(samples, 0.5) * 1000) if samples else None,
+                "latency_p99_ms": round(_percentile(samples, 0.99) * 1000) if samples else None,
+            }
+        return stats
+
+    @staticmethod
+    def _checked_key(key: Optional[str], tried_keys: Set[str]) -> str:
+        """Record *key* as tried, or raise GeminiPoolExhausted if there is none."""
+        if key is None:
+            raise GeminiPoolExhausted(
+                f"GeminiKeyPool: 所有 API key 都已耗盡 (已嘗試 {len(tried_keys)} 個)"
+            )
+        tried_keys.add(key)
+        return key
+
+    def _handle_success(self, key: str, call_type: str, latency: Optional[float] = None,
+                        usage: Optional[gemini_client.Usage] = None):
+        metrics.record_gemini("ok")
+        if usage is None:
+            self.report_success(key)
+            self.track_usage(key, call_type=call_type)
+        else:
+            self.report_success(key, usage.total_tokens)
+            self.track_usage(
+                key, model=usage.model, call_type=call_type,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+                total_tokens=usage.total_tokens,
+            )
+        if latency is not None:
+            self.record_latency(call_type, latency)
+
+    def _handle_failure(self, key: str, exc: Exception, tried_keys: Set[str]):
+        """Re-raise non-429 errors; cool the key down on 429 so the caller retries."""
+        if not self._is_rate_limit_error(exc):
+            metrics.record_gemini("error")
+            raise exc
+        metrics.record_gemini("rate_limited")
+        cooldown = self.report_rate_limited(key, exc)
+        logger.warning(
+            "GeminiKeyPool: key ...%s 遭遇 429/ResourceExhausted，冷卻 %.0fs (已嘗試 %d 個 key)",
+            key[-4:],
+            cooldown,
+            len(tried_keys),
+        )
+
     # Pattern for matching HTTP 429 in error strings — must appear in a
     # recognisable context, not just any occurrence of the digits "429".
     _RATE_LIMIT_PATTERN = re.compile(
@@ -553,6 +1275,23 @@ class GeminiKeyPool:
         return False
 
 
+def _utc_day(days_ago: int = 0) -> str:
+    """UTC calendar day (matches SQLite's date('now')) as YYYY-MM-DD."""
+    return time.strftime("%Y-%m-%d", time.gmtime(time.time() - days_ago * 86400))
+
+
+def _percentile(sorted_samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    index = min(len(sorted_samples) - 1, max(0, int(round(q * len(sorted_samples))) - 1))
+    return sorted_samples[index]
+
+
+def _add_counts(daily: Dict[Tuple[str, str], List[int]], day_key: Tuple[str, str], counts):
+    totals = daily.setdefault(day_key, [0, 0, 0, 0])
+    for i, n in enumerate(counts):
+        totals[i] += n
+
+
 # ------------------------------------------------------------------
 # Module-level singleton
 # ------------------------------------------------------------------
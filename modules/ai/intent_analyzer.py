@@ -6,17 +6,26 @@
 取代舊版 dialog_analysis.py 的多步驟分析流程。
 """
 
+import asyncio
 import json
-import re
 import logging
+import os
+import re
+import threading
+from collections import OrderedDict
 from datetime import datetime
-from typing import Optional
+from typing import Optional, Tuple
 
-from google import genai
 from google.genai import types
 
+from modules.ai import gemini_client
 from modules.ai.gemini_pool import gemini_pool
-from modules.sqlite_cache_manager import get_ai_cache, set_ai_cache
+from modules.executors import get_executor
+from modules.singleflight import (
+    async_singleflight, normalize_location, singleflight, strip_location_prefix,
+)
+from modules.stages import STAGE_TIMEOUTS
+from modules.tiered_cache import get_ai_cache, set_ai_cache
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +49,41 @@ FOOD_PATTERNS = {
     "素食": ["素食", "蔬食", "素"],
 }
 
+# 快取正規化：地點別名（正規化後的寫法 → 標準名稱）
+_LOCATION_ALIASES = {
+    "台北101": "101",
+    "101大樓": "101",
+    "台北101大樓": "101",
+    "北車": "台北車站",
+    "台北火車站": "台北車站",
+    "北火": "台北車站",
+    "西門": "西門町",
+    "京站": "台北京站",
+}
+# 單次掃描、長詞優先；標準名稱本身也列入，避免「台北車站」中的「北車」被再次替換
+_ALIAS_RE = re.compile("|".join(
+    re.escape(name)
+    for name in sorted(set(_LOCATION_ALIASES) | set(_LOCATION_ALIASES.values()), key=len, reverse=True)
+))
+
+# 不影響意圖的贅詞（長詞在前，先行移除）
+_FILLER_PHRASES = (
+    "可以推薦", "請推薦", "推薦一下", "幫我找", "幫我", "請問",
+    "我想要吃", "我想吃", "想要吃", "我想要", "我想", "想吃", "要吃", "我要",
+    "附近的", "附近", "周邊", "一帶", "有沒有", "有什麼", "哪裡有", "哪裡",
+    "我在", "推薦", "好吃的", "好吃", "一下", "還有",
+)
+# 不列入單字贅詞（和、的、吧…）：會把「和牛」「酒吧」這類詞拆壞
+
+# 數字與否定詞改變意圖（「300元」與「200元」、「不要太辣」與「要太辣」），
+# 相似查詢只在這些詞完全相同的候選之間比較
+_EXACT_TOKEN_RE = re.compile(r"[0-9０-９]+|[不別沒無].")
+
+_PUNCTUATION_RE = re.compile(r"[\W_]+")
+
+# 正規化鍵值未命中時，以其餘文字的 bigram 相似度找近似查詢（0 表示停用）
+INTENT_SIMILARITY_THRESHOLD = float(os.environ.get("INTENT_SIMILARITY_THRESHOLD", "0.6"))
+
 # 時段預設關鍵字
 _TIME_BASED_KEYWORDS = {
     "morning":  ["早餐", "蛋餅", "三明治"],
@@ -127,11 +171,38 @@ def _build_user_message(
     return "\n".join(parts)
 
 
-def _build_cache_key(user_input: str, weather_data: Optional[dict], current_hour: int) -> str:
+def _canonical_query(user_input: str) -> Tuple[str, Tuple[str, ...], str]:
     """
-    產生用於快取的複合鍵值。
-    天氣與時段會影響分析結果，因此納入鍵值。
+    將使用者輸入正規化為 (地點, 食物詞, 其餘文字)。
+
+    「我在101想吃拉麵」與「101附近 拉麵」都會得到 ("101", ("拉麵",), "")：
+    地點套用別名表，食物詞取 FOOD_PATTERNS 中最長的匹配（「拉麵」吸收「麵」）
+    並排序，其餘文字去除贅詞與標點。
     """
+    text = normalize_location(user_input)
+    text = _ALIAS_RE.sub(lambda m: _LOCATION_ALIASES.get(m.group(0), m.group(0)), text)
+
+    raw_location = _extract_location(text) or ""
+    location = _strip_fillers(raw_location) or raw_location
+    rest = text.replace(raw_location, " ") if raw_location else text
+
+    matched = {pat for patterns in FOOD_PATTERNS.values() for pat in patterns if pat in rest}
+    foods = sorted(pat for pat in matched if not any(pat != other and pat in other for other in matched))
+    for food in sorted(foods, key=len, reverse=True):
+        rest = rest.replace(food, " ")
+
+    residual = _PUNCTUATION_RE.sub("", _strip_fillers(rest))
+    return location, tuple(foods), residual
+
+
+def _strip_fillers(text: str) -> str:
+    for phrase in _FILLER_PHRASES:
+        text = text.replace(phrase, " ")
+    return "".join(text.split())
+
+
+def _context_signature(weather_data: Optional[dict], current_hour: int) -> str:
+    """時段與量化後的天氣；同一查詢在不同情境下結果不同，因此納入鍵值。"""
     period = _get_time_period(current_hour)
     weather_sig = ""
     if weather_data:
@@ -144,36 +215,179 @@ def _build_cache_key(user_input: str, weather_data: Optional[dict], current_hour
         si_bucket = si if si is not None else "x"
         rain_bucket = round(rain / 10) * 10 if rain is not None else "x"
         weather_sig = f"|t{temp_bucket}|si{si_bucket}|r{rain_bucket}"
-    return f"{user_input}|{period}{weather_sig}"
+    return f"{period}{weather_sig}"
+
+
+def _build_cache_key(user_input: str, weather_data: Optional[dict], current_hour: int) -> str:
+    """
+    產生用於快取的複合鍵值：正規化查詢 + 時段 + 天氣。
+    近似的說法（贅詞、地點別名、食物詞順序不同）會得到相同鍵值。
+    """
+    location, foods, residual = _canonical_query(user_input)
+    context = _context_signature(weather_data, current_hour)
+    return f"{location}|{'+'.join(foods)}|{residual}|{context}"
+
+
+def _exact_tokens(text: str) -> tuple:
+    return tuple(sorted(_EXACT_TOKEN_RE.findall(text)))
+
+
+def _bigrams(text: str) -> set:
+    return {text[i:i + 2] for i in range(len(text) - 1)} or ({text} if text else set())
+
+
+class _SimilarIntentIndex:
+    """
+    近期已快取意圖的記憶體索引，供正規化鍵值未命中時做相似查詢。
+
+    只在地點、食物詞、情境與數字 / 否定詞完全相同的候選中比較其餘文字的
+    bigram Jaccard 相似度，避免把不同地點、食物、預算或否定的查詢誤判為相同。
+    """
+
+    def __init__(self, max_groups: int = 512, per_group: int = 16):
+        self.max_groups = max_groups
+        self.per_group = per_group
+        self._lock = threading.Lock()
+        self._groups: "OrderedDict[tuple, OrderedDict[str, str]]" = OrderedDict()
+
+    def add(self, user_input: str, context: str, cache_key: str):
+        location, foods, residual = _canonical_query(user_input)
+        group_key = (location, foods, context, _exact_tokens(residual))
+        with self._lock:
+            group = self._groups.get(group_key)
+            if group is None:
+                group = self._groups[group_key] = OrderedDict()
+                if len(self._groups) > self.max_groups:
+                    self._groups.popitem(last=False)
+            else:
+                self._groups.move_to_end(group_key)
+            group[residual] = cache_key
+            group.move_to_end(residual)
+            if len(group) > self.per_group:
+                group.popitem(last=False)
+
+    def find(self, user_input: str, context: str, threshold: float) -> Optional[str]:
+        """回傳相似度最高且不低於 *threshold* 的快取鍵值。"""
+        location, foods, residual = _canonical_query(user_input)
+        with self._lock:
+            group = self._groups.get((location, foods, context, _exact_tokens(residual)))
+            candidates = list(group.items()) if group else []
+        target = _bigrams(residual)
+        best_key, best_score = None, threshold
+        for other, cache_key in candidates:
+            union = target | _bigrams(other)
+            score = len(target & _bigrams(other)) / len(union) if union else 1.0
+            if score >= best_score:
+                best_key, best_score = cache_key, score
+        return best_key
+
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+
+
+_similar_intents = _SimilarIntentIndex()
 
 
 # ---------------------------------------------------------------------------
 # Gemini API 呼叫（含自動重試）
 # ---------------------------------------------------------------------------
 
+_INTENT_MODEL = "gemini-2.5-flash"
+_INTENT_TIMEOUT_SECONDS = 15
+
 @gemini_pool.auto_retry
 def _call_gemini(user_message: str, *, api_key=None) -> str:
     """
     透過 gemini_pool 呼叫 Gemini API，回傳原始文字回應。
     使用 @gemini_pool.auto_retry 裝飾器處理暫時性失敗與 key 輪替。
     """
-    client = genai.Client(api_key=api_key, http_options={"timeout": 15})
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
+    response = gemini_client.generate_content(
+        api_key,
+        model=_INTENT_MODEL,
         contents=user_message,
-        config=types.GenerateContentConfig(
-            temperature=0.1,
-            response_mime_type="application/json",
-            system_instruction=_SYSTEM_PROMPT,
-        ),
+        config=_intent_config(),
+        timeout=_INTENT_TIMEOUT_SECONDS,
     )
     return response.text
 
 
+@gemini_pool.auto_retry(hedge=True)
+async def _call_gemini_async(user_message: str, *, api_key=None) -> str:
+    """
+    _call_gemini 的非同步版本：透過共用 client 的 aio 介面呼叫，不佔用執行緒。
+    逾時或被取消時會立即放棄 HTTP 請求。
+    位於 SSE 關鍵路徑上，因此啟用對沖：超過近期延遲百分位仍未回應時，
+    改用另一個 key 再發一次，先回來的勝出。
+    """
+    response = await gemini_client.agenerate_content(
+        api_key,
+        model=_INTENT_MODEL,
+        contents=user_message,
+        config=_intent_config(),
+        timeout=_INTENT_TIMEOUT_SECONDS,
+    )
+    return response.text
+
+
+def _intent_config() -> types.GenerateContentConfig:
+    return types.GenerateContentConfig(
+        temperature=0.1,
+        response_mime_type="application/json",
+        system_instruction=_SYSTEM_PROMPT,
+    )
+
+
 # ---------------------------------------------------------------------------
 # 備用分析（正則表達式）
 # ---------------------------------------------------------------------------
 
+_LOCATION_PATTERNS = [
+    r'([^\s，。！？]*(?:海生館|101|車站|機場|夜市|博物館|美術館|故宮|小巨蛋|威秀|京站|遠百|大學|醫院|高鐵|捷運|商場|百貨|科博館))',
+    r'([^\s，。！？]*(?:區|站|路|街|市|縣|鎮|鄉|村))',
+    r'(台北[\w]{1,8}|高雄[\w]{1,8}|台中[\w]{1,8}|台南[\w]{1,8}|屏東[\w]{1,8}|新竹[\w]{1,8}|桃園[\w]{1,8})',
+]
+
+
+def _extract_location(user_input: str) -> Optional[str]:
+    """以正則表達式擷取地點，找不到時回傳 None。"""
+    for pattern in _LOCATION_PATTERNS:
+        matches = re.findall(pattern, user_input)
+        if matches:
+            return matches[0]
+    return None
+
+
+def speculative_intent(user_input: str) -> Optional[dict]:
+    """
+    不呼叫 Gemini，以正則快速取得可先行搜尋的地點與食物關鍵字。
+
+    供 SSE 串流的推測性搜尋使用：只有同時偵測到地點與明確食物時才回傳，
+    否則回傳 None（時段預設關鍵字多半會被 Gemini 結果取代，不值得先搜）。
+    每個分類取最長的匹配字（「拉麵」優先於「麵」），較接近 Gemini 的關鍵字。
+    """
+    location = _extract_location(user_input)
+    if not location:
+        return None
+    location = strip_location_prefix(location)
+
+    keywords = []
+    for patterns in FOOD_PATTERNS.values():
+        matched = [pat for pat in patterns if pat in user_input]
+        if matched:
+            best = max(matched, key=len)
+            if best not in keywords:
+                keywords.append(best)
+    if not keywords:
+        return None
+
+    return {
+        "location": location,
+        "primary_keywords": keywords[:4],
+        "_source": "speculative",
+    }
+
+
 def _fallback_analysis(
     user_input: str,
     weather_data: Optional[dict],
@@ -185,17 +399,7 @@ def _fallback_analysis(
     logger.warning("使用備用正則分析 (Gemini 不可用)")
 
     # --- 地點提取 ---
-    location = None
-    location_patterns = [
-        r'([^\s，。！？]*(?:海生館|101|車站|機場|夜市|博物館|美術館|故宮|小巨蛋|威秀|京站|遠百|大學|醫院|高鐵|捷運|商場|百貨|科博館))',
-        r'([^\s，。！？]*(?:區|站|路|街|市|縣|鎮|鄉|村))',
-        r'(台北[\w]{1,8}|高雄[\w]{1,8}|台中[\w]{1,8}|台南[\w]{1,8}|屏東[\w]{1,8}|新竹[\w]{1,8}|桃園[\w]{1,8})',
-    ]
-    for pattern in location_patterns:
-        matches = re.findall(pattern, user_input)
-        if matches:
-            location = matches[0]
-            break
+    location = _extract_location(user_input)
 
     # --- 預算提取 ---
     budget = None
@@ -337,6 +541,18 @@ def _estimate_price_range(budget: Optional[dict], categories: list) -> str:
 # 主要公開函式
 # ---------------------------------------------------------------------------
 
+def _intent_flight_key(
+    user_input: str,
+    weather_data: Optional[dict] = None,
+    current_hour: Optional[int] = None,
+) -> str:
+    """同一快取鍵的並行請求合併為一次 Gemini 呼叫。"""
+    if current_hour is None:
+        current_hour = datetime.now().hour
+    return _build_cache_key(user_input, weather_data, current_hour)
+
+
+@singleflight("intent", key=_intent_flight_key, timeout=STAGE_TIMEOUTS["intent"])
 def analyze_intent(
     user_input: str,
     weather_data: Optional[dict] = None,
@@ -362,90 +578,179 @@ def analyze_intent(
     if current_hour is None:
         current_hour = datetime.now().hour
 
-    # --- 快取檢查 ---
     cache_key = _build_cache_key(user_input, weather_data, current_hour)
-    try:
-        cached = get_ai_cache(cache_key, analysis_type="intent")
-        if cached:
-            logger.info("意圖分析快取命中: '%s'", user_input[:40])
-            return cached
-    except Exception as e:
-        logger.warning("快取讀取失敗: %s", e)
+    cached = _get_cached_intent(cache_key, user_input, weather_data, current_hour)
+    if cached:
+        return cached
 
-    # --- Gemini 呼叫 ---
     try:
         user_message = _build_user_message(user_input, weather_data, current_hour)
         raw_response = _call_gemini(user_message)
+        return _finish_intent(raw_response, cache_key, user_input, weather_data, current_hour)
+    except json.JSONDecodeError as e:
+        logger.error("Gemini 回應 JSON 解析失敗: %s", e)
+    except Exception as e:
+        logger.error("Gemini 意圖分析失敗: %s", e)
+
+    return _fallback_and_cache(cache_key, user_input, weather_data, current_hour)
+
+
+@async_singleflight("intent_async", key=_intent_flight_key)
+async def analyze_intent_async(
+    user_input: str,
+    weather_data: Optional[dict] = None,
+    current_hour: Optional[int] = None,
+) -> dict:
+    """
+    analyze_intent 的非同步版本，供 SSE 串流直接 await。
+
+    Gemini 呼叫走共用 client 的 aio 介面，不佔用執行緒；
+    被取消時（例如階段逾時）會一併取消 HTTP 請求。
+    快取讀寫（SQLite）在 io 執行緒池執行，不阻塞事件迴圈。
+    """
+    if current_hour is None:
+        current_hour = datetime.now().hour
 
-        # 清理可能的 Markdown 包裹
-        cleaned = raw_response.strip()
-        if cleaned.startswith("```"):
-            # 移除 ```json ... ``` 包裹
-            cleaned = re.sub(r'^```(?:json)?\s*', '', cleaned)
-            cleaned = re.sub(r'\s*```$', '', cleaned)
-
-        parsed = json.loads(cleaned)
-
-        # 建構標準化輸出
-        primary_keywords = parsed.get("primary_keywords", [])[:4]
-        secondary_keywords = parsed.get("secondary_keywords", [])[:3]
-
-        # 去重：確保 secondary_keywords 不與 primary_keywords 重疊
-        primary_set = set(primary_keywords)
-        secondary_keywords = [kw for kw in secondary_keywords if kw not in primary_set]
-
-        # weather_hints: soft scoring signal only — never used as search keywords
-        weather_hints = parsed.get("weather_hints", []) or _weather_secondary_keywords(weather_data)
-
-        result = {
-            "success": True,
-            "location": parsed.get("location"),
-            "primary_keywords": primary_keywords,
-            "secondary_keywords": secondary_keywords,
-            "budget": parsed.get("budget"),
-            "estimated_price_range": parsed.get("estimated_price_range", "中等"),
-            "search_radius_hint": parsed.get("search_radius_hint", "中距離"),
-            "intent": parsed.get("intent", "search_restaurants"),
-            "weather_hints": weather_hints,
-            "raw_input": user_input,
-            "_source": "gemini",
-        }
-
-        # 確保 primary_keywords 至少有 2 個
-        if len(result["primary_keywords"]) < 2:
-            period = _get_time_period(current_hour)
-            fallback_kws = _TIME_BASED_KEYWORDS.get(period, ["便當", "小吃"])
-            for kw in fallback_kws:
-                if kw not in result["primary_keywords"]:
-                    result["primary_keywords"].append(kw)
-                if len(result["primary_keywords"]) >= 2:
-                    break
-
-        # --- 寫入快取 ---
-        try:
-            set_ai_cache(cache_key, result, analysis_type="intent")
-        except Exception as e:
-            logger.warning("快取寫入失敗: %s", e)
-
-        logger.info(
-            "意圖分析完成: intent=%s, location=%s, keywords=%s",
-            result["intent"],
-            result["location"],
-            result["primary_keywords"],
-        )
-        return result
+    cache_key = _build_cache_key(user_input, weather_data, current_hour)
+    cached = await _in_io_pool(_get_cached_intent, cache_key, user_input, weather_data, current_hour)
+    if cached:
+        return cached
 
+    try:
+        user_message = _build_user_message(user_input, weather_data, current_hour)
+        raw_response = await _call_gemini_async(user_message)
+        return await _in_io_pool(_finish_intent, raw_response, cache_key, user_input,
+                                 weather_data, current_hour)
     except json.JSONDecodeError as e:
         logger.error("Gemini 回應 JSON 解析失敗: %s", e)
     except Exception as e:
         logger.error("Gemini 意圖分析失敗: %s", e)
 
-    # --- 備用分析 ---
+    return await _in_io_pool(_fallback_and_cache, cache_key, user_input, weather_data, current_hour)
+
+
+async def _in_io_pool(func, *args):
+    """在共用 io 執行緒池執行會碰到快取的同步函式。"""
+    return await asyncio.get_running_loop().run_in_executor(get_executor("io"), func, *args)
+
+
+def _get_cached_intent(
+    cache_key: str,
+    user_input: str,
+    weather_data: Optional[dict],
+    current_hour: int,
+) -> Optional[dict]:
+    """
+    快取檢查：先以正規化鍵值查詢，未命中再找相似查詢。讀取失敗時視為未命中。
+    """
+    try:
+        cached = get_ai_cache(cache_key, analysis_type="intent")
+        match = "正規化"
+        if not cached and INTENT_SIMILARITY_THRESHOLD > 0:
+            context = _context_signature(weather_data, current_hour)
+            similar_key = _similar_intents.find(user_input, context, INTENT_SIMILARITY_THRESHOLD)
+            if similar_key and similar_key != cache_key:
+                cached = get_ai_cache(similar_key, analysis_type="intent")
+                match = "相似"
+        if cached:
+            logger.info("意圖分析快取命中（%s）: '%s'", match, user_input[:40])
+            # 快取可能來自不同說法的查詢，回報本次的原始輸入
+            return {**cached, "raw_input": user_input}
+    except Exception as e:
+        logger.warning("快取讀取失敗: %s", e)
+    return None
+
+
+def _store_intent(
+    cache_key: str,
+    result: dict,
+    user_input: str,
+    weather_data: Optional[dict],
+    current_hour: int,
+):
+    """寫入 SQLite 快取並登記到相似查詢索引。"""
+    set_ai_cache(cache_key, result, analysis_type="intent")
+    _similar_intents.add(user_input, _context_signature(weather_data, current_hour), cache_key)
+
+
+def _finish_intent(
+    raw_response: str,
+    cache_key: str,
+    user_input: str,
+    weather_data: Optional[dict],
+    current_hour: int,
+) -> dict:
+    """解析 Gemini 原始回應、標準化並寫入快取。JSON 無效時拋出 JSONDecodeError。"""
+    # 清理可能的 Markdown 包裹
+    cleaned = raw_response.strip()
+    if cleaned.startswith("```"):
+        # 移除 ```json ... ``` 包裹
+        cleaned = re.sub(r'^```(?:json)?\s*', '', cleaned)
+        cleaned = re.sub(r'\s*```$', '', cleaned)
+
+    parsed = json.loads(cleaned)
+
+    # 建構標準化輸出
+    primary_keywords = parsed.get("primary_keywords", [])[:4]
+    secondary_keywords = parsed.get("secondary_keywords", [])[:3]
+
+    # 去重：確保 secondary_keywords 不與 primary_keywords 重疊
+    primary_set = set(primary_keywords)
+    secondary_keywords = [kw for kw in secondary_keywords if kw not in primary_set]
+
+    # weather_hints: soft scoring signal only — never used as search keywords
+    weather_hints = parsed.get("weather_hints", []) or _weather_secondary_keywords(weather_data)
+
+    result = {
+        "success": True,
+        "location": parsed.get("location"),
+        "primary_keywords": primary_keywords,
+        "secondary_keywords": secondary_keywords,
+        "budget": parsed.get("budget"),
+        "estimated_price_range": parsed.get("estimated_price_range", "中等"),
+        "search_radius_hint": parsed.get("search_radius_hint", "中距離"),
+        "intent": parsed.get("intent", "search_restaurants"),
+        "weather_hints": weather_hints,
+        "raw_input": user_input,
+        "_source": "gemini",
+    }
+
+    # 確保 primary_keywords 至少有 2 個
+    if len(result["primary_keywords"]) < 2:
+        period = _get_time_period(current_hour)
+        fallback_kws = _TIME_BASED_KEYWORDS.get(period, ["便當", "小吃"])
+        for kw in fallback_kws:
+            if kw not in result["primary_keywords"]:
+                result["primary_keywords"].append(kw)
+            if len(result["primary_keywords"]) >= 2:
+                break
+
+    # --- 寫入快取 ---
+    try:
+        _store_intent(cache_key, result, user_input, weather_data, current_hour)
+    except Exception as e:
+        logger.warning("快取寫入失敗: %s", e)
+
+    logger.info(
+        "意圖分析完成: intent=%s, location=%s, keywords=%s",
+        result["intent"],
+        result["location"],
+        result["primary_keywords"],
+    )
+    return result
+
+
+def _fallback_and_cache(
+    cache_key: str,
+    user_input: str,
+    weather_data: Optional[dict],
+    current_hour: int,
+) -> dict:
+    """備用分析，並嘗試快取備用結果。"""
     fallback_result = _fallback_analysis(user_input, weather_data, current_hour)
 
-    # 嘗試快取備用結果
     try:
-        set_ai_cache(cache_key, fallback_result, analysis_type="intent")
+        _store_intent(cache_key, fallback_result, user_input, weather_data, current_hour)
     except Exception as e:
         logger.warning("備用結果快取寫入失敗: %s", e)
 
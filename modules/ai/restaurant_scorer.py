@@ -14,9 +14,9 @@ import math
 import re
 from typing import Any, Dict, List, Optional
 
-from google import genai
 from google.genai import types
 
+from modules.ai import gemini_client
 from modules.ai.gemini_pool import gemini_pool
 
 logger = logging.getLogger(__name__)
@@ -335,8 +335,8 @@ def _call_gemini_scoring(prompt: str, *, api_key: Optional[str] = None) -> Optio
     The api_key parameter is injected by the auto_retry decorator.
     Returns parsed JSON list or None on failure.
     """
-    client = genai.Client(api_key=api_key)
-    response = client.models.generate_content(
+    response = gemini_client.generate_content(
+        api_key,
         model=GEMINI_MODEL,
         contents=prompt,
         config=types.GenerateContentConfig(
@@ -0,0 +1,209 @@
+"""Serializers for cached payloads, tagged per row.
+
+``SQLiteCacheManager`` used to store ``data`` / ``metadata`` as
+``json.dumps(..., ensure_ascii=False)`` text.  CWA responses and restaurant
+lists are large and highly repetitive (the same field names, URL prefixes
+and opening-hours phrases on every item), so rows are now written with a
+compressing codec and the codec name is stored next to them.  Rows without
+a tag are plain JSON, so existing ``cache.db`` files stay readable.
+
+Available codecs:
+
+- ``json``            -- UTF-8 JSON text (legacy rows)
+- ``json-zlib``       -- compact JSON, zlib
+- ``json-zlib-d1``    -- compact JSON, zlib with the shared dictionary v1
+- ``json-zstd``       -- compact JSON, zstd (needs ``zstandard``)
+- ``msgpack``         -- MessagePack (needs ``msgpack``)
+- ``msgpack-zlib``    -- MessagePack, zlib (needs ``msgpack``)
+
+The shared dictionary primes zlib with substrings that occur in almost
+every payload, which matters most for small rows (one intent result, one
+weather observation) where plain zlib has nothing to back-reference.  A
+dictionary can never change once rows were written with it -- add
+``_ZDICT_V2`` and a ``json-zlib-d2`` codec instead.
+
+``benchmark_cache_codecs.py`` reports size and encode / decode time per
+codec for sample payloads or for the rows of an existing ``cache.db``.
+"""
+
+import json
+import logging
+import os
+import zlib
+from typing import Any, Callable, Dict, Union
+
+try:
+    import msgpack
+except ImportError:  # optional
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # optional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+Encoded = Union[str, bytes]
+
+DEFAULT_CODEC = os.environ.get("CACHE_CODEC", "json-zlib-d1")
+LEGACY_CODEC = "json"
+# Used for new rows when the configured codec cannot be (standard library only)
+FALLBACK_CODEC = "json-zlib-d1"
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# Shared zlib dictionary v1: frequent substrings of restaurant lists, CWA
+# observations and intent results (most frequent last -- zlib prefers
+# matches near the end of the dictionary).  Never edit; see module docstring.
+_ZDICT_V1 = "".join([
+    '"hours_status":"休息中 · 開始營業時間：',
+    '"hours_status":"營業中 · 打烊時間：',
+    '"rain_probability":{"probability":',
+    '"source":"中央氣象署"',
+    '"station_name":"',
+    '"data_time":"',
+    '"wind_speed":',
+    '"distance_km":',
+    '"is_real_data":true',
+    '"sweat_index":',
+    '"temperature":',
+    '"humidity":',
+    '"food_preferences":[',
+    '"budget":{"min":',
+    '"max":',
+    '"location":"',
+    '"intent":"search_food_type"',
+    '"confidence":',
+    '"keywords":[',
+    '"walking_distance":"',
+    '"walking_minutes":',
+    '"price_level":"$150-400"',
+    '"price_level":null',
+    '"open_now":true',
+    '"open_now":false',
+    '"rating":4.',
+    '"food_type":"',
+    '"source":"google_maps"',
+    '"maps_url":"https://www.google.com/maps/place/',
+    '"address":"',
+    '{"name":"',
+]).encode("utf-8")
+
+
+def _compact_json(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _zlib_compress(raw: bytes, zdict: bytes = None) -> bytes:
+    if zdict is None:
+        return zlib.compress(raw, ZLIB_LEVEL)
+    compressor = zlib.compressobj(ZLIB_LEVEL, zdict=zdict)
+    return compressor.compress(raw) + compressor.flush()
+
+
+def _zlib_decompress(blob: bytes, zdict: bytes = None) -> bytes:
+    if zdict is None:
+        return zlib.decompress(blob)
+    decompressor = zlib.decompressobj(zdict=zdict)
+    return decompressor.decompress(blob) + decompressor.flush()
+
+
+class Codec:
+    """A named ``encode`` / ``decode`` pair."""
+
+    def __init__(self, name: str, encode: Callable[[Any], Encoded], decode: Callable[[Encoded], Any]):
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+
+    def __repr__(self) -> str:
+        return f"Codec({self.name!r})"
+
+
+_CODECS: Dict[str, Codec] = {}
+
+
+def register_codec(codec: Codec):
+    _CODECS[codec.name] = codec
+
+
+def get_codec(name: str = None) -> Codec:
+    """Codec for *name* (``None`` / empty means a legacy untagged row).
+
+    Raises ``ValueError`` for unknown names or codecs whose optional
+    dependency is not installed.
+    """
+    codec = _CODECS.get(name or LEGACY_CODEC)
+    if codec is None:
+        raise ValueError(f"Unknown or unavailable cache codec: {name!r}")
+    return codec
+
+
+def write_codec(name: str = None) -> Codec:
+    """Codec for new rows: *name*, else ``DEFAULT_CODEC``.
+
+    Unlike ``get_codec`` this never raises: an unknown name or a codec whose
+    optional dependency is missing (e.g. ``CACHE_CODEC=json-zstd`` without
+    ``zstandard``) logs a warning and falls back to ``FALLBACK_CODEC``, so a
+    bad setting cannot stop the app from importing its cache.
+    """
+    name = name or DEFAULT_CODEC
+    try:
+        return get_codec(name)
+    except ValueError:
+        logger.warning("Cache codec %r is unknown or unavailable; writing %r instead", name, FALLBACK_CODEC)
+        return get_codec(FALLBACK_CODEC)
+
+
+def available_codecs() -> Dict[str, Codec]:
+    return dict(_CODECS)
+
+
+def decode(raw: Encoded, name: str = None) -> Any:
+    """Decode a stored value written with codec *name*."""
+    if isinstance(raw, memoryview):
+        raw = raw.tobytes()
+    return get_codec(name).decode(raw)
+
+
+# ---------------------------------------------------------------------------
+# Built-in codecs
+# ---------------------------------------------------------------------------
+
+register_codec(Codec(
+    "json",
+    lambda obj: json.dumps(obj, ensure_ascii=False),
+    lambda raw: json.loads(raw),
+))
+register_codec(Codec(
+    "json-zlib",
+    lambda obj: _zlib_compress(_compact_json(obj)),
+    lambda raw: json.loads(_zlib_decompress(raw)),
+))
+register_codec(Codec(
+    "json-zlib-d1",
+    lambda obj: _zlib_compress(_compact_json(obj), _ZDICT_V1),
+    lambda raw: json.loads(_zlib_decompress(raw, _ZDICT_V1)),
+))
+
+if zstandard is not None:
+    # zstd (de)compressor objects are not safe to share between threads
+    register_codec(Codec(
+        "json-zstd",
+        lambda obj: zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(_compact_json(obj)),
+        lambda raw: json.loads(zstandard.ZstdDecompressor().decompress(raw)),
+    ))
+
+if msgpack is not None:
+    register_codec(Codec(
+        "msgpack",
+        lambda obj: msgpack.packb(obj, use_bin_type=True),
+        lambda raw: msgpack.unpackb(raw, raw=False),
+    ))
+    register_codec(Codec(
+        "msgpack-zlib",
+        lambda obj: _zlib_compress(msgpack.packb(obj, use_bin_type=True)),
+        lambda raw: msgpack.unpackb(_zlib_decompress(raw), raw=False),
+    ))
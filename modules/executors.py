@@ -0,0 +1,60 @@
+"""Shared, bounded thread pools for blocking work.
+
+Created once at app startup (``start_executors``) instead of per request:
+
+- ``io``       -- HTTP / SQLite / Gemini calls (weather, geocode, AI)
+- ``selenium`` -- browser-bound scraping, sized to the browser pool
+
+``modules.pipeline`` runs its stages on them; lower layers that need to
+move blocking work off the event loop (e.g. the intent cache in
+``modules.ai.intent_analyzer``) use ``get_executor`` from here rather than
+importing the SSE pipeline.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+IO_WORKERS = int(os.environ.get("PIPELINE_IO_WORKERS", "16"))
+# Runs Google Maps searches only (Uber Eats uses the io executor). BrowserPool
+# holds 3 pre-warmed drivers; a 4th concurrent search waits up to 3 s for one,
+# then starts a temporary browser.
+SELENIUM_WORKERS = int(os.environ.get("PIPELINE_SELENIUM_WORKERS", "4"))
+
+_executors: Dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def start_executors(io_workers: int = IO_WORKERS, selenium_workers: int = SELENIUM_WORKERS):
+    """Create the shared thread pools. Called once from the app startup hook."""
+    with _executors_lock:
+        if not _executors:
+            _executors["io"] = ThreadPoolExecutor(
+                max_workers=io_workers, thread_name_prefix="pipeline-io",
+            )
+            _executors["selenium"] = ThreadPoolExecutor(
+                max_workers=selenium_workers, thread_name_prefix="pipeline-selenium",
+            )
+            logger.info(
+                "Pipeline executors started (io=%d, selenium=%d)",
+                io_workers, selenium_workers,
+            )
+
+
+def shutdown_executors():
+    """Shut down the shared thread pools without waiting for stuck workers."""
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
+
+
+def get_executor(name: str = "io") -> ThreadPoolExecutor:
+    """Return a shared executor, starting the pools lazily (e.g. in tests)."""
+    if name not in _executors:
+        start_executors()
+    return _executors[name]
@@ -7,12 +7,24 @@ Target: < 8 seconds for the entire search pipeline.
 import json
 import logging
 import re
+import threading
 import time
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import quote
 
+from modules.geo.geocode_store import geocode_store
+from modules.geo.geomath import haversine_many, to_list, walking_estimate
+from modules.geo.parallel_geocoder import geocode_queries
+from modules.singleflight import normalize_location, singleflight
+from modules.stages import STAGE_TIMEOUTS
+from modules.tiered_cache import tiered_cache
+
 logger = logging.getLogger(__name__)
 
+# Own namespace: google_maps.set_restaurant_cache writes "restaurant" entries
+# keyed by the raw user address, in the same tuple shape
+MAPS_CACHE_NAMESPACE = "maps_search"
+
 
 def _extract_coords_from_maps_url(url: str) -> Optional[tuple]:
     """Extract (lat, lng) from a Google Maps place URL like /@25.061,121.433,17z/."""
@@ -27,6 +39,21 @@ def _extract_coords_from_maps_url(url: str) -> Optional[tuple]:
     return None
 
 
+def _geocode_user_location(user_location: str) -> Optional[tuple]:
+    """ArcGIS query variants for a free-text user location, run concurrently;
+    the earliest variant that resolves wins.  ArcGIS failures raise
+    ``GeocodeUnavailable`` instead of returning ``None``, so they are not
+    stored as "not found"."""
+    variants = [
+        user_location,
+        user_location + " 台灣",
+        user_location.replace("科大", "科技大學") + " 台灣",
+        user_location + " Taiwan",
+    ]
+    hit = geocode_queries(variants, provider="arcgis", scores=[-i for i in range(len(variants))])
+    return hit.coords if hit else None
+
+
 def calculate_real_distances(
     restaurants: List[Dict],
     user_location: str,
@@ -34,34 +61,21 @@ def calculate_real_distances(
 ) -> List[Dict]:
     """Calculate real distances.
 
-    Priority for user location:  frontend GPS coords > ArcGIS geocoding
-    Priority for restaurant location:  Maps URL coords > ArcGIS geocoding
+    Priority for user location:  frontend GPS coords > geocode store > ArcGIS geocoding
+    Priority for restaurant location:  Maps URL coords > geocode store > ArcGIS geocoding
+    Distances:  one vectorized haversine pass (modules.geo.geomath)
     Walking estimate:  straight-line * 1.3 (Taiwan urban alley factor)
     """
     try:
-        from geopy.distance import geodesic
-
         # --- Resolve user coordinates ---
         if user_coords:
             logger.info("User coords from GPS: (%.5f, %.5f)", *user_coords)
         else:
-            # Fallback: geocode user location text
+            # Fallback: geocode user location text (geocode store first)
             try:
-                from geopy.geocoders import ArcGIS
-                geolocator = ArcGIS(timeout=5)
-                user_geo = None
-                for variant in [
-                    user_location,
-                    user_location + " 台灣",
-                    user_location.replace("科大", "科技大學") + " 台灣",
-                    user_location + " Taiwan",
-                ]:
-                    user_geo = geolocator.geocode(variant)
-                    if user_geo:
-                        break
-                if user_geo:
-                    user_coords = (user_geo.latitude, user_geo.longitude)
-                    logger.info("User coords from ArcGIS: %s -> (%.5f, %.5f)", user_location, *user_coords)
+                user_coords = geocode_store.resolve(user_location, _geocode_user_location, source="arcgis")
+                if user_coords:
+                    logger.info("User coords: %s -> (%.5f, %.5f)", user_location, *user_coords)
                 else:
                     logger.warning("Cannot geocode user location: %s", user_location)
                     return restaurants
@@ -69,73 +83,98 @@ def calculate_real_distances(
                 logger.warning("User geocoding failed: %s", e)
                 return restaurants
 
-        # --- Calculate distance for each restaurant ---
-        geolocator = None  # lazy init only if needed
-
-        for r in restaurants:
-            # Priority 1: extract coords from Google Maps URL
+        # --- Resolve restaurant coordinates ---
+        # Priority 1: extract coords from Google Maps URL
+        coords_by_index: Dict[int, tuple] = {}
+        addr_by_index: Dict[int, str] = {}
+        for i, r in enumerate(restaurants):
             rest_coords = _extract_coords_from_maps_url(r.get("maps_url", ""))
-
-            # Priority 2: fallback to ArcGIS geocoding
-            if not rest_coords:
-                addr = r.get("address", "")
-                if not addr or addr.endswith("附近"):
-                    addr = r.get("name", "") + " " + user_location + " 台灣"
-                elif not re.search(r'[市縣區鎮鄉]', addr):
-                    addr = addr + " " + user_location + " 台灣"
-
-                try:
-                    if geolocator is None:
-                        from geopy.geocoders import ArcGIS
-                        geolocator = ArcGIS(timeout=5)
-                    rest_geo = geolocator.geocode(addr)
-                    if rest_geo:
-                        candidate = (rest_geo.latitude, rest_geo.longitude)
-                        # Sanity: must be within 50km of user (reject geocoding errors)
-                        if geodesic(user_coords, candidate).kilometers < 50:
-                            rest_coords = candidate
-                        else:
-                            logger.warning("  ArcGIS result too far for %s: %.1fkm", r.get("name"), geodesic(user_coords, candidate).kilometers)
-                except Exception as e:
-                    logger.warning("  Geocode error for %s: %s", r.get("name"), e)
-
-            if not rest_coords:
+            if rest_coords:
+                coords_by_index[i] = rest_coords
+                continue
+            addr = r.get("address", "")
+            if not addr or addr.endswith("附近"):
+                addr = r.get("name", "") + " " + user_location + " 台灣"
+            elif not re.search(r'[市縣區鎮鄉]', addr):
+                addr = addr + " " + user_location + " 台灣"
+            addr_by_index[i] = addr
+
+        # Priority 2: one batch through the geocode store; misses are
+        # geocoded concurrently, so this takes as long as the slowest lookup
+        if addr_by_index:
+            try:
+                found = geocode_store.resolve_many(addr_by_index.values(), provider="arcgis")
+            except Exception as e:
+                logger.warning("  Batch geocoding failed: %s", e)
+                found = {}
+            for i, addr in addr_by_index.items():
+                if found.get(addr):
+                    coords_by_index[i] = found[addr]
+
+        # --- Calculate all distances in one vectorized pass ---
+        indices = sorted(coords_by_index)
+        distances = haversine_many(user_coords, [coords_by_index[i] for i in indices])
+        for i, dist_km in zip(indices, to_list(distances)):
+            r = restaurants[i]
+
+            # Sanity: geocoded results must be within 50km of user (reject geocoding errors)
+            if i in addr_by_index and dist_km >= 50:
+                logger.warning("  ArcGIS result too far for %s: %.1fkm", r.get("name"), dist_km)
                 continue
-
-            dist_km = geodesic(user_coords, rest_coords).kilometers
 
             # Skip if distance < 20m (geocode probably hit the same point)
             if dist_km < 0.02:
                 continue
 
-            walking_km = dist_km * 1.3  # Urban walking factor for Taiwan alleys
-            walking_minutes = max(1, round(walking_km / 4 * 60))  # 4km/h walking speed
-
+            walking = walking_estimate(dist_km)
             r["distance_km"] = round(dist_km, 2)
-            r["walking_distance"] = f"{round(walking_km * 1000)}m" if walking_km < 1 else f"{walking_km:.1f}km"
-            r["walking_minutes"] = walking_minutes
-            r["_coords"] = rest_coords  # keep for debugging
+            r["walking_distance"] = walking["walking_distance"]
+            r["walking_minutes"] = walking["walking_minutes"]
+            r["_coords"] = coords_by_index[i]  # keep for debugging
 
-    except ImportError:
-        logger.warning("geopy not available")
     except Exception as e:
         logger.warning("Distance calculation failed: %s", e)
 
     return restaurants
 
 
+@singleflight(
+    "maps",
+    key=lambda keyword, location, max_results=5, cancelled=None: (
+        normalize_location(location), keyword.strip(), max_results,
+    ),
+    # Speculative and confirmed searches share one scrape; it stops only
+    # once every caller sharing it has cancelled
+    cancel="cancelled",
+    timeout=STAGE_TIMEOUTS["maps"],
+)
 def search_restaurants_fast(
     keyword: str,
     location: str,
     max_results: int = 5,
+    cancelled: Optional[threading.Event] = None,
 ) -> List[Dict[str, Any]]:
     """Search Google Maps for real restaurants using a shared Selenium browser.
 
     Uses a single pre-warmed Chrome instance for speed.
     Target: < 5 seconds per keyword search.
+
+    Setting *cancelled* stops the scrape at the next checkpoint (before
+    the browser is taken, before the page load, during the render wait
+    and between results) and returns ``[]`` -- once every concurrent
+    caller of the same search has set its event.
     """
     restaurants = []
 
+    def abandoned() -> bool:
+        if cancelled is not None and cancelled.is_set():
+            logger.info("Maps search cancelled: '%s' in '%s'", keyword, location)
+            return True
+        return False
+
+    if abandoned():
+        return []
+
     try:
         from modules.scraper.browser_pool import browser_pool
         from selenium.webdriver.common.by import By
@@ -147,6 +186,8 @@ def search_restaurants_fast(
         maps_url = f"https://www.google.com/maps/search/{encoded}"
 
         with browser_pool.get_browser() as driver:
+            if abandoned():
+                return []
             driver.set_page_load_timeout(8)
 
             try:
@@ -154,7 +195,13 @@ def search_restaurants_fast(
             except Exception:
                 pass  # Timeout is OK, we parse what loaded
 
-            time.sleep(3)  # Wait for results to render
+            # Wait for results to render
+            if cancelled is not None:
+                cancelled.wait(3)
+            else:
+                time.sleep(3)
+            if abandoned():
+                return []
 
             # Parse restaurant results from Google Maps
             # Google Maps results are in divs with role="feed" > div elements
@@ -168,6 +215,8 @@ def search_restaurants_fast(
                         'a[href*="/maps/place/"]')
 
                 for div in results_divs[:max_results]:
+                    if abandoned():
+                        return []
                     try:
                         href = div.get_attribute('href') or ''
                         aria_label = div.get_attribute('aria-label') or ''
@@ -271,6 +320,29 @@ def search_restaurants_fast(
     return restaurants
 
 
+def search_restaurants_cached(
+    keyword: str,
+    location: str,
+    max_results: int = 5,
+    cancelled: Optional[threading.Event] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """``search_restaurants_fast`` behind the ``maps_search`` cache, stale-while-revalidate.
+
+    Returns ``(restaurants, stale)``.  An entry past its TTL is returned at
+    once with ``stale=True`` while the scrape re-runs in the background;
+    only a cold miss waits on Selenium.  Empty results are not cached.
+
+    *cancelled* only applies to the cold-miss scrape; background refreshes
+    of stale entries always run to completion.
+    """
+    key = (keyword.strip(), normalize_location(location), max_results)
+    return tiered_cache.get_or_refresh(
+        MAPS_CACHE_NAMESPACE, key,
+        lambda: search_restaurants_fast(keyword, location, max_results, cancelled=cancelled),
+        refresh_loader=lambda: search_restaurants_fast(keyword, location, max_results),
+    )
+
+
 def enrich_with_gemini(
     restaurants: List[Dict],
     user_input: str,
@@ -282,8 +354,8 @@ def enrich_with_gemini(
     """Use Gemini to enrich restaurant results with ratings, prices, and reasons.
     Also add any additional recommendations Gemini knows about.
     """
+    from modules.ai import gemini_client
     from modules.ai.gemini_pool import gemini_pool
-    from google import genai
     from google.genai import types
 
     api_key = gemini_pool.get_key()
@@ -342,8 +414,8 @@ def enrich_with_gemini(
 - 只有辦公室、公園等非食物場所才設 "remove": true，餐廳一律保留"""
 
     try:
-        client = genai.Client(api_key=api_key)
-        resp = client.models.generate_content(
+        resp = gemini_client.generate_content(
+            api_key,
             model="gemini-2.5-flash",
             contents=prompt,
             config=types.GenerateContentConfig(
@@ -0,0 +1,384 @@
+"""
+Prefetched CWA township forecasts (F-D0047-xxx), indexed in memory.
+
+``weather.get_township_weather_data`` used to download a whole city
+forecast document, scan ``Location`` linearly for one town and throw the
+rest away; ``get_rain_probability_for_location`` repeated that for every
+request.  ``ForecastStore`` keeps every city document parsed instead:
+
+- each document becomes ``{town: TownForecast}``; a town holds its first
+  temperature / humidity values, and its temperature, humidity, wind and
+  3-hour PoP series as sorted times plus the midpoints between
+  neighbouring points, so "the slot nearest to now" is a single
+  ``bisect`` (``modules.sweat_timeline`` reads the full series)
+- towns and cities are keyed with 臺/台 folded, so ``台東縣`` and
+  ``臺東縣`` hit the same document
+- ``start_prefetch()`` runs a daemon thread that refreshes every city
+  document on a schedule (``CWA_FORECAST_REFRESH_SECONDS``, default 1800);
+  a city that is requested before it was prefetched, or whose document
+  is older than ``max_age_seconds``, is loaded on demand once (concurrent
+  callers wait for that one download)
+- a failed refresh keeps the previous document; after a failed
+  on-demand load the city is not retried on demand for
+  ``CWA_FORECAST_RETRY_SECONDS`` (default 60), so an API outage costs one
+  download attempt per city per minute instead of one per request
+
+Usage::
+
+    forecast_store.start_prefetch()
+    forecast = forecast_store.get_town("台北市", "中正區")
+    forecast["pop"]   # "30", nearest 3-hour slot to now
+"""
+
+import bisect
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+
+from modules.station_index import parse_reading
+
+logger = logging.getLogger(__name__)
+
+FORECAST_URL = "https://opendata.cwa.gov.tw/api/v1/rest/datastore/F-D0047-{code}"
+FORECAST_REFRESH_SECONDS = float(os.environ.get("CWA_FORECAST_REFRESH_SECONDS", "1800"))
+FORECAST_MAX_AGE_SECONDS = float(os.environ.get("CWA_FORECAST_MAX_AGE_SECONDS", "10800"))
+# Pause between city downloads during a prefetch round (be polite to the API)
+FORECAST_PREFETCH_SPACING = float(os.environ.get("CWA_FORECAST_PREFETCH_SPACING", "0.5"))
+# Minimum pause before a failed city is loaded on demand again
+FORECAST_RETRY_SECONDS = float(os.environ.get("CWA_FORECAST_RETRY_SECONDS", "60"))
+
+TAIPEI_TZ = timezone(timedelta(hours=8))
+
+# TODO: 將縣市代碼對應表改用資料庫存儲 (如 SQLite)
+# 建議資料表：city_weather_codes (city_name, api_code, region, active_status)
+# 優點：支援動態更新、區域分組、啟用狀態管理等
+CITY_FORECAST_CODES = {
+    "宜蘭縣": "001", "桃園市": "005", "新竹縣": "009", "苗栗縣": "013", "彰化縣": "017",
+    "南投縣": "021", "雲林縣": "025", "嘉義縣": "029", "屏東縣": "033", "台東縣": "037",
+    "花蓮縣": "041", "澎湖縣": "045", "基隆市": "049", "新竹市": "053", "嘉義市": "057",
+    "台北市": "061", "高雄市": "065", "新北市": "069", "台中市": "073", "台南市": "077",
+    "連江縣": "081", "金門縣": "085",
+}
+
+
+def fold_name(name: Optional[str]) -> str:
+    """City / town name with 臺 folded to 台, as used for the index keys."""
+    return (name or "").strip().replace("臺", "台")
+
+
+def city_code(city_name: Optional[str]) -> Optional[str]:
+    """F-D0047 dataset code of *city_name* (臺/台 either way), or ``None``."""
+    return CITY_FORECAST_CODES.get(fold_name(city_name))
+
+
+def _first_value(elements: Dict, element_name: str, key: str):
+    times = elements.get(element_name, {}).get('Time', [])
+    if not times:
+        return 'N/A'
+    return times[0].get('ElementValue', [{}])[0].get(key, 'N/A')
+
+
+def _timestamp(entry: Dict) -> Optional[float]:
+    """Epoch seconds of a forecast entry (``DataTime`` or ``StartTime``)."""
+    try:
+        return datetime.fromisoformat(entry.get('DataTime') or entry.get('StartTime', '')).timestamp()
+    except (ValueError, TypeError):
+        return None
+
+
+class _Series:
+    """Time-sorted forecast values with nearest-time lookup."""
+
+    __slots__ = ("times", "values", "_boundaries")
+
+    def __init__(self, points: List[tuple]):
+        points = sorted(points, key=lambda p: p[0])
+        self.times = [t for t, _value in points]
+        self.values = [value for _t, value in points]
+        # Point i is the nearest for times in [boundaries[i-1], boundaries[i])
+        self._boundaries = [(a + b) / 2 for a, b in zip(self.times, self.times[1:])]
+
+    @classmethod
+    def from_element(cls, elements: Dict, element_name: str, key: str, convert=None) -> "_Series":
+        points = []
+        for entry in elements.get(element_name, {}).get('Time', []):
+            when = _timestamp(entry)
+            if when is None:
+                continue
+            value = entry.get('ElementValue', [{}])[0].get(key, 'N/A')
+            points.append((when, convert(value) if convert else value))
+        return cls(points)
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    def nearest_index(self, when: float) -> int:
+        return bisect.bisect_right(self._boundaries, when)
+
+    def at(self, when: float, default=None):
+        """Value of the point nearest to *when*, or *default* when empty."""
+        return self.values[self.nearest_index(when)] if self.values else default
+
+    def during(self, when: float, default=None):
+        """Value of the last point starting at or before *when* (the first if none)."""
+        if not self.values:
+            return default
+        return self.values[max(0, bisect.bisect_right(self.times, when) - 1)]
+
+
+def _reading(value) -> float:
+    number = parse_reading(value)
+    return math.nan if number is None else number
+
+
+class TownForecast:
+    """One town's forecast series, ready for nearest-time lookups."""
+
+    __slots__ = ("name", "temperature", "humidity", "pop", "temperatures", "humidities", "winds")
+
+    def __init__(self, name: str, temperature, humidity, pop: _Series,
+                 temperatures: Optional[_Series] = None, humidities: Optional[_Series] = None,
+                 winds: Optional[_Series] = None):
+        self.name = name
+        # First values as published (strings), for the point-in-time lookup
+        self.temperature = temperature
+        self.humidity = humidity
+        self.pop = pop
+        # Full numeric series (NaN for missing readings), for timelines
+        self.temperatures = temperatures or _Series([])
+        self.humidities = humidities or _Series([])
+        self.winds = winds or _Series([])
+
+    @classmethod
+    def from_location(cls, loc: Dict) -> "TownForecast":
+        elements = {e.get('ElementName'): e for e in loc.get('WeatherElement', [])}
+        return cls(
+            loc.get('LocationName', ''),
+            _first_value(elements, '溫度', 'Temperature'),
+            _first_value(elements, '相對濕度', 'RelativeHumidity'),
+            _Series.from_element(elements, '3小時降雨機率', 'ProbabilityOfPrecipitation'),
+            _Series.from_element(elements, '溫度', 'Temperature', _reading),
+            _Series.from_element(elements, '相對濕度', 'RelativeHumidity', _reading),
+            _Series.from_element(elements, '風速', 'WindSpeed', _reading),
+        )
+
+    def pop_at(self, when: Optional[float] = None):
+        """PoP of the slot whose start time is nearest to *when* (epoch seconds)."""
+        return self.pop.at(time.time() if when is None else when, 'N/A')
+
+    def pop_during(self, when: float):
+        """PoP of the 3-hour slot that contains *when*."""
+        return self.pop.during(when, 'N/A')
+
+    def slot_times(self, start: float, hours: float) -> List[float]:
+        """Temperature time steps from the one nearest *start* through ``start + hours``."""
+        if not len(self.temperatures):
+            return []
+        end = start + hours * 3600
+        first = self.temperatures.nearest_index(start)
+        return [t for t in self.temperatures.times[first:] if t <= end]
+
+    def as_dict(self, when: Optional[float] = None) -> Dict:
+        return {
+            'locationName': self.name,
+            'temperature': self.temperature,
+            'humidity': self.humidity,
+            'pop': self.pop_at(when),
+        }
+
+
+def parse_city_document(data: Dict) -> Dict[str, TownForecast]:
+    """``{folded town name: TownForecast}`` of one F-D0047 document."""
+    locations = data.get('records', {}).get('Locations', [{}])[0].get('Location', [])
+    towns = {}
+    for loc in locations:
+        forecast = TownForecast.from_location(loc)
+        towns[fold_name(forecast.name)] = forecast
+    return towns
+
+
+def fetch_city_document(code: str, api_key: Optional[str] = None, timeout: float = 15) -> Dict:
+    """Download one F-D0047 city forecast document."""
+    import requests
+
+    api_key = api_key or os.getenv("CWB_API_KEY")
+    if not api_key:
+        raise ValueError("中央氣象署 API 金鑰未設置")
+    response = requests.get(FORECAST_URL.format(code=code),
+                            params={'Authorization': api_key, 'format': 'JSON'},
+                            timeout=timeout, verify=False)
+    response.raise_for_status()
+    return response.json()
+
+
+class ForecastStore:
+    """Parsed township forecasts for every city, refreshed in the background."""
+
+    def __init__(self, fetch: Callable[[str], Dict] = fetch_city_document,
+                 refresh_seconds: float = FORECAST_REFRESH_SECONDS,
+                 max_age_seconds: float = FORECAST_MAX_AGE_SECONDS,
+                 prefetch_spacing: float = FORECAST_PREFETCH_SPACING,
+                 retry_seconds: float = FORECAST_RETRY_SECONDS):
+        self._fetch = fetch
+        self.refresh_seconds = refresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.prefetch_spacing = prefetch_spacing
+        self.retry_seconds = retry_seconds
+        # city -> (fetched_at, {town: TownForecast})
+        self._cities: Dict[str, tuple] = {}
+        # city -> time of the last failed download
+        self._failed_at: Dict[str, float] = {}
+        self._city_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"hits": 0, "on_demand_loads": 0, "prefetched": 0,
+                       "failures": 0, "unknown_towns": 0, "retries_skipped": 0}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _city_lock(self, city: str) -> threading.Lock:
+        with self._lock:
+            return self._city_locks.setdefault(city, threading.Lock())
+
+    def _age(self, city: str) -> Optional[float]:
+        entry = self._cities.get(city)
+        return time.time() - entry[0] if entry else None
+
+    def _fresh_or_backing_off(self, city: str) -> bool:
+        """True if *city* needs no on-demand load: fresh, or failed too recently."""
+        age = self._age(city)
+        if age is not None and age < self.max_age_seconds:
+            return True
+        failed_at = self._failed_at.get(city)
+        if failed_at is not None and time.time() - failed_at < self.retry_seconds:
+            self._count("retries_skipped")
+            return True
+        return False
+
+    # -- loading ---------------------------------------------------------------
+
+    def refresh_city(self, city_name: str) -> bool:
+        """Download and index one city; ``False`` (old document kept) on failure."""
+        city = fold_name(city_name)
+        code = city_code(city)
+        if code is None:
+            return False
+        try:
+            towns = parse_city_document(self._fetch(code))
+        except Exception as e:
+            self._failed_at[city] = time.time()
+            self._count("failures")
+            logger.warning("Township forecast refresh failed for %s: %s", city, e)
+            return False
+        self._cities[city] = (time.time(), towns)
+        self._failed_at.pop(city, None)
+        return True
+
+    def refresh_all(self, cities: Optional[Iterable[str]] = None) -> int:
+        """Refresh *cities* (default: all); returns how many succeeded."""
+        loaded = 0
+        for i, city in enumerate(cities or CITY_FORECAST_CODES):
+            if self._stop.is_set():
+                break
+            if i and self.prefetch_spacing:
+                self._stop.wait(self.prefetch_spacing)
+            with self._city_lock(fold_name(city)):
+                loaded += self.refresh_city(city)
+        self._count("prefetched", loaded)
+        return loaded
+
+    def _ensure_city(self, city: str):
+        if self._fresh_or_backing_off(city):
+            return
+        with self._city_lock(city):
+            if self._fresh_or_backing_off(city):
+                return
+            if self.refresh_city(city):
+                self._count("on_demand_loads")
+
+    # -- lookups ---------------------------------------------------------------
+
+    def get_forecast(self, city_name: str, town_name: str) -> Optional[TownForecast]:
+        """The town's parsed forecast, or ``None``.
+
+        ``None`` means the city is unknown, its document could not be
+        loaded, or it has no such town.
+        """
+        city = fold_name(city_name)
+        if city_code(city) is None:
+            return None
+        self._ensure_city(city)
+        entry = self._cities.get(city)
+        if entry is None:
+            return None
+        forecast = entry[1].get(fold_name(town_name))
+        if forecast is None:
+            self._count("unknown_towns")
+            return None
+        self._count("hits")
+        return forecast
+
+    def get_town(self, city_name: str, town_name: str, when: Optional[float] = None) -> Optional[Dict]:
+        """``{'locationName', 'temperature', 'humidity', 'pop'}`` or ``None`` (see ``get_forecast``)."""
+        forecast = self.get_forecast(city_name, town_name)
+        return forecast.as_dict(when) if forecast is not None else None
+
+    def towns(self, city_name: str) -> List[str]:
+        """Town names of a city document (loaded on demand)."""
+        city = fold_name(city_name)
+        if city_code(city) is None:
+            return []
+        self._ensure_city(city)
+        entry = self._cities.get(city)
+        return [f.name for f in entry[1].values()] if entry else []
+
+    # -- background prefetch ---------------------------------------------------
+
+    def start_prefetch(self, cities: Optional[Iterable[str]] = None) -> bool:
+        """Start the refresh thread (idempotent); ``False`` if already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._stop.clear()
+            city_list = list(cities) if cities else None
+
+            def run():
+                while not self._stop.is_set():
+                    started = time.time()
+                    loaded = self.refresh_all(city_list)
+                    logger.info("Township forecasts refreshed: %d cities in %.1fs",
+                                loaded, time.time() - started)
+                    self._stop.wait(self.refresh_seconds)
+
+            self._thread = threading.Thread(target=run, name="cwa-forecast-prefetch", daemon=True)
+            self._thread.start()
+            return True
+
+    def stop_prefetch(self, timeout: Optional[float] = None):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            running = self._thread is not None and self._thread.is_alive()
+        ages = [time.time() - fetched_at for fetched_at, _towns in self._cities.values()]
+        stats["cities_loaded"] = len(ages)
+        stats["oldest_age_seconds"] = round(max(ages), 1) if ages else None
+        stats["prefetch_running"] = running
+        return stats
+
+
+# ------------------------------------------------------------------
+# Module-level singleton
+# ------------------------------------------------------------------
+forecast_store = ForecastStore()
@@ -15,10 +15,11 @@ import logging
 import urllib.parse
 import concurrent.futures
 
-from geopy.distance import geodesic
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 
+from modules.geo.geomath import distance_km
+
 # Lazy imports to avoid circular dependency with scraper modules
 # from modules.scraper.browser_pool import create_chrome_driver  # imported in functions
 # from modules.scraper.selectors import WALKING_TAB_SELECTORS  # imported in functions
@@ -39,7 +40,7 @@ def calculate_distance(user_coords: Tuple[float, float], restaurant_coords: Tupl
     :return: distance in km (rounded to 2 dp), or None on error
     """
     try:
-        distance = geodesic(user_coords, restaurant_coords).kilometers
+        distance = distance_km(user_coords, restaurant_coords, exact=True)
         return round(distance, 2)
     except Exception:
         return None
@@ -0,0 +1,229 @@
+"""
+Persistent geocode store shared by every geocoding call site.
+
+``calculate_real_distances``, the SSE Uber Eats geocode, ``geocode_address``
+and ``sweat_index.get_location_coordinates`` each used to call ArcGIS /
+Nominatim live, often walking several query variants in sequence, and none
+of them shared results.  They now go through ``geocode_store``:
+
+- queries are keyed on a normalized address (whitespace, 臺/台, case,
+  punctuation and a trailing "台灣" / "Taiwan" are folded)
+- a precomputed in-memory index seeded from ``TAIWAN_LANDMARKS`` and
+  ``CITY_CENTERS`` answers known places with a dict lookup
+- everything else lives in the ``geocode`` namespace of the tiered cache
+  (process LRU + SQLite), so repeated office locations resolve from memory
+  and survive restarts
+- negative results ("no provider found this") are recorded too, with a
+  shorter TTL, so a hopeless query is not retried on every request
+- lookups are counted per outcome (``get_stats``)
+- ``resolve_many`` answers a whole batch (one address per restaurant):
+  store hits first, then the misses fanned out concurrently
+
+Usage::
+
+    coords = geocode_store.resolve(location, lambda q: _arcgis(q))
+"""
+
+import logging
+import re
+import threading
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from modules.geo.landmarks import CITY_CENTERS, TAIWAN_LANDMARKS
+from modules.singleflight import normalize_location
+from modules.tiered_cache import TieredCache, tiered_cache
+
+logger = logging.getLogger(__name__)
+
+NAMESPACE = "geocode"
+# Negative results expire quickly: a provider hiccup must not hide a place for long
+NEGATIVE_TTL_MINUTES = 60
+
+_PUNCTUATION_RE = re.compile(r"[,，、。.．]+")
+_COUNTRY_SUFFIXES = ("台灣", "taiwan")
+
+Coords = Tuple[float, float]
+
+
+def normalize_address(text: Optional[str]) -> str:
+    """Cache key form of a free-text address or place name."""
+    key = _PUNCTUATION_RE.sub("", normalize_location(text))
+    for suffix in _COUNTRY_SUFFIXES:
+        if key.endswith(suffix) and len(key) > len(suffix):
+            key = key[: -len(suffix)]
+    return key
+
+
+def coords_of(entry: Optional[Dict]) -> Optional[Coords]:
+    """``(lat, lng)`` of a positive entry; ``None`` for a negative or missing one."""
+    if not entry or entry.get("not_found"):
+        return None
+    return (entry["lat"], entry["lng"])
+
+
+class GeocodeStore:
+    """Seeded landmark index in front of the persistent ``geocode`` cache."""
+
+    def __init__(self, cache: Optional[TieredCache] = None,
+                 negative_ttl_minutes: float = NEGATIVE_TTL_MINUTES):
+        self._cache = cache if cache is not None else tiered_cache
+        self.negative_ttl_minutes = negative_ttl_minutes
+        # normalized key -> entry, for exact lookups
+        self._seeds: Dict[str, Dict] = {}
+        # normalized landmark name -> entry, for substring matching
+        self._landmarks: Dict[str, Dict] = {}
+        self._landmark_re: Optional[re.Pattern] = None
+        self._stats = {
+            "seed_hits": 0, "cache_hits": 0, "negative_hits": 0, "misses": 0,
+            "stored": 0, "stored_negative": 0,
+        }
+        self._lock = threading.Lock()
+
+    # -- seeding ---------------------------------------------------------------
+
+    def seed(self, table: Dict[str, Tuple[float, float, str]], source: str,
+             landmarks: bool = True):
+        """Add ``{name: (lat, lng, display_name)}`` to the in-memory index.
+
+        With ``landmarks=True`` the names are also matched inside longer
+        text by ``match_landmark``.
+        """
+        with self._lock:
+            for name, (lat, lng, display_name) in table.items():
+                key = normalize_address(name)
+                entry = {"lat": lat, "lng": lng, "display_name": display_name, "source": source}
+                self._seeds[key] = entry
+                if landmarks:
+                    self._landmarks[key] = entry
+            names = sorted(self._landmarks, key=len, reverse=True)
+            self._landmark_re = re.compile("|".join(map(re.escape, names))) if names else None
+
+    def match_landmark(self, text: str) -> Optional[Dict]:
+        """Seeded landmark named inside *text*, or whose name contains *text*."""
+        key = normalize_address(text)
+        if not key or self._landmark_re is None:
+            return None
+        match = self._landmark_re.search(key)
+        if match:
+            entry = self._landmarks[match.group(0)]
+        else:
+            entry = next((e for name, e in self._landmarks.items() if key in name), None)
+        if entry is not None:
+            self._count("seed_hits")
+            return dict(entry)
+        return None
+
+    # -- lookups ---------------------------------------------------------------
+
+    def lookup(self, query: str) -> Optional[Dict]:
+        """Known result for *query*.
+
+        ``{"lat", "lng", "display_name", "source"}`` for a positive result,
+        ``{"not_found": True}`` for a recorded negative one, ``None`` when the
+        query was never resolved (or its entry expired).
+        """
+        key = normalize_address(query)
+        if not key:
+            return None
+        seed = self._seeds.get(key)
+        if seed is not None:
+            self._count("seed_hits")
+            return dict(seed)
+        entry = self._cache.get(NAMESPACE, (key,))
+        if entry is None:
+            self._count("misses")
+        elif entry.get("not_found"):
+            self._count("negative_hits")
+        else:
+            self._count("cache_hits")
+        return entry
+
+    def store(self, query: str, coords: Optional[Coords],
+              display_name: Optional[str] = None, source: str = "geocoder"):
+        """Record a positive result, or a negative one when *coords* is ``None``."""
+        key = normalize_address(query)
+        if not key:
+            return
+        if coords is None:
+            self._cache.set(NAMESPACE, (key,), {"not_found": True},
+                            ttl_minutes=self.negative_ttl_minutes)
+            self._count("stored_negative")
+            return
+        self._cache.set(NAMESPACE, (key,), {
+            "lat": coords[0], "lng": coords[1],
+            "display_name": display_name or query, "source": source,
+        })
+        self._count("stored")
+
+    def resolve(self, query: str, geocode: Callable[[str], Optional[Coords]],
+                source: str = "geocoder") -> Optional[Coords]:
+        """Coordinates for *query*, calling *geocode* only on a store miss.
+
+        The result (including "not found") is stored; exceptions raised by
+        *geocode* propagate and are not recorded.
+        """
+        entry = self.lookup(query)
+        if entry is not None:
+            return coords_of(entry)
+        coords = geocode(query)
+        self.store(query, coords, source=source)
+        return coords
+
+    def resolve_many(self, queries: Iterable[str], provider: str = "arcgis",
+                     deadline: Optional[float] = None) -> Dict[str, Optional[Coords]]:
+        """Coordinates for many independent queries at once.
+
+        Queries are deduplicated on their normalized form and answered from
+        the store first; the misses are geocoded concurrently under
+        *provider*'s rate limit (``parallel_geocoder.geocode_many``) and
+        stored.  Returns ``{query: coords or None}`` for every input query;
+        queries whose lookup failed or timed out map to ``None`` without
+        being recorded.
+        """
+        from modules.geo.parallel_geocoder import GEOCODE_DEADLINE, geocode_many
+
+        by_key: Dict[str, str] = {}
+        for query in queries:
+            key = normalize_address(query)
+            if key and key not in by_key:
+                by_key[key] = query
+
+        resolved: Dict[str, Optional[Coords]] = {}
+        misses = []
+        for key, query in by_key.items():
+            entry = self.lookup(query)
+            if entry is None:
+                misses.append(query)
+            else:
+                resolved[key] = coords_of(entry)
+
+        if misses:
+            found = geocode_many(misses, provider=provider,
+                                 deadline=GEOCODE_DEADLINE if deadline is None else deadline)
+            for query, coords in found.items():
+                self.store(query, coords, source=provider)
+                resolved[normalize_address(query)] = coords
+
+        return {query: resolved.get(normalize_address(query)) for query in queries}
+
+    # -- stats -----------------------------------------------------------------
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["seeded"] = len(self._seeds)
+        lookups = stats["seed_hits"] + stats["cache_hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((lookups - stats["misses"]) / lookups, 3) if lookups else None
+        return stats
+
+
+# ------------------------------------------------------------------
+# Module-level singleton
+# ------------------------------------------------------------------
+geocode_store = GeocodeStore()
+geocode_store.seed(TAIWAN_LANDMARKS, source="landmark")
+geocode_store.seed(CITY_CENTERS, source="city", landmarks=False)
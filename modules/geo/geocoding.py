@@ -40,6 +40,12 @@ USER_AGENTS = [
 
 # CSS selectors used in extract_address_from_maps_url
 from modules.scraper.selectors import MAPS_PAGE_ADDRESS_SELECTORS
+from modules.geo.geocode_store import geocode_store
+from modules.geo.parallel_geocoder import (
+    FULL_ADDRESS_SCORE, GeocodeUnavailable, geocode_queries, in_taiwan,
+)
+from modules.singleflight import normalize_location, singleflight
+from modules.stages import STAGE_TIMEOUTS
 
 # ---------------------------------------------------------------------------
 # Helper: requests Session
@@ -374,170 +380,173 @@ def geocode_address_with_options(address: str, search_location: Optional[str] =
         return {'type': 'error', 'message': f'\u7121\u6cd5\u627e\u5230\u5730\u5740: {address}'}
 
 
+@singleflight(
+    "geocode_address",
+    key=lambda address, search_location=None: (
+        normalize_location(address), normalize_location(search_location),
+    ),
+    timeout=STAGE_TIMEOUTS["geocode"],
+)
 def geocode_address(address: str, search_location: Optional[str] = None) -> Optional[Tuple[float, float]]:
     """
-    Convert an address string to (lat, lng) coordinates using Nominatim.
+    Convert an address string to (lat, lng) coordinates.
 
-    Implements a multi-query strategy with scoring to find the best match.
+    Known landmarks and previously resolved addresses (including ones no
+    query could find) are answered by ``geocode_store``; everything else
+    goes through the Nominatim multi-query strategy and is stored.
     """
     if not address or len(address.strip()) < 3:
         return None
 
+    query = f"{address} @ {search_location}" if search_location else address
+    try:
+        return geocode_store.resolve(
+            query, lambda _q: _geocode_address_nominatim(address, search_location), source="nominatim",
+        )
+    except Exception as e:
+        # Not stored: the next request retries instead of hitting a cached "not found"
+        logger.error(f"Geocoding service error: {e}")
+        return None
+
+
+def _geocode_address_nominatim(address: str, search_location: Optional[str] = None) -> Optional[Tuple[float, float]]:
+    """
+    Nominatim lookup for geocode_address.
+
+    Implements a multi-query strategy with scoring to find the best match.
+    Returns ``None`` only when the queries found nothing; service errors
+    propagate so ``geocode_store`` does not record them as "not found".
+    """
     completed_address = smart_address_completion(address, search_location)
     logger.info(f"Address completion: {address} -> {completed_address}")
 
     normalized_address = normalize_taiwan_address(completed_address)
     logger.info(f"Normalised address: {completed_address} -> {normalized_address}")
 
-    try:
-        geolocator = Nominatim(user_agent="lunch-recommendation-system", timeout=10)
-
-        search_queries: list[str] = []
-
-        has_city_or_county = any(city in address for city in ['\u5e02', '\u7e23'])
-        district_to_city_map = {
-            '\u4e2d\u6b63\u5340': '\u53f0\u5317\u5e02', '\u5927\u540c\u5340': '\u53f0\u5317\u5e02',
-            '\u4e2d\u5c71\u5340': '\u53f0\u5317\u5e02', '\u677e\u5c71\u5340': '\u53f0\u5317\u5e02',
-            '\u5927\u5b89\u5340': '\u53f0\u5317\u5e02', '\u842c\u83ef\u5340': '\u53f0\u5317\u5e02',
-            '\u4fe1\u7fa9\u5340': '\u53f0\u5317\u5e02', '\u58eb\u6797\u5340': '\u53f0\u5317\u5e02',
-            '\u5317\u6295\u5340': '\u53f0\u5317\u5e02', '\u5167\u6e56\u5340': '\u53f0\u5317\u5e02',
-            '\u5357\u6e2f\u5340': '\u53f0\u5317\u5e02', '\u6587\u5c71\u5340': '\u53f0\u5317\u5e02',
-            '\u677f\u6a4b\u5340': '\u65b0\u5317\u5e02', '\u65b0\u838a\u5340': '\u65b0\u5317\u5e02',
-            '\u4e2d\u548c\u5340': '\u65b0\u5317\u5e02', '\u6c38\u548c\u5340': '\u65b0\u5317\u5e02',
-            '\u4e09\u91cd\u5340': '\u65b0\u5317\u5e02', '\u8606\u6d32\u5340': '\u65b0\u5317\u5e02',
-            '\u6c50\u6b62\u5340': '\u65b0\u5317\u5e02', '\u65b0\u5e97\u5340': '\u65b0\u5317\u5e02',
-            '\u571f\u57ce\u5340': '\u65b0\u5317\u5e02', '\u9daf\u6b4c\u5340': '\u65b0\u5317\u5e02',
-            '\u4e09\u5cfd\u5340': '\u65b0\u5317\u5e02', '\u6cf0\u5c71\u5340': '\u65b0\u5317\u5e02',
-            '\u6797\u53e3\u5340': '\u65b0\u5317\u5e02', '\u6de1\u6c34\u5340': '\u65b0\u5317\u5e02',
-            '\u4e94\u80a1\u5340': '\u65b0\u5317\u5e02', '\u516b\u91cc\u5340': '\u65b0\u5317\u5e02',
-        }
-        mapped_city_prefix = None
-        if not has_city_or_county:
-            for district, city in district_to_city_map.items():
-                if district in normalized_address or district in completed_address or district in address:
-                    mapped_city_prefix = city
-                    break
-
-        if mapped_city_prefix:
-            search_queries.extend([
-                f"{mapped_city_prefix}{normalized_address}, Taiwan",
-                f"{mapped_city_prefix}{normalized_address}",
-                f"{mapped_city_prefix}{completed_address}, Taiwan",
-                f"{mapped_city_prefix}{completed_address}",
-            ])
+    search_queries: list[str] = []
+
+    has_city_or_county = any(city in address for city in ['\u5e02', '\u7e23'])
+    district_to_city_map = {
+        '\u4e2d\u6b63\u5340': '\u53f0\u5317\u5e02', '\u5927\u540c\u5340': '\u53f0\u5317\u5e02',
+        '\u4e2d\u5c71\u5340': '\u53f0\u5317\u5e02', '\u677e\u5c71\u5340': '\u53f0\u5317\u5e02',
+        '\u5927\u5b89\u5340': '\u53f0\u5317\u5e02', '\u842c\u83ef\u5340': '\u53f0\u5317\u5e02',
+        '\u4fe1\u7fa9\u5340': '\u53f0\u5317\u5e02', '\u58eb\u6797\u5340': '\u53f0\u5317\u5e02',
+        '\u5317\u6295\u5340': '\u53f0\u5317\u5e02', '\u5167\u6e56\u5340': '\u53f0\u5317\u5e02',
+        '\u5357\u6e2f\u5340': '\u53f0\u5317\u5e02', '\u6587\u5c71\u5340': '\u53f0\u5317\u5e02',
+        '\u677f\u6a4b\u5340': '\u65b0\u5317\u5e02', '\u65b0\u838a\u5340': '\u65b0\u5317\u5e02',
+        '\u4e2d\u548c\u5340': '\u65b0\u5317\u5e02', '\u6c38\u548c\u5340': '\u65b0\u5317\u5e02',
+        '\u4e09\u91cd\u5340': '\u65b0\u5317\u5e02', '\u8606\u6d32\u5340': '\u65b0\u5317\u5e02',
+        '\u6c50\u6b62\u5340': '\u65b0\u5317\u5e02', '\u65b0\u5e97\u5340': '\u65b0\u5317\u5e02',
+        '\u571f\u57ce\u5340': '\u65b0\u5317\u5e02', '\u9daf\u6b4c\u5340': '\u65b0\u5317\u5e02',
+        '\u4e09\u5cfd\u5340': '\u65b0\u5317\u5e02', '\u6cf0\u5c71\u5340': '\u65b0\u5317\u5e02',
+        '\u6797\u53e3\u5340': '\u65b0\u5317\u5e02', '\u6de1\u6c34\u5340': '\u65b0\u5317\u5e02',
+        '\u4e94\u80a1\u5340': '\u65b0\u5317\u5e02', '\u516b\u91cc\u5340': '\u65b0\u5317\u5e02',
+    }
+    mapped_city_prefix = None
+    if not has_city_or_county:
+        for district, city in district_to_city_map.items():
+            if district in normalized_address or district in completed_address or district in address:
+                mapped_city_prefix = city
+                break
 
+    if mapped_city_prefix:
         search_queries.extend([
-            normalized_address + ", Taiwan",
-            normalized_address,
-            completed_address + ", Taiwan",
-            completed_address,
-            address + ", Taiwan",
-            address,
+            f"{mapped_city_prefix}{normalized_address}, Taiwan",
+            f"{mapped_city_prefix}{normalized_address}",
+            f"{mapped_city_prefix}{completed_address}, Taiwan",
+            f"{mapped_city_prefix}{completed_address}",
         ])
 
-        # MRT station handling
-        if address.endswith('\u7ad9') and not any(kw in address for kw in ['\u5e02', '\u7e23', '\u8def', '\u8857']):
-            mrt_queries = [
-                f"\u53f0\u5317\u6377\u904b{address}, Taiwan",
-                f"\u6377\u904b{address}, Taiwan",
-                f"\u53f0\u5317\u6377\u904b{address}",
-                f"\u6377\u904b{address}",
-            ]
-            search_queries = mrt_queries + search_queries
-            logger.debug(f"Detected possible MRT station, added MRT queries: {address}")
-
-        # Address with road name but no city -> prepend Taipei
-        if not any(city in address for city in ['\u5e02', '\u7e23']) and any(road in address for road in ['\u8def', '\u8857', '\u5927\u9053']):
-            search_queries.insert(0, f"\u53f0\u5317\u5e02{address}, Taiwan")
-            search_queries.insert(1, f"\u53f0\u5317\u5e02{address}")
-
-        logger.debug(f"Full query list: {search_queries}")
+    search_queries.extend([
+        normalized_address + ", Taiwan",
+        normalized_address,
+        completed_address + ", Taiwan",
+        completed_address,
+        address + ", Taiwan",
+        address,
+    ])
 
-        best_result = None
-        best_query_score = 0
-        best_query = ""
+    # MRT station handling
+    if address.endswith('\u7ad9') and not any(kw in address for kw in ['\u5e02', '\u7e23', '\u8def', '\u8857']):
+        mrt_queries = [
+            f"\u53f0\u5317\u6377\u904b{address}, Taiwan",
+            f"\u6377\u904b{address}, Taiwan",
+            f"\u53f0\u5317\u6377\u904b{address}",
+            f"\u6377\u904b{address}",
+        ]
+        search_queries = mrt_queries + search_queries
+        logger.debug(f"Detected possible MRT station, added MRT queries: {address}")
 
-        for i, query in enumerate(search_queries):
-            try:
-                logger.debug(f"Trying query: {query}")
-                location = geolocator.geocode(query, limit=1)
-                if location and location.latitude and location.longitude:
-                    if 21.0 <= location.latitude <= 26.0 and 119.0 <= location.longitude <= 122.5:
-                        query_score = 100 - i
-                        if '\u5df7' in query and '\u865f' in query:
-                            query_score += 50
-                        elif '\u5df7' in query or '\u865f' in query:
-                            query_score += 25
-                        elif '\u6bb5' in query:
-                            query_score += 10
-
-                        if best_result is None or query_score > best_query_score:
-                            best_result = (location.latitude, location.longitude)
-                            best_query_score = query_score
-                            best_query = query
-
-                        if '\u5df7' in query and '\u865f' in query:
-                            logger.info(f"Found full-address result: {query} -> ({location.latitude:.4f}, {location.longitude:.4f})")
-                            return (location.latitude, location.longitude)
+    # Address with road name but no city -> prepend Taipei
+    if not any(city in address for city in ['\u5e02', '\u7e23']) and any(road in address for road in ['\u8def', '\u8857', '\u5927\u9053']):
+        search_queries.insert(0, f"\u53f0\u5317\u5e02{address}, Taiwan")
+        search_queries.insert(1, f"\u53f0\u5317\u5e02{address}")
 
-            except Exception as e:
-                logger.debug(f"Query failed: {query} - {e}")
-                continue
+    logger.debug(f"Full query list: {search_queries}")
 
-        if best_result:
-            logger.info(f"Geocoding succeeded: {best_query} -> ({best_result[0]:.4f}, {best_result[1]:.4f})")
-            return best_result
-
-        # Fallback: progressively simplify the address
-        if '\u5df7' in address or '\u865f' in address:
-            logger.warning(f"Full address query failed, trying Taiwan address simplification: {address}")
-            fallback_strategies: list[str] = []
-
-            if '\u865f' in address:
-                addr_without_number = re.sub(r'\d+\u865f.*$', '', address)
-                if addr_without_number != address:
-                    fallback_strategies.extend([f"{addr_without_number}, Taiwan", addr_without_number])
-
-            if '\u5f04' in address:
-                addr_without_alley = re.sub(r'\d+\u5f04.*$', '', address)
-                if addr_without_alley != address:
-                    fallback_strategies.extend([f"{addr_without_alley}, Taiwan", addr_without_alley])
-
-            if '\u5df7' in address:
-                addr_to_lane = re.sub(r'(\d+\u5df7).*$', r'\1', address)
-                if addr_to_lane != address:
-                    fallback_strategies.extend([f"{addr_to_lane}, Taiwan", addr_to_lane])
-
-            road_match = re.search(
-                r'([^\u5e02\u7e23\u5340\u9109\u93ae]*[\u8def\u8857\u5927\u9053](?:\u4e00|\u4e8c|\u4e09|\u56db|\u4e94|\u516d|\u4e03|\u516b|\u4e5d|\d+)*\u6bb5?)',
-                address,
-            )
-            if road_match:
-                main_road = road_match.group(1).strip()
-                fallback_strategies.extend([
-                    f"\u53f0\u5317\u5e02{main_road}, Taiwan",
-                    f"{main_road}, Taiwan",
-                    main_road,
-                ])
-
-            for i, query in enumerate(fallback_strategies):
-                try:
-                    logger.debug(f"Taiwan address simplification attempt {i + 1}: {query}")
-                    location = geolocator.geocode(query, limit=1)
-                    if location and 21.0 <= location.latitude <= 26.0 and 119.0 <= location.longitude <= 122.5:
-                        if '\u5df7' in query:
-                            logger.info(f"Lane-level simplification succeeded: {query} -> ({location.latitude:.4f}, {location.longitude:.4f})")
-                        elif '\u6bb5' in query:
-                            logger.warning(f"[WARNING] Section-level simplification succeeded: {query}")
-                        else:
-                            logger.warning(f"[WARNING] Road-level simplification succeeded: {query}")
-                        return (location.latitude, location.longitude)
-                except Exception:
-                    continue
+    # All variants run concurrently; a full-address hit ends the search.
+    # If some variants failed, the simplifications below still get a try,
+    # but without a hit the outage is raised rather than reported as "not found".
+    unavailable: Optional[GeocodeUnavailable] = None
+    try:
+        hit = geocode_queries(
+            search_queries, provider="nominatim",
+            accept_score=FULL_ADDRESS_SCORE, validate=in_taiwan,
+        )
+    except GeocodeUnavailable as e:
+        unavailable, hit = e, None
+    if hit:
+        logger.info(f"Geocoding succeeded: {hit.query} -> ({hit.coords[0]:.4f}, {hit.coords[1]:.4f})")
+        return hit.coords
+
+    # Fallback: progressively simplify the address
+    if '\u5df7' in address or '\u865f' in address:
+        logger.warning(f"Full address query failed, trying Taiwan address simplification: {address}")
+        fallback_strategies: list[str] = []
+
+        if '\u865f' in address:
+            addr_without_number = re.sub(r'\d+\u865f.*$', '', address)
+            if addr_without_number != address:
+                fallback_strategies.extend([f"{addr_without_number}, Taiwan", addr_without_number])
+
+        if '\u5f04' in address:
+            addr_without_alley = re.sub(r'\d+\u5f04.*$', '', address)
+            if addr_without_alley != address:
+                fallback_strategies.extend([f"{addr_without_alley}, Taiwan", addr_without_alley])
+
+        if '\u5df7' in address:
+            addr_to_lane = re.sub(r'(\d+\u5df7).*$', r'\1', address)
+            if addr_to_lane != address:
+                fallback_strategies.extend([f"{addr_to_lane}, Taiwan", addr_to_lane])
+
+        road_match = re.search(
+            r'([^\u5e02\u7e23\u5340\u9109\u93ae]*[\u8def\u8857\u5927\u9053](?:\u4e00|\u4e8c|\u4e09|\u56db|\u4e94|\u516d|\u4e03|\u516b|\u4e5d|\d+)*\u6bb5?)',
+            address,
+        )
+        if road_match:
+            main_road = road_match.group(1).strip()
+            fallback_strategies.extend([
+                f"\u53f0\u5317\u5e02{main_road}, Taiwan",
+                f"{main_road}, Taiwan",
+                main_road,
+            ])
 
-    except Exception as e:
-        logger.error(f"Geocoding service error: {e}")
+        # Earlier (more specific) simplifications win
+        hit = geocode_queries(
+            fallback_strategies, provider="nominatim",
+            scores=[-i for i in range(len(fallback_strategies))], validate=in_taiwan,
+        )
+        if hit:
+            if '\u5df7' in hit.query:
+                logger.info(f"Lane-level simplification succeeded: {hit.query} -> ({hit.coords[0]:.4f}, {hit.coords[1]:.4f})")
+            elif '\u6bb5' in hit.query:
+                logger.warning(f"[WARNING] Section-level simplification succeeded: {hit.query}")
+            else:
+                logger.warning(f"[WARNING] Road-level simplification succeeded: {hit.query}")
+            return hit.coords
 
+    if unavailable is not None:
+        raise unavailable
     logger.warning(f"Address resolution failed: {address}")
     return None
 
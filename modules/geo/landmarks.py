@@ -0,0 +1,100 @@
+"""
+Hard-coded Taiwan landmark and city-centre coordinates.
+
+Used by ``sweat_index.get_location_coordinates`` for landmark matching and
+as the seed of the geocode store (``modules.geo.geocode_store``), so common
+office / tourist locations resolve without a network call.
+
+Values are ``(lat, lng, display_name)``.
+"""
+
+from typing import Dict, Tuple
+
+# TODO: 將硬編碼的台灣地點座標庫改用資料庫存儲 (如 SQLite)
+# 應包含：地點名稱、緯度、經度、顯示名稱、類型(景點/車站/夜市等)、更新時間等欄位
+# 可考慮支援地點別名、多語言名稱等功能，並定期從API更新座標資料
+TAIWAN_LANDMARKS: Dict[str, Tuple[float, float, str]] = {
+    # 原有測試地點
+    "台北101": (25.0340, 121.5645, "台北101"),
+    "台北市敦化南路二段77號": (25.0271, 121.5493, "台北市敦化南路二段77號"),
+    "新北市泰山區貴子路2號": (25.0597, 121.4313, "新北市泰山區貴子路2號"),
+    "900屏東縣屏東市青島街106號": (22.6690, 120.4818, "屏東縣屏東市青島街106號"),
+    "六十石山": (23.3081, 121.2833, "六十石山"),
+
+    # 車站機場
+    "台北車站": (25.0478, 121.5170, "台北車站"),
+    "高雄車站": (22.6391, 120.3022, "高雄車站"),
+    "台中車站": (24.1369, 120.6856, "台中車站"),
+    "台南車站": (22.9969, 120.2127, "台南車站"),
+    "桃園機場": (25.0777, 121.2328, "桃園國際機場"),
+    "高雄機場": (22.5771, 120.3498, "高雄國際機場"),
+
+    # 自然景點
+    "阿里山": (23.5112, 120.8128, "阿里山"),
+    "日月潭": (23.8569, 120.9150, "日月潭"),
+    "太魯閣": (24.1580, 121.4906, "太魯閣國家公園"),
+    "墾丁": (22.0072, 120.7473, "墾丁"),
+    "九份": (25.1095, 121.8439, "九份老街"),
+    "淡水": (25.1677, 121.4408, "淡水老街"),
+
+    # 都市地標
+    "西門町": (25.0421, 121.5066, "西門町"),
+    "信義區": (25.0336, 121.5645, "台北市信義區"),
+    "彰化大佛": (24.0838, 120.5397, "彰化大佛"),
+
+    # 新增常見地點（基於測試結果）
+    "中正紀念堂": (25.0346, 121.5218, "中正紀念堂"),
+    "士林夜市": (25.0883, 121.5251, "士林夜市"),
+    "愛河": (22.6516, 120.2998, "愛河"),
+    "逢甲夜市": (24.1774, 120.6466, "逢甲夜市"),
+    "安平古堡": (23.0016, 120.1606, "安平古堡"),
+    "清水斷崖": (24.2101, 121.6781, "清水斷崖"),
+    "野柳地質公園": (25.2113, 121.6964, "野柳地質公園"),
+    "鹿港老街": (24.0571, 120.4321, "鹿港老街"),
+    "溪頭森林遊樂區": (23.6667, 120.7833, "溪頭森林遊樂區"),
+    "金城武樹": (23.0974, 121.2044, "金城武樹"),
+
+    # 其他夜市
+    "饒河夜市": (25.0516, 121.5771, "饒河夜市"),
+    "華西街夜市": (25.0371, 121.5010, "華西街夜市"),
+    "南機場夜市": (25.0297, 121.5069, "南機場夜市"),
+    "寧夏夜市": (25.0565, 121.5158, "寧夏夜市"),
+    "六合夜市": (22.6318, 120.3014, "六合夜市"),
+    "瑞豐夜市": (22.6589, 120.3116, "瑞豐夜市"),
+    "一中街": (24.1465, 120.6845, "一中街"),
+    "花園夜市": (22.9928, 120.2269, "花園夜市"),
+
+    # 知名景點
+    "故宮博物院": (25.1013, 121.5481, "故宮博物院"),
+    "龍山寺": (25.0368, 121.4999, "龍山寺"),
+    "總統府": (25.0404, 121.5090, "總統府"),
+    "國父紀念館": (25.0403, 121.5603, "國父紀念館"),
+    "中山紀念林": (25.0735, 121.5200, "中山紀念林"),
+    "陽明山": (25.1561, 121.5284, "陽明山"),
+    "貓空": (24.9738, 121.5766, "貓空"),
+    "烏來": (24.8638, 121.5496, "烏來"),
+    "平溪": (25.0261, 121.7428, "平溪"),
+    "十分瀑布": (25.0448, 121.7693, "十分瀑布"),
+}
+
+# TODO: 將縣市座標資料改用資料庫存儲 (如 SQLite)
+# 應包含：縣市名稱、中心座標、邊界資料、行政代碼等，並支援縣市別名匹配
+CITY_CENTERS: Dict[str, Tuple[float, float, str]] = {
+    "台北": (25.0330, 121.5654, "台北市"),
+    "新北": (25.0118, 121.4652, "新北市"),
+    "桃園": (24.9936, 121.3010, "桃園市"),
+    "台中": (24.1477, 120.6736, "台中市"),
+    "台南": (22.9999, 120.2269, "台南市"),
+    "高雄": (22.6273, 120.3014, "高雄市"),
+    "基隆": (25.1276, 121.7391, "基隆市"),
+    "新竹": (24.8138, 120.9675, "新竹市"),
+    "苗栗": (24.5602, 120.8214, "苗栗縣"),
+    "彰化": (24.0518, 120.5161, "彰化縣"),
+    "南投": (23.9609, 120.9718, "南投縣"),
+    "雲林": (23.7092, 120.4313, "雲林縣"),
+    "嘉義": (23.4800, 120.4491, "嘉義市"),
+    "屏東": (22.6690, 120.4818, "屏東縣"),
+    "宜蘭": (24.7021, 121.7378, "宜蘭縣"),
+    "花蓮": (23.9871, 121.6015, "花蓮縣"),
+    "台東": (22.7972, 121.1713, "台東縣"),
+}
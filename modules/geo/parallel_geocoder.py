@@ -0,0 +1,313 @@
+"""
+Concurrent multi-variant geocoding.
+
+``geocode_address`` used to walk up to a dozen Nominatim query variants one
+after another (10 s timeout each) and ``calculate_real_distances`` /
+the SSE geocode stage did the same with four ArcGIS variants, so a bad
+address could take tens of seconds.  ``geocode_queries`` fires the
+variants concurrently instead:
+
+- each provider has its own worker pool, sized to its concurrency cap,
+  and a minimum spacing between requests, so queries queued behind a slow
+  or rate-limited provider never hold threads another provider needs
+  (Nominatim's usage policy allows about one request per second, so its
+  limit stays at 1/s unless ``GEOCODE_RATE_NOMINATIM`` says otherwise)
+- every query has a score that depends only on the query text and its
+  position (``score_query``: the lane / number scoring from
+  ``geocode_address``), so a result can be accepted as soon as no query
+  still in flight could beat it -- which reproduces the serial "best
+  score wins" outcome exactly
+- a result scoring at least ``accept_score`` (a full-address hit) ends the
+  search immediately
+- once a result is accepted, queries still waiting for a rate-limit slot
+  are dropped without touching the network; calls already on the wire
+  finish in the background and are ignored
+
+``geocode_queries`` returns ``None`` only when every query was answered
+and none found the place.  If nothing was found but some query raised or
+was still outstanding at the deadline, it raises ``GeocodeUnavailable``
+instead, so callers that remember "not found" (``geocode_store``) do not
+record a provider outage as one.
+
+Providers are plain callables ``query -> (lat, lng) | None`` registered
+with ``register_provider``; ``nominatim`` and ``arcgis`` (geopy) are
+registered on first use.
+
+``geocode_many`` is the batch counterpart for independent queries (one
+address per restaurant): every query is sent, under the same provider
+limits, and the call returns when the slowest one does.
+
+Usage::
+
+    hit = geocode_queries(["台北市信義路五段7號, Taiwan", "信義路五段7號"],
+                          provider="nominatim", accept_score=FULL_ADDRESS_SCORE)
+    if hit:
+        lat, lng = hit.coords
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, NamedTuple, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+Coords = Tuple[float, float]
+
+
+class GeocodeUnavailable(Exception):
+    """No query found the place, but some failed or timed out: the answer is unknown."""
+
+# Overall deadline for one geocode_queries call (seconds)
+GEOCODE_DEADLINE = float(os.environ.get("GEOCODE_DEADLINE", "12"))
+
+# Scores at or above this end the search at once: 100 - index + 50 for a
+# query with both 巷 and 號, i.e. a full-address query among the first 20
+FULL_ADDRESS_SCORE = 130
+
+_DEFAULT_LIMITS = {
+    # provider: (requests per second, max concurrent requests)
+    "nominatim": (float(os.environ.get("GEOCODE_RATE_NOMINATIM", "1")), 2),
+    "arcgis": (float(os.environ.get("GEOCODE_RATE_ARCGIS", "8")), 4),
+}
+
+
+def score_query(query: str, index: int) -> float:
+    """Lane / number score of the *index*-th query variant (higher is better)."""
+    score = 100 - index
+    if '巷' in query and '號' in query:
+        score += 50
+    elif '巷' in query or '號' in query:
+        score += 25
+    elif '段' in query:
+        score += 10
+    return score
+
+
+def in_taiwan(coords: Coords) -> bool:
+    """Bounding box check used to reject results outside Taiwan."""
+    lat, lng = coords
+    return 21.0 <= lat <= 26.0 and 119.0 <= lng <= 122.5
+
+
+class GeocodeHit(NamedTuple):
+    coords: Coords
+    query: str
+    score: float
+
+
+class _RateLimiter:
+    """Minimum spacing between requests; waiting can be abandoned."""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, cancelled: threading.Event) -> bool:
+        """Wait for the next slot; ``False`` if *cancelled* was set first."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._next_at:
+                    self._next_at = now + self.interval
+                    return True
+                delay = self._next_at - now
+            if cancelled.wait(delay):
+                return False
+
+
+class _Provider:
+
+    def __init__(self, name: str, geocode: Callable[[str], Optional[Coords]],
+                 per_second: float, max_concurrency: int):
+        self.name = name
+        self.geocode = geocode
+        self.limiter = _RateLimiter(per_second)
+        # One worker per allowed in-flight request
+        self.executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency),
+                                           thread_name_prefix=f"geocode-{name}")
+        self.stats = {"calls": 0, "hits": 0, "errors": 0, "skipped": 0, "searches": 0, "early_exits": 0}
+
+
+_providers: Dict[str, _Provider] = {}
+_providers_lock = threading.Lock()
+
+
+def register_provider(name: str, geocode: Callable[[str], Optional[Coords]],
+                      per_second: float = 1.0, max_concurrency: int = 2):
+    """Register (or replace) provider *name*."""
+    with _providers_lock:
+        previous = _providers.get(name)
+        _providers[name] = _Provider(name, geocode, per_second, max_concurrency)
+    if previous is not None:
+        previous.executor.shutdown(wait=False)
+
+
+def _geopy_provider(name: str) -> Callable[[str], Optional[Coords]]:
+    if name == "nominatim":
+        from geopy.geocoders import Nominatim
+        geolocator = Nominatim(user_agent="lunch-recommendation-system", timeout=10)
+
+        def geocode(query):
+            location = geolocator.geocode(query, limit=1)
+            return (location.latitude, location.longitude) if location else None
+        return geocode
+    if name == "arcgis":
+        from geopy.geocoders import ArcGIS
+        geolocator = ArcGIS(timeout=5)
+
+        def geocode(query):
+            location = geolocator.geocode(query)
+            return (location.latitude, location.longitude) if location else None
+        return geocode
+    raise ValueError(f"Unknown geocoding provider: {name!r}")
+
+
+def _get_provider(name: str) -> _Provider:
+    with _providers_lock:
+        provider = _providers.get(name)
+        if provider is None:
+            per_second, max_concurrency = _DEFAULT_LIMITS.get(name, (1.0, 2))
+            provider = _Provider(name, _geopy_provider(name), per_second, max_concurrency)
+            _providers[name] = provider
+        return provider
+
+
+def _run_query(provider: _Provider, query: str, cancelled: threading.Event) -> Optional[Coords]:
+    if cancelled.is_set() or not provider.limiter.acquire(cancelled):
+        with _providers_lock:
+            provider.stats["skipped"] += 1
+        return None
+    with _providers_lock:
+        provider.stats["calls"] += 1
+    coords = provider.geocode(query)
+    if coords:
+        with _providers_lock:
+            provider.stats["hits"] += 1
+    return coords
+
+
+def geocode_queries(
+    queries: Sequence[str],
+    provider: str = "nominatim",
+    scores: Optional[Sequence[float]] = None,
+    accept_score: Optional[float] = None,
+    validate: Optional[Callable[[Coords], bool]] = None,
+    deadline: float = GEOCODE_DEADLINE,
+) -> Optional[GeocodeHit]:
+    """Best-scoring hit among *queries*, resolved concurrently.
+
+    :param scores: score per query (default ``score_query``); pass e.g.
+        ``[-i for i in ...]`` for "first variant in order wins"
+    :param accept_score: stop as soon as a hit scores at least this much
+    :param validate: reject hits for which this returns ``False``
+    :param deadline: give up after this many seconds and return the best
+        hit so far
+    :raises GeocodeUnavailable: nothing was found and at least one query
+        raised or did not finish before *deadline*
+    """
+    # Duplicate variants (e.g. an address that needed no completion) are queried once
+    order: Dict[str, float] = {}
+    for i, query in enumerate(queries):
+        if query and query not in order:
+            order[query] = scores[i] if scores is not None else score_query(query, i)
+    if not order:
+        return None
+
+    prov = _get_provider(provider)
+    with _providers_lock:
+        prov.stats["searches"] += 1
+    cancelled = threading.Event()
+    pending = {prov.executor.submit(_run_query, prov, q, cancelled): q for q in order}
+    best: Optional[GeocodeHit] = None
+    failed = 0
+    end = time.monotonic() + deadline
+
+    try:
+        while pending:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                logger.warning("Geocoding deadline hit with %d queries outstanding", len(pending))
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                query = pending.pop(future)
+                try:
+                    coords = future.result()
+                except Exception as e:
+                    failed += 1
+                    with _providers_lock:
+                        prov.stats["errors"] += 1
+                    logger.debug("Query failed: %s - %s", query, e)
+                    continue
+                if not coords or (validate is not None and not validate(coords)):
+                    continue
+                if best is None or order[query] > best.score:
+                    best = GeocodeHit(coords, query, order[query])
+            if best is None:
+                continue
+            if accept_score is not None and best.score >= accept_score:
+                break
+            # Nothing still outstanding can score higher than what we have
+            if all(order[q] <= best.score for q in pending.values()):
+                break
+        if best is None and (failed or pending):
+            raise GeocodeUnavailable(
+                f"{provider}: {failed} of {len(order)} queries failed, {len(pending)} unanswered"
+            )
+    finally:
+        if pending:
+            cancelled.set()
+            for future in pending:
+                future.cancel()
+            if best is not None:
+                with _providers_lock:
+                    prov.stats["early_exits"] += 1
+    return best
+
+
+def geocode_many(
+    queries: Sequence[str],
+    provider: str = "arcgis",
+    deadline: float = GEOCODE_DEADLINE,
+) -> Dict[str, Optional[Coords]]:
+    """Resolve independent *queries* concurrently (one provider call each).
+
+    Returns ``{query: coords or None}`` for every query whose call finished
+    within *deadline*; queries that raised or did not finish are left out,
+    so callers can tell "not found" from "unknown".
+    """
+    unique = list(dict.fromkeys(q for q in queries if q))
+    if not unique:
+        return {}
+
+    prov = _get_provider(provider)
+    cancelled = threading.Event()
+    pending = {prov.executor.submit(_run_query, prov, q, cancelled): q for q in unique}
+    results: Dict[str, Optional[Coords]] = {}
+
+    done, not_done = wait(pending, timeout=deadline)
+    if not_done:
+        logger.warning("Batch geocoding deadline hit with %d of %d queries outstanding",
+                       len(not_done), len(unique))
+        cancelled.set()
+        for future in not_done:
+            future.cancel()
+    for future in done:
+        query = pending[future]
+        try:
+            results[query] = future.result()
+        except Exception as e:
+            with _providers_lock:
+                prov.stats["errors"] += 1
+            logger.debug("Query failed: %s - %s", query, e)
+    return results
+
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    """Per-provider call counters."""
+    with _providers_lock:
+        return {name: dict(p.stats) for name, p in _providers.items()}
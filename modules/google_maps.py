@@ -235,12 +235,14 @@ class BrowserPool:
                 pass
 
 class SearchCache:
-    """搜尋結果快取，避免重複搜尋"""
+    """搜尋結果快取，避免重複搜尋（存放在 modules.tiered_cache 僅限記憶體的 "search" 命名空間）"""
+    
+    NAMESPACE = "search"
     
     def __init__(self, cache_ttl: int = 300):  # 5分鐘快取
-        self.cache = {}
+        from modules.tiered_cache import tiered_cache
         self.cache_ttl = cache_ttl
-        self.lock = threading.Lock()
+        self._cache = tiered_cache
     
     def get_cache_key(self, keyword: str, location_info: Optional[Dict] = None) -> str:
         """生成快取鍵"""
@@ -252,23 +254,16 @@ class SearchCache:
     def get(self, keyword: str, location_info: Optional[Dict] = None) -> Optional[List[Dict]]:
         """獲取快取結果"""
         cache_key = self.get_cache_key(keyword, location_info)
-        with self.lock:
-            if cache_key in self.cache:
-                cached_data, timestamp = self.cache[cache_key]
-                if datetime.now() - timestamp < timedelta(seconds=self.cache_ttl):
-                    logger.info(f"📦 使用快取結果: {cache_key}")
-                    return cached_data
-                else:
-                    # 快取過期，刪除
-                    del self.cache[cache_key]
-        return None
+        cached_data = self._cache.get(self.NAMESPACE, (cache_key,))
+        if cached_data is not None:
+            logger.info(f"📦 使用快取結果: {cache_key}")
+        return cached_data
     
     def set(self, keyword: str, location_info: Optional[Dict], results: List[Dict]):
         """設置快取結果"""
         cache_key = self.get_cache_key(keyword, location_info)
-        with self.lock:
-            self.cache[cache_key] = (results, datetime.now())
-            logger.info(f"💾 快取搜尋結果: {cache_key}")
+        self._cache.set(self.NAMESPACE, (cache_key,), results, ttl_minutes=self.cache_ttl / 60)
+        logger.info(f"💾 快取搜尋結果: {cache_key}")
 
 # 全域實例
 browser_pool = BrowserPool(pool_size=3)
@@ -2465,7 +2460,7 @@ def search_restaurants(keyword: str, user_address: Optional[str] = None, max_res
     """
     # 檢查快取
     try:
-        from modules.sqlite_cache_manager import get_restaurant_cache, set_restaurant_cache
+        from modules.tiered_cache import get_restaurant_cache, set_restaurant_cache
         cache_location = user_address or "unknown"
         cached_results = get_restaurant_cache(keyword, cache_location, max_results)
         if cached_results:
@@ -0,0 +1,329 @@
+"""In-process metrics for the recommendation pipeline.
+
+Records, per process:
+
+- per-stage latency histograms (weather, intent, maps, ubereats, enrich,
+  distance, social, scoring, ...) with ok / timeout / error outcomes
+- cache hit / miss counters per cache, plus per-tier (L1 memory / L2
+  SQLite) counters from ``modules.tiered_cache`` and geocode store
+  outcomes from ``modules.geo.geocode_store`` and provider call counters
+  from ``modules.geo.parallel_geocoder``
+- CWA observation snapshot downloads / reuse from ``modules.weather_snapshot``
+  and township forecast prefetch state from ``modules.forecast_store``
+- precomputed sweat grid builds and lookups from ``modules.sweat_grid``
+- browser pool wait times and temporary-browser fallbacks
+- Gemini request outcomes, including 429 / ResourceExhausted
+
+``render_prometheus()`` backs the ``/metrics`` endpoint (Prometheus text
+exposition format) and ``summary()`` backs ``/metrics/summary`` (JSON with
+p50 / p95 estimates), so the stage that blows the 8 s target is visible
+without grepping logs.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+METRIC_PREFIX = "lunchmind"
+
+# Stage latency buckets (seconds); the SSE target is 8 s end to end
+LATENCY_BUCKETS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+# Browser pool wait buckets (seconds); BrowserPool gives up after 3 s
+WAIT_BUCKETS: Tuple[float, ...] = (0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5)
+
+STAGE_OUTCOMES = ("ok", "timeout", "error", "cancelled")
+GEMINI_OUTCOMES = ("ok", "rate_limited", "error", "cancelled")
+
+
+class Histogram:
+    """Fixed-bucket histogram (not thread-safe; guarded by the registry lock)."""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """``[(le, cumulative_count), ...]`` including ``+Inf``."""
+        result = []
+        running = 0
+        for bound, n in zip(self.buckets + (float("inf"),), self.counts):
+            running += n
+            result.append(("+Inf" if bound == float("inf") else _fmt(bound), running))
+        return result
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        running = 0
+        lower = 0.0
+        for bound, n in zip(self.buckets, self.counts):
+            if n and running + n >= rank:
+                return lower + (bound - lower) * (rank - running) / n
+            running += n
+            lower = bound
+        # Falls in the +Inf bucket: the largest finite bound is the best we know
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Thread-safe collection of pipeline metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._started = time.time()
+            self._stages: Dict[str, Histogram] = {}
+            self._stage_outcomes: Dict[str, Dict[str, int]] = {}
+            self._cache: Dict[str, Dict[str, int]] = {}
+            self._browser_wait = Histogram(WAIT_BUCKETS)
+            self._browser_fallbacks = 0
+            self._gemini = {outcome: 0 for outcome in GEMINI_OUTCOMES}
+
+    # -- recording -----------------------------------------------------------
+
+    def observe_stage(self, stage: str, seconds: float, outcome: str = "ok"):
+        """Record one execution of *stage* taking *seconds*."""
+        with self._lock:
+            hist = self._stages.get(stage)
+            if hist is None:
+                hist = self._stages[stage] = Histogram(LATENCY_BUCKETS)
+                self._stage_outcomes[stage] = {o: 0 for o in STAGE_OUTCOMES}
+            hist.observe(seconds)
+            outcomes = self._stage_outcomes[stage]
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    @contextmanager
+    def time_stage(self, stage: str) -> Iterator[None]:
+        """Context manager timing a block; exceptions are recorded as errors."""
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            yield
+        except TimeoutError:
+            outcome = "timeout"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self.observe_stage(stage, time.perf_counter() - start, outcome)
+
+    def record_cache(self, cache: str, hit: bool):
+        with self._lock:
+            counters = self._cache.setdefault(cache, {"hits": 0, "misses": 0})
+            counters["hits" if hit else "misses"] += 1
+
+    def observe_browser_wait(self, seconds: float, pooled: bool = True):
+        """Record time spent waiting for a pooled browser.
+
+        ``pooled=False`` means the pool was exhausted and a temporary browser
+        had to be created.
+        """
+        with self._lock:
+            self._browser_wait.observe(seconds)
+            if not pooled:
+                self._browser_fallbacks += 1
+
+    def record_gemini(self, outcome: str):
+        """Record one Gemini request attempt: ok / rate_limited / error / cancelled (hedge loser)."""
+        with self._lock:
+            self._gemini[outcome] = self._gemini.get(outcome, 0) + 1
+
+    # -- reporting -----------------------------------------------------------
+
+    def summary(self) -> Dict:
+        """JSON-friendly snapshot with quantile estimates and ratios."""
+        from modules.forecast_store import forecast_store
+        from modules.geo.geocode_store import geocode_store
+        from modules.geo.parallel_geocoder import get_stats as get_geocoder_stats
+        from modules.singleflight import get_stats as get_singleflight_stats
+        from modules.sweat_grid import get_stats as get_sweat_grid_stats
+        from modules.tiered_cache import get_stats as get_tiered_cache_stats
+        from modules.weather_snapshot import observation_snapshot
+
+        with self._lock:
+            stages = {}
+            for stage, hist in sorted(self._stages.items()):
+                stages[stage] = {
+                    "count": hist.count,
+                    "avg_s": _round(hist.sum / hist.count) if hist.count else None,
+                    "p50_s": _round(hist.quantile(0.5)),
+                    "p95_s": _round(hist.quantile(0.95)),
+                    "p99_s": _round(hist.quantile(0.99)),
+                    "outcomes": dict(self._stage_outcomes[stage]),
+                }
+
+            caches = {}
+            for name, counters in sorted(self._cache.items()):
+                total = counters["hits"] + counters["misses"]
+                caches[name] = {
+                    **counters,
+                    "hit_ratio": round(counters["hits"] / total, 3) if total else None,
+                }
+
+            wait = self._browser_wait
+            browser_pool = {
+                "acquisitions": wait.count,
+                "avg_wait_s": _round(wait.sum / wait.count) if wait.count else None,
+                "p95_wait_s": _round(wait.quantile(0.95)),
+                "fallbacks": self._browser_fallbacks,
+            }
+
+            gemini_total = sum(self._gemini.values())
+            gemini = {
+                **self._gemini,
+                "total": gemini_total,
+                "rate_limited_ratio": (
+                    round(self._gemini["rate_limited"] / gemini_total, 3) if gemini_total else None
+                ),
+            }
+            uptime = time.time() - self._started
+
+        return {
+            "uptime_s": round(uptime, 1),
+            "stages": stages,
+            "caches": caches,
+            "browser_pool": browser_pool,
+            "gemini": gemini,
+            "singleflight": get_singleflight_stats(),
+            "tiered_cache": get_tiered_cache_stats(),
+            "geocode": geocode_store.get_stats(),
+            "geocoder": get_geocoder_stats(),
+            "observation_snapshot": observation_snapshot.get_stats(),
+            "forecast_store": forecast_store.get_stats(),
+            "sweat_grid": get_sweat_grid_stats(),
+        }
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        from modules.geo.geocode_store import geocode_store
+        from modules.singleflight import get_stats as get_singleflight_stats
+        from modules.tiered_cache import get_stats as get_tiered_cache_stats
+
+        p = METRIC_PREFIX
+        lines: List[str] = []
+
+        with self._lock:
+            name = f"{p}_stage_latency_seconds"
+            lines.append(f"# HELP {name} Pipeline stage latency.")
+            lines.append(f"# TYPE {name} histogram")
+            for stage, hist in sorted(self._stages.items()):
+                _append_histogram(lines, name, hist, {"stage": stage})
+
+            name = f"{p}_stage_runs_total"
+            lines.append(f"# HELP {name} Pipeline stage executions by outcome.")
+            lines.append(f"# TYPE {name} counter")
+            for stage, outcomes in sorted(self._stage_outcomes.items()):
+                for outcome, n in outcomes.items():
+                    lines.append(f"{name}{_labels(stage=stage, outcome=outcome)} {n}")
+
+            name = f"{p}_cache_requests_total"
+            lines.append(f"# HELP {name} Cache lookups by result.")
+            lines.append(f"# TYPE {name} counter")
+            for cache, counters in sorted(self._cache.items()):
+                lines.append(f"{name}{_labels(cache=cache, result='hit')} {counters['hits']}")
+                lines.append(f"{name}{_labels(cache=cache, result='miss')} {counters['misses']}")
+
+            name = f"{p}_browser_pool_wait_seconds"
+            lines.append(f"# HELP {name} Time spent waiting for a pooled browser.")
+            lines.append(f"# TYPE {name} histogram")
+            _append_histogram(lines, name, self._browser_wait, {})
+
+            name = f"{p}_browser_pool_fallbacks_total"
+            lines.append(f"# HELP {name} Temporary browsers created because the pool was exhausted.")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {self._browser_fallbacks}")
+
+            name = f"{p}_gemini_requests_total"
+            lines.append(f"# HELP {name} Gemini request attempts by outcome.")
+            lines.append(f"# TYPE {name} counter")
+            for outcome, n in self._gemini.items():
+                lines.append(f"{name}{_labels(outcome=outcome)} {n}")
+
+        name = f"{p}_singleflight_calls_total"
+        lines.append(f"# HELP {name} Single-flight calls by role (executed or coalesced).")
+        lines.append(f"# TYPE {name} counter")
+        for group, stats in sorted(get_singleflight_stats().items()):
+            lines.append(f"{name}{_labels(group=group, role='executed')} {stats['executions']}")
+            lines.append(f"{name}{_labels(group=group, role='coalesced')} {stats['coalesced']}")
+
+        tiered = get_tiered_cache_stats()
+        name = f"{p}_tiered_cache_lookups_total"
+        lines.append(f"# HELP {name} Tiered cache lookups by namespace and serving tier.")
+        lines.append(f"# TYPE {name} counter")
+        for namespace, stats in tiered["namespaces"].items():
+            for tier, key in (("l1", "l1_hits"), ("l2", "l2_hits"),
+                              ("stale", "stale_hits"), ("miss", "misses")):
+                lines.append(f"{name}{_labels(namespace=namespace, tier=tier)} {stats[key]}")
+
+        name = f"{p}_tiered_cache_l1_bytes"
+        lines.append(f"# HELP {name} Approximate bytes held by the in-process L1 cache.")
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {tiered['l1']['bytes']}")
+
+        geocode = geocode_store.get_stats()
+        name = f"{p}_geocode_lookups_total"
+        lines.append(f"# HELP {name} Geocode store lookups by outcome.")
+        lines.append(f"# TYPE {name} counter")
+        for outcome, key in (("seed", "seed_hits"), ("cache", "cache_hits"),
+                             ("negative", "negative_hits"), ("miss", "misses")):
+            lines.append(f"{name}{_labels(outcome=outcome)} {geocode[key]}")
+
+        return "\n".join(lines) + "\n"
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if value != int(value) else f"{value:.1f}"
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 3)
+
+
+def _labels(**labels: str) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _append_histogram(lines: List[str], name: str, hist: Histogram, labels: Dict[str, str]):
+    for le, n in hist.cumulative():
+        lines.append(f"{name}_bucket{_labels(**labels, le=le)} {n}")
+    lines.append(f"{name}_sum{_labels(**labels)} {hist.sum:.6f}")
+    lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+
+
+# ------------------------------------------------------------------
+# Module-level singleton
+# ------------------------------------------------------------------
+metrics = MetricsRegistry()
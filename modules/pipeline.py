@@ -0,0 +1,330 @@
+"""Async stage runtime for the SSE recommendation stream.
+
+Every blocking stage of ``/chat-recommendation-stream`` (weather, intent,
+geocoding, Google Maps / Uber Eats scraping, enrichment, distance, social
+search) is exposed here as an awaitable with its own timeout budget.
+
+Blocking work runs on two shared, bounded thread pools that are created once
+at app startup (see ``start_executors`` in ``modules.executors``) instead of
+per request:
+
+- ``io``       -- HTTP / SQLite / Gemini calls (weather, geocode, AI)
+- ``selenium`` -- browser-bound scraping, sized to the browser pool
+
+The intent stage is a native coroutine on the shared async Gemini client
+(``run_async``) and holds no thread while Gemini answers; its SQLite cache
+read and write are short hops onto the ``io`` pool.
+
+Nothing in this module performs blocking I/O on the event loop.  When a stage
+times out the awaiting coroutine gives up immediately; the worker thread
+finishes in the background, but because the pools are bounded a hung ArcGIS
+call can no longer stall every other stream on the worker.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Executor registry lives in modules.executors; re-exported for existing callers
+from modules.executors import (
+    IO_WORKERS, SELENIUM_WORKERS, get_executor, shutdown_executors, start_executors,
+)
+from modules.metrics import metrics
+from modules.singleflight import normalize_location, singleflight
+from modules.stages import STAGE_TIMEOUTS
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Start Maps / geocode from the regex intent while Gemini is still thinking
+SPECULATIVE_SEARCH = os.environ.get("PIPELINE_SPECULATIVE", "1") != "0"
+
+# Geocoding variants tried for a free-text search location
+_GEOCODE_SUFFIXES = ("", " 台灣", " Taiwan")
+
+
+# ---------------------------------------------------------------------------
+# Stage runners
+# ---------------------------------------------------------------------------
+
+async def run_blocking(
+    stage: str,
+    func: Callable,
+    *args,
+    executor: str = "io",
+    timeout: Optional[float] = None,
+    **kwargs,
+) -> Any:
+    """Run *func* on a shared executor and await it with the stage's timeout.
+
+    Raises ``asyncio.TimeoutError`` when the stage exceeds its budget.
+    Every run is recorded in the ``stage`` latency histogram.
+    """
+    if timeout is None:
+        timeout = STAGE_TIMEOUTS.get(stage)
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        future = loop.run_in_executor(get_executor(executor), lambda: func(*args, **kwargs))
+        return await asyncio.wait_for(future, timeout=timeout)
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        metrics.observe_stage(stage, time.perf_counter() - start, outcome)
+
+
+async def run_async(stage: str, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+    """Await a native coroutine stage with the stage's timeout (no thread used).
+
+    Same contract and metrics as :func:`run_blocking`; on timeout the
+    coroutine is cancelled along with any HTTP request it is awaiting.
+    """
+    if timeout is None:
+        timeout = STAGE_TIMEOUTS.get(stage)
+    start = time.perf_counter()
+    outcome = "ok"
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception:
+        outcome = "error"
+        raise
+    finally:
+        metrics.observe_stage(stage, time.perf_counter() - start, outcome)
+
+
+# ---------------------------------------------------------------------------
+# Stages
+# ---------------------------------------------------------------------------
+
+async def fetch_weather(location: str) -> Dict:
+    """Stage: sweat index / weather lookup for a location."""
+    from modules.sweat_index import query_sweat_index_by_location
+    return await run_blocking("weather", query_sweat_index_by_location, location)
+
+
+async def fetch_sweat_timeline(location: str, hours: int) -> Dict:
+    """Stage: sweat index timeline over the township forecast."""
+    from modules.sweat_timeline import query_sweat_timeline_by_location
+    return await run_blocking("sweat_timeline", query_sweat_timeline_by_location, location, hours)
+
+
+async def analyze_intent_async(user_input: str, weather_data: Optional[Dict], current_hour: int) -> Dict:
+    """Stage: Gemini intent analysis over the async client (regex fallback inside)."""
+    from modules.ai.intent_analyzer import analyze_intent_async as _analyze_intent_async
+    return await run_async(
+        "intent",
+        _analyze_intent_async(user_input=user_input, weather_data=weather_data, current_hour=current_hour),
+    )
+
+
+@singleflight("geocode", key=normalize_location, timeout=STAGE_TIMEOUTS["geocode"])
+def _geocode_location_blocking(location: str) -> Optional[Tuple[float, float]]:
+    """(lat, lng) or None, from the geocode store or the ArcGIS query variants."""
+    from modules.geo.geocode_store import geocode_store
+    return geocode_store.resolve(location, _geocode_arcgis_variants, source="arcgis")
+
+
+def _geocode_arcgis_variants(location: str) -> Optional[Tuple[float, float]]:
+    """Run the ArcGIS query variants concurrently; the earliest that resolves wins.
+
+    Raises ``GeocodeUnavailable`` when ArcGIS failed or timed out without a
+    hit, so ``geocode_store`` does not remember the location as not found.
+    """
+    from modules.geo.parallel_geocoder import geocode_queries
+    hit = geocode_queries(
+        [location + suffix for suffix in _GEOCODE_SUFFIXES], provider="arcgis",
+        scores=[-i for i in range(len(_GEOCODE_SUFFIXES))],
+    )
+    return hit.coords if hit else None
+
+
+async def geocode_location(location: str) -> Optional[Tuple[float, float]]:
+    """Stage: geocode a free-text search location without blocking the loop."""
+    try:
+        return await run_blocking("geocode", _geocode_location_blocking, location)
+    except asyncio.TimeoutError:
+        logger.warning("Geocode timed out for '%s'", location)
+    except Exception as e:
+        logger.warning("Geocode failed for '%s': %s", location, e)
+    return None
+
+
+async def search_maps(keyword: str, location: str, max_results: int = 8,
+                      cancelled: Optional[threading.Event] = None) -> List[Dict]:
+    """Stage: Google Maps search for one keyword (cached, stale-while-revalidate).
+
+    Restaurants served from an expired cache entry carry ``"stale": True``
+    while a background scrape refreshes it.  Cancelling the awaiting task
+    does not stop the Selenium thread; setting *cancelled* does.
+    """
+    from modules.fast_search import search_restaurants_cached
+    results, stale = await run_blocking(
+        "maps", search_restaurants_cached, keyword, location, max_results,
+        executor="selenium", cancelled=cancelled,
+    )
+    if stale:
+        for r in results:
+            r["stale"] = True
+    return results
+
+
+async def search_ubereats(keyword: str, lat: float, lng: float, location: str, max_results: int = 20) -> List[Dict]:
+    """Stage: Uber Eats feed search around (lat, lng)."""
+    from modules.scraper.ubereats import search_ubereats as _search_ubereats
+    return await run_blocking(
+        "ubereats", _search_ubereats, keyword, lat, lng, location, max_results,
+    )
+
+
+async def enrich(restaurants: List[Dict], user_input: str, location: str,
+                 keywords: List[str], budget: Optional[Dict], weather_data: Optional[Dict]) -> List[Dict]:
+    """Stage: Gemini enrichment of existing results (reasons, missing fields)."""
+    from modules.fast_search import enrich_with_gemini
+    return await run_blocking(
+        "enrich", enrich_with_gemini,
+        restaurants, user_input, location, keywords, budget, weather_data,
+    )
+
+
+async def calculate_distances(restaurants: List[Dict], location: str,
+                              user_coords: Optional[Tuple[float, float]] = None) -> List[Dict]:
+    """Stage: real walking distances for every restaurant."""
+    from modules.fast_search import calculate_real_distances
+    return await run_blocking(
+        "distance", calculate_real_distances,
+        restaurants, location, user_coords=user_coords,
+    )
+
+
+async def search_social(restaurant_names: List[str], location: str) -> Dict[str, List[Dict]]:
+    """Stage: Dcard / PTT / Threads mentions via Selenium Google search."""
+    from modules.fast_search import search_social_mentions
+    return await run_blocking(
+        "social", search_social_mentions, restaurant_names, location,
+        executor="selenium",
+    )
+
+
+# ---------------------------------------------------------------------------
+# Speculative search
+# ---------------------------------------------------------------------------
+
+class SpeculativeSearch:
+    """Maps and geocode tasks started from the regex intent before Gemini answers.
+
+    ``start()`` launches one Maps task per speculative keyword plus a geocode
+    task for the speculative location.  Once the real intent arrives,
+    ``reconcile()`` keeps tasks that match it, cancels the rest, and
+    supplements any keyword the speculation did not cover.
+
+    Each speculative Maps task carries a ``threading.Event`` that is set
+    when the task is cancelled, so its Selenium scrape stops at the next
+    checkpoint instead of holding a browser until the page is parsed --
+    unless another request is sharing the same scrape.
+    """
+
+    def __init__(self, location: str, keywords: List[str], max_results: int = 8):
+        self.location = location
+        self.keywords = list(keywords)
+        self.max_results = max_results
+        self.maps_tasks: Dict[str, asyncio.Task] = {}
+        self._cancel_events: Dict[str, threading.Event] = {}
+        self.geocode_task: Optional[asyncio.Task] = None
+        self.stats = {"kept": 0, "cancelled": 0, "added": 0, "geocode_reused": False}
+
+    @classmethod
+    def from_message(cls, message: str, max_keywords: int = 3) -> Optional["SpeculativeSearch"]:
+        """Build a speculation from the regex intent, or None if it is too vague."""
+        if not SPECULATIVE_SEARCH:
+            return None
+        from modules.ai.intent_analyzer import speculative_intent
+        guess = speculative_intent(message)
+        if not guess:
+            return None
+        return cls(guess["location"], guess["primary_keywords"][:max_keywords])
+
+    def start(self):
+        """Launch the speculative tasks on the running loop."""
+        for kw in self.keywords:
+            cancelled = self._cancel_events[kw] = threading.Event()
+            self.maps_tasks[kw] = asyncio.ensure_future(self._maps_for(kw, self.location, cancelled))
+        self.geocode_task = asyncio.ensure_future(geocode_location(self.location))
+        logger.info("Speculative search started: %s @ %s", self.keywords, self.location)
+
+    async def _maps_for(self, keyword: str, location: str,
+                        cancelled: Optional[threading.Event] = None) -> Tuple[str, List[Dict]]:
+        return keyword, await search_maps(keyword, location, self.max_results, cancelled)
+
+    def _cancel_maps(self, keyword: str):
+        self.maps_tasks[keyword].cancel()
+        self._cancel_events[keyword].set()
+
+    def reconcile(self, location: str, keywords: List[str]) -> Tuple[Dict[str, asyncio.Task], asyncio.Task]:
+        """Align the speculative tasks with the real intent.
+
+        Returns ``(maps_tasks, geocode_task)`` covering exactly *keywords* at
+        *location*.  Work is only reused when the location matches; a
+        different location invalidates every speculative task.
+        """
+        same_location = _same_location(self.location, location)
+        maps_tasks: Dict[str, asyncio.Task] = {}
+
+        for kw, task in self.maps_tasks.items():
+            if same_location and kw in keywords:
+                maps_tasks[kw] = task
+                self.stats["kept"] += 1
+            else:
+                self._cancel_maps(kw)
+                self.stats["cancelled"] += 1
+
+        for kw in keywords:
+            if kw not in maps_tasks:
+                maps_tasks[kw] = asyncio.ensure_future(self._maps_for(kw, location))
+                self.stats["added"] += 1
+
+        if same_location and self.geocode_task is not None:
+            geocode_task = self.geocode_task
+            self.stats["geocode_reused"] = True
+        else:
+            if self.geocode_task is not None:
+                self.geocode_task.cancel()
+            geocode_task = asyncio.ensure_future(geocode_location(location))
+
+        logger.info(
+            "Speculative search reconciled: kept=%d cancelled=%d added=%d geocode_reused=%s",
+            self.stats["kept"], self.stats["cancelled"], self.stats["added"],
+            self.stats["geocode_reused"],
+        )
+        return maps_tasks, geocode_task
+
+    def cancel(self):
+        """Cancel every speculative task (e.g. when the stream aborts)."""
+        for kw in self.maps_tasks:
+            self._cancel_maps(kw)
+        if self.geocode_task is not None:
+            self.geocode_task.cancel()
+
+
+def _same_location(a: Optional[str], b: Optional[str]) -> bool:
+    """Loose location equality: ignore whitespace and conversational prefixes."""
+    return bool(a) and normalize_location(a) == normalize_location(b)
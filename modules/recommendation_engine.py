@@ -19,6 +19,7 @@ from typing import Any, Dict, List, Optional, Tuple
 from modules.ai.intent_analyzer import analyze_intent
 from modules.ai.restaurant_scorer import score_restaurants, _parse_price_avg
 from modules.geo.distance import calculate_walking_distances_parallel
+from modules.metrics import metrics
 from modules.scraper.google_maps import search_restaurants
 from modules.scraper.google_search import search_google_recommendations
 from modules.scraper.ptt_scraper import search_ptt_recommendations
@@ -578,7 +579,8 @@ def generate_recommendation(
     sweat_index: Optional[float] = None
 
     try:
-        sweat_result = query_sweat_index_by_location(location)
+        with metrics.time_stage("weather"):
+            sweat_result = query_sweat_index_by_location(location)
         if "error" not in sweat_result:
             weather_data, sweat_index = _extract_weather_data(sweat_result)
             logger.info(
@@ -594,11 +596,12 @@ def generate_recommendation(
 
     # 1b. Intent analysis
     try:
-        intent = analyze_intent(
-            user_input=user_input,
-            weather_data=weather_data,
-            current_hour=current_hour,
-        )
+        with metrics.time_stage("intent"):
+            intent = analyze_intent(
+                user_input=user_input,
+                weather_data=weather_data,
+                current_hour=current_hour,
+            )
     except Exception as exc:
         logger.error("[Phase 1] Intent analysis failed: %s", exc)
         return {
@@ -651,6 +654,7 @@ def generate_recommendation(
     max_distance_km = _max_distance_from_sweat_index(sweat_index)
 
     phase1_elapsed = time.time() - phase1_start
+    metrics.observe_stage("phase1_intent", phase1_elapsed)
     logger.info(
         "[Phase 1] Complete in %.2fs | keywords=%s, budget=%s, distance=%.1fkm",
         phase1_elapsed,
@@ -734,6 +738,7 @@ def generate_recommendation(
                 pass
 
     phase2_elapsed = time.time() - phase2_start
+    metrics.observe_stage("phase2_search", phase2_elapsed)
     logger.info(
         "[Phase 2] Complete in %.2fs | maps=%d, google_search=%d, ptt=%d",
         phase2_elapsed,
@@ -801,13 +806,16 @@ def generate_recommendation(
             )
 
     # 3d. Score restaurants with Gemini
+    scoring_start = time.time()
     try:
         scored = score_restaurants(
             user_request=user_input,
             intent_analysis=intent,
             restaurants=merged,
         )
+        metrics.observe_stage("scoring", time.time() - scoring_start)
     except Exception as exc:
+        metrics.observe_stage("scoring", time.time() - scoring_start, "error")
         logger.warning("[Phase 3] Gemini scoring failed, using distance sort: %s", exc)
         # Fallback: sort by distance only
         scored = merged
@@ -827,12 +835,14 @@ def generate_recommendation(
     total_found = len(scored)
 
     phase3_elapsed = time.time() - phase3_start
+    metrics.observe_stage("phase3_score", phase3_elapsed)
     logger.info("[Phase 3] Complete in %.2fs | scored=%d, returned=%d", phase3_elapsed, total_found, len(top_results))
 
     # =====================================================================
     # Build response
     # =====================================================================
     total_elapsed = time.time() - pipeline_start
+    metrics.observe_stage("recommendation_total", total_elapsed)
 
     weather_info = None
     if weather_data:
@@ -4,7 +4,7 @@ Browser Pool Management + Search Cache for the scraper subsystem.
 Contains:
 - create_chrome_driver() / create_chrome_driver_fast() -- Chrome WebDriver factories
 - BrowserPool -- queue-based browser instance pool (used inside google_maps scraper)
-- SearchCache -- in-memory TTL cache for search results
+- SearchCache -- TTL cache for search results (L1-only namespace of modules.tiered_cache)
 - Global singleton instances: browser_pool, search_cache
 
 Note: The *other* browser pool lives at modules/browser_pool.py and is used by
@@ -20,12 +20,14 @@ import logging
 import threading
 from queue import Queue
 from contextlib import contextmanager
-from datetime import datetime, timedelta
 
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.chrome.service import Service
 
+from modules.metrics import metrics
+from modules.tiered_cache import TieredCache, tiered_cache
+
 # ---------------------------------------------------------------------------
 # Logging
 # ---------------------------------------------------------------------------
@@ -178,9 +180,11 @@ class BrowserPool:
     def get_browser(self):
         """Context manager that borrows a browser from the pool."""
         driver = None
+        wait_start = time.perf_counter()
         try:
             # Try to get a browser from the pool (3 s timeout)
             driver = self.available_browsers.get(timeout=3)
+            metrics.observe_browser_wait(time.perf_counter() - wait_start)
 
             # Verify the session is alive before yielding
             try:
@@ -199,6 +203,8 @@ class BrowserPool:
         except Exception:
             # Pool exhausted -- create a temporary instance
             logger.warning("[WARNING] Pool exhausted, creating temporary browser")
+            if driver is None:
+                metrics.observe_browser_wait(time.perf_counter() - wait_start, pooled=False)
             driver = create_chrome_driver(headless=True)
             with self.lock:
                 self.all_browsers.append(driver)
@@ -229,12 +235,14 @@ class BrowserPool:
 # ---------------------------------------------------------------------------
 
 class SearchCache:
-    """In-memory TTL cache for search results."""
+    """TTL cache for search results, kept in the L1-only "search" namespace
+    of ``modules.tiered_cache`` (shared LRU bounds and per-tier stats)."""
+
+    NAMESPACE = "search"
 
-    def __init__(self, cache_ttl: int = 300):  # 5-minute default
-        self.cache: dict = {}
+    def __init__(self, cache_ttl: int = 300, cache: Optional[TieredCache] = None):  # 5-minute default
         self.cache_ttl = cache_ttl
-        self.lock = threading.Lock()
+        self._cache = cache if cache is not None else tiered_cache
 
     def get_cache_key(self, keyword: str, location_info: Optional[Dict] = None) -> str:
         location_str = ""
@@ -244,21 +252,15 @@ class SearchCache:
 
     def get(self, keyword: str, location_info: Optional[Dict] = None) -> Optional[List[Dict]]:
         cache_key = self.get_cache_key(keyword, location_info)
-        with self.lock:
-            if cache_key in self.cache:
-                cached_data, timestamp = self.cache[cache_key]
-                if datetime.now() - timestamp < timedelta(seconds=self.cache_ttl):
-                    logger.info(f"Using cached result: {cache_key}")
-                    return cached_data
-                else:
-                    del self.cache[cache_key]
-        return None
+        cached_data = self._cache.get(self.NAMESPACE, (cache_key,))
+        if cached_data is not None:
+            logger.info(f"Using cached result: {cache_key}")
+        return cached_data
 
     def set(self, keyword: str, location_info: Optional[Dict], results: List[Dict]):
         cache_key = self.get_cache_key(keyword, location_info)
-        with self.lock:
-            self.cache[cache_key] = (results, datetime.now())
-            logger.info(f"Cached search result: {cache_key}")
+        self._cache.set(self.NAMESPACE, (cache_key,), results, ttl_minutes=self.cache_ttl / 60)
+        logger.info(f"Cached search result: {cache_key}")
 
 
 # ---------------------------------------------------------------------------
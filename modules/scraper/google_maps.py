@@ -970,9 +970,9 @@ def search_restaurants(
     :param max_results: maximum number of results
     :return: list of restaurant info dicts
     """
-    # Check SQLite cache
+    # Check tiered cache (memory L1, then SQLite L2)
     try:
-        from modules.sqlite_cache_manager import get_restaurant_cache, set_restaurant_cache
+        from modules.tiered_cache import get_restaurant_cache, set_restaurant_cache
         cache_location = user_address or "unknown"
         cached_results = get_restaurant_cache(keyword, cache_location, max_results)
         if cached_results:
@@ -1046,9 +1046,9 @@ def search_restaurants(
             restaurant['maps_url'] = reliable_url
             logger.debug(f"Optimised URL for {restaurant['name']}: {reliable_url[:50]}...")
 
-    # Store in SQLite cache
+    # Store in tiered cache (memory L1 + SQLite L2)
     try:
-        from modules.sqlite_cache_manager import set_restaurant_cache
+        from modules.tiered_cache import set_restaurant_cache
         cache_location = user_address or "unknown"
         set_restaurant_cache(keyword, cache_location, max_results, results)
     except Exception as e:
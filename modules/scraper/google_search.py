@@ -18,6 +18,7 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
 from modules.scraper.browser_pool import browser_pool
+from modules.ai import gemini_client
 from modules.ai.gemini_pool import gemini_pool, GeminiPoolExhausted
 
 logger = logging.getLogger(__name__)
@@ -109,7 +110,6 @@ def _extract_restaurant_names(combined_text: str, *, api_key=None) -> List[Dict]
     Returns:
         List of dicts with 'name' and 'snippet' keys.
     """
-    from google import genai
     from google.genai import types
 
     prompt = (
@@ -120,8 +120,8 @@ def _extract_restaurant_names(combined_text: str, *, api_key=None) -> List[Dict]
         f"搜尋結果：\n{combined_text}"
     )
 
-    client = genai.Client(api_key=api_key)
-    response = client.models.generate_content(
+    response = gemini_client.generate_content(
+        api_key,
         model="gemini-2.0-flash-lite",
         contents=prompt,
         config=types.GenerateContentConfig(
@@ -17,6 +17,7 @@ from urllib.parse import quote
 import requests
 from bs4 import BeautifulSoup
 
+from modules.ai import gemini_client
 from modules.ai.gemini_pool import gemini_pool, GeminiPoolExhausted
 
 logger = logging.getLogger(__name__)
@@ -170,7 +171,6 @@ def _extract_restaurant_names(combined_text: str, *, api_key=None) -> List[Dict]
 
     Returns a list of dicts: [{"name": "...", "mentioned_in_title": bool}, ...]
     """
-    from google import genai
     from google.genai import types
 
     prompt = (
@@ -181,8 +181,8 @@ def _extract_restaurant_names(combined_text: str, *, api_key=None) -> List[Dict]
         f"{combined_text}"
     )
 
-    client = genai.Client(api_key=api_key)
-    response = client.models.generate_content(
+    response = gemini_client.generate_content(
+        api_key,
         model="gemini-2.0-flash-lite",
         contents=prompt,
         config=types.GenerateContentConfig(
@@ -0,0 +1,336 @@
+"""Request coalescing (single-flight) for identical in-flight calls.
+
+When dozens of people in the same office ask for "台北101 拉麵" at noon, only
+the first caller runs the Selenium search / geocode / Gemini call; concurrent
+callers with the same key block until it finishes and receive a copy of the
+same result (or the same exception).  Nothing is cached after the call
+returns -- that is the cache managers' job.
+
+Usage::
+
+    @singleflight("maps", key=lambda keyword, location, max_results=5:
+                  (normalize_location(location), keyword, max_results))
+    def search_restaurants_fast(keyword, location, max_results=5):
+        ...
+
+Coroutine functions use ``@async_singleflight`` instead, which coalesces
+awaits on the running event loop.
+
+A function that can be stopped half-way names its cancel argument with
+``cancel=``: every caller passes its own ``threading.Event`` (or ``None``),
+and the function receives the flight's :class:`FlightCancel`, which is set
+only once every caller sharing the flight has set its event::
+
+    @singleflight("maps", key=..., cancel="cancelled")
+    def search_restaurants_fast(keyword, location, max_results=5, cancelled=None):
+        ...
+
+Counters per group are available from ``get_stats()``.
+"""
+
+import asyncio
+import copy
+import functools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Conversational prefixes stripped from free-text locations
+_LOCATION_PREFIXES = ("我在", "我想去", "在")
+
+# How often FlightCancel.wait() re-checks the callers' events
+_CANCEL_POLL_SECONDS = 0.1
+
+
+# How long a follower waits on a leader when the caller gives no budget
+DEFAULT_WAIT_TIMEOUT = 30.0
+
+
+def strip_location_prefix(text: str) -> str:
+    """Drop one conversational prefix ("我在台北101" -> "台北101")."""
+    for prefix in _LOCATION_PREFIXES:
+        if text.startswith(prefix) and len(text) > len(prefix):
+            return text[len(prefix):]
+    return text
+
+
+def normalize_location(location: Optional[str]) -> str:
+    """Canonical form of a free-text location for coalescing keys."""
+    text = strip_location_prefix("".join((location or "").split()))
+    return text.replace("臺", "台").lower()
+
+
+class FlightCancel:
+    """Cancellation token owned by one flight.
+
+    Each caller joining the flight brings its own ``threading.Event``, or
+    ``None`` if it never cancels.  The token reads as set only once every
+    caller's event is set, so one caller giving up does not empty the
+    result for the others.  It offers the ``is_set()`` / ``wait(timeout)``
+    part of ``threading.Event`` that a cancellable function polls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._events: List[threading.Event] = []
+        self._pinned = False
+
+    def join(self, cancelled: Optional[threading.Event]):
+        with self._lock:
+            if cancelled is None:
+                self._pinned = True
+            else:
+                self._events.append(cancelled)
+
+    def is_set(self) -> bool:
+        with self._lock:
+            return not self._pinned and all(event.is_set() for event in self._events)
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to *timeout* seconds, returning early (True) once set."""
+        deadline = time.monotonic() + timeout
+        while not self.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(_CANCEL_POLL_SECONDS, remaining))
+        return True
+
+
+class _Call:
+    """One in-flight execution shared by the leader and its followers."""
+
+    __slots__ = ("event", "result", "error", "waiters", "cancel")
+
+    def __init__(self, cancellable: bool = False):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+        self.cancel: Optional[FlightCancel] = FlightCancel() if cancellable else None
+
+
+class SingleFlight:
+    """Thread-safe group that runs at most one call per key at a time."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.stats = {"calls": 0, "executions": 0, "coalesced": 0, "errors": 0, "wait_timeouts": 0}
+
+    def do(self, key: Hashable, fn: Callable, *args,
+           cancel_arg: Optional[str] = None, wait_timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run ``fn(*args, **kwargs)`` unless an identical call is in flight.
+
+        With *cancel_arg*, ``kwargs[cancel_arg]`` is this caller's cancel
+        event; it joins the flight's :class:`FlightCancel`, which the leader
+        passes to *fn* in its place.  A follower still waiting after
+        *wait_timeout* seconds stops waiting and runs *fn* itself.
+        """
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None and call.cancel is not None and call.cancel.is_set():
+                # Every caller gave up and the leader is winding down: start afresh
+                call = None
+            if call is not None:
+                call.waiters += 1
+                self.stats["coalesced"] += 1
+                leader = False
+            else:
+                call = _Call(cancellable=cancel_arg is not None)
+                self._calls[key] = call
+                self.stats["executions"] += 1
+                leader = True
+            if call.cancel is not None:
+                call.cancel.join(kwargs.get(cancel_arg))
+
+        if not leader:
+            logger.debug("SingleFlight[%s]: coalesced %r", self.name, key)
+            if not call.event.wait(wait_timeout):
+                with self._lock:
+                    self.stats["wait_timeouts"] += 1
+                logger.warning("SingleFlight[%s]: leader still running after %.0fs, calling directly: %r",
+                               self.name, wait_timeout, key)
+                return fn(*args, **kwargs)
+            if call.error is not None:
+                raise call.error
+            # Followers get private copies: callers mutate result dicts in place
+            return copy.deepcopy(call.result)
+
+        if call.cancel is not None:
+            kwargs[cancel_arg] = call.cancel
+        result = None
+        try:
+            result = fn(*args, **kwargs)
+            return result
+        except BaseException as exc:
+            call.error = exc
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                waiters = call.waiters
+            if waiters and call.error is None:
+                # Snapshot before the leader's caller can mutate the result
+                call.result = copy.deepcopy(result)
+            call.event.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class _AsyncCall:
+    """One in-flight coroutine shared by every awaiting caller."""
+
+    __slots__ = ("task", "waiters", "shared")
+
+    def __init__(self, task: "asyncio.Task"):
+        self.task = task
+        self.waiters = 0
+        self.shared = False
+
+
+class AsyncSingleFlight:
+    """Event-loop counterpart of :class:`SingleFlight` for coroutine functions.
+
+    The call runs in its own task, so a caller that is cancelled (e.g. a
+    client closing its SSE stream) does not cancel it for the others; the
+    task is only cancelled once every waiter has gone.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()  # guards stats for get_stats()
+        self._calls: Dict[Hashable, _AsyncCall] = {}
+        self.stats = {"calls": 0, "executions": 0, "coalesced": 0, "errors": 0}
+
+    async def do(self, key: Hashable, fn: Callable, *args, **kwargs) -> Any:
+        """Await ``fn(*args, **kwargs)`` unless an identical call is in flight."""
+        with self._lock:
+            self.stats["calls"] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.shared = True
+                self.stats["coalesced"] += 1
+            else:
+                call = _AsyncCall(asyncio.ensure_future(fn(*args, **kwargs)))
+                call.task.add_done_callback(lambda t, k=key, c=call: self._finish(k, c, t))
+                self._calls[key] = call
+                self.stats["executions"] += 1
+            call.waiters += 1
+
+        try:
+            result = await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            if not call.task.done():
+                call.waiters -= 1
+                if call.waiters == 0:
+                    call.task.cancel()
+            raise
+        # Shared results are copied: callers mutate result dicts in place
+        return copy.deepcopy(result) if call.shared else result
+
+    def _finish(self, key: Hashable, call: _AsyncCall, task: "asyncio.Task"):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            if not task.cancelled() and task.exception() is not None:
+                self.stats["errors"] += 1
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+# ---------------------------------------------------------------------------
+# Registry
+# ---------------------------------------------------------------------------
+
+_groups: Dict[str, SingleFlight] = {}
+_groups_lock = threading.Lock()
+
+
+def get_group(name: str) -> SingleFlight:
+    """Return the named group, creating it on first use."""
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = SingleFlight(name)
+        return group
+
+
+def singleflight(name: str, key: Optional[Callable[..., Hashable]] = None,
+                 cancel: Optional[str] = None, timeout: float = DEFAULT_WAIT_TIMEOUT):
+    """Decorator coalescing concurrent calls that map to the same *key*.
+
+    *key* receives the same arguments as the decorated function; by default
+    the raw positional and keyword arguments are used.  *cancel* names the
+    keyword argument carrying a caller's cancel event (see
+    :class:`FlightCancel`); leave it out of *key* so cancellable callers
+    share flights.  *timeout* bounds how long a follower waits on a hung
+    leader -- pass the budget of the stage the call runs in.
+    """
+    group = get_group(name)
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if key is not None:
+                call_key = key(*args, **kwargs)
+            else:
+                call_key = (args, tuple(sorted(kwargs.items())))
+            return group.do(call_key, func, *args, cancel_arg=cancel, wait_timeout=timeout, **kwargs)
+
+        wrapper.singleflight_group = group
+        return wrapper
+
+    return decorator
+
+
+def async_singleflight(name: str, key: Optional[Callable[..., Hashable]] = None):
+    """Decorator coalescing concurrent awaits of a coroutine function.
+
+    Same contract as :func:`singleflight`; the group is registered under
+    *name* and reported by ``get_stats()``.
+    """
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = AsyncSingleFlight(name)
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if key is not None:
+                call_key = key(*args, **kwargs)
+            else:
+                call_key = (args, tuple(sorted(kwargs.items())))
+            return await group.do(call_key, func, *args, **kwargs)
+
+        wrapper.singleflight_group = group
+        return wrapper
+
+    return decorator
+
+
+def get_stats() -> Dict[str, Dict[str, int]]:
+    """Per-group counters: calls, executions, coalesced callers, errors, in flight
+    (and, for thread groups, followers that gave up waiting on a leader)."""
+    with _groups_lock:
+        groups = list(_groups.values())
+    result = {}
+    for group in groups:
+        with group._lock:
+            stats = dict(group.stats)
+            stats["in_flight"] = len(group._calls)
+        result[group.name] = stats
+    return result
@@ -8,21 +8,47 @@ SQLite 持久化快取管理系統 - 提升搜尋性能並支援跨會話快取
 3. AI分析結果快取
 4. 自動過期機制
 5. 快取統計與清理
+6. 連線重用：每個執行緒一條長駐連線（WAL + synchronous=NORMAL）
+7. 命中時只做一次索引讀取；access_count / last_accessed 與統計數據
+   先累積在記憶體，由背景執行緒批次寫回
+8. 過期與淘汰由背景執行緒定期、分批進行：寫入只做一次 INSERT，
+   項目數以記憶體中的近似值追蹤，淘汰順序有專用索引
+9. 通用 get_item / set_item，作為 modules.tiered_cache 的 L2
+10. data / metadata 以可抽換的編碼器（modules.cache_codecs）壓縮儲存，
+    每列記錄 codec 標籤；沒有標籤的舊資料視為 JSON 文字，仍可讀取
 """
 
+import atexit
 import sqlite3
 import time
 import hashlib
-import json
 import threading
 from typing import Dict, Any, Optional, Tuple
 from datetime import datetime, timedelta
 import os
 
+from modules import cache_codecs
+from modules.metrics import metrics
+
+# 批次寫回存取紀錄與統計的間隔（秒）
+ACCESS_FLUSH_INTERVAL_SECONDS = 1.0
+# 累積這麼多筆存取紀錄時提早寫回
+ACCESS_BATCH_SIZE = 500
+# 背景維護（過期清理 + 容量淘汰）的間隔（秒）與每批刪除上限
+MAINTENANCE_INTERVAL_SECONDS = 30.0
+MAINTENANCE_BATCH_SIZE = 500
+# 近似項目數超過 max_size 這個比例時提早喚醒維護
+EVICTION_HIGH_WATER = 1.1
+# 每隔這麼久以 COUNT(*) 校正一次近似項目數（秒）
+RECOUNT_INTERVAL_SECONDS = 600.0
+
+
 class SQLiteCacheManager:
-    def __init__(self, db_path="cache.db", max_size=10000):
+    def __init__(self, db_path="cache.db", max_size=10000, codec: Optional[str] = None):
         self.db_path = db_path
         self.max_size = max_size
+        # 新寫入資料使用的編碼器（讀取時依每列的 codec 標籤解碼）
+        self.codec = cache_codecs.write_codec(codec)
         self._lock = threading.Lock()
         self.cache_stats = {
             "hits": 0,
@@ -31,16 +57,196 @@ class SQLiteCacheManager:
             "weather_hits": 0,
             "ai_hits": 0
         }
-        
+
+        # 每個執行緒一條連線：thread id -> (thread, connection)
+        self._conns: Dict[int, Tuple[threading.Thread, sqlite3.Connection]] = {}
+        self._conns_lock = threading.Lock()
+        # 尚未寫回的存取紀錄 cache_key -> [次數, 最後存取時間] 與統計增量
+        self._pending_access: Dict[str, list] = {}
+        self._pending_stats: Dict[str, int] = {}
+        self._pending_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        # 近似項目數：寫入時 +1，維護刪除時扣除，定期以 COUNT(*) 校正
+        self._approx_count = 0
+        self._maintain_now = threading.Event()
+        self._last_maintenance = time.time()
+        self._last_recount = 0.0
+
         # 初始化資料庫
         self._init_database()
         
         # 啟動時清理過期項目
         self._cleanup_expired_items()
-    
+        self._recount()
+
+        self._start_writer()
+        atexit.register(self.close)
+
+    # ------------------------------------------------------------------
+    # 連線池
+    # ------------------------------------------------------------------
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """取得目前執行緒的長駐連線（首次使用時建立）。"""
+        tid = threading.get_ident()
+        entry = self._conns.get(tid)
+        if entry is not None:
+            current = threading.current_thread()
+            if entry[0] is not current:
+                # 執行緒 id 被重用：沿用舊連線，但改登記為目前的執行緒
+                with self._conns_lock:
+                    self._conns[tid] = (current, entry[1])
+            return entry[1]
+
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conns_lock:
+            # 順便關閉已結束執行緒留下的連線
+            for dead_tid, (thread, dead_conn) in list(self._conns.items()):
+                if not thread.is_alive():
+                    dead_conn.close()
+                    del self._conns[dead_tid]
+            self._conns[tid] = (threading.current_thread(), conn)
+        return conn
+
+    def _close_connections(self):
+        with self._conns_lock:
+            for _thread, conn in self._conns.values():
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._conns.clear()
+
+    # ------------------------------------------------------------------
+    # 批次寫回
+    # ------------------------------------------------------------------
+
+    def _start_writer(self):
+        self._writer = threading.Thread(
+            target=self._writer_loop, name="sqlite-cache-writer", daemon=True,
+        )
+        self._writer.start()
+
+    def _writer_loop(self):
+        while not self._stop.is_set():
+            self._wake.wait(ACCESS_FLUSH_INTERVAL_SECONDS)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.flush()
+                if (self._maintain_now.is_set()
+                        or time.time() - self._last_maintenance >= MAINTENANCE_INTERVAL_SECONDS):
+                    self.maintain()
+            except sqlite3.Error as e:
+                print(f"快取存取紀錄寫回失敗: {e}")
+
+    def _record_access(self, cache_key: str):
+        with self._pending_lock:
+            entry = self._pending_access.get(cache_key)
+            if entry is None:
+                self._pending_access[cache_key] = [1, time.time()]
+            else:
+                entry[0] += 1
+                entry[1] = time.time()
+            if len(self._pending_access) >= ACCESS_BATCH_SIZE:
+                self._wake.set()
+
+    def flush(self):
+        """將累積的存取紀錄與統計以單一交易寫回 SQLite。"""
+        with self._pending_lock:
+            access, self._pending_access = self._pending_access, {}
+            stats, self._pending_stats = self._pending_stats, {}
+        if not access and not stats:
+            return
+        conn = self._get_conn()
+        with conn:
+            conn.executemany(
+                """
+                UPDATE cache_items
+                SET access_count = access_count + ?, last_accessed = ?
+                WHERE cache_key = ?
+                """,
+                [
+                    (count, _sql_timestamp(last), key)
+                    for key, (count, last) in access.items()
+                ],
+            )
+            conn.executemany(
+                "UPDATE cache_stats SET stat_value = stat_value + ? WHERE stat_name = ?",
+                [(n, name) for name, n in stats.items()],
+            )
+
+    # ------------------------------------------------------------------
+    # 背景維護：分批過期清理與容量淘汰
+    # ------------------------------------------------------------------
+
+    def maintain(self, batch_size: int = MAINTENANCE_BATCH_SIZE) -> Tuple[int, int]:
+        """執行一輪維護，回傳 (過期刪除數, 淘汰刪除數)。
+
+        每輪最多刪除 *batch_size* 筆過期項目（走 idx_expires_at），
+        近似項目數仍超過 max_size 時再依 idx_eviction 淘汰最少使用的項目。
+        """
+        self._maintain_now.clear()
+        self._last_maintenance = time.time()
+        if self._last_maintenance - self._last_recount >= RECOUNT_INTERVAL_SECONDS:
+            self._recount()
+
+        conn = self._get_conn()
+        with conn:
+            expired = conn.execute('''
+                DELETE FROM cache_items WHERE rowid IN (
+                    SELECT rowid FROM cache_items WHERE expires_at <= ? LIMIT ?
+                )
+            ''', (_expiry_now(), batch_size)).rowcount
+        self._adjust_count(-expired)
+
+        evicted = 0
+        excess = self._approx_count - self.max_size
+        if excess > 0:
+            # 淘汰前以 COUNT(*) 確認真的超量，避免近似值偏高時刪掉有效項目
+            self._recount()
+            excess = self._approx_count - self.max_size
+        if excess > 0:
+            with conn:
+                evicted = conn.execute('''
+                    DELETE FROM cache_items WHERE rowid IN (
+                        SELECT rowid FROM cache_items
+                        ORDER BY access_count ASC, last_accessed ASC
+                        LIMIT ?
+                    )
+                ''', (min(excess, batch_size),)).rowcount
+            self._adjust_count(-evicted)
+            if self._approx_count > self.max_size:
+                self._maintain_now.set()  # 還沒清完，下一輪繼續
+
+        if expired or evicted:
+            print(f"快取維護：清理 {expired} 個過期項目、淘汰 {evicted} 個最少使用項目")
+        return expired, evicted
+
+    def _recount(self):
+        """以 COUNT(*) 校正近似項目數。"""
+        count = self._get_conn().execute('SELECT COUNT(*) FROM cache_items').fetchone()[0]
+        with self._pending_lock:
+            self._approx_count = count
+        self._last_recount = time.time()
+
+    def _adjust_count(self, delta: int):
+        with self._pending_lock:
+            self._approx_count = max(0, self._approx_count + delta)
+            over = self._approx_count > self.max_size * EVICTION_HIGH_WATER
+        if over and not self._maintain_now.is_set():
+            self._maintain_now.set()
+            self._wake.set()
+
     def _init_database(self):
         """初始化 SQLite 資料庫結構"""
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._get_conn()
+        with conn:
             cursor = conn.cursor()
             
             # 建立快取表
@@ -57,6 +263,11 @@ class SQLiteCacheManager:
                 )
             ''')
             
+            # 舊資料庫補上 codec 欄位（NULL 代表 JSON 文字）
+            columns = {row[1] for row in cursor.execute('PRAGMA table_info(cache_items)')}
+            if "codec" not in columns:
+                cursor.execute('ALTER TABLE cache_items ADD COLUMN codec TEXT')
+
             # 建立統計表
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS cache_stats (
@@ -82,6 +293,12 @@ class SQLiteCacheManager:
                 CREATE INDEX IF NOT EXISTS idx_cache_type
                 ON cache_items(cache_type)
             ''')
+
+            # 淘汰順序索引：維護時依此刪除最少使用的項目，不需全表排序
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_eviction
+                ON cache_items(access_count, last_accessed)
+            ''')
             
             # 初始化統計數據
             stats_to_init = ["hits", "misses", "restaurant_hits", "weather_hits", "ai_hits"]
@@ -99,109 +316,103 @@ class SQLiteCacheManager:
         return hashlib.md5(cache_string.encode()).hexdigest()
     
     def _update_stats(self, stat_name: str, increment: int = 1):
-        """更新統計數據"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                UPDATE cache_stats SET stat_value = stat_value + ? 
-                WHERE stat_name = ?
-            ''', (increment, stat_name))
-            conn.commit()
+        """更新統計數據（記憶體立即更新，資料庫由背景執行緒批次寫回）"""
+        with self._pending_lock:
+            self._pending_stats[stat_name] = self._pending_stats.get(stat_name, 0) + increment
         
         # 同步更新記憶體統計
         if stat_name in self.cache_stats:
             self.cache_stats[stat_name] += increment
     
     def _get_cache_item(self, cache_key: str) -> Optional[Dict]:
-        """從資料庫獲取快取項目"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT data, metadata, expires_at, access_count 
-                FROM cache_items 
-                WHERE cache_key = ? AND expires_at > CURRENT_TIMESTAMP
-            ''', (cache_key,))
-            
-            result = cursor.fetchone()
-            if result:
-                # 更新訪問次數和時間
-                cursor.execute('''
-                    UPDATE cache_items 
-                    SET access_count = access_count + 1, 
-                        last_accessed = CURRENT_TIMESTAMP 
-                    WHERE cache_key = ?
-                ''', (cache_key,))
-                conn.commit()
-                
-                return {
-                    "data": json.loads(result[0]),
-                    "metadata": json.loads(result[1]) if result[1] else {},
-                    "expires_at": result[2],
-                    "access_count": result[3] + 1
-                }
-            return None
+        """從資料庫獲取快取項目（單次索引讀取，存取紀錄延後批次寫回）"""
+        cursor = self._get_conn().execute('''
+            SELECT data, metadata, expires_at, access_count, codec 
+            FROM cache_items 
+            WHERE cache_key = ? AND expires_at > ?
+        ''', (cache_key, _expiry_now()))
+        
+        result = cursor.fetchone()
+        if result:
+            try:
+                data = cache_codecs.decode(result[0], result[4])
+                metadata = cache_codecs.decode(result[1], result[4]) if result[1] else {}
+            except Exception as e:
+                # 未安裝的編碼器或損毀的資料視為未命中
+                print(f"快取資料解碼失敗 ({result[4]}): {e}")
+                return None
+            self._record_access(cache_key)
+            return {
+                "data": data,
+                "metadata": metadata,
+                "expires_at": result[2],
+                "access_count": result[3] + 1
+            }
+        return None
     
     def _set_cache_item(self, cache_key: str, cache_type: str, data: Any, 
                        metadata: Dict, ttl_minutes: int):
         """設置快取項目到資料庫"""
         expires_at = datetime.now() + timedelta(minutes=ttl_minutes)
         
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._get_conn()
+        with conn:
             cursor = conn.cursor()
+            # 覆寫既有鍵不增加項目數，只有新插入的列才計入
+            is_new = cursor.execute(
+                'SELECT 1 FROM cache_items WHERE cache_key = ?', (cache_key,)
+            ).fetchone() is None
             cursor.execute('''
                 INSERT OR REPLACE INTO cache_items 
-                (cache_key, cache_type, data, metadata, expires_at) 
-                VALUES (?, ?, ?, ?, ?)
+                (cache_key, cache_type, data, metadata, expires_at, codec) 
+                VALUES (?, ?, ?, ?, ?, ?)
             ''', (
                 cache_key,
                 cache_type,
-                json.dumps(data, ensure_ascii=False),
-                json.dumps(metadata, ensure_ascii=False),
-                expires_at.isoformat()
+                self.codec.encode(data),
+                self.codec.encode(metadata),
+                expires_at.isoformat(),
+                self.codec.name
             ))
             conn.commit()
         
-        # 清理過期項目以控制資料庫大小
-        self._cleanup_expired_items()
-        self._enforce_size_limit()
+        # 過期清理與容量淘汰交給背景維護，這裡只更新近似項目數
+        if is_new:
+            self._adjust_count(1)
     
     def _cleanup_expired_items(self):
         """清理過期的快取項目"""
-        with sqlite3.connect(self.db_path) as conn:
+        conn = self._get_conn()
+        with conn:
             cursor = conn.cursor()
             cursor.execute('''
                 DELETE FROM cache_items 
-                WHERE expires_at <= CURRENT_TIMESTAMP
-            ''')
+                WHERE expires_at <= ?
+            ''', (_expiry_now(),))
             deleted_count = cursor.rowcount
             conn.commit()
             
             if deleted_count > 0:
                 print(f"清理了 {deleted_count} 個過期快取項目")
     
-    def _enforce_size_limit(self):
-        """強制執行快取大小限制"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # 檢查當前項目數量
-            cursor.execute('SELECT COUNT(*) FROM cache_items')
-            current_count = cursor.fetchone()[0]
-            
-            if current_count > self.max_size:
-                # 刪除最舊且最少使用的項目
-                items_to_delete = current_count - self.max_size
-                cursor.execute('''
-                    DELETE FROM cache_items 
-                    WHERE cache_key IN (
-                        SELECT cache_key FROM cache_items 
-                        ORDER BY access_count ASC, last_accessed ASC 
-                        LIMIT ?
-                    )
-                ''', (items_to_delete,))
-                conn.commit()
-                print(f"清理了 {items_to_delete} 個最少使用的快取項目")
-    
+    # 通用存取（供 modules.tiered_cache 當作 L2 使用）
+    def get_item(self, cache_type: str, *key_parts) -> Optional[Dict]:
+        """依 cache_type 與鍵值組成取得快取項目（含 expires_at），並更新命中統計"""
+        cache_key = self._generate_cache_key(cache_type, *key_parts)
+        cached_item = self._get_cache_item(cache_key)
+        if cached_item:
+            self._update_stats("hits")
+            self._update_stats(f"{cache_type}_hits")
+        else:
+            self._update_stats("misses")
+        return cached_item
+
+    def set_item(self, cache_type: str, key_parts: tuple, data: Any,
+                 ttl_minutes: float, metadata: Optional[Dict] = None):
+        """依 cache_type 與鍵值組成寫入快取項目"""
+        cache_key = self._generate_cache_key(cache_type, *key_parts)
+        self._set_cache_item(cache_key, cache_type, data, metadata or {}, ttl_minutes)
+
     # 餐廳搜尋快取
     def get_restaurant_cache(self, keyword: str, location: str, max_results: int, 
                            max_distance: float = None) -> Optional[Dict]:
@@ -213,10 +424,12 @@ class SQLiteCacheManager:
             if cached_item:
                 self._update_stats("hits")
                 self._update_stats("restaurant_hits")
+                metrics.record_cache("restaurant", True)
                 print(f"快取命中：餐廳搜尋 {keyword} @ {location}")
                 return cached_item["data"]
             
             self._update_stats("misses")
+            metrics.record_cache("restaurant", False)
             return None
     
     def set_restaurant_cache(self, keyword: str, location: str, max_results: int, 
@@ -247,10 +460,12 @@ class SQLiteCacheManager:
             if cached_item:
                 self._update_stats("hits")
                 self._update_stats("weather_hits")
+                metrics.record_cache("weather", True)
                 print(f"快取命中：天氣資料 {location}")
                 return cached_item["data"]
             
             self._update_stats("misses")
+            metrics.record_cache("weather", False)
             return None
     
     def set_weather_cache(self, location: str, weather_data: Dict):
@@ -277,10 +492,12 @@ class SQLiteCacheManager:
             if cached_item:
                 self._update_stats("hits")
                 self._update_stats("ai_hits")
+                metrics.record_cache("ai", True)
                 print(f"快取命中：AI分析 '{user_input[:30]}...'")
                 return cached_item["data"]
             
             self._update_stats("misses")
+            metrics.record_cache("ai", False)
             return None
     
     def set_ai_cache(self, user_input: str, analysis_result: Dict, analysis_type: str = "general"):
@@ -300,7 +517,9 @@ class SQLiteCacheManager:
     
     def get_cache_stats(self) -> Dict:
         """獲取快取統計"""
-        with sqlite3.connect(self.db_path) as conn:
+        self.flush()
+        conn = self._get_conn()
+        with conn:
             cursor = conn.cursor()
             
             # 從資料庫獲取統計數據
@@ -311,9 +530,9 @@ class SQLiteCacheManager:
             cursor.execute('''
                 SELECT cache_type, COUNT(*) 
                 FROM cache_items 
-                WHERE expires_at > CURRENT_TIMESTAMP 
+                WHERE expires_at > ? 
                 GROUP BY cache_type
-            ''')
+            ''', (_expiry_now(),))
             cache_sizes = dict(cursor.fetchall())
             
             # 計算命中率
@@ -334,7 +553,12 @@ class SQLiteCacheManager:
     def clear_cache(self, cache_type: str = "all"):
         """清空快取"""
         with self._lock:
-            with sqlite3.connect(self.db_path) as conn:
+            if cache_type == "all":
+                with self._pending_lock:
+                    self._pending_access.clear()
+                    self._pending_stats.clear()
+            conn = self._get_conn()
+            with conn:
                 cursor = conn.cursor()
                 
                 if cache_type == "all":
@@ -345,18 +569,40 @@ class SQLiteCacheManager:
                     cursor.execute('DELETE FROM cache_items WHERE cache_type = ?', (cache_type,))
                 
                 conn.commit()
-                print(f"快取已清空：{cache_type}")
+            self._recount()
+            print(f"快取已清空：{cache_type}")
     
     def vacuum_database(self):
         """壓縮資料庫以回收空間"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.execute('VACUUM')
-            print("資料庫已壓縮")
+        self._get_conn().execute('VACUUM')
+        print("資料庫已壓縮")
     
     def close(self):
-        """關閉快取管理器（清理資源）"""
-        # SQLite 連接會自動關閉，這裡可以執行最終清理
-        pass
+        """關閉快取管理器：停止背景寫回、寫入尚未寫回的紀錄並關閉連線"""
+        self._stop.set()
+        self._wake.set()
+        if self._writer is not None and self._writer is not threading.current_thread():
+            self._writer.join(timeout=2)
+        if os.path.exists(self.db_path):
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                print(f"關閉時寫回快取紀錄失敗: {e}")
+        self._close_connections()
+
+
+def _expiry_now() -> str:
+    """目前時間，格式與寫入 expires_at 的 datetime.isoformat() 相同。
+
+    expires_at 以本地時間 isoformat（含 "T"）儲存，與 CURRENT_TIMESTAMP
+    （UTC、以空白分隔）做字串比較會讓當天到期的項目永遠不過期。
+    """
+    return datetime.now().isoformat()
+
+
+def _sql_timestamp(ts: float) -> str:
+    """與 SQLite CURRENT_TIMESTAMP 相同格式的 UTC 時間字串"""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
 
 # 創建全域 SQLite 快取管理器實例
 import os as _os
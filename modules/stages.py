@@ -0,0 +1,24 @@
+"""Per-stage timeout budgets of the SSE recommendation stream.
+
+``modules.pipeline`` gives up on a stage after its budget; the coalesced
+calls behind a stage (``@singleflight`` groups in fast_search, sweat_index,
+intent_analyzer, geocoding) bound how long a follower waits on a leader by
+the same number.  Kept apart from ``modules.pipeline`` so those modules do
+not depend on the SSE runtime.
+"""
+
+from typing import Dict
+
+# Per-stage timeout budget (seconds)
+STAGE_TIMEOUTS: Dict[str, float] = {
+    "weather": 8,
+    "intent": 12,
+    "geocode": 6,
+    "maps": 30,
+    "ubereats": 30,
+    "enrich": 15,
+    "distance": 20,
+    "social": 10,
+    # Geocoding plus, on a cold city, one forecast document download
+    "sweat_timeline": 20,
+}
@@ -0,0 +1,242 @@
+"""
+Spatial index over CWA observation stations (O-A0003-001).
+
+``sweat_index.find_nearest_weather_station`` and
+``weather.find_nearest_observation_station`` used to scan every station of
+the payload on every request, re-parsing WGS84 coordinates and
+string-comparing the ``-99`` / ``-990`` sentinels each time.
+``StationIndex`` parses a payload once:
+
+- valid stations (temperature and humidity present) are kept in flat
+  ``array('d')`` columns plus name / id / observation-time lists
+- a uniform lat/lng grid (``cell_deg``, 0.1 degree ~ 11 km by default)
+  maps each cell to its station rows; ``nearest`` / ``k_nearest`` search
+  rings of cells outward from the query and stop once no unsearched cell
+  can hold anything closer
+- ``interpolate`` blends the k nearest stations by inverse distance
+  weighting
+
+``station_index_for(payload)`` memoizes the index of the last payload it
+saw, so repeated queries against the same observation download reuse it.
+
+Usage::
+
+    index = StationIndex.from_payload(cwa_json)
+    station = index.nearest(25.034, 121.565, max_km=200)
+"""
+
+import math
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from modules.geo.geomath import haversine_km
+
+DEFAULT_CELL_DEG = 0.1
+# km per degree of latitude (and of longitude at the equator) on the
+# 6371 km haversine sphere
+_KM_PER_DEG = math.pi * 6371.0 / 180
+
+# CWA marks missing readings with -99 / -990 (also as "-99.0", "-990.0")
+_SENTINEL_LIMIT = -98.0
+
+
+def parse_reading(value) -> Optional[float]:
+    """Float value of a CWA reading; ``None`` for empty, sentinel or garbage."""
+    if value is None or value == '':
+        return None
+    try:
+        number = float(value)
+    except (ValueError, TypeError):
+        return None
+    return None if number <= _SENTINEL_LIMIT else number
+
+
+def _station_coords(station: Dict) -> Optional[Tuple[float, float]]:
+    """WGS84 coordinates, or the first listed coordinate pair as a fallback."""
+    coordinates = station.get('GeoInfo', {}).get('Coordinates', [])
+    ordered = [c for c in coordinates if c.get('CoordinateName') == 'WGS84'] + coordinates[:1]
+    for coord in ordered:
+        try:
+            return float(coord.get('StationLatitude')), float(coord.get('StationLongitude'))
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+class StationIndex:
+    """Valid stations of one observation payload, grid-indexed by location."""
+
+    def __init__(self, cell_deg: float = DEFAULT_CELL_DEG):
+        self.cell_deg = cell_deg
+        self.lats = array('d')
+        self.lngs = array('d')
+        self.temperatures = array('d')
+        self.humidities = array('d')
+        self.wind_speeds = array('d')
+        self.names: List[str] = []
+        self.station_ids: List[str] = []
+        self.obs_times: List[str] = []
+        self.station_count = 0
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        # (min row, max row, min col, max col) of occupied cells
+        self._bounds = (0, 0, 0, 0)
+
+    @classmethod
+    def from_payload(cls, payload: Dict, cell_deg: float = DEFAULT_CELL_DEG) -> "StationIndex":
+        index = cls(cell_deg)
+        stations = (payload or {}).get('records', {}).get('Station', [])
+        index.station_count = len(stations)
+        for station in stations:
+            coords = _station_coords(station)
+            if coords is None:
+                continue
+            element = station.get('WeatherElement', {})
+            temp = parse_reading(element.get('AirTemperature'))
+            humidity = parse_reading(element.get('RelativeHumidity'))
+            if temp is None or humidity is None:
+                continue
+            index._add(
+                coords, temp, humidity, parse_reading(element.get('WindSpeed')) or 0,
+                station.get('StationName', '未知測站'), station.get('StationId', ''),
+                station.get('ObsTime', {}).get('DateTime', ''),
+            )
+        index._finish()
+        return index
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_deg), math.floor(lng / self.cell_deg))
+
+    def _add(self, coords, temp, humidity, wind_speed, name, station_id, obs_time):
+        row = len(self.names)
+        self.lats.append(coords[0])
+        self.lngs.append(coords[1])
+        self.temperatures.append(temp)
+        self.humidities.append(humidity)
+        self.wind_speeds.append(wind_speed)
+        self.names.append(name)
+        self.station_ids.append(station_id)
+        self.obs_times.append(obs_time)
+        self._grid.setdefault(self._cell(*coords), []).append(row)
+
+    def _finish(self):
+        if not self._grid:
+            return
+        rows = [cell[0] for cell in self._grid]
+        cols = [cell[1] for cell in self._grid]
+        self._bounds = (min(rows), max(rows), min(cols), max(cols))
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    # -- queries ---------------------------------------------------------------
+
+    def _ring(self, center: Tuple[int, int], r: int):
+        ci, cj = center
+        if r == 0:
+            yield center
+            return
+        for j in range(cj - r, cj + r + 1):
+            yield (ci - r, j)
+            yield (ci + r, j)
+        for i in range(ci - r + 1, ci + r):
+            yield (i, cj - r)
+            yield (i, cj + r)
+
+    def _search(self, lat: float, lng: float, k: int, max_km: Optional[float]) -> List[Tuple[float, int]]:
+        """``(distance_km, row)`` of up to *k* nearest stations, closest first."""
+        if not self.names or k <= 0:
+            return []
+        center = self._cell(lat, lng)
+        ci, cj = center
+        min_i, max_i, min_j, max_j = self._bounds
+        # Beyond this ring there are no cells at all (the query may lie outside the grid)
+        last_ring = max(abs(ci - min_i), abs(ci - max_i), abs(cj - min_j), abs(cj - max_j))
+        found: List[Tuple[float, int]] = []
+        for r in range(last_ring + 1):
+            for cell in self._ring(center, r):
+                for row in self._grid.get(cell, ()):
+                    found.append((haversine_km(lat, lng, self.lats[row], self.lngs[row]), row))
+            # Anything outside rings 0..r is at least r cells away along one axis
+            lat_edge = min(89.9, abs(lat) + (r + 1) * self.cell_deg)
+            bound = r * self.cell_deg * _KM_PER_DEG * math.cos(math.radians(lat_edge))
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= bound:
+                    break
+            if max_km is not None and bound > max_km:
+                break
+        found.sort()
+        found = found[:k]
+        if max_km is not None:
+            found = [(d, row) for d, row in found if d <= max_km]
+        return found
+
+    def _station(self, row: int, distance_km: float) -> Dict:
+        return {
+            'station_name': self.names[row],
+            'station_id': self.station_ids[row],
+            'temperature': self.temperatures[row],
+            'humidity': self.humidities[row],
+            'wind_speed': self.wind_speeds[row],
+            'latitude': self.lats[row],
+            'longitude': self.lngs[row],
+            'distance_km': distance_km,
+            'data_time': self.obs_times[row],
+        }
+
+    def nearest(self, lat: float, lng: float, max_km: Optional[float] = None) -> Optional[Dict]:
+        """Closest valid station (within *max_km*), or ``None``."""
+        found = self._search(lat, lng, 1, max_km)
+        return self._station(found[0][1], found[0][0]) if found else None
+
+    def k_nearest(self, lat: float, lng: float, k: int, max_km: Optional[float] = None) -> List[Dict]:
+        """Up to *k* closest valid stations, closest first."""
+        return [self._station(row, d) for d, row in self._search(lat, lng, k, max_km)]
+
+    def interpolate(self, lat: float, lng: float, k: int = 4, power: float = 2.0,
+                    max_km: Optional[float] = None) -> Optional[Dict]:
+        """Inverse-distance-weighted temperature / humidity / wind of the *k* nearest.
+
+        Returns ``None`` when no station is in range.  ``stations`` lists the
+        names used; ``distance_km`` is the nearest one's distance.
+        """
+        found = self._search(lat, lng, k, max_km)
+        if not found:
+            return None
+        if found[0][0] < 1e-3:
+            found = found[:1]
+        weights = [1.0 / max(d, 1e-3) ** power for d, _row in found]
+        total = sum(weights)
+
+        def blend(column):
+            return sum(w * column[row] for w, (_d, row) in zip(weights, found)) / total
+
+        return {
+            'temperature': round(blend(self.temperatures), 1),
+            'humidity': round(blend(self.humidities), 1),
+            'wind_speed': round(blend(self.wind_speeds), 1),
+            'distance_km': found[0][0],
+            'stations': [self.names[row] for _d, row in found],
+            'data_time': max(self.obs_times[row] for _d, row in found),
+        }
+
+
+# ------------------------------------------------------------------
+# Memoized index of the most recent payload
+# ------------------------------------------------------------------
+_last_lock = threading.Lock()
+_last: Tuple[Optional[Dict], Optional[StationIndex]] = (None, None)
+
+
+def station_index_for(payload: Dict) -> StationIndex:
+    """Index of *payload*, rebuilt only when a different payload object arrives."""
+    global _last
+    with _last_lock:
+        last_payload, last_index = _last
+        if last_payload is payload and last_index is not None:
+            return last_index
+    index = StationIndex.from_payload(payload)
+    with _last_lock:
+        _last = (payload, index)
+    return index
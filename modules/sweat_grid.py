@@ -0,0 +1,194 @@
+"""
+Precomputed sweat index grid over the observation stations.
+
+``query_sweat_index_by_location`` used to run ``estimate_sweat_index``,
+``calculate_heat_index`` and the comfort / alert rules on every request,
+and main.py then re-derived the walking radius from the result.  Every
+request is answered from its nearest station, so all of that depends only
+on the station's reading:
+
+- ``SweatGrid.from_index(index)`` computes one ``profile`` per valid
+  station of a ``StationIndex``: sweat index, heat index, comfort level,
+  risk alerts and the recommended walking radius (sweat / heat index for
+  all stations in one pass via ``modules.sweat_math``)
+- ``sweat_grid_for(index)`` memoizes the grid of the current snapshot; it
+  is registered as an ``observation_snapshot`` listener, so the grid is
+  rebuilt (off the request path) whenever a new snapshot is installed
+- ``profile_for(station)`` is the request-time lookup; a reading that no
+  longer matches the current grid (an older cached observation, simulated
+  data) is computed directly instead
+
+Profiles are shared between requests and must be treated as read-only.
+
+Usage::
+
+    profile = profile_for(weather_data)
+    profile["sweat_index"], profile["walking_radius"]["max_distance_km"]
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from modules.station_index import StationIndex
+from modules.sweat_index import (
+    calculate_heat_index,
+    estimate_sweat_index,
+    get_comfort_level,
+    get_sweat_risk_alerts,
+)
+from modules.sweat_math import heat_index_many, sweat_index_many, to_list
+from modules.weather_snapshot import observation_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Walking radius: at most a 10-minute walk in good weather, 5 minutes in bad
+RAIN_RADIUS_THRESHOLD = 50
+
+
+def _rain_percent(value) -> Optional[float]:
+    """Rain probability as a number (accepts 30, "30", "30%"); ``None`` if unknown."""
+    if value is None or value == '' or value == 'N/A':
+        return None
+    try:
+        return float(str(value).replace('%', '').strip())
+    except (ValueError, TypeError):
+        return None
+
+
+def recommend_walking_radius(sweat_index: Optional[float], rain_probability=None) -> Dict:
+    """``{'max_distance_km', 'reason'}`` for the sweat index and rain probability."""
+    rain = _rain_percent(rain_probability)
+    if sweat_index is not None and sweat_index >= 7:
+        return {"max_distance_km": 0.4, "reason": f"流汗指數 {sweat_index} (不舒適)，步行5分鐘內 (400m)"}
+    if rain is not None and rain >= RAIN_RADIUS_THRESHOLD:
+        return {"max_distance_km": 0.4, "reason": f"降雨機率 {rain_probability}%，步行5分鐘內 (400m)"}
+    if sweat_index is not None and sweat_index >= 5:
+        return {"max_distance_km": 0.6, "reason": f"流汗指數 {sweat_index} (普通)，步行8分鐘內 (600m)"}
+    return {"max_distance_km": 0.8, "reason": "舒適天氣，步行10分鐘內 (800m)"}
+
+
+def build_profile(temp: float, humidity: float, wind_speed: float = 0,
+                  sweat_index: Optional[float] = None, heat_index: Optional[float] = None) -> Dict:
+    """Sweat / heat index, comfort level, alerts and dry-weather walking radius.
+
+    *sweat_index* / *heat_index* may be passed in when already computed
+    (``SweatGrid.from_index`` computes them for all stations at once).
+    """
+    if sweat_index is None:
+        sweat_index = estimate_sweat_index(temp, humidity, wind_speed)
+    if heat_index is None:
+        heat_index = calculate_heat_index(temp, humidity)
+    return {
+        "sweat_index": sweat_index,
+        "heat_index": heat_index,
+        "comfort_level": get_comfort_level(sweat_index),
+        "alerts": get_sweat_risk_alerts(temp, humidity, wind_speed,
+                                        sweat_index=sweat_index, heat_index=heat_index),
+        "walking_radius": recommend_walking_radius(sweat_index),
+    }
+
+
+def walking_radius(profile: Dict, rain_probability=None) -> Dict:
+    """The profile's walking radius, shortened when rain is likely."""
+    rain = _rain_percent(rain_probability)
+    if rain is None or rain < RAIN_RADIUS_THRESHOLD:
+        return profile["walking_radius"]
+    return recommend_walking_radius(profile["sweat_index"], rain_probability)
+
+
+def _reading(station: Dict) -> Tuple[float, float, float]:
+    return (float(station['temperature']), float(station['humidity']),
+            float(station.get('wind_speed') or 0))
+
+
+class SweatGrid:
+    """Per-station profiles of one observation snapshot."""
+
+    def __init__(self, index: StationIndex):
+        self.index = index
+        # station key -> (reading, profile); the reading guards against stale callers
+        self._profiles: Dict[str, Tuple[Tuple[float, float, float], Dict]] = {}
+
+    @classmethod
+    def from_index(cls, index: StationIndex) -> "SweatGrid":
+        grid = cls(index)
+        if not len(index):
+            return grid
+        # Sweat / heat index of every station in one vectorized pass
+        sweat = to_list(sweat_index_many(index.temperatures, index.humidities, index.wind_speeds))
+        heat = to_list(heat_index_many(index.temperatures, index.humidities))
+        for row in range(len(index)):
+            reading = (index.temperatures[row], index.humidities[row], index.wind_speeds[row])
+            key = index.station_ids[row] or index.names[row]
+            grid._profiles[key] = (reading, build_profile(*reading, sweat_index=sweat[row], heat_index=heat[row]))
+        return grid
+
+    def __len__(self) -> int:
+        return len(self._profiles)
+
+    def lookup(self, station: Dict) -> Optional[Dict]:
+        """Profile of *station* if its reading is the one this grid was built from."""
+        entry = self._profiles.get(station.get('station_id') or station.get('station_name'))
+        if entry is None:
+            return None
+        try:
+            reading = _reading(station)
+        except (KeyError, ValueError, TypeError):
+            return None
+        return entry[1] if entry[0] == reading else None
+
+
+# ------------------------------------------------------------------
+# Grid of the current observation snapshot
+# ------------------------------------------------------------------
+_lock = threading.Lock()
+_last: Tuple[Optional[StationIndex], Optional[SweatGrid]] = (None, None)
+_stats = {"hits": 0, "misses": 0, "builds": 0, "last_build_ms": None}
+
+
+def _count(name: str):
+    with _lock:
+        _stats[name] += 1
+
+
+def sweat_grid_for(index: StationIndex) -> SweatGrid:
+    """Grid of *index*, rebuilt only when a different index arrives."""
+    global _last
+    with _lock:
+        last_index, last_grid = _last
+        if last_index is index and last_grid is not None:
+            return last_grid
+    started = time.perf_counter()
+    grid = SweatGrid.from_index(index)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _lock:
+        _last = (index, grid)
+        _stats["builds"] += 1
+        _stats["last_build_ms"] = round(elapsed_ms, 2)
+    logger.info("Sweat grid built: %d stations in %.1fms", len(grid), elapsed_ms)
+    return grid
+
+
+def profile_for(station: Dict) -> Dict:
+    """Profile of a station reading (``temperature`` / ``humidity`` / ``wind_speed``)."""
+    index = observation_snapshot.current_index()
+    if index is not None:
+        profile = sweat_grid_for(index).lookup(station)
+        if profile is not None:
+            _count("hits")
+            return profile
+    _count("misses")
+    return build_profile(*_reading(station))
+
+
+def get_stats() -> Dict:
+    with _lock:
+        stats = dict(_stats)
+        grid = _last[1]
+    stats["stations"] = len(grid) if grid is not None else 0
+    return stats
+
+
+observation_snapshot.add_listener(sweat_grid_for)
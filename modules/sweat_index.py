@@ -9,6 +9,15 @@ from typing import Dict, Optional, Tuple
 from datetime import datetime
 from dotenv import load_dotenv
 
+from modules.geo.geocode_store import geocode_store
+from modules.geo.geomath import haversine_km
+from modules.geo.landmarks import CITY_CENTERS
+from modules.singleflight import normalize_location, singleflight
+from modules.stages import STAGE_TIMEOUTS
+from modules.station_index import StationIndex, station_index_for
+from modules.tiered_cache import tiered_cache
+from modules.weather_snapshot import ObservationUnavailable, observation_snapshot
+
 # 加載環境變數
 load_dotenv()
 
@@ -30,132 +39,50 @@ def get_location_coordinates(location: str) -> Optional[Tuple[float, float, str]
             except ValueError:
                 pass
         
-        # TODO: 將硬編碼的台灣地點座標庫改用資料庫存儲 (如 SQLite)
-        # 應包含：地點名稱、緯度、經度、顯示名稱、類型(景點/車站/夜市等)、更新時間等欄位
-        # 可考慮支援地點別名、多語言名稱等功能，並定期從API更新座標資料
-        # 台灣常見地點座標庫
-        taiwan_locations = {
-            # 原有測試地點
-            "台北101": (25.0340, 121.5645, "台北101"),
-            "台北市敦化南路二段77號": (25.0271, 121.5493, "台北市敦化南路二段77號"),
-            "新北市泰山區貴子路2號": (25.0597, 121.4313, "新北市泰山區貴子路2號"),
-            "900屏東縣屏東市青島街106號": (22.6690, 120.4818, "屏東縣屏東市青島街106號"),
-            "六十石山": (23.3081, 121.2833, "六十石山"),
-            
-            # 車站機場
-            "台北車站": (25.0478, 121.5170, "台北車站"),
-            "高雄車站": (22.6391, 120.3022, "高雄車站"),
-            "台中車站": (24.1369, 120.6856, "台中車站"),
-            "台南車站": (22.9969, 120.2127, "台南車站"),
-            "桃園機場": (25.0777, 121.2328, "桃園國際機場"),
-            "高雄機場": (22.5771, 120.3498, "高雄國際機場"),
-            
-            # 自然景點
-            "阿里山": (23.5112, 120.8128, "阿里山"),
-            "日月潭": (23.8569, 120.9150, "日月潭"),
-            "太魯閣": (24.1580, 121.4906, "太魯閣國家公園"),
-            "墾丁": (22.0072, 120.7473, "墾丁"),
-            "九份": (25.1095, 121.8439, "九份老街"),
-            "淡水": (25.1677, 121.4408, "淡水老街"),
-            
-            # 都市地標
-            "西門町": (25.0421, 121.5066, "西門町"),
-            "信義區": (25.0336, 121.5645, "台北市信義區"),
-            "彰化大佛": (24.0838, 120.5397, "彰化大佛"),
-            
-            # 新增常見地點（基於測試結果）
-            "中正紀念堂": (25.0346, 121.5218, "中正紀念堂"),
-            "士林夜市": (25.0883, 121.5251, "士林夜市"),
-            "愛河": (22.6516, 120.2998, "愛河"),
-            "逢甲夜市": (24.1774, 120.6466, "逢甲夜市"),
-            "安平古堡": (23.0016, 120.1606, "安平古堡"),
-            "清水斷崖": (24.2101, 121.6781, "清水斷崖"),
-            "野柳地質公園": (25.2113, 121.6964, "野柳地質公園"),
-            "鹿港老街": (24.0571, 120.4321, "鹿港老街"),
-            "溪頭森林遊樂區": (23.6667, 120.7833, "溪頭森林遊樂區"),
-            "金城武樹": (23.0974, 121.2044, "金城武樹"),
-            
-            # 其他夜市
-            "饒河夜市": (25.0516, 121.5771, "饒河夜市"),
-            "華西街夜市": (25.0371, 121.5010, "華西街夜市"),
-            "南機場夜市": (25.0297, 121.5069, "南機場夜市"),
-            "寧夏夜市": (25.0565, 121.5158, "寧夏夜市"),
-            "六合夜市": (22.6318, 120.3014, "六合夜市"),
-            "瑞豐夜市": (22.6589, 120.3116, "瑞豐夜市"),
-            "一中街": (24.1465, 120.6845, "一中街"),
-            "花園夜市": (22.9928, 120.2269, "花園夜市"),
-            
-            # 知名景點
-            "故宮博物院": (25.1013, 121.5481, "故宮博物院"),
-            "龍山寺": (25.0368, 121.4999, "龍山寺"),
-            "總統府": (25.0404, 121.5090, "總統府"),
-            "國父紀念館": (25.0403, 121.5603, "國父紀念館"),
-            "中山紀念林": (25.0735, 121.5200, "中山紀念林"),
-            "陽明山": (25.1561, 121.5284, "陽明山"),
-            "貓空": (24.9738, 121.5766, "貓空"),
-            "烏來": (24.8638, 121.5496, "烏來"),
-            "平溪": (25.0261, 121.7428, "平溪"),
-            "十分瀑布": (25.0448, 121.7693, "十分瀑布"),
-        }
+        # 檢查預設地點庫（預先建立的地標索引）
+        landmark = geocode_store.match_landmark(location)
+        if landmark:
+            return (landmark["lat"], landmark["lng"], landmark["display_name"])
         
-        # 檢查預設地點庫
-        for key, (lat, lng, display_name) in taiwan_locations.items():
-            if key in location or location in key:
-                return (lat, lng, display_name)
+        # 檢查地理編碼快取（含先前查無結果的紀錄）
+        cached = geocode_store.lookup(location)
+        if cached and not cached.get("not_found"):
+            return (cached["lat"], cached["lng"], cached["display_name"])
         
-        # 嘗試使用地理編碼服務（加上SSL驗證跳過）
-        try:
-            url = "https://nominatim.openstreetmap.org/search"
-            params = {
-                'q': location,
-                'format': 'json',
-                'limit': 1,
-                'countrycodes': 'tw',
-                'addressdetails': 1
-            }
+        # 嘗試使用地理編碼服務（加上SSL驗證跳過；快取記錄為查無結果時跳過）
+        if cached is None:
+            try:
+                url = "https://nominatim.openstreetmap.org/search"
+                params = {
+                    'q': location,
+                    'format': 'json',
+                    'limit': 1,
+                    'countrycodes': 'tw',
+                    'addressdetails': 1
+                }
             
-            headers = {
-                'User-Agent': 'AI-Lunch-Mind/1.0 (lunch-recommendation-app)'
-            }
+                headers = {
+                    'User-Agent': 'AI-Lunch-Mind/1.0 (lunch-recommendation-app)'
+                }
             
-            response = requests.get(url, params=params, headers=headers, 
-                                  timeout=10, verify=False)
-            response.raise_for_status()
-            data = response.json()
+                response = requests.get(url, params=params, headers=headers, 
+                                      timeout=10, verify=False)
+                response.raise_for_status()
+                data = response.json()
             
-            if data:
-                result = data[0]
-                lat = float(result['lat'])
-                lng = float(result['lon'])
-                display_name = result.get('display_name', location)
-                return (lat, lng, display_name)
-        except:
-            pass  # 如果線上服務失敗，繼續用其他方法
+                if data:
+                    result = data[0]
+                    lat = float(result['lat'])
+                    lng = float(result['lon'])
+                    display_name = result.get('display_name', location)
+                    geocode_store.store(location, (lat, lng), display_name, source="nominatim")
+                    return (lat, lng, display_name)
+                geocode_store.store(location, None)
+            except:
+                pass  # 如果線上服務失敗，繼續用其他方法
         
         # 如果都找不到，嘗試從地址中推測縣市
-        # TODO: 將縣市座標資料改用資料庫存儲 (如 SQLite)
-        # 應包含：縣市名稱、中心座標、邊界資料、行政代碼等，並支援縣市別名匹配
-        city_coords = {
-            "台北": (25.0330, 121.5654, "台北市"),
-            "新北": (25.0118, 121.4652, "新北市"),
-            "桃園": (24.9936, 121.3010, "桃園市"),
-            "台中": (24.1477, 120.6736, "台中市"),
-            "台南": (22.9999, 120.2269, "台南市"),
-            "高雄": (22.6273, 120.3014, "高雄市"),
-            "基隆": (25.1276, 121.7391, "基隆市"),
-            "新竹": (24.8138, 120.9675, "新竹市"),
-            "苗栗": (24.5602, 120.8214, "苗栗縣"),
-            "彰化": (24.0518, 120.5161, "彰化縣"),
-            "南投": (23.9609, 120.9718, "南投縣"),
-            "雲林": (23.7092, 120.4313, "雲林縣"),
-            "嘉義": (23.4800, 120.4491, "嘉義市"),
-            "屏東": (22.6690, 120.4818, "屏東縣"),
-            "宜蘭": (24.7021, 121.7378, "宜蘭縣"),
-            "花蓮": (23.9871, 121.6015, "花蓮縣"),
-            "台東": (22.7972, 121.1713, "台東縣"),
-        }
-        
-        for city_name, (lat, lng, display_name) in city_coords.items():
+        for city_name, (lat, lng, display_name) in CITY_CENTERS.items():
             if city_name in location:
                 return (lat, lng, f"{display_name}(推估)")
         
@@ -180,27 +107,17 @@ def get_real_weather_data(latitude: float, longitude: float) -> Dict:
                 "message": "請設置 CWB_API_KEY 環境變數以獲取真實天氣資料"
             }
         
-        # 使用中央氣象署自動氣象站資料
-        url = f"https://opendata.cwa.gov.tw/api/v1/rest/datastore/O-A0003-001"
-        params = {
-            'Authorization': api_key,
-            'elementName': 'TEMP,HUMD,WDSD',
-            'parameterName': 'LAT,LON'
-        }
-        
-        response = requests.get(url, params=params, timeout=15, verify=False)
-        response.raise_for_status()
-        data = response.json()
-        
-        # 檢查API回應狀態
-        if data.get('success') != 'true':
+        # 使用共用的全台觀測快照（每個觀測週期最多下載一次）
+        try:
+            index = observation_snapshot.get_index()
+        except ObservationUnavailable as e:
             return {
                 "error": "中央氣象署API回應錯誤",
-                "message": f"API狀態: {data.get('result', {}).get('resource_id', 'unknown')}"
+                "message": str(e)
             }
         
         # 找到最近的氣象站
-        nearest_station = find_nearest_weather_station(latitude, longitude, data)
+        nearest_station = nearest_weather_station(latitude, longitude, index)
         
         if nearest_station:
             nearest_station['is_real_data'] = True
@@ -237,133 +154,63 @@ def get_real_weather_data(latitude: float, longitude: float) -> Dict:
             "message": f"未知錯誤: {str(e)}"
         }
 
+def get_real_weather_data_cached(latitude: float, longitude: float) -> Tuple[Dict, bool]:
+    """
+    經過天氣快取的 get_real_weather_data（stale-while-revalidate）
+    過期但仍在寬限期內的資料立即回傳並標記為 stale，同時在背景重新查詢；
+    錯誤結果不快取
+    :return: (天氣資料, 是否為過期資料)
+    """
+    # 座標取到小數第三位（約 100 公尺），附近的查詢共用同一筆
+    key = ("observation", round(latitude, 3), round(longitude, 3))
+    return tiered_cache.get_or_refresh(
+        "weather", key, lambda: get_real_weather_data(latitude, longitude),
+        cacheable=lambda data: "error" not in data,
+    )
+
 def find_nearest_weather_station(lat: float, lng: float, weather_data: Dict) -> Optional[Dict]:
     """
-    找到最近的氣象站並提取天氣資料
+    找到最近的氣象站並提取天氣資料（使用測站空間索引，每份觀測資料只解析一次）
     """
     try:
-        stations = weather_data.get('records', {}).get('Station', [])
-        min_distance = float('inf')
-        nearest_station_data = None
-        
-        print(f"🔍 搜尋氣象站... (共找到 {len(stations)} 個測站)")
-        
-        for station in stations:
-            # 獲取氣象站座標 (使用WGS84格式)
-            station_lat = None
-            station_lng = None
-            
-            geo_info = station.get('GeoInfo', {})
-            coordinates = geo_info.get('Coordinates', [])
-            
-            # 找WGS84座標
-            for coord in coordinates:
-                if coord.get('CoordinateName') == 'WGS84':
-                    try:
-                        station_lat = float(coord.get('StationLatitude', 0))
-                        station_lng = float(coord.get('StationLongitude', 0))
-                        break
-                    except (ValueError, TypeError):
-                        continue
-            
-            # 如果沒有WGS84，使用第一個可用的座標
-            if station_lat is None and coordinates:
-                try:
-                    station_lat = float(coordinates[0].get('StationLatitude', 0))
-                    station_lng = float(coordinates[0].get('StationLongitude', 0))
-                except (ValueError, TypeError):
-                    continue
-            
-            if station_lat is None or station_lng is None:
-                continue
-            
-            # 使用更精確的距離計算 (Haversine公式)
-            distance_km = calculate_distance(lat, lng, station_lat, station_lng)
-            
-            # 提取天氣要素
-            weather_element = station.get('WeatherElement', {})
-            temp = None
-            humidity = None
-            wind_speed = 0
-            
-            try:
-                # 溫度
-                temp_str = weather_element.get('AirTemperature')
-                if temp_str and temp_str != '-990.0' and temp_str != '-99.0':
-                    temp = float(temp_str)
-                
-                # 濕度
-                humidity_str = weather_element.get('RelativeHumidity')
-                if humidity_str and humidity_str != '-990' and humidity_str != '-99':
-                    humidity = float(humidity_str)
-                
-                # 風速
-                wind_str = weather_element.get('WindSpeed')
-                if wind_str and wind_str != '-990.0' and wind_str != '-99.0':
-                    wind_speed = float(wind_str)
-                else:
-                    wind_speed = 0
-                    
-            except (ValueError, TypeError):
-                continue
-            
-            # 只有當有效的溫度和濕度資料時才考慮這個測站
-            if temp is not None and humidity is not None and distance_km < min_distance:
-                min_distance = distance_km
-                
-                station_name = station.get('StationName', '未知測站')
-                obs_time = station.get('ObsTime', {}).get('DateTime', '')
-                
-                nearest_station_data = {
-                    'station_name': station_name,
-                    'temperature': temp,
-                    'humidity': humidity,
-                    'wind_speed': wind_speed,
-                    'distance_km': distance_km,
-                    'data_time': obs_time,
-                    'is_real_data': True
-                }
-                print(f"📡 找到有效測站: {station_name} (距離 {distance_km:.1f}公里, {temp}°C, {humidity}%)")
-        
-        # 檢查是否在合理範圍內 (200公里)
-        if nearest_station_data and nearest_station_data['distance_km'] <= 200:
-            print(f"✅ 使用最近測站: {nearest_station_data['station_name']}")
-            return nearest_station_data
-        else:
-            if nearest_station_data:
-                print(f"❌ 最近測站距離 {nearest_station_data['distance_km']:.1f}公里，超過200公里限制")
-            else:
-                print("❌ 沒有找到有有效天氣資料的測站")
-            return None
-        
+        return nearest_weather_station(lat, lng, station_index_for(weather_data))
     except Exception as e:
         print(f"處理氣象站資料失敗: {e}")
         return None
 
-def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+def nearest_weather_station(lat: float, lng: float, index: StationIndex) -> Optional[Dict]:
     """
-    使用Haversine公式計算兩點間距離（公里）
+    從測站索引找到最近的有效氣象站（200公里內）
     """
-    import math
-    
-    # 轉換為弧度
-    lat1_rad = math.radians(lat1)
-    lng1_rad = math.radians(lng1)
-    lat2_rad = math.radians(lat2)
-    lng2_rad = math.radians(lng2)
-    
-    # Haversine公式
-    dlat = lat2_rad - lat1_rad
-    dlng = lng2_rad - lng1_rad
+    print(f"🔍 搜尋氣象站... (共找到 {index.station_count} 個測站，{len(index)} 個有效)")
     
-    a = (math.sin(dlat/2)**2 + 
-         math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlng/2)**2)
-    c = 2 * math.asin(math.sqrt(a))
+    station = index.nearest(lat, lng)
+    if station is None:
+        print("❌ 沒有找到有有效天氣資料的測站")
+        return None
     
-    # 地球半徑（公里）
-    r = 6371
+    # 檢查是否在合理範圍內 (200公里)
+    if station['distance_km'] > 200:
+        print(f"❌ 最近測站距離 {station['distance_km']:.1f}公里，超過200公里限制")
+        return None
     
-    return r * c
+    print(f"✅ 使用最近測站: {station['station_name']} (距離 {station['distance_km']:.1f}公里, {station['temperature']}°C, {station['humidity']}%)")
+    return {
+        'station_name': station['station_name'],
+        'station_id': station['station_id'],
+        'temperature': station['temperature'],
+        'humidity': station['humidity'],
+        'wind_speed': station['wind_speed'],
+        'distance_km': station['distance_km'],
+        'data_time': station['data_time'],
+        'is_real_data': True
+    }
+
+def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """
+    使用Haversine公式計算兩點間距離（公里）
+    """
+    return haversine_km(lat1, lng1, lat2, lng2)
 
 def get_simulated_weather(latitude: float, longitude: float) -> Dict:
     """
@@ -406,6 +253,9 @@ def get_simulated_weather(latitude: float, longitude: float) -> Dict:
         'is_simulated': True
     }
 
+# 同地點同時間的查詢只打一次 API，其餘呼叫者共用結果
+@singleflight("weather", key=lambda location: normalize_location(location),
+              timeout=STAGE_TIMEOUTS["weather"])
 def query_sweat_index_by_location(location: str) -> Dict:
     """
     根據地點查詢真實天氣資料並計算流汗指數
@@ -438,8 +288,8 @@ def query_sweat_index_by_location(location: str) -> Dict:
         print(f"📍 座標: {latitude}, {longitude}")
         print(f"📍 地點: {display_name}")
         
-        # 2. 獲取真實天氣資料
-        weather_data = get_real_weather_data(latitude, longitude)
+        # 2. 獲取真實天氣資料（快取過期時先回傳舊資料，背景更新）
+        weather_data, stale = get_real_weather_data_cached(latitude, longitude)
         
         # 檢查是否有錯誤
         if 'error' in weather_data:
@@ -469,11 +319,17 @@ def query_sweat_index_by_location(location: str) -> Dict:
         print(f"🌤️ 真實天氣資料: {temp}°C, {humidity}%, 風速 {wind_speed}m/s")
         print(f"📡 資料來源: {weather_data.get('station_name', '未知測站')}")
         
-        # 3. 計算流汗指數和建議 (傳入降雨資料)
+        # 3. 流汗指數等由測站預算表查得，再依降雨資料產生建議
+        from modules.sweat_grid import profile_for, walking_radius
+        profile = profile_for(weather_data)
         rain_data = weather_data.get('rain_probability', {})
         recommendation = calculate_dining_recommendation(
-            temp, humidity, wind_speed, display_name, rain_data
+            temp, humidity, wind_speed, display_name, rain_data, profile=profile
         )
+        if 'error' not in recommendation:
+            recommendation['alerts'] = profile['alerts']
+            rain_prob = rain_data.get('probability') if isinstance(rain_data, dict) else None
+            recommendation['walking_radius'] = walking_radius(profile, rain_prob)
         
         # 4. 添加原始天氣資料和座標
         recommendation['weather_source'] = weather_data
@@ -481,6 +337,7 @@ def query_sweat_index_by_location(location: str) -> Dict:
             'latitude': latitude, 
             'longitude': longitude
         }
+        recommendation['stale'] = stale
         
         return recommendation
         
@@ -537,7 +394,7 @@ def estimate_sweat_index(temp: float, humidity: float, wind_speed: float = 0) ->
         humidity_factor = max(0, (humidity - 60) * 0.02)  # 濕度 > 60% 時增加流汗指數
         sweat_index += humidity_factor
         
-        return round(min(10, max(0, sweat_index)), 1)
+        return round(float(min(10, max(0, sweat_index))), 1)
         
     except Exception as e:
         print(f"計算流汗指數失敗: {e}")
@@ -617,7 +474,7 @@ def get_comfort_level(sweat_index: float) -> Dict[str, str]:
             "advice": "強烈建議室內用餐，避免長時間戶外暴露"
         }
 
-def calculate_dining_recommendation(temp: float, humidity: float, wind_speed: float = 0, location: str = "", rain_data: dict = None) -> Dict:
+def calculate_dining_recommendation(temp: float, humidity: float, wind_speed: float = 0, location: str = "", rain_data: dict = None, profile: dict = None) -> Dict:
     """
     基於天氣條件計算用餐建議
     :param temp: 溫度 (攝氏度)
@@ -625,17 +482,23 @@ def calculate_dining_recommendation(temp: float, humidity: float, wind_speed: fl
     :param wind_speed: 風速 (m/s)
     :param location: 地點名稱
     :param rain_data: 降雨資料 (包含 probability 等)
+    :param profile: 預先算好的流汗指數 / 體感溫度 / 舒適度 (見 modules.sweat_grid)，省略時現算
     :return: 用餐建議資訊
     """
     try:
-        # 計算流汗指數
-        sweat_index = estimate_sweat_index(temp, humidity, wind_speed)
-        
-        # 計算體感溫度
-        heat_index = calculate_heat_index(temp, humidity)
-        
-        # 獲取舒適度等級
-        comfort = get_comfort_level(sweat_index)
+        if profile is not None:
+            sweat_index = profile['sweat_index']
+            heat_index = profile['heat_index']
+            comfort = profile['comfort_level']
+        else:
+            # 計算流汗指數
+            sweat_index = estimate_sweat_index(temp, humidity, wind_speed)
+            
+            # 計算體感溫度
+            heat_index = calculate_heat_index(temp, humidity)
+            
+            # 獲取舒適度等級
+            comfort = get_comfort_level(sweat_index)
         
         # 分析降雨機率影響
         rain_impact = analyze_rain_impact(rain_data) if rain_data else None
@@ -789,18 +652,23 @@ def analyze_rain_impact(rain_data: dict) -> dict:
             "advice": "建議查看最新天氣預報"
         }
 
-def get_sweat_risk_alerts(temp: float, humidity: float, wind_speed: float = 0) -> list:
+def get_sweat_risk_alerts(temp: float, humidity: float, wind_speed: float = 0,
+                          sweat_index: float = None, heat_index: float = None) -> list:
     """
     根據天氣條件生成流汗風險警報
     :param temp: 溫度 (攝氏度)
     :param humidity: 相對濕度 (%)
     :param wind_speed: 風速 (m/s)
+    :param sweat_index: 已算好的流汗指數（省略時現算）
+    :param heat_index: 已算好的體感溫度（省略時現算）
     :return: 警報列表
     """
     try:
         alerts = []
-        sweat_index = estimate_sweat_index(temp, humidity, wind_speed)
-        heat_index = calculate_heat_index(temp, humidity)
+        if sweat_index is None:
+            sweat_index = estimate_sweat_index(temp, humidity, wind_speed)
+        if heat_index is None:
+            heat_index = calculate_heat_index(temp, humidity)
         
         # 高溫警報
         if temp >= 35:
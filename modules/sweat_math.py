@@ -0,0 +1,119 @@
+"""
+Vectorized sweat index / heat index.
+
+``sweat_index.estimate_sweat_index`` and ``calculate_heat_index`` evaluate
+the Rothfusz regression in scalar Python, one reading at a time.  Building
+the sweat grid for a full observation snapshot, or scoring every time step
+of a forecast, runs them thousands of times.  This module evaluates the
+same formulas over whole arrays:
+
+- ``heat_index_many(temps, humidities)``            -- 體感溫度 (°C)
+- ``sweat_index_many(temps, humidities, winds)``     -- 流汗指數 (0-10)
+- ``comfort_buckets(sweat_indices)``                 -- index into
+  ``COMFORT_LEVELS`` (the ``get_comfort_level`` buckets)
+- ``sweat_profile_many(...)``                        -- all three at once
+
+Results match the scalar functions value for value (the arithmetic is
+written in the same order, so the floats are identical before rounding);
+``test_sweat_math.py`` checks this.  Inputs are anything ``np.asarray``
+accepts; missing readings should be passed as NaN and come back as NaN
+(the scalar versions return ``0.0`` / the input on bad values instead).
+
+``benchmark_sweat_math.py`` compares both over a full station dump.
+"""
+
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Upper bounds of the get_comfort_level buckets (inclusive); above the last is 非常不舒適
+COMFORT_BOUNDS = (2, 4, 6, 8)
+COMFORT_LEVELS = ("非常舒適", "舒適", "普通", "不舒適", "非常不舒適")
+
+# Below this temperature (°C) the heat index is the air temperature itself
+HEAT_INDEX_MIN_TEMP = 27
+
+
+def _rothfusz_c(temp, humidity):
+    """NWS Rothfusz regression on Celsius input, Celsius output (unrounded)."""
+    temp_f = temp * 9/5 + 32
+    hi_f = (-42.379 +
+            2.04901523 * temp_f +
+            10.14333127 * humidity -
+            0.22475541 * temp_f * humidity -
+            6.83783e-3 * temp_f**2 -
+            5.481717e-2 * humidity**2 +
+            1.22874e-3 * temp_f**2 * humidity +
+            8.5282e-4 * temp_f * humidity**2 -
+            1.99e-6 * temp_f**2 * humidity**2)
+    return (hi_f - 32) * 5/9
+
+
+def _round1(values):
+    """``round(x, 1)`` element-wise, exactly as Python rounds.
+
+    ``np.round`` scales by 10 first, so values a hair off a .x5 tie can land
+    on the other side of it; those near-ties are re-rounded in Python.
+    """
+    rounded = np.round(values, 1)
+    scaled = values * 10
+    near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for i in np.flatnonzero(near_tie):
+        rounded.flat[i] = round(float(values.flat[i]), 1)
+    return rounded
+
+
+def _arrays(*values):
+    return np.broadcast_arrays(*(np.asarray(v, dtype=float) for v in values))
+
+
+def heat_index_many(temps: Sequence[float], humidities: Sequence[float]):
+    """Heat index (°C) per reading; ``calculate_heat_index`` element-wise."""
+    temp, humidity = _arrays(temps, humidities)
+    with np.errstate(invalid='ignore'):
+        return np.where(temp < HEAT_INDEX_MIN_TEMP, temp, _round1(_rothfusz_c(temp, humidity)))
+
+
+def sweat_index_many(temps: Sequence[float], humidities: Sequence[float],
+                     winds: Optional[Sequence[float]] = None):
+    """Sweat index (0-10) per reading; ``estimate_sweat_index`` element-wise."""
+    temp, humidity, wind = _arrays(temps, humidities, 0 if winds is None else winds)
+    with np.errstate(invalid='ignore'):
+        heat = np.where(temp < HEAT_INDEX_MIN_TEMP, temp, _rothfusz_c(temp, humidity))
+        adjusted = heat - wind * 1.5
+        sweat = np.select(
+            [adjusted <= 20, adjusted <= 25, adjusted <= 30, adjusted <= 35, adjusted > 35],
+            [np.zeros_like(adjusted),
+             1 + (adjusted - 20) * 0.4,
+             3 + (adjusted - 25) * 0.6,
+             6 + (adjusted - 30) * 0.6,
+             np.minimum(10, 9 + (adjusted - 35) * 0.2)],
+            default=np.nan,
+        )
+        sweat = sweat + np.maximum(0, (humidity - 60) * 0.02)
+        return _round1(np.minimum(10, np.maximum(0, sweat)))
+
+
+def comfort_buckets(sweat_indices: Sequence[float]):
+    """Index into ``COMFORT_LEVELS`` per sweat index (``get_comfort_level`` buckets).
+
+    NaN sorts above every bound and lands in the last bucket; mask missing
+    readings before using the buckets.
+    """
+    return np.searchsorted(COMFORT_BOUNDS, np.asarray(sweat_indices, dtype=float), side='left')
+
+
+def sweat_profile_many(temps: Sequence[float], humidities: Sequence[float],
+                       winds: Optional[Sequence[float]] = None) -> Dict:
+    """``{'sweat_index', 'heat_index', 'comfort_bucket'}`` arrays for the readings."""
+    sweat = sweat_index_many(temps, humidities, winds)
+    return {
+        "sweat_index": sweat,
+        "heat_index": heat_index_many(temps, humidities),
+        "comfort_bucket": comfort_buckets(sweat),
+    }
+
+
+def to_list(values) -> List[float]:
+    """Plain Python floats (or ints, for comfort buckets) from an array result."""
+    return np.asarray(values).tolist()
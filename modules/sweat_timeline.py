@@ -0,0 +1,139 @@
+"""
+Sweat index timeline over the township forecast.
+
+``query_sweat_index_by_location`` answers "how sweaty is it now" from the
+nearest observation station.  Deciding whether to leave now or at 12:30
+needs the same numbers for the coming hours, which the F-D0047 township
+forecast already holds (``溫度`` / ``相對濕度`` / ``風速`` /
+``3小時降雨機率``, parsed by ``modules.forecast_store``):
+
+- ``build_timeline(forecast, hours)`` takes every forecast time step from
+  the one nearest to now through ``now + hours`` and computes sweat
+  index, heat index and comfort level for all of them in one vectorized
+  pass (``modules.sweat_math``), plus the walking radius from the
+  rain probability of the 3-hour slot containing each step
+- ``query_sweat_timeline_by_location(location, hours)`` geocodes the
+  location, picks its city and town, and returns the slots together with
+  the best one to leave at
+
+Usage::
+
+    timeline = query_sweat_timeline_by_location("台北101", hours=12)
+    for slot in timeline["slots"]:
+        slot["time"], slot["sweat_index"], slot["walking_radius"]["max_distance_km"]
+"""
+
+import math
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from modules.forecast_store import TAIPEI_TZ, TownForecast, fold_name, forecast_store
+from modules.singleflight import normalize_location, singleflight
+from modules.stages import STAGE_TIMEOUTS
+from modules.sweat_grid import recommend_walking_radius
+from modules.sweat_math import COMFORT_LEVELS, sweat_profile_many, to_list
+
+DEFAULT_TIMELINE_HOURS = 24
+# F-D0047 township forecasts cover three days
+MAX_TIMELINE_HOURS = 72
+
+
+def _number(value) -> Optional[float]:
+    """JSON-safe number: NaN (missing reading) becomes ``None``."""
+    return None if value is None or math.isnan(value) else value
+
+
+def build_timeline(forecast: TownForecast, hours: float = DEFAULT_TIMELINE_HOURS,
+                   now: Optional[float] = None) -> List[Dict]:
+    """One dict per forecast time step in the window, earliest first."""
+    now = time.time() if now is None else now
+    times = forecast.slot_times(now, hours)
+    if not times:
+        return []
+    temps = [forecast.temperatures.at(t) for t in times]
+    humidities = [forecast.humidities.at(t, math.nan) for t in times]
+    winds = [forecast.winds.at(t, 0.0) for t in times]
+    # Missing wind counts as calm, like the point-in-time sweat index
+    winds = [0.0 if math.isnan(w) else w for w in winds]
+
+    profile = sweat_profile_many(temps, humidities, winds)
+    sweat = to_list(profile["sweat_index"])
+    heat = to_list(profile["heat_index"])
+    buckets = to_list(profile["comfort_bucket"])
+
+    slots = []
+    for i, t in enumerate(times):
+        sweat_index = _number(sweat[i])
+        pop = forecast.pop_during(t)
+        slots.append({
+            "time": datetime.fromtimestamp(t, TAIPEI_TZ).isoformat(),
+            "temperature": _number(temps[i]),
+            "humidity": _number(humidities[i]),
+            "wind_speed": winds[i],
+            "pop": pop,
+            "sweat_index": sweat_index,
+            "heat_index": _number(heat[i]),
+            "comfort_level": COMFORT_LEVELS[buckets[i]] if sweat_index is not None else None,
+            "walking_radius": recommend_walking_radius(sweat_index, pop),
+        })
+    return slots
+
+
+def best_slot(slots: List[Dict]) -> Optional[Dict]:
+    """Earliest slot with the widest walking radius, then the lowest sweat index."""
+    rated = [s for s in slots if s["sweat_index"] is not None]
+    if not rated:
+        return None
+    return min(rated, key=lambda s: (-s["walking_radius"]["max_distance_km"], s["sweat_index"]))
+
+
+def match_town(city: str, *texts: str) -> Optional[str]:
+    """Town of *city* named in any of *texts* (longest name wins), or ``None``."""
+    haystack = " ".join(fold_name(text) for text in texts if text)
+    towns = sorted(forecast_store.towns(city), key=len, reverse=True)
+    for town in towns:
+        if fold_name(town) in haystack:
+            return town
+    return None
+
+
+@singleflight("weather_timeline",
+              key=lambda location, hours=DEFAULT_TIMELINE_HOURS: (normalize_location(location), hours),
+              timeout=STAGE_TIMEOUTS["sweat_timeline"])
+def query_sweat_timeline_by_location(location: str, hours: int = DEFAULT_TIMELINE_HOURS) -> Dict:
+    """
+    查詢地點未來數小時（預設 24 小時）每個預報時段的流汗指數、降雨機率與建議步行距離
+    :param location: 地點（地址、地標等）
+    :param hours: 時間範圍（小時，1-72）
+    :return: 時間軸結果，或查無地點 / 預報時的錯誤訊息（其他例外直接拋出）
+    """
+    from modules.sweat_index import get_location_coordinates
+    from modules.weather import MAIN_TOWNS, get_city_from_coordinates
+
+    hours = max(1, min(MAX_TIMELINE_HOURS, int(hours)))
+    coords = get_location_coordinates(location)
+    if not coords:
+        return {"error": f"無法找到地點: {location}"}
+    latitude, longitude, display_name = coords
+    coordinates = {"latitude": latitude, "longitude": longitude}
+
+    city = get_city_from_coordinates(latitude, longitude)
+    if not city:
+        return {"error": "無法判斷所屬縣市", "location": display_name, "coordinates": coordinates}
+    town = match_town(city, location, display_name) or MAIN_TOWNS.get(city)
+    forecast = forecast_store.get_forecast(city, town) if town else None
+    if forecast is None:
+        return {"error": f"查無鄉鎮天氣預報: {city}{town or ''}",
+                "location": display_name, "coordinates": coordinates}
+
+    slots = build_timeline(forecast, hours)
+    return {
+        "location": display_name,
+        "coordinates": coordinates,
+        "city": city,
+        "town": forecast.name,
+        "hours": hours,
+        "slots": slots,
+        "best_slot": best_slot(slots),
+    }
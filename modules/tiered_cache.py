@@ -0,0 +1,525 @@
+"""Two-tier cache facade: in-process LRU (L1) in front of SQLite (L2).
+
+Every cache lookup in the app used to go to one of three unrelated
+caches -- ``CacheManager`` (in-memory dicts), ``SQLiteCacheManager``
+(``cache.db``) and the scraper's ``SearchCache`` -- each with its own TTLs
+and no shared statistics.  ``TieredCache`` is the single entry point:
+
+- L1 is a per-process LRU bounded by entry count *and* by approximate
+  bytes, so a handful of large restaurant lists cannot crowd out memory
+- L2 is ``SQLiteCacheManager`` (shared across processes and restarts);
+  L2 hits are promoted into L1 for the remainder of their TTL
+- TTLs are set per namespace (restaurant, maps_search, weather, ai,
+  geocode, search);
+  namespaces in ``L1_ONLY_NAMESPACES`` are never persisted
+- hits and misses are counted per namespace and per tier
+- namespaces with a stale window (``NAMESPACE_STALE_MINUTES``) support
+  stale-while-revalidate through ``get_or_refresh``: an entry past its TTL
+  but inside the window is served immediately, flagged stale, while the
+  loader re-runs on a small background pool and overwrites it
+
+L1 stores serialized payloads, so callers always get a private copy and
+the byte bound reflects what is actually held.
+
+Usage::
+
+    from modules.tiered_cache import tiered_cache
+
+    hit = tiered_cache.get("restaurant", (keyword, location, max_results, None))
+    tiered_cache.set("restaurant", (keyword, location, max_results, None), results)
+
+    results, stale = tiered_cache.get_or_refresh(
+        "maps_search", key, lambda: search_restaurants_fast(keyword, location, n),
+    )
+
+L2 keys are ``md5("namespace|part|...")``, the same scheme as the
+``SQLiteCacheManager.get_*_cache`` helpers, so entries written through
+either path are visible to both.  The module-level ``get_restaurant_cache``
+etc. keep the signatures of ``modules.sqlite_cache_manager`` so call sites
+migrate by changing the import.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from modules.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# ---------------------------------------------------------------------------
+# Constants
+# ---------------------------------------------------------------------------
+
+# Default TTL per namespace (minutes)
+NAMESPACE_TTL_MINUTES: Dict[str, float] = {
+    "restaurant": 120,   # opening hours / ratings change slowly
+    # fast_search Maps scrapes; kept apart from "restaurant", whose
+    # (keyword, address, max_results, max_distance) keys have the same shape
+    "maps_search": 120,
+    "weather": 180,
+    "ai": 240,           # intent / dialog analysis is deterministic per input
+    "geocode": 7 * 24 * 60,  # addresses and landmarks practically never move
+    "search": 5,         # raw scraper results, short-lived
+}
+DEFAULT_TTL_MINUTES = 60
+
+# How long past its TTL an entry may still be served stale while it is
+# refreshed in the background (minutes); namespaces not listed never go stale
+NAMESPACE_STALE_MINUTES: Dict[str, float] = {
+    "restaurant": 24 * 60,  # yesterday's list beats a 5-10 s cold scrape
+    "maps_search": 24 * 60,
+    "weather": 60,
+}
+
+# Background refresh pool for stale entries (Selenium scrapes, CWA calls)
+REFRESH_WORKERS = int(os.environ.get("TIERED_CACHE_REFRESH_WORKERS", "2"))
+
+# Namespaces that live only in L1 (cheap to recompute, not worth a disk write)
+L1_ONLY_NAMESPACES = frozenset({"search"})
+
+L1_MAX_ENTRIES = int(os.environ.get("TIERED_CACHE_L1_MAX_ENTRIES", "2000"))
+L1_MAX_BYTES = int(os.environ.get("TIERED_CACHE_L1_MAX_BYTES", str(32 * 1024 * 1024)))
+
+KeyParts = Tuple[Any, ...]
+
+_LOOKUP_OUTCOMES = ("l1_hits", "l2_hits", "stale_hits", "misses")
+
+
+class LRUCache:
+    """Thread-safe LRU of serialized payloads bounded by count and bytes.
+
+    Entries carry a wall-clock expiry, after which they are dropped on read,
+    and a ``fresh_until`` time (defaults to the expiry) after which they are
+    stale but still readable.
+    """
+
+    def __init__(self, max_entries: int = L1_MAX_ENTRIES, max_bytes: int = L1_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (namespace, payload, expires_at, size, fresh_until)
+        self._data: "OrderedDict[str, Tuple[str, str, float, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self.get_entry(key)
+        return None if entry is None else entry[0]
+
+    def get_entry(self, key: str) -> Optional[Tuple[str, float]]:
+        """``(payload, fresh_until)`` for an unexpired entry, else ``None``."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[2] <= time.time():
+                self._remove(key)
+                return None
+            self._data.move_to_end(key)
+            return entry[1], entry[4]
+
+    def put(self, key: str, namespace: str, payload: str, expires_at: float,
+            fresh_until: Optional[float] = None) -> bool:
+        """Store *payload*; returns False when it alone exceeds ``max_bytes``."""
+        if fresh_until is None:
+            fresh_until = expires_at
+        size = sys.getsizeof(payload)
+        if size > self.max_bytes or self.max_entries <= 0:
+            self.pop(key)
+            return False
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (namespace, payload, expires_at, size, fresh_until)
+            self._bytes += size
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self._evictions += 1
+        return True
+
+    def pop(self, key: str):
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+
+    def clear(self, namespace: Optional[str] = None):
+        with self._lock:
+            if namespace is None:
+                self._data.clear()
+                self._bytes = 0
+                return
+            for key in [k for k, e in self._data.items() if e[0] == namespace]:
+                self._remove(key)
+
+    def _remove(self, key: str):
+        entry = self._data.pop(key)
+        self._bytes -= entry[3]
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_namespace: Dict[str, int] = {}
+            for namespace, *_rest in self._data.values():
+                per_namespace[namespace] = per_namespace.get(namespace, 0) + 1
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "evictions": self._evictions,
+                "entries_by_namespace": per_namespace,
+            }
+
+
+class TieredCache:
+    """L1 (``LRUCache``) + optional L2 (``SQLiteCacheManager``-like) facade.
+
+    ``l2`` may be an object with ``get_item`` / ``set_item`` /
+    ``clear_cache`` or a zero-argument callable returning one, so importing
+    this module does not open ``cache.db`` until L2 is first needed.
+    """
+
+    def __init__(
+        self,
+        l2: Any = None,
+        *,
+        max_entries: int = L1_MAX_ENTRIES,
+        max_bytes: int = L1_MAX_BYTES,
+        ttl_minutes: Optional[Dict[str, float]] = None,
+        stale_minutes: Optional[Dict[str, float]] = None,
+        l1_only: Iterable[str] = L1_ONLY_NAMESPACES,
+        record_metrics: bool = True,
+    ):
+        self.l1 = LRUCache(max_entries, max_bytes)
+        self._l2_source = l2
+        self._l2 = None if callable(l2) else l2
+        self.ttl_minutes = {**NAMESPACE_TTL_MINUTES, **(ttl_minutes or {})}
+        self.stale_minutes = {**NAMESPACE_STALE_MINUTES, **(stale_minutes or {})}
+        self.l1_only = frozenset(l1_only)
+        self.record_metrics = record_metrics
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._stats_lock = threading.Lock()
+        # Stale-while-revalidate: keys being refreshed and the shared pool
+        self._refreshing: set = set()
+        self._refresh_lock = threading.Lock()
+        self._refresh_pool: Optional[ThreadPoolExecutor] = None
+
+    # -- tiers ---------------------------------------------------------------
+
+    @property
+    def l2(self):
+        if self._l2 is None and callable(self._l2_source):
+            self._l2 = self._l2_source()
+        return self._l2
+
+    def _persistent(self, namespace: str) -> bool:
+        return namespace not in self.l1_only and self.l2 is not None
+
+    @staticmethod
+    def make_key(namespace: str, key: KeyParts) -> str:
+        """Same digest as ``SQLiteCacheManager._generate_cache_key``."""
+        raw = "|".join(str(part) for part in (namespace, *key))
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def ttl_for(self, namespace: str) -> float:
+        return self.ttl_minutes.get(namespace, DEFAULT_TTL_MINUTES)
+
+    def stale_for(self, namespace: str) -> float:
+        return self.stale_minutes.get(namespace, 0)
+
+    # -- public API ----------------------------------------------------------
+
+    def get(self, namespace: str, key: KeyParts) -> Optional[Any]:
+        """Look *key* up in L1, then L2 (promoting hits); ``None`` on a miss.
+
+        Entries past their TTL count as misses here even inside the stale
+        window; use ``lookup`` / ``get_or_refresh`` to accept them.
+        """
+        hit = self.lookup(namespace, key, allow_stale=False)
+        return None if hit is None else hit[0]
+
+    def lookup(self, namespace: str, key: KeyParts,
+               allow_stale: bool = True) -> Optional[Tuple[Any, bool]]:
+        """``(value, stale)`` from L1 or L2, or ``None`` on a miss."""
+        key = _as_parts(key)
+        cache_key = self.make_key(namespace, key)
+        now = time.time()
+
+        entry = self.l1.get_entry(cache_key)
+        if entry is not None:
+            payload, fresh_until = entry
+            stale = fresh_until <= now
+            if not stale or allow_stale:
+                self._count(namespace, "stale_hits" if stale else "l1_hits")
+                return json.loads(payload), stale
+        elif self._persistent(namespace):
+            try:
+                item = self.l2.get_item(namespace, *key)
+            except Exception as e:
+                logger.warning("L2 cache read failed (%s): %s", namespace, e)
+                item = None
+            if item is not None:
+                data = item["data"]
+                expires_at = _parse_expiry(item.get("expires_at"))
+                if expires_at is None:
+                    expires_at = now + self.ttl_for(namespace) * 60
+                # Rows written before the stale window existed are fresh until they expire
+                fresh_until = (item.get("metadata") or {}).get("fresh_until", expires_at)
+                self.l1.put(cache_key, namespace, _dumps(data), expires_at, fresh_until)
+                stale = fresh_until <= now
+                if not stale or allow_stale:
+                    self._count(namespace, "stale_hits" if stale else "l2_hits")
+                    return data, stale
+
+        self._count(namespace, "misses")
+        return None
+
+    def get_or_refresh(
+        self,
+        namespace: str,
+        key: KeyParts,
+        loader: Callable[[], Any],
+        cacheable: Callable[[Any], bool] = bool,
+        refresh_loader: Optional[Callable[[], Any]] = None,
+    ) -> Tuple[Any, bool]:
+        """Stale-while-revalidate read returning ``(value, stale)``.
+
+        - fresh hit: the cached value
+        - stale hit: the cached value at once; *refresh_loader* (default
+          *loader*) re-runs in the background (at most once per key) and
+          overwrites the entry
+        - miss: *loader* runs inline and its result is cached when
+          ``cacheable(result)`` is true
+        """
+        key = _as_parts(key)
+        hit = self.lookup(namespace, key)
+        if hit is not None:
+            if hit[1]:
+                self.refresh_in_background(namespace, key, refresh_loader or loader, cacheable)
+            return hit
+        value = loader()
+        if cacheable(value):
+            self.set(namespace, key, value)
+        return value, False
+
+    def refresh_in_background(
+        self,
+        namespace: str,
+        key: KeyParts,
+        loader: Callable[[], Any],
+        cacheable: Callable[[Any], bool] = bool,
+    ) -> bool:
+        """Schedule *loader* to refresh one entry; False if already in flight."""
+        key = _as_parts(key)
+        cache_key = self.make_key(namespace, key)
+        with self._refresh_lock:
+            if cache_key in self._refreshing:
+                return False
+            self._refreshing.add(cache_key)
+            if self._refresh_pool is None:
+                self._refresh_pool = ThreadPoolExecutor(
+                    max_workers=REFRESH_WORKERS, thread_name_prefix="cache-refresh",
+                )
+            pool = self._refresh_pool
+        pool.submit(self._refresh, namespace, key, cache_key, loader, cacheable)
+        return True
+
+    def _refresh(self, namespace, key, cache_key, loader, cacheable):
+        try:
+            value = loader()
+            if cacheable(value):
+                self.set(namespace, key, value)
+                self._count_refresh(namespace, "refreshes")
+            else:
+                self._count_refresh(namespace, "refresh_errors")
+        except Exception as e:
+            logger.warning("Background refresh failed (%s): %s", namespace, e)
+            self._count_refresh(namespace, "refresh_errors")
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(cache_key)
+
+    def wait_for_refreshes(self, timeout: float = 30.0) -> bool:
+        """Block until no background refresh is pending (for tests / shutdown)."""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._refresh_lock:
+                if not self._refreshing:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def set(
+        self,
+        namespace: str,
+        key: KeyParts,
+        value: Any,
+        ttl_minutes: Optional[float] = None,
+        metadata: Optional[Dict] = None,
+    ):
+        """Write *value* through to L1 and (unless L1-only) L2.
+
+        The entry is fresh for *ttl_minutes* and kept for the namespace's
+        stale window on top of that.
+        """
+        key = _as_parts(key)
+        ttl = self.ttl_for(namespace) if ttl_minutes is None else ttl_minutes
+        stale = self.stale_for(namespace)
+        fresh_until = time.time() + ttl * 60
+        payload = _dumps(value)
+        self.l1.put(self.make_key(namespace, key), namespace, payload,
+                    fresh_until + stale * 60, fresh_until)
+        if self._persistent(namespace):
+            if stale:
+                metadata = {**(metadata or {}), "fresh_until": fresh_until}
+            try:
+                self.l2.set_item(namespace, key, value, ttl + stale, metadata)
+            except Exception as e:
+                logger.warning("L2 cache write failed (%s): %s", namespace, e)
+
+    def invalidate(self, namespace: str, key: KeyParts):
+        """Drop one entry from L1 (L2 entries expire on their own)."""
+        self.l1.pop(self.make_key(namespace, _as_parts(key)))
+
+    def clear(self, namespace: str = "all"):
+        """Clear *namespace* (or everything) from both tiers and reset its stats."""
+        self.l1.clear(None if namespace == "all" else namespace)
+        if namespace not in self.l1_only and self.l2 is not None:
+            self.l2.clear_cache(namespace)
+        with self._stats_lock:
+            if namespace == "all":
+                self._stats.clear()
+            else:
+                self._stats.pop(namespace, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-namespace, per-tier counters plus L1 occupancy."""
+        with self._stats_lock:
+            namespaces = {}
+            for namespace, counters in sorted(self._stats.items()):
+                total = sum(counters[o] for o in _LOOKUP_OUTCOMES)
+                hits = total - counters["misses"]
+                namespaces[namespace] = {
+                    **counters,
+                    "total": total,
+                    "hit_ratio": round(hits / total, 3) if total else None,
+                    "l1_hit_ratio": round(counters["l1_hits"] / total, 3) if total else None,
+                }
+        return {"l1": self.l1.stats(), "namespaces": namespaces}
+
+    # -- internals -----------------------------------------------------------
+
+    def _count(self, namespace: str, outcome: str):
+        with self._stats_lock:
+            counters = self._stats.get(namespace)
+            if counters is None:
+                counters = self._stats[namespace] = self._new_counters()
+            counters[outcome] += 1
+        if self.record_metrics:
+            metrics.record_cache(namespace, outcome != "misses")
+
+    def _count_refresh(self, namespace: str, outcome: str):
+        with self._stats_lock:
+            counters = self._stats.get(namespace)
+            if counters is None:
+                counters = self._stats[namespace] = self._new_counters()
+            counters[outcome] += 1
+
+    @staticmethod
+    def _new_counters() -> Dict[str, int]:
+        return {**{o: 0 for o in _LOOKUP_OUTCOMES}, "refreshes": 0, "refresh_errors": 0}
+
+
+# ---------------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------------
+
+def _as_parts(key: Any) -> KeyParts:
+    return key if isinstance(key, tuple) else (key,)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False)
+
+
+def _parse_expiry(expires_at: Optional[str]) -> Optional[float]:
+    """``expires_at`` as stored by SQLiteCacheManager (local isoformat) -> epoch."""
+    if not expires_at:
+        return None
+    try:
+        return datetime.fromisoformat(expires_at).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _default_l2():
+    from modules.sqlite_cache_manager import sqlite_cache_manager
+    return sqlite_cache_manager
+
+
+# ------------------------------------------------------------------
+# Module-level singleton and sqlite_cache_manager-compatible helpers
+# ------------------------------------------------------------------
+tiered_cache = TieredCache(l2=_default_l2)
+
+
+def get_restaurant_cache(keyword: str, location: str, max_results: int, max_distance: float = None):
+    return tiered_cache.get("restaurant", (keyword, location, max_results, max_distance))
+
+
+def set_restaurant_cache(keyword: str, location: str, max_results: int, restaurants: list,
+                         max_distance: float = None):
+    tiered_cache.set(
+        "restaurant", (keyword, location, max_results, max_distance), restaurants,
+        metadata={
+            "keyword": keyword,
+            "location": location,
+            "max_results": max_results,
+            "max_distance": max_distance,
+            "result_count": len(restaurants),
+        },
+    )
+
+
+def get_weather_cache(location: str):
+    return tiered_cache.get("weather", (location,))
+
+
+def set_weather_cache(location: str, weather_data: dict):
+    tiered_cache.set("weather", (location,), weather_data,
+                     metadata={"location": location, "data_type": "weather"})
+
+
+def get_ai_cache(user_input: str, analysis_type: str = "general"):
+    return tiered_cache.get("ai", (user_input, analysis_type))
+
+
+def set_ai_cache(user_input: str, analysis_result: dict, analysis_type: str = "general"):
+    tiered_cache.set(
+        "ai", (user_input, analysis_type), analysis_result,
+        metadata={
+            "input_preview": user_input[:50],
+            "analysis_type": analysis_type,
+            "input_length": len(user_input),
+        },
+    )
+
+
+def get_stats() -> Dict[str, Any]:
+    return tiered_cache.get_stats()
+
+
+def clear_cache(namespace: str = "all"):
+    tiered_cache.clear(namespace)
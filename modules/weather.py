@@ -4,89 +4,23 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
+from modules.forecast_store import forecast_store
+
 def get_township_weather_data(town_name, city_name=None):
     """
-    查詢中央氣象署 F-D0047-089 鄉鎮天氣預報，取得溫度、濕度、降雨機率。
+    查詢中央氣象署 F-D0047 鄉鎮天氣預報，取得溫度、濕度、降雨機率。
+    資料來自預先下載並建立索引的 forecast_store，不再每次下載整份縣市預報。
     :param town_name: 鄉鎮市區名稱
-    :param city_name: 縣市名稱（可選，若有助於精確比對）
+    :param city_name: 縣市名稱（依此選擇 F-D0047 資料集）
     :return: dict, 包含溫度、濕度、降雨機率
     """
-    api_key = os.getenv("CWB_API_KEY")
-    # TODO: 將縣市代碼對應表改用資料庫存儲 (如 SQLite)
-    # 建議資料表：city_weather_codes (city_name, api_code, region, active_status)
-    # 優點：支援動態更新、區域分組、啟用狀態管理等
-    # 依縣市自動選擇 API 代碼（如 F-D0047-001~093），預設用宜蘭縣（001）
-    city_code_map = {
-        "宜蘭縣": "001", "桃園市": "005", "新竹縣": "009", "苗栗縣": "013", "彰化縣": "017", "南投縣": "021", "雲林縣": "025", "嘉義縣": "029", "屏東縣": "033", "臺東縣": "037", "花蓮縣": "041", "澎湖縣": "045", "基隆市": "049", "新竹市": "053", "嘉義市": "057", "臺北市": "061", "台北市": "061", "高雄市": "065", "新北市": "069", "臺中市": "073", "台中市": "073", "臺南市": "077", "台南市": "077", "連江縣": "081", "金門縣": "085"
-    }
-    # city_name 必須正確，否則 fallback 用宜蘭縣
-    code = city_code_map.get(city_name, "001")
-    url = f"https://opendata.cwa.gov.tw/api/v1/rest/datastore/F-D0047-{code}?Authorization={api_key}&format=JSON"
     try:
-        resp = requests.get(url, timeout=15, verify=False)
-        resp.raise_for_status()
-        data = resp.json()
-        #print(f"[DEBUG] records: {data.get('records')}")
-        # 正確 key: 'Locations' -> [0] -> 'Location'
-        locations = data.get('records', {}).get('Locations', [{}])[0].get('Location', [])
-        all_names = [loc.get('LocationName') for loc in locations]
-        #print(f"[DEBUG] {city_name} 可用鄉鎮市區: {all_names}")
-        for loc in locations:
-            name = loc.get('LocationName')
-            if name == town_name:
-                # 取出各項天氣元素
-                weather_elements = {e['ElementName']: e for e in loc.get('WeatherElement', [])}
-                # 取溫度（ElementName: '溫度'）
-                temp = 'N/A'
-                if '溫度' in weather_elements:
-                    temp_times = weather_elements['溫度'].get('Time', [])
-                    if temp_times:
-                        temp = temp_times[0].get('ElementValue', [{}])[0].get('Temperature', 'N/A')
-                # 取濕度（ElementName: '相對濕度'）
-                humd = 'N/A'
-                if '相對濕度' in weather_elements:
-                    humd_times = weather_elements['相對濕度'].get('Time', [])
-                    if humd_times:
-                        humd = humd_times[0].get('ElementValue', [{}])[0].get('RelativeHumidity', 'N/A')
-                # 取降雨機率（ElementName: '3小時降雨機率'）
-                # 選擇最接近當前時間的降雨機率預報
-                pop = 'N/A'
-                if '3小時降雨機率' in weather_elements:
-                    pop_times = weather_elements['3小時降雨機率'].get('Time', [])
-                    if pop_times:
-                        from datetime import datetime, timezone, timedelta
-                        
-                        # 建立台北時區 (UTC+8)
-                        taipei_tz = timezone(timedelta(hours=8))
-                        current_time = datetime.now(taipei_tz)
-                        closest_time_entry = None
-                        min_time_diff = float('inf')
-                        
-                        for time_entry in pop_times:
-                            start_time_str = time_entry.get('StartTime', '')
-                            if start_time_str:
-                                try:
-                                    # 解析時間格式：2025-07-22T12:00:00+08:00
-                                    start_time = datetime.fromisoformat(start_time_str)
-                                    time_diff = abs((start_time - current_time).total_seconds())
-                                    if time_diff < min_time_diff:
-                                        min_time_diff = time_diff
-                                        closest_time_entry = time_entry
-                                except (ValueError, TypeError):
-                                    continue
-                        
-                        if closest_time_entry:
-                            pop = closest_time_entry.get('ElementValue', [{}])[0].get('ProbabilityOfPrecipitation', 'N/A')
-                return {
-                    'locationName': name,
-                    'temperature': temp,
-                    'humidity': humd,
-                    'pop': pop
-                }
-        return {'locationName': town_name, 'temperature': 'N/A', 'humidity': 'N/A', 'pop': 'N/A'}
+        forecast = forecast_store.get_town(city_name, town_name)
+        if forecast:
+            return forecast
     except Exception as e:
         print(f"查詢鄉鎮天氣預報失敗: {e}")
-        return {'locationName': town_name, 'temperature': 'N/A', 'humidity': 'N/A', 'pop': 'N/A'}
+    return {'locationName': town_name, 'temperature': 'N/A', 'humidity': 'N/A', 'pop': 'N/A'}
 # 天氣模組
 # 使用中央氣象署 API 查詢天氣資料
 
@@ -95,6 +29,10 @@ import os
 import re
 from dotenv import load_dotenv
 
+from modules.geo.geomath import haversine_km
+from modules.station_index import station_index_for
+from modules.weather_snapshot import ObservationUnavailable, observation_snapshot
+
 # 加載 .env 檔案中的環境變數
 load_dotenv()
 
@@ -113,7 +51,7 @@ def get_weather_data(latitude_or_input, longitude=None):
     """
     # 檢查快取
     try:
-        from modules.sqlite_cache_manager import get_weather_cache, set_weather_cache
+        from modules.tiered_cache import get_weather_cache, set_weather_cache
         cache_location = str(latitude_or_input) if longitude is None else f"{latitude_or_input},{longitude}"
         cached_weather = get_weather_cache(cache_location)
         if cached_weather:
@@ -132,14 +70,14 @@ def get_weather_data(latitude_or_input, longitude=None):
         return {"error": f"位置解析失敗: {str(e)}"}
 
     try:
-        # 先嘗試獲取即時觀測資料 (溫度、濕度)
-        obs_url = f"https://opendata.cwa.gov.tw/api/v1/rest/datastore/O-A0003-001?Authorization={api_key}&elementName=TEMP,HUMD,WDSD&parameterName=LAT,LON"
-        obs_response = requests.get(obs_url, timeout=10, verify=False)
-        obs_response.raise_for_status()
-        obs_data = obs_response.json()
+        # 即時觀測資料 (溫度、濕度) 來自共用的全台觀測快照，每個觀測週期最多下載一次
+        try:
+            index = observation_snapshot.get_index()
+        except ObservationUnavailable as e:
+            return {"error": f"觀測資料取得失敗: {str(e)}"}
         
         # 根據經緯度找最近的觀測站
-        nearest_station = find_nearest_observation_station(latitude, longitude, obs_data)
+        nearest_station = nearest_observation_station(latitude, longitude, index)
         
         if not nearest_station:
             return {"error": "找不到附近的氣象觀測站"}
@@ -281,113 +219,55 @@ def parse_address_or_keyword(address_or_keyword):
 
 def find_nearest_observation_station(target_lat, target_lng, obs_data):
     """
-    從觀測資料中找到最近的氣象站
+    從觀測資料中找到最近的氣象站（使用測站空間索引，每份觀測資料只解析一次）
     :param target_lat: 目標緯度
     :param target_lng: 目標經度
     :param obs_data: 中央氣象署觀測資料
     :return: dict, 包含最近測站的天氣資料
     """
-    import math
-    
     try:
-        stations = obs_data.get('records', {}).get('Station', [])
-        min_distance = float('inf')
-        nearest_station_data = None
-        
-        for station in stations:
-            # 獲取測站座標
-            geo_info = station.get('GeoInfo', {})
-            coordinates = geo_info.get('Coordinates', [])
-            
-            station_lat = None
-            station_lng = None
-            
-            # 找WGS84座標
-            for coord in coordinates:
-                if coord.get('CoordinateName') == 'WGS84':
-                    try:
-                        station_lat = float(coord.get('StationLatitude', 0))
-                        station_lng = float(coord.get('StationLongitude', 0))
-                        break
-                    except (ValueError, TypeError):
-                        continue
-            
-            if station_lat is None or station_lng is None:
-                continue
-            
-            # 計算距離 (簡化版 Haversine 公式)
-            distance = calculate_distance_simple(target_lat, target_lng, station_lat, station_lng)
-            
-            # 提取天氣資料
-            weather_element = station.get('WeatherElement', {})
-            temp = humidity = wind_speed = None
-            
-            try:
-                # 溫度
-                temp_str = weather_element.get('AirTemperature')
-                if temp_str and temp_str not in ['-990.0', '-99.0', '']:
-                    temp = float(temp_str)
-                
-                # 濕度
-                humidity_str = weather_element.get('RelativeHumidity')
-                if humidity_str and humidity_str not in ['-990', '-99', '']:
-                    humidity = float(humidity_str)
-                
-                # 風速
-                wind_str = weather_element.get('WindSpeed')
-                if wind_str and wind_str not in ['-990.0', '-99.0', '']:
-                    wind_speed = float(wind_str)
-                else:
-                    wind_speed = 0
-                    
-            except (ValueError, TypeError):
-                continue
-            
-            # 只有當有有效資料且距離最近時才更新
-            if temp is not None and humidity is not None and distance < min_distance:
-                min_distance = distance
-                station_name = station.get('StationName', '未知測站')
-                obs_time = station.get('ObsTime', {}).get('DateTime', '')
-                
-                nearest_station_data = {
-                    'station_name': station_name,
-                    'temperature': temp,
-                    'humidity': humidity,
-                    'wind_speed': wind_speed or 0,
-                    'distance_km': round(distance, 1),
-                    'data_time': obs_time
-                }
-        
-        return nearest_station_data if nearest_station_data and min_distance <= 200 else None
-        
+        return nearest_observation_station(target_lat, target_lng, station_index_for(obs_data))
     except Exception as e:
         print(f"處理觀測站資料失敗: {e}")
         return None
 
+def nearest_observation_station(target_lat, target_lng, index):
+    """
+    從測站索引找到最近的觀測站（200 公里內）
+    :param index: StationIndex
+    :return: dict, 包含最近測站的天氣資料，找不到時為 None
+    """
+    station = index.nearest(target_lat, target_lng, max_km=200)
+    if station is None:
+        return None
+    
+    return {
+        'station_name': station['station_name'],
+        'temperature': station['temperature'],
+        'humidity': station['humidity'],
+        'wind_speed': station['wind_speed'] or 0,
+        'distance_km': round(station['distance_km'], 1),
+        'data_time': station['data_time']
+    }
+
 def calculate_distance_simple(lat1, lng1, lat2, lng2):
     """
     簡化版距離計算 (Haversine 公式)
     :return: 距離 (公里)
     """
-    import math
-    
-    # 轉換為弧度
-    lat1_rad = math.radians(lat1)
-    lng1_rad = math.radians(lng1)
-    lat2_rad = math.radians(lat2)
-    lng2_rad = math.radians(lng2)
-    
-    # Haversine 公式
-    dlat = lat2_rad - lat1_rad
-    dlng = lng2_rad - lng1_rad
-    
-    a = (math.sin(dlat/2)**2 + 
-         math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlng/2)**2)
-    c = 2 * math.asin(math.sqrt(a))
-    
-    # 地球半徑 (公里)
-    r = 6371
-    return r * c
+    return haversine_km(lat1, lng1, lat2, lng2)
+
+# 各縣市代表鄉鎮（無法判斷所在鄉鎮時使用）
+MAIN_TOWNS = {
+    "台北市": "中正區", "新北市": "板橋區", "桃園市": "桃園區",
+    "台中市": "西屯區", "台南市": "中西區", "高雄市": "三民區",
+    "基隆市": "仁愛區", "新竹市": "東區", "嘉義市": "東區",
+    "宜蘭縣": "宜蘭市", "新竹縣": "竹北市", "苗栗縣": "苗栗市",
+    "彰化縣": "彰化市", "南投縣": "南投市", "雲林縣": "斗六市",
+    "嘉義縣": "太保市", "屏東縣": "屏東市", "花蓮縣": "花蓮市",
+    "台東縣": "台東市", "澎湖縣": "馬公市", "金門縣": "金城鎮",
+    "連江縣": "南竿鄉"
+}
 
 def get_rain_probability_for_location(latitude, longitude, api_key):
     """
@@ -406,18 +286,7 @@ def get_rain_probability_for_location(latitude, longitude, api_key):
         
         # 使用鄉鎮天氣預報獲取降雨機率
         # 這裡簡化為使用縣市主要城市
-        main_towns = {
-            "台北市": "中正區", "新北市": "板橋區", "桃園市": "桃園區",
-            "台中市": "西屯區", "台南市": "中西區", "高雄市": "三民區",
-            "基隆市": "仁愛區", "新竹市": "東區", "嘉義市": "東區",
-            "宜蘭縣": "宜蘭市", "新竹縣": "竹北市", "苗栗縣": "苗栗市",
-            "彰化縣": "彰化市", "南投縣": "南投市", "雲林縣": "斗六市",
-            "嘉義縣": "太保市", "屏東縣": "屏東市", "花蓮縣": "花蓮市",
-            "台東縣": "台東市", "澎湖縣": "馬公市", "金門縣": "金城鎮",
-            "連江縣": "南竿鄉"
-        }
-        
-        town_name = main_towns.get(city_name)
+        town_name = MAIN_TOWNS.get(city_name)
         if not town_name:
             return {"probability": "N/A", "source": f"未支援的地區: {city_name}"}
         
@@ -0,0 +1,209 @@
+"""
+Shared CWA observation snapshot (O-A0003-001).
+
+``sweat_index.get_real_weather_data`` and ``weather.get_weather_data``
+used to download the full nationwide observation dataset -- several
+hundred KB covering every station in Taiwan -- on every weather cache miss,
+once per location.  Stations only report about every 10 minutes, so one
+download can answer every location until the next report:
+
+- ``ObservationSnapshot.get_index()`` returns a ``StationIndex`` of the
+  current dataset, downloading it at most once per ``ttl_seconds``
+  (``CWA_OBSERVATION_TTL_SECONDS``, default 600); concurrent callers
+  wait for the one download in flight
+- the raw dataset is also written to the tiered cache (``weather``
+  namespace), so other worker processes and restarts pick it up without
+  another download
+- once expired, the previous snapshot keeps being served for up to
+  ``stale_seconds`` while a background thread downloads the next one; a
+  failed download keeps the previous snapshot
+- ``add_listener(callback)`` registers a callback that receives every
+  newly installed ``StationIndex`` (derived data such as the sweat grid
+  is rebuilt there, off the request path)
+- ``get_stats()`` counts downloads, shared-cache loads, memory hits and
+  failures
+
+Usage::
+
+    index = observation_snapshot.get_index()
+    station = index.nearest(lat, lng, max_km=200)
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from modules.station_index import StationIndex
+from modules.tiered_cache import tiered_cache
+
+logger = logging.getLogger(__name__)
+
+OBSERVATION_URL = "https://opendata.cwa.gov.tw/api/v1/rest/datastore/O-A0003-001"
+OBSERVATION_TTL_SECONDS = float(os.environ.get("CWA_OBSERVATION_TTL_SECONDS", "600"))
+OBSERVATION_STALE_SECONDS = float(os.environ.get("CWA_OBSERVATION_STALE_SECONDS", "3600"))
+
+_CACHE_KEY = ("snapshot", "O-A0003-001")
+
+
+class ObservationUnavailable(Exception):
+    """No observation snapshot could be loaded (no API key, bad response)."""
+
+
+def fetch_observations(api_key: Optional[str] = None, timeout: float = 15) -> Dict:
+    """Download the nationwide observation dataset."""
+    import requests
+
+    api_key = api_key or os.getenv("CWB_API_KEY")
+    if not api_key:
+        raise ObservationUnavailable("中央氣象署 API 金鑰未設置")
+    params = {
+        'Authorization': api_key,
+        'elementName': 'TEMP,HUMD,WDSD',
+        'parameterName': 'LAT,LON',
+    }
+    response = requests.get(OBSERVATION_URL, params=params, timeout=timeout, verify=False)
+    response.raise_for_status()
+    data = response.json()
+    if data.get('success') != 'true':
+        raise ObservationUnavailable(
+            f"API狀態: {data.get('result', {}).get('resource_id', 'unknown')}"
+        )
+    return data
+
+
+class ObservationSnapshot:
+    """Process-wide observation snapshot, refreshed once per interval."""
+
+    def __init__(self, fetch: Callable[[], Dict] = fetch_observations,
+                 ttl_seconds: float = OBSERVATION_TTL_SECONDS,
+                 stale_seconds: float = OBSERVATION_STALE_SECONDS,
+                 cache=None, shared: bool = True):
+        self._fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self._cache = cache if cache is not None else tiered_cache
+        self._shared = shared
+        self._index: Optional[StationIndex] = None
+        self._fetched_at = 0.0
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._listeners: List[Callable[[StationIndex], None]] = []
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "stale_hits": 0, "shared_loads": 0,
+                       "downloads": 0, "failures": 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def age(self) -> Optional[float]:
+        """Seconds since the current snapshot was downloaded, or ``None``."""
+        return time.time() - self._fetched_at if self._index is not None else None
+
+    def current_index(self) -> Optional[StationIndex]:
+        """The installed snapshot's index (possibly expired) without loading."""
+        return self._index
+
+    def add_listener(self, callback: Callable[[StationIndex], None]):
+        """Call *callback(index)* after every snapshot install."""
+        with self._lock:
+            self._listeners.append(callback)
+        if self._index is not None:
+            self._notify(callback, self._index)
+
+    def _notify(self, callback, index: StationIndex):
+        try:
+            callback(index)
+        except Exception:
+            logger.warning("Observation snapshot listener failed", exc_info=True)
+
+    def get_index(self) -> StationIndex:
+        """Station index of the current snapshot.
+
+        Raises ``ObservationUnavailable`` or the download's exception only
+        when no usable snapshot exists at all.
+        """
+        age = self.age()
+        if age is not None and age < self.ttl_seconds:
+            self._count("memory_hits")
+            return self._index
+        if age is not None and age < self.ttl_seconds + self.stale_seconds:
+            self._count("stale_hits")
+            self._refresh_in_background()
+            return self._index
+        return self._load()
+
+    def _load(self) -> StationIndex:
+        with self._load_lock:
+            # Another caller may have finished loading while we waited
+            age = self.age()
+            if age is not None and age < self.ttl_seconds:
+                self._count("memory_hits")
+                return self._index
+            try:
+                self._reload()
+            except Exception:
+                self._count("failures")
+                if self._index is not None:
+                    logger.warning("Observation download failed; keeping the previous snapshot", exc_info=True)
+                    return self._index
+                raise
+            return self._index
+
+    def _reload(self):
+        """Fresh dataset from the shared cache, else from the CWA API."""
+        if self._shared:
+            cached = self._cache.get("weather", _CACHE_KEY)
+            if cached and time.time() - cached.get("fetched_at", 0) < self.ttl_seconds:
+                self._install(cached["data"], cached["fetched_at"])
+                self._count("shared_loads")
+                return
+        data = self._fetch()
+        fetched_at = time.time()
+        self._install(data, fetched_at)
+        self._count("downloads")
+        if self._shared:
+            self._cache.set("weather", _CACHE_KEY, {"fetched_at": fetched_at, "data": data},
+                            ttl_minutes=(self.ttl_seconds + self.stale_seconds) / 60)
+
+    def _install(self, data: Dict, fetched_at: float):
+        index = StationIndex.from_payload(data)
+        self._index, self._fetched_at = index, fetched_at
+        logger.info("Observation snapshot loaded: %d stations (%d valid)", index.station_count, len(index))
+        with self._lock:
+            listeners = list(self._listeners)
+        for callback in listeners:
+            self._notify(callback, index)
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self._load()
+            except Exception:
+                pass  # counted and logged in _load; the old snapshot stays
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="cwa-observation-refresh", daemon=True).start()
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        age = self.age()
+        stats["age_seconds"] = round(age, 1) if age is not None else None
+        stats["stations"] = len(self._index) if self._index is not None else 0
+        return stats
+
+
+# ------------------------------------------------------------------
+# Module-level singleton
+# ------------------------------------------------------------------
+observation_snapshot = ObservationSnapshot()
@@ -0,0 +1,193 @@
+# test_async_pipeline.py
+"""
+測試 SSE 推薦流程的非同步執行環境（modules/pipeline.py）
+
+執行方式：python test_async_pipeline.py
+"""
+
+import asyncio
+import sys
+import time
+import unittest
+from unittest.mock import patch
+
+sys.path.append('.')
+
+from modules import pipeline
+
+
+class TestRunBlocking(unittest.TestCase):
+    """run_blocking() executes on shared pools and enforces stage budgets."""
+
+    @classmethod
+    def setUpClass(cls):
+        pipeline.start_executors(io_workers=4, selenium_workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        pipeline.shutdown_executors()
+
+    def test_returns_result(self):
+        result = asyncio.run(pipeline.run_blocking("weather", lambda x: x * 2, 21))
+        self.assertEqual(result, 42)
+        print("PASS: test_returns_result")
+
+    def test_stage_timeout(self):
+        """A stage exceeding its budget raises TimeoutError promptly."""
+        async def run():
+            start = time.time()
+            with self.assertRaises(asyncio.TimeoutError):
+                await pipeline.run_blocking("geocode", time.sleep, 1.0, timeout=0.1)
+            return time.time() - start
+
+        elapsed = asyncio.run(run())
+        self.assertLess(elapsed, 0.5)
+        print(f"PASS: test_stage_timeout ({elapsed:.2f}s)")
+
+    def test_hung_stage_does_not_block_loop(self):
+        """While one stage hangs in a worker, other coroutines keep running."""
+        async def run():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                for _ in range(5):
+                    await asyncio.sleep(0.02)
+                    ticks += 1
+
+            hung = asyncio.ensure_future(
+                pipeline.run_blocking("geocode", time.sleep, 0.5, timeout=0.3)
+            )
+            await ticker()
+            with self.assertRaises(asyncio.TimeoutError):
+                await hung
+            return ticks
+
+        self.assertEqual(asyncio.run(run()), 5)
+        print("PASS: test_hung_stage_does_not_block_loop")
+
+    def test_run_async_cancels_on_timeout(self):
+        """A coroutine stage is cancelled when it exceeds its budget."""
+        cancelled = []
+
+        async def slow_intent():
+            try:
+                await asyncio.sleep(1.0)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        async def run():
+            with self.assertRaises(asyncio.TimeoutError):
+                await pipeline.run_async("intent", slow_intent(), timeout=0.05)
+
+        asyncio.run(run())
+        self.assertEqual(cancelled, [1])
+        print("PASS: test_run_async_cancels_on_timeout")
+
+    def test_executors_are_shared(self):
+        """The same pool instance is reused across calls."""
+        self.assertIs(pipeline.get_executor("io"), pipeline.get_executor("io"))
+        self.assertIsNot(pipeline.get_executor("io"), pipeline.get_executor("selenium"))
+        print("PASS: test_executors_are_shared")
+
+
+class TestSpeculativeSearch(unittest.TestCase):
+    """Speculative Maps / geocode tasks are kept, cancelled or supplemented."""
+
+    def test_speculative_intent_needs_location_and_food(self):
+        from modules.ai.intent_analyzer import speculative_intent
+
+        guess = speculative_intent("我在台北101想吃拉麵")
+        self.assertEqual(guess["location"], "台北101")
+        self.assertEqual(guess["primary_keywords"], ["拉麵"])
+        self.assertIsNone(speculative_intent("我餓了"))
+        self.assertIsNone(speculative_intent("我在台北101"))
+        print("PASS: test_speculative_intent_needs_location_and_food")
+
+    def _run_reconcile(self, spec_location, spec_keywords, real_location, real_keywords):
+        calls = []
+        self.cancel_events = {}
+
+        async def fake_maps(keyword, location, max_results=8, cancelled=None):
+            calls.append((keyword, location))
+            if cancelled is not None:
+                self.cancel_events[keyword] = cancelled
+            await asyncio.sleep(0.05)
+            return [{"name": f"{keyword}@{location}"}]
+
+        async def fake_geocode(location):
+            calls.append(("geocode", location))
+            return (25.03, 121.56)
+
+        async def run():
+            with patch("modules.pipeline.search_maps", fake_maps), \
+                 patch("modules.pipeline.geocode_location", fake_geocode):
+                spec = pipeline.SpeculativeSearch(spec_location, spec_keywords)
+                spec.start()
+                await asyncio.sleep(0)
+                maps_tasks, geocode_task = spec.reconcile(real_location, real_keywords)
+                results = dict([await t for t in maps_tasks.values()])
+                await geocode_task
+                return spec.stats, results
+
+        stats, results = asyncio.run(run())
+        return stats, results, calls
+
+    def test_reconcile_same_location(self):
+        stats, results, calls = self._run_reconcile(
+            "台北101", ["拉麵", "火鍋"], "我在台北101", ["拉麵", "日式拉麵"],
+        )
+        self.assertEqual(stats["kept"], 1)
+        self.assertEqual(stats["cancelled"], 1)
+        self.assertEqual(stats["added"], 1)
+        self.assertTrue(stats["geocode_reused"])
+        self.assertEqual(set(results), {"拉麵", "日式拉麵"})
+        self.assertEqual(sum(1 for c in calls if c[0] == "geocode"), 1)
+        # The dropped keyword's scrape is told to stop; the kept one is not
+        self.assertTrue(self.cancel_events["火鍋"].is_set())
+        self.assertFalse(self.cancel_events["拉麵"].is_set())
+        print(f"PASS: test_reconcile_same_location ({stats})")
+
+    def test_reconcile_different_location(self):
+        stats, results, calls = self._run_reconcile(
+            "台北101", ["拉麵"], "西門町", ["拉麵"],
+        )
+        self.assertEqual(stats["kept"], 0)
+        self.assertEqual(stats["cancelled"], 1)
+        self.assertFalse(stats["geocode_reused"])
+        self.assertEqual(results["拉麵"], [{"name": "拉麵@西門町"}])
+        self.assertIn(("geocode", "西門町"), calls)
+        self.assertTrue(self.cancel_events["拉麵"].is_set())
+        print(f"PASS: test_reconcile_different_location ({stats})")
+
+    def test_cancelled_scrape_never_takes_a_browser(self):
+        import threading
+        from modules.fast_search import search_restaurants_cached
+
+        cancelled = threading.Event()
+        cancelled.set()
+        with patch("modules.fast_search.tiered_cache.lookup", return_value=None), \
+             patch("modules.fast_search.tiered_cache.set") as cache_set:
+            self.assertEqual(search_restaurants_cached("拉麵", "台北101", 8, cancelled=cancelled), ([], False))
+        cache_set.assert_not_called()
+        print("PASS: test_cancelled_scrape_never_takes_a_browser")
+
+    def test_maps_cache_is_separate_from_restaurant_cache(self):
+        from modules import fast_search
+        from modules.tiered_cache import TieredCache
+
+        cache = TieredCache(l2=None, record_metrics=False)
+        # google_maps.set_restaurant_cache writes the same tuple shape under "restaurant"
+        cache.set("restaurant", ("拉麵", "台北101", 8, None), [{"name": "舊的地址查詢結果"}])
+        with patch.object(fast_search, "tiered_cache", cache), \
+             patch.object(fast_search, "search_restaurants_fast", return_value=[{"name": "一蘭"}]) as scrape:
+            self.assertEqual(fast_search.search_restaurants_cached("拉麵", "台北101", 8), ([{"name": "一蘭"}], False))
+            self.assertEqual(fast_search.search_restaurants_cached("拉麵", "台北101", 8), ([{"name": "一蘭"}], False))
+        self.assertEqual(scrape.call_count, 1)
+        self.assertEqual(cache.get("restaurant", ("拉麵", "台北101", 8, None)), [{"name": "舊的地址查詢結果"}])
+        print("PASS: test_maps_cache_is_separate_from_restaurant_cache")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,152 @@
+# test_forecast_store.py
+"""
+測試預先載入的鄉鎮天氣預報（modules/forecast_store.py）
+
+執行方式：python test_forecast_store.py
+"""
+
+import sys
+import threading
+import time
+import unittest
+from datetime import datetime
+
+sys.path.append('.')
+
+from cwa_test_data import forecast_document, forecast_element, forecast_location
+from modules.forecast_store import ForecastStore, TownForecast, city_code, parse_city_document
+
+SLOTS = ["2026-07-01T12:00:00+08:00", "2026-07-01T15:00:00+08:00", "2026-07-01T18:00:00+08:00"]
+
+
+def _ts(iso):
+    return datetime.fromisoformat(iso).timestamp()
+
+
+def _location(name, pops=("10", "40", "80")):
+    return forecast_location(name, [
+        forecast_element("溫度", "Temperature", SLOTS[:1], ["31"]),
+        forecast_element("相對濕度", "RelativeHumidity", SLOTS[:1], ["72"]),
+        forecast_element("3小時降雨機率", "ProbabilityOfPrecipitation", SLOTS, pops, time_key="StartTime"),
+    ])
+
+
+def _document(*towns):
+    return forecast_document(*[_location(t) for t in towns])
+
+
+class _FakeFetch:
+
+    def __init__(self, delay=0.0):
+        self.codes = []
+        self.delay = delay
+        self.fail = False
+        self._lock = threading.Lock()
+
+    def __call__(self, code):
+        with self._lock:
+            self.codes.append(code)
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError("API down")
+        return _document("中正區", "大安區", "信義區")
+
+
+class TestTownForecast(unittest.TestCase):
+
+    def test_nearest_slot(self):
+        forecast = TownForecast.from_location(_location("中正區"))
+        self.assertEqual(forecast.pop_at(_ts(SLOTS[0]) - 3600), "10")
+        self.assertEqual(forecast.pop_at(_ts(SLOTS[0]) + 5000), "10")
+        self.assertEqual(forecast.pop_at(_ts(SLOTS[0]) + 6000), "40")
+        self.assertEqual(forecast.pop_at(_ts(SLOTS[2]) + 86400), "80")
+
+    def test_missing_elements(self):
+        forecast = TownForecast.from_location({"LocationName": "某鄉"})
+        self.assertEqual(forecast.as_dict(), {
+            "locationName": "某鄉", "temperature": "N/A", "humidity": "N/A", "pop": "N/A",
+        })
+
+    def test_parse_city_document_folds_names(self):
+        towns = parse_city_document(_document("臺東市"))
+        self.assertIn("台東市", towns)
+        self.assertEqual(towns["台東市"].temperature, "31")
+
+    def test_city_code(self):
+        self.assertEqual(city_code("臺北市"), city_code("台北市"))
+        self.assertEqual(city_code("台東縣"), "037")
+        self.assertIsNone(city_code("東京都"))
+
+
+class TestForecastStore(unittest.TestCase):
+
+    def setUp(self):
+        self.fetch = _FakeFetch()
+        self.store = ForecastStore(fetch=self.fetch, refresh_seconds=60, prefetch_spacing=0)
+
+    def tearDown(self):
+        self.store.stop_prefetch(timeout=2)
+
+    def test_lookups_are_served_from_memory(self):
+        when = _ts(SLOTS[1])
+        self.assertEqual(self.store.get_town("台北市", "中正區", when)["pop"], "40")
+        self.assertEqual(self.store.get_town("臺北市", "大安區", when)["humidity"], "72")
+        self.assertEqual(self.fetch.codes, ["061"])
+        stats = self.store.get_stats()
+        self.assertEqual((stats["hits"], stats["on_demand_loads"]), (2, 1))
+
+    def test_concurrent_misses_load_once(self):
+        self.fetch.delay = 0.2
+        threads = [threading.Thread(target=self.store.get_town, args=("台北市", "中正區")) for _ in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.fetch.codes, ["061"])
+
+    def test_unknown_city_and_town(self):
+        self.assertIsNone(self.store.get_town("東京都", "新宿區"))
+        self.assertIsNone(self.store.get_town("台北市", "不存在區"))
+        self.assertEqual(self.fetch.codes, ["061"])
+        self.assertEqual(self.store.get_stats()["unknown_towns"], 1)
+
+    def test_prefetch_loads_every_city(self):
+        self.assertTrue(self.store.start_prefetch(cities=["台北市", "高雄市"]))
+        self.assertFalse(self.store.start_prefetch())
+        deadline = time.time() + 2
+        while self.store.get_stats()["cities_loaded"] < 2 and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(sorted(self.fetch.codes), ["061", "065"])
+        self.assertIsNotNone(self.store.get_town("高雄市", "信義區"))
+        self.assertEqual(len(self.fetch.codes), 2)
+
+    def test_failed_refresh_keeps_old_document(self):
+        self.store.refresh_city("台北市")
+        self.fetch.fail = True
+        self.assertFalse(self.store.refresh_city("台北市"))
+        self.assertEqual(self.store.towns("台北市"), ["中正區", "大安區", "信義區"])
+        self.assertEqual(self.store.get_stats()["failures"], 1)
+
+    def test_stale_document_is_reloaded(self):
+        store = ForecastStore(fetch=self.fetch, max_age_seconds=0.05, prefetch_spacing=0)
+        store.get_town("台北市", "中正區")
+        time.sleep(0.1)
+        store.get_town("台北市", "中正區")
+        self.assertEqual(self.fetch.codes, ["061", "061"])
+
+    def test_failed_on_demand_load_backs_off(self):
+        store = ForecastStore(fetch=self.fetch, prefetch_spacing=0, retry_seconds=0.2)
+        self.fetch.fail = True
+        for _ in range(5):
+            self.assertIsNone(store.get_town("台北市", "中正區"))
+        self.assertEqual(self.fetch.codes, ["061"])
+        self.assertEqual(store.get_stats()["retries_skipped"], 4)
+
+        self.fetch.fail = False
+        time.sleep(0.25)
+        self.assertIsNotNone(store.get_town("台北市", "中正區"))
+        self.assertEqual(self.fetch.codes, ["061", "061"])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,117 @@
+# test_gemini_client.py
+"""
+測試共用 Gemini client（modules/ai/gemini_client.py）
+
+執行方式：python test_gemini_client.py
+"""
+
+import asyncio
+import sys
+import types
+import unittest
+from unittest.mock import patch
+
+sys.path.append('.')
+
+from modules.ai import gemini_client
+
+
+class _FakeModels:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = []
+        self.configs = []
+        self.cancelled = False
+
+    def generate_content(self, model, contents, config=None):
+        self.calls.append((model, contents))
+        self.configs.append(config)
+        return types.SimpleNamespace(text=f"{model}:{contents}")
+
+
+class _FakeAsyncModels(_FakeModels):
+    async def generate_content(self, model, contents, config=None):
+        self.calls.append((model, contents))
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return types.SimpleNamespace(text=f"{model}:{contents}")
+
+
+class _FakeClient:
+    created = 0
+
+    def __init__(self, api_key, http_options=None):
+        _FakeClient.created += 1
+        self.api_key = api_key
+        self.models = _FakeModels()
+        self.aio = types.SimpleNamespace(models=_FakeAsyncModels())
+
+
+class TestGeminiClient(unittest.TestCase):
+
+    def setUp(self):
+        gemini_client.clear_clients()
+        _FakeClient.created = 0
+        fake_genai = types.ModuleType("google.genai")
+        fake_genai.Client = _FakeClient
+        fake_genai.types = types.SimpleNamespace(HttpOptions=lambda **kw: types.SimpleNamespace(**kw))
+        fake_google = types.ModuleType("google")
+        fake_google.genai = fake_genai
+        self._modules = patch.dict(sys.modules, {"google": fake_google, "google.genai": fake_genai})
+        self._modules.start()
+
+    def tearDown(self):
+        self._modules.stop()
+        gemini_client.clear_clients()
+
+    def test_one_client_per_key(self):
+        for _ in range(5):
+            gemini_client.generate_content("AIzaKEY_A", "m", "hi")
+        gemini_client.generate_content("AIzaKEY_B", "m", "hi")
+        self.assertEqual(_FakeClient.created, 2)
+        self.assertEqual(len(gemini_client.get_client("AIzaKEY_A").models.calls), 5)
+        gemini_client.drop_client("AIzaKEY_A")
+        self.assertEqual(gemini_client.cached_client_count(), 1)
+        print("PASS: test_one_client_per_key")
+
+    def test_cache_is_bounded(self):
+        with patch.object(gemini_client, "MAX_CACHED_CLIENTS", 3):
+            for i in range(5):
+                gemini_client.get_client(f"AIzaKEY_{i}")
+        self.assertEqual(gemini_client.cached_client_count(), 3)
+        print("PASS: test_cache_is_bounded")
+
+    def test_async_shares_client(self):
+        text = asyncio.run(gemini_client.agenerate_content("AIzaKEY_A", "m", "hi", timeout=1)).text
+        self.assertEqual(text, "m:hi")
+        gemini_client.generate_content("AIzaKEY_A", "m", "hi")
+        self.assertEqual(_FakeClient.created, 1)
+        print("PASS: test_async_shares_client")
+
+    def test_async_timeout_cancels_request(self):
+        client = gemini_client.get_client("AIzaKEY_A")
+        client.aio.models.delay = 5
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(gemini_client.agenerate_content("AIzaKEY_A", "m", "hi", timeout=0.05))
+        self.assertTrue(client.aio.models.cancelled)
+        print("PASS: test_async_timeout_cancels_request")
+
+    def test_timeout_does_not_modify_caller_config(self):
+        config = types.SimpleNamespace(temperature=0.1, http_options=None)
+        gemini_client.generate_content("AIzaKEY_A", "m", "hi", config, timeout=2)
+        gemini_client.generate_content("AIzaKEY_A", "m", "hi", config)
+
+        sent_with_timeout, sent_without = gemini_client.get_client("AIzaKEY_A").models.configs
+        self.assertIsNone(config.http_options)
+        self.assertEqual(sent_with_timeout.http_options.timeout, 2000)
+        self.assertEqual(sent_with_timeout.temperature, 0.1)
+        self.assertIs(sent_without, config)
+        print("PASS: test_timeout_does_not_modify_caller_config")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,500 @@
+# test_gemini_pool.py
+"""
+測試 GeminiKeyPool 的記憶體內金鑰選擇與延遲寫入
+
+執行方式：python test_gemini_pool.py
+"""
+
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+sys.path.append('.')
+
+from modules.ai import gemini_client
+from modules.ai.gemini_pool import GeminiKeyPool
+
+
+KEYS = [f"AIzaPOOL_INTERNAL_TEST_{i:04d}" for i in range(5)]
+
+
+class _PoolTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self._tmpdir.name, "pool.db")
+        self.pool = GeminiKeyPool(db_path=self.db_path)
+        self.pool.add_keys("\n".join(KEYS), validate=False)
+
+    def tearDown(self):
+        self.pool.close()
+        self._tmpdir.cleanup()
+
+    def _db_cooldown(self, key):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(
+                "SELECT cooldown_until FROM api_keys WHERE api_key = ?", (key,)
+            ).fetchone()[0]
+        finally:
+            conn.close()
+
+
+class TestInMemorySelection(_PoolTestCase):
+    """Key selection is served from memory without touching SQLite."""
+
+    def test_selection_does_not_hit_sqlite(self):
+        with patch.object(self.pool, "_get_conn", side_effect=AssertionError("SQLite used")):
+            self.assertIn(self.pool.get_key(), KEYS)
+            self.assertIn(self.pool.get_key_excluding(KEYS[0]), KEYS[1:])
+            self.assertEqual(self.pool.get_key_excluding_all(set(KEYS[:4])), KEYS[4])
+            self.pool.mark_bad(KEYS[0], cooldown_seconds=60)
+        print("PASS: test_selection_does_not_hit_sqlite")
+
+    def test_ready_index_stays_consistent(self):
+        for key in KEYS[:3]:
+            self.pool.mark_bad(key, cooldown_seconds=60)
+        self.pool.remove_key(KEYS[3][-4:])
+        seen = {self.pool.get_key() for _ in range(50)}
+        self.assertEqual(seen, {KEYS[4]})
+        self.assertEqual(len(self.pool._ready), len(self.pool._ready_pos))
+        print("PASS: test_ready_index_stays_consistent")
+
+    def test_cooldown_expiry_returns_key(self):
+        for key in KEYS:
+            self.pool.mark_bad(key, cooldown_seconds=0.2)
+        self.assertIsNone(self.pool.get_key())
+        time.sleep(0.3)
+        self.assertEqual({self.pool.get_key() for _ in range(100)}, set(KEYS))
+        print("PASS: test_cooldown_expiry_returns_key")
+
+
+class TestWriteBehind(_PoolTestCase):
+    """Cooldowns reach SQLite asynchronously and survive a restart."""
+
+    def test_mark_bad_is_written_behind(self):
+        self.pool.mark_bad(KEYS[0], cooldown_seconds=60)
+        self.assertEqual(self._db_cooldown(KEYS[0]), 0)  # not yet flushed
+        deadline = time.time() + 3
+        while self._db_cooldown(KEYS[0]) == 0 and time.time() < deadline:
+            time.sleep(0.1)
+        self.assertGreater(self._db_cooldown(KEYS[0]), time.time() + 50)
+        print("PASS: test_mark_bad_is_written_behind")
+
+    def test_new_pool_loads_persisted_cooldown(self):
+        self.pool.mark_bad(KEYS[0], cooldown_seconds=60)
+        self.pool.flush()
+        other = GeminiKeyPool(db_path=self.db_path)
+        try:
+            picks = {other.get_key() for _ in range(100)}
+            self.assertNotIn(KEYS[0], picks)
+            self.assertEqual(len(other.get_key_status()), len(KEYS))
+        finally:
+            other.close()
+        print("PASS: test_new_pool_loads_persisted_cooldown")
+
+    def test_sync_picks_up_other_process_changes(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO api_keys (api_key) VALUES (?)", ("AIzaPOOL_EXTERNAL_KEY_0001",))
+        conn.execute(
+            "UPDATE api_keys SET cooldown_until = ? WHERE api_key = ?",
+            (time.time() + 60, KEYS[1]),
+        )
+        conn.commit()
+        conn.close()
+
+        conn = self.pool._get_conn()
+        try:
+            self.pool._sync_from_db(conn)
+        finally:
+            conn.close()
+        picks = {self.pool.get_key() for _ in range(200)}
+        self.assertIn("AIzaPOOL_EXTERNAL_KEY_0001", picks)
+        self.assertNotIn(KEYS[1], picks)
+        print("PASS: test_sync_picks_up_other_process_changes")
+
+    def test_writer_recreates_missing_database(self):
+        self.pool.mark_bad(KEYS[0], cooldown_seconds=60)
+        self.pool.flush()
+        os.unlink(self.db_path)
+        self.pool.mark_bad(KEYS[1], cooldown_seconds=60)
+        self.pool._wake.set()
+
+        deadline = time.time() + 3
+        while time.time() < deadline:
+            if os.path.exists(self.db_path):
+                try:
+                    if self._db_cooldown(KEYS[1]) > time.time():
+                        break
+                except (sqlite3.Error, TypeError):
+                    pass
+            time.sleep(0.05)
+        self.assertGreater(self._db_cooldown(KEYS[1]), time.time() + 50)
+        self.assertTrue(self.pool._writer.is_alive())
+        # Keys survive the next re-sync from the recreated file
+        conn = self.pool._get_conn()
+        try:
+            self.pool._sync_from_db(conn)
+        finally:
+            conn.close()
+        self.assertEqual(len(self.pool.get_key_status()), len(KEYS))
+        print("PASS: test_writer_recreates_missing_database")
+
+
+class TestUsageLogging(_PoolTestCase):
+    """Usage is queued, flushed in batches and summarised per key per day."""
+
+    def _count_rows(self, table):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_track_usage_is_batched(self):
+        # Stop the background writer so the flush below is deterministic
+        self.pool._stop.set()
+        self.pool._wake.set()
+        self.pool._writer.join()
+
+        with patch.object(self.pool, "_get_conn", side_effect=AssertionError("SQLite used")):
+            for _ in range(3):
+                self.pool.track_usage(KEYS[0], model="gemini-2.5-flash", prompt_tokens=10, completion_tokens=5)
+            self.pool.track_usage(KEYS[1], call_type="intent")
+        self.assertEqual(self._count_rows("api_key_usage"), 0)
+
+        # Pending records are already visible to the status endpoints
+        status = {s["suffix"]: s["usage_today"] for s in self.pool.get_key_status()}
+        self.assertEqual(status[KEYS[0][-4:]], 3)
+
+        self.pool.flush()
+        self.assertEqual(self._count_rows("api_key_usage"), 4)
+        self.assertEqual(self._count_rows("api_key_usage_daily"), 2)
+
+        stats = self.pool.get_usage_stats()
+        self.assertEqual(stats["today"], 4)
+        self.assertEqual(stats["last_7_days"], 4)
+        self.assertEqual(stats["last_30_days"], 4)
+        self.assertEqual(stats["today_tokens"], {"prompt": 30, "completion": 15, "total": 45})
+        status = {s["suffix"]: s["usage_today"] for s in self.pool.get_key_status()}
+        self.assertEqual(status[KEYS[0][-4:]], 3)
+        self.assertEqual(status[KEYS[1][-4:]], 1)
+        print("PASS: test_track_usage_is_batched")
+
+    def test_summary_ignores_old_rows(self):
+        """Status reads the summary table, not the raw log."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(
+            "INSERT INTO api_key_usage_daily (key_suffix, day, calls) VALUES (?, date('now', '-60 days'), 500)",
+            (KEYS[0][-4:],),
+        )
+        conn.commit()
+        conn.close()
+        self.pool.track_usage(KEYS[0])
+        self.pool.flush()
+        self.assertEqual(self.pool.get_usage_stats()["last_30_days"], 1)
+        print("PASS: test_summary_ignores_old_rows")
+
+    def test_backfill_existing_usage(self):
+        """A database created before the summary table is backfilled once."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DROP TABLE api_key_usage_daily")
+        conn.execute("INSERT INTO api_key_usage (key_suffix) VALUES (?)", (KEYS[2][-4:],))
+        conn.commit()
+        conn.close()
+        other = GeminiKeyPool(db_path=self.db_path)
+        try:
+            self.assertEqual(other.get_usage_stats()["today"], 1)
+        finally:
+            other.close()
+        print("PASS: test_backfill_existing_usage")
+
+    def test_daily_reads_use_day_index(self):
+        """Existing summary tables get the day index; reads by day never scan the table."""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DROP INDEX idx_api_key_usage_daily_day")
+        conn.commit()
+        conn.close()
+        GeminiKeyPool(db_path=self.db_path).close()
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            for sql in (
+                "SELECT key_suffix, calls FROM api_key_usage_daily WHERE day = '2026-07-01'",
+                "SELECT day, SUM(calls) FROM api_key_usage_daily "
+                "WHERE day >= date('now', '-29 days') GROUP BY day",
+            ):
+                plan = " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql))
+                self.assertIn("idx_api_key_usage_daily_day", plan, sql)
+                self.assertNotIn("TEMP B-TREE", plan, sql)
+        finally:
+            conn.close()
+        print("PASS: test_daily_reads_use_day_index")
+
+    def test_auto_retry_tracks_usage(self):
+        @self.pool.auto_retry
+        def call_gemini(*, api_key=None):
+            return "ok"
+
+        call_gemini()
+        self.pool.flush()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            call_type = conn.execute("SELECT call_type FROM api_key_usage").fetchone()[0]
+        finally:
+            conn.close()
+        self.assertEqual(call_type, "call_gemini")
+        print("PASS: test_auto_retry_tracks_usage")
+
+    def test_auto_retry_records_response_tokens(self):
+        usage = SimpleNamespace(prompt_token_count=1200, candidates_token_count=300, total_token_count=9000)
+        response = SimpleNamespace(text="ok", usage_metadata=usage)
+
+        async def agenerate(**kwargs):
+            return response
+
+        client = SimpleNamespace(models=SimpleNamespace(generate_content=lambda **kwargs: response),
+                                 aio=SimpleNamespace(models=SimpleNamespace(generate_content=agenerate)))
+
+        @self.pool.auto_retry
+        def call_gemini(*, api_key=None):
+            return gemini_client.generate_content(api_key, "gemini-2.5-flash", "hi").text
+
+        @self.pool.auto_retry
+        async def call_gemini_async(*, api_key=None):
+            return (await gemini_client.agenerate_content(api_key, "gemini-2.5-flash", "hi")).text
+
+        with patch.object(gemini_client, "get_client", return_value=client), \
+                patch.object(self.pool, "report_success", wraps=self.pool.report_success) as reported:
+            self.assertEqual(call_gemini(), "ok")
+            self.assertEqual(asyncio.run(call_gemini_async()), "ok")
+        # The reservation estimate is topped up with the real total
+        self.assertEqual([c.args[1] for c in reported.call_args_list], [9000, 9000])
+
+        self.pool.flush()
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT model, prompt_tokens, completion_tokens, total_tokens FROM api_key_usage"
+            ).fetchall()
+        finally:
+            conn.close()
+        self.assertEqual(rows, [("gemini-2.5-flash", 1200, 300, 9000)] * 2)
+        print("PASS: test_auto_retry_records_response_tokens")
+
+
+class TestRateLimiting(_PoolTestCase):
+    """Token buckets steer traffic away from keys that are about to 429."""
+
+    def test_acquire_prefers_headroom(self):
+        for _ in range(len(KEYS) * 2):
+            self.pool.acquire_key()
+        # Reservations are spread evenly instead of piling onto one key
+        levels = [round(self.pool._keys[k].rpm.tokens) for k in KEYS]
+        self.assertEqual(len(set(levels)), 1, levels)
+        print(f"PASS: test_acquire_prefers_headroom (rpm tokens left: {levels})")
+
+    def test_acquire_waits_for_capacity(self):
+        for key in KEYS[1:]:
+            self.pool.remove_key(key[-4:])
+        state = self.pool._keys[KEYS[0]]
+        state.rpm.set_capacity(60)  # one token per second
+        state.rpm.tokens = 0.0
+
+        start = time.time()
+        self.assertEqual(self.pool.acquire_key(max_wait=2.0), KEYS[0])
+        waited = time.time() - start
+        self.assertGreater(waited, 0.5)
+        self.assertLess(waited, 1.5)
+
+        # Beyond max_wait the key is returned immediately and the API decides
+        state.rpm.tokens = -100.0
+        start = time.time()
+        self.assertEqual(self.pool.acquire_key(max_wait=0.5), KEYS[0])
+        self.assertLess(time.time() - start, 0.2)
+        print(f"PASS: test_acquire_waits_for_capacity (waited {waited:.2f}s)")
+
+    def test_adaptive_cooldown(self):
+        key = KEYS[0]
+        hinted = self.pool.report_rate_limited(
+            key, Exception("429 RESOURCE_EXHAUSTED {'retryDelay': '27s'}"),
+        )
+        self.assertEqual(hinted, 27)
+        first = self.pool.report_rate_limited(key, Exception("429 quota"))
+        second = self.pool.report_rate_limited(key, Exception("429 quota"))
+        self.assertEqual(second, first * 2)
+
+        status = {s["suffix"]: s for s in self.pool.get_key_status()}
+        self.assertGreater(status[key[-4:]]["cooldown_remaining"], 0)
+        # 429s with budget left lower the learned RPM; success lets it recover
+        self.assertLess(status[key[-4:]]["learned_rpm"], 10)
+        learned = self.pool._keys[key].rpm.capacity
+        self.pool.report_success(key)
+        self.assertEqual(self.pool._keys[key].strikes, 0)
+        self.assertGreater(self.pool._keys[key].rpm.capacity, learned)
+        print(f"PASS: test_adaptive_cooldown (hinted={hinted}, backoff={first}->{second})")
+
+    def test_auto_retry_skips_to_next_key_on_429(self):
+        calls = []
+
+        @self.pool.auto_retry
+        def call_gemini(*, api_key=None):
+            calls.append(api_key)
+            if len(calls) == 1:
+                raise Exception("429 Resource has been exhausted")
+            return api_key
+
+        used = call_gemini()
+        self.assertNotEqual(used, calls[0])
+        self.assertNotIn(calls[0], {self.pool.get_key() for _ in range(50)})
+        print("PASS: test_auto_retry_skips_to_next_key_on_429")
+
+    def test_auto_retry_async(self):
+        calls = []
+
+        @self.pool.auto_retry
+        async def call_gemini(*, api_key=None):
+            calls.append(api_key)
+            if len(calls) == 1:
+                raise Exception("429 Resource has been exhausted")
+            await asyncio.sleep(0)
+            return api_key
+
+        self.assertTrue(asyncio.iscoroutinefunction(call_gemini))
+        used = asyncio.run(call_gemini())
+        self.assertEqual(len(calls), 2)
+        self.assertNotEqual(used, calls[0])
+        self.assertEqual(len(self.pool._pending_usage), 1)
+        print("PASS: test_auto_retry_async")
+
+    def test_acquire_key_async_waits_without_blocking(self):
+        for key in KEYS[1:]:
+            self.pool.mark_bad(key, cooldown_seconds=60)
+        state = self.pool._keys[KEYS[0]]
+        state.rpm.tokens = 1 - state.rpm.rate * 0.2  # ~0.2 s until the next request
+
+        async def main():
+            ticks = []
+
+            async def ticker():
+                while True:
+                    ticks.append(1)
+                    await asyncio.sleep(0.01)
+
+            task = asyncio.ensure_future(ticker())
+            key = await self.pool.acquire_key_async()
+            task.cancel()
+            return key, len(ticks)
+
+        key, ticks = asyncio.run(main())
+        self.assertEqual(key, KEYS[0])
+        self.assertGreater(ticks, 5)  # the loop kept running while we waited
+        print(f"PASS: test_acquire_key_async_waits_without_blocking (ticks={ticks})")
+
+    def test_remove_key_drops_cached_client(self):
+        from modules.ai import gemini_client
+        key = KEYS[0]
+        gemini_client._clients[key] = object()
+        self.pool.remove_key(key[-8:])
+        self.assertNotIn(key, gemini_client._clients)
+        print("PASS: test_remove_key_drops_cached_client")
+
+
+class TestHedging(_PoolTestCase):
+    """Opt-in hedged calls: a slow first call is duplicated on another key."""
+
+    def test_slow_call_is_hedged_and_loser_cancelled(self):
+        started, cancelled = [], []
+
+        @self.pool.auto_retry(hedge=True)
+        async def call_intent(*, api_key=None):
+            started.append(api_key)
+            try:
+                await asyncio.sleep(5 if len(started) == 1 else 0.01)
+            except asyncio.CancelledError:
+                cancelled.append(api_key)
+                raise
+            return api_key
+
+        with patch("modules.ai.gemini_pool.HEDGE_DEFAULT_DELAY_SECONDS", 0.05):
+            start = time.time()
+            winner = asyncio.run(call_intent())
+            elapsed = time.time() - start
+
+        self.assertLess(elapsed, 1.0)
+        self.assertEqual(len(started), 2)
+        self.assertNotEqual(started[0], started[1])
+        self.assertEqual(winner, started[1])
+        self.assertEqual(cancelled, [started[0]])
+
+        stats = self.pool.get_usage_stats()["hedging"]["call_intent"]
+        self.assertEqual((stats["calls"], stats["hedged"], stats["hedge_wins"]), (1, 1, 1))
+        self.assertEqual(stats["hedge_rate"], 1.0)
+        print(f"PASS: test_slow_call_is_hedged_and_loser_cancelled ({elapsed:.2f}s)")
+
+    def test_fast_call_is_not_hedged(self):
+        @self.pool.auto_retry(hedge=True)
+        async def call_intent(*, api_key=None):
+            return api_key
+
+        asyncio.run(call_intent())
+        stats = self.pool.get_hedge_stats()["call_intent"]
+        self.assertEqual((stats["calls"], stats["hedged"]), (1, 0))
+        self.assertIsNotNone(stats["latency_p50_ms"])
+        print("PASS: test_fast_call_is_not_hedged")
+
+    def test_hedge_delay_tracks_latency_percentile(self):
+        for ms in range(1, 101):
+            self.pool.record_latency("call_intent", ms / 100)
+        self.assertAlmostEqual(self.pool.hedge_delay("call_intent", 0.95), 0.95)
+        self.assertAlmostEqual(self.pool.hedge_delay("call_intent", 0.5), 0.5)
+        # Too few samples: fall back to the default delay
+        self.pool.record_latency("rare_call", 0.1)
+        with patch("modules.ai.gemini_pool.HEDGE_DEFAULT_DELAY_SECONDS", 3.0):
+            self.assertEqual(self.pool.hedge_delay("rare_call"), 3.0)
+        print("PASS: test_hedge_delay_tracks_latency_percentile")
+
+    def test_no_hedge_without_spare_key(self):
+        for key in KEYS[1:]:
+            self.pool.mark_bad(key, cooldown_seconds=60)
+        calls = []
+
+        @self.pool.auto_retry(hedge=True)
+        async def call_intent(*, api_key=None):
+            calls.append(api_key)
+            await asyncio.sleep(0.1)
+            return api_key
+
+        with patch("modules.ai.gemini_pool.HEDGE_DEFAULT_DELAY_SECONDS", 0.01):
+            self.assertEqual(asyncio.run(call_intent()), KEYS[0])
+        self.assertEqual(calls, [KEYS[0]])
+        self.assertEqual(self.pool.get_hedge_stats()["call_intent"]["hedged"], 0)
+        print("PASS: test_no_hedge_without_spare_key")
+
+    def test_primary_error_surfaces_when_all_legs_fail(self):
+        @self.pool.auto_retry(hedge=True)
+        async def call_intent(*, api_key=None):
+            await asyncio.sleep(0.05)
+            raise ValueError(api_key)
+
+        with patch("modules.ai.gemini_pool.HEDGE_DEFAULT_DELAY_SECONDS", 0.01):
+            with self.assertRaises(ValueError):
+                asyncio.run(call_intent())
+        print("PASS: test_primary_error_surfaces_when_all_legs_fail")
+
+    def test_hedge_requires_coroutine(self):
+        with self.assertRaises(TypeError):
+            @self.pool.auto_retry(hedge=True)
+            def call_sync(*, api_key=None):
+                return api_key
+        print("PASS: test_hedge_requires_coroutine")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
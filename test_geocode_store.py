@@ -0,0 +1,155 @@
+# test_geocode_store.py
+"""
+測試持久化地理編碼儲存（modules/geo/geocode_store.py）
+
+執行方式：python test_geocode_store.py
+"""
+
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.append('.')
+
+from modules.geo.geocode_store import GeocodeStore, normalize_address
+from modules.geo.landmarks import CITY_CENTERS, TAIWAN_LANDMARKS
+from modules.geo.parallel_geocoder import register_provider
+from modules.sqlite_cache_manager import SQLiteCacheManager
+from modules.tiered_cache import TieredCache
+
+
+class TestNormalizeAddress(unittest.TestCase):
+
+    def test_folds_variants_of_the_same_place(self):
+        self.assertEqual(normalize_address("臺北101"), normalize_address(" 台北101 台灣"))
+        self.assertEqual(normalize_address("Taipei 101, Taiwan"), normalize_address("taipei 101"))
+
+    def test_empty(self):
+        self.assertEqual(normalize_address(None), "")
+        self.assertEqual(normalize_address("   "), "")
+
+
+class TestGeocodeStore(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.l2 = SQLiteCacheManager(db_path=os.path.join(self._tmpdir.name, "cache.db"))
+        self.cache = TieredCache(l2=self.l2, record_metrics=False)
+        self.store = GeocodeStore(cache=self.cache)
+        self.store.seed(TAIWAN_LANDMARKS, source="landmark")
+        self.store.seed(CITY_CENTERS, source="city", landmarks=False)
+
+    def tearDown(self):
+        self.l2.close()
+        self._tmpdir.cleanup()
+
+    def test_seeded_names_resolve_without_geocoder(self):
+        def geocode(_query):
+            raise AssertionError("geocoder must not be called for a seeded name")
+
+        lat, lng, _ = TAIWAN_LANDMARKS["台北101"]
+        self.assertEqual(self.store.resolve("臺北101", geocode), (lat, lng))
+        self.assertEqual(self.store.get_stats()["seed_hits"], 1)
+
+    def test_match_landmark_inside_longer_text(self):
+        entry = self.store.match_landmark("台北101附近的拉麵")
+        self.assertEqual((entry["lat"], entry["lng"]), TAIWAN_LANDMARKS["台北101"][:2])
+        self.assertIsNone(self.store.match_landmark("完全不存在的地方"))
+
+    def test_city_centers_are_not_substring_matched(self):
+        city = next(iter(CITY_CENTERS))
+        self.assertIsNotNone(self.store.lookup(city))
+        landmark = self.store.match_landmark(city + "某某路")
+        if landmark is not None:
+            self.assertEqual(landmark["source"], "landmark")
+
+    def test_resolve_calls_geocoder_once(self):
+        calls = []
+
+        def geocode(query):
+            calls.append(query)
+            return (25.1, 121.5)
+
+        self.assertEqual(self.store.resolve("新北市泰山區明志路一段", geocode), (25.1, 121.5))
+        self.assertEqual(self.store.resolve("新北市泰山區明志路一段 台灣", geocode), (25.1, 121.5))
+        self.assertEqual(len(calls), 1)
+
+        stats = self.store.get_stats()
+        self.assertEqual((stats["misses"], stats["cache_hits"], stats["stored"]), (1, 1, 1))
+
+    def test_negative_result_is_remembered(self):
+        calls = []
+
+        def geocode(query):
+            calls.append(query)
+            return None
+
+        self.assertIsNone(self.store.resolve("查無此地址", geocode))
+        self.assertIsNone(self.store.resolve("查無此地址", geocode))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.store.lookup("查無此地址"), {"not_found": True})
+        self.assertEqual(self.store.get_stats()["negative_hits"], 2)
+
+    def test_geocoder_errors_are_not_recorded(self):
+        def geocode(_query):
+            raise RuntimeError("provider down")
+
+        with self.assertRaises(RuntimeError):
+            self.store.resolve("信義路五段7號", geocode)
+        self.assertIsNone(self.store.lookup("信義路五段7號"))
+
+    def test_entries_survive_a_restart(self):
+        self.store.store("公司樓下", (25.05, 121.55), display_name="公司樓下")
+        fresh = GeocodeStore(cache=TieredCache(l2=self.l2, record_metrics=False))
+        entry = fresh.lookup("公司樓下")
+        self.assertEqual((entry["lat"], entry["lng"]), (25.05, 121.55))
+
+    def test_resolve_many_dedupes_and_fans_out(self):
+        calls = []
+
+        def geocode(query):
+            calls.append(query)
+            time.sleep(0.2)
+            return None if "查無" in query else (25.0 + len(calls) / 1000, 121.5)
+
+        register_provider("fake-batch", geocode, per_second=100, max_concurrency=8)
+        self.store.store("已知餐廳", (25.05, 121.55))
+        queries = ["已知餐廳", "台北101", "拉麵店 台北", "拉麵店 臺北 台灣", "查無此店", "牛肉麵店"]
+
+        start = time.monotonic()
+        result = self.store.resolve_many(queries, provider="fake-batch")
+        elapsed = time.monotonic() - start
+
+        self.assertEqual(result["已知餐廳"], (25.05, 121.55))
+        self.assertEqual(result["台北101"], TAIWAN_LANDMARKS["台北101"][:2])
+        self.assertIsNotNone(result["拉麵店 台北"])
+        self.assertEqual(result["拉麵店 台北"], result["拉麵店 臺北 台灣"])
+        self.assertIsNone(result["查無此店"])
+        self.assertEqual(len(calls), 3)
+        self.assertLess(elapsed, 0.6)
+
+        # Second batch is served entirely from the store
+        again = self.store.resolve_many(queries, provider="fake-batch")
+        self.assertEqual(again, result)
+        self.assertEqual(len(calls), 3)
+
+    def test_resolve_many_skips_failed_lookups(self):
+        def geocode(query):
+            raise RuntimeError("provider down")
+
+        register_provider("fake-down", geocode, per_second=100, max_concurrency=2)
+        self.assertEqual(self.store.resolve_many(["信義路五段7號"], provider="fake-down"),
+                         {"信義路五段7號": None})
+        self.assertIsNone(self.store.lookup("信義路五段7號"))
+
+    def test_hit_ratio(self):
+        self.assertIsNone(self.store.get_stats()["hit_ratio"])
+        self.store.lookup("台北101")
+        self.store.lookup("沒見過的地方")
+        self.assertEqual(self.store.get_stats()["hit_ratio"], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
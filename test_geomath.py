@@ -0,0 +1,64 @@
+# test_geomath.py
+"""
+測試共用距離計算（modules/geo/geomath.py）
+
+執行方式：python test_geomath.py
+"""
+
+import sys
+import unittest
+
+sys.path.append('.')
+
+from modules.geo import geomath
+
+TAIPEI_101 = (25.0339, 121.5645)
+TAIPEI_MAIN = (25.0478, 121.5170)
+KAOHSIUNG = (22.6273, 120.3014)
+
+
+class TestHaversine(unittest.TestCase):
+
+    def test_known_distances(self):
+        self.assertAlmostEqual(geomath.haversine_km(*TAIPEI_101, *TAIPEI_101), 0.0)
+        self.assertAlmostEqual(geomath.haversine_km(*TAIPEI_101, *TAIPEI_MAIN), 5.03, delta=0.05)
+        self.assertAlmostEqual(geomath.haversine_km(*TAIPEI_101, *KAOHSIUNG), 297, delta=3)
+
+    def test_many_matches_scalar(self):
+        points = [TAIPEI_MAIN, KAOHSIUNG, TAIPEI_101]
+        expected = [geomath.haversine_km(*TAIPEI_101, *p) for p in points]
+        for got, want in zip(geomath.to_list(geomath.haversine_many(TAIPEI_101, points)), expected):
+            self.assertAlmostEqual(got, want, places=9)
+
+    def test_matrix_shape_and_values(self):
+        origins = [TAIPEI_101, KAOHSIUNG]
+        points = [TAIPEI_MAIN, KAOHSIUNG, TAIPEI_101]
+        matrix = geomath.haversine_matrix(origins, points)
+        self.assertEqual(len(matrix), 2)
+        for i, origin in enumerate(origins):
+            row = geomath.to_list(matrix[i])
+            self.assertEqual(len(row), 3)
+            for j, p in enumerate(points):
+                self.assertAlmostEqual(row[j], geomath.haversine_km(*origin, *p), places=9)
+
+    def test_empty_points(self):
+        self.assertEqual(geomath.to_list(geomath.haversine_many(TAIPEI_101, [])), [])
+
+
+class TestDistanceAndWalking(unittest.TestCase):
+
+    def test_exact_is_close_to_haversine(self):
+        exact = geomath.distance_km(TAIPEI_101, KAOHSIUNG, exact=True)
+        approx = geomath.distance_km(TAIPEI_101, KAOHSIUNG)
+        self.assertLess(abs(exact - approx) / exact, 0.005)
+
+    def test_walking_estimate(self):
+        self.assertEqual(geomath.walking_estimate(0.5), {
+            "walking_km": 0.65, "walking_minutes": 10, "walking_distance": "650m",
+        })
+        self.assertEqual(geomath.walking_estimate(1.0)["walking_distance"], "1.3km")
+        self.assertEqual(geomath.walking_estimate(0.001)["walking_minutes"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,151 @@
+# test_metrics.py
+"""
+測試流程指標模組（modules/metrics.py）與 /metrics 端點
+
+執行方式：python test_metrics.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+import unittest
+
+sys.path.append('.')
+
+from modules.metrics import Histogram, MetricsRegistry, metrics
+
+
+class TestHistogram(unittest.TestCase):
+
+    def test_buckets_and_quantiles(self):
+        hist = Histogram((1, 2, 4))
+        for v in (0.5, 0.5, 1.5, 3.0, 10.0):
+            hist.observe(v)
+        self.assertEqual(hist.count, 5)
+        self.assertAlmostEqual(hist.sum, 15.5)
+        self.assertEqual(hist.cumulative(), [("1.0", 2), ("2.0", 3), ("4.0", 4), ("+Inf", 5)])
+        self.assertLessEqual(hist.quantile(0.4), 1.0)
+        self.assertEqual(hist.quantile(0.99), 4)
+        self.assertIsNone(Histogram().quantile(0.5))
+        print("PASS: test_buckets_and_quantiles")
+
+
+class TestMetricsRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_summary(self):
+        r = self.registry
+        r.observe_stage("maps", 3.2)
+        r.observe_stage("maps", 9.0, "timeout")
+        r.record_cache("weather", True)
+        r.record_cache("weather", True)
+        r.record_cache("weather", False)
+        r.observe_browser_wait(0.02)
+        r.observe_browser_wait(3.0, pooled=False)
+        r.record_gemini("ok")
+        r.record_gemini("rate_limited")
+
+        summary = r.summary()
+        self.assertEqual(summary["stages"]["maps"]["count"], 2)
+        self.assertEqual(summary["stages"]["maps"]["outcomes"]["timeout"], 1)
+        self.assertAlmostEqual(summary["caches"]["weather"]["hit_ratio"], 0.667)
+        self.assertEqual(summary["browser_pool"]["acquisitions"], 2)
+        self.assertEqual(summary["browser_pool"]["fallbacks"], 1)
+        self.assertEqual(summary["gemini"]["rate_limited_ratio"], 0.5)
+        print("PASS: test_summary")
+
+    def test_time_stage_records_errors(self):
+        with self.assertRaises(ValueError):
+            with self.registry.time_stage("intent"):
+                raise ValueError("boom")
+        with self.registry.time_stage("intent"):
+            pass
+        outcomes = self.registry.summary()["stages"]["intent"]["outcomes"]
+        self.assertEqual(outcomes["error"], 1)
+        self.assertEqual(outcomes["ok"], 1)
+        print("PASS: test_time_stage_records_errors")
+
+    def test_prometheus_format(self):
+        r = self.registry
+        r.observe_stage("weather", 0.3)
+        r.record_cache("ai", False)
+        r.record_gemini("rate_limited")
+        text = r.render_prometheus()
+        self.assertIn("# TYPE lunchmind_stage_latency_seconds histogram", text)
+        self.assertIn('lunchmind_stage_latency_seconds_bucket{stage="weather",le="0.5"} 1', text)
+        self.assertIn('lunchmind_stage_latency_seconds_bucket{stage="weather",le="+Inf"} 1', text)
+        self.assertIn('lunchmind_stage_latency_seconds_count{stage="weather"} 1', text)
+        self.assertIn('lunchmind_cache_requests_total{cache="ai",result="miss"} 1', text)
+        self.assertIn('lunchmind_gemini_requests_total{outcome="rate_limited"} 1', text)
+        self.assertTrue(text.endswith("\n"))
+        print("PASS: test_prometheus_format")
+
+
+class TestInstrumentation(unittest.TestCase):
+
+    def setUp(self):
+        metrics.reset()
+
+    def test_run_blocking_records_stage(self):
+        from modules import pipeline
+
+        async def run():
+            await pipeline.run_blocking("weather", lambda: 1)
+            with self.assertRaises(asyncio.TimeoutError):
+                await pipeline.run_blocking("geocode", time.sleep, 0.3, timeout=0.05)
+
+        asyncio.run(run())
+        stages = metrics.summary()["stages"]
+        self.assertEqual(stages["weather"]["outcomes"]["ok"], 1)
+        self.assertEqual(stages["geocode"]["outcomes"]["timeout"], 1)
+        print("PASS: test_run_blocking_records_stage")
+
+    def test_auto_retry_records_rate_limits(self):
+        import tempfile
+        from modules.ai.gemini_pool import GeminiKeyPool
+
+        with tempfile.TemporaryDirectory() as tmp:
+            pool = GeminiKeyPool(db_path=os.path.join(tmp, "keys.db"))
+            pool.add_keys("AIzaTestKey000000000000000001\nAIzaTestKey000000000000000002", validate=False)
+            calls = []
+
+            @pool.auto_retry
+            def call(*, api_key=None):
+                calls.append(api_key)
+                if len(calls) == 1:
+                    raise Exception("429 Resource has been exhausted")
+                return "ok"
+
+            try:
+                self.assertEqual(call(), "ok")
+            finally:
+                pool.close()
+
+        gemini = metrics.summary()["gemini"]
+        self.assertEqual(gemini["rate_limited"], 1)
+        self.assertEqual(gemini["ok"], 1)
+        print("PASS: test_auto_retry_records_rate_limits")
+
+    def test_endpoints(self):
+        from fastapi.testclient import TestClient
+        from main import app
+
+        metrics.observe_stage("maps", 1.5)
+        client = TestClient(app)
+
+        resp = client.get("/metrics")
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.headers["content-type"].startswith("text/plain"))
+        self.assertIn('lunchmind_stage_latency_seconds_count{stage="maps"} 1', resp.text)
+
+        resp = client.get("/metrics/summary")
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["stages"]["maps"]["count"], 1)
+        print("PASS: test_endpoints")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
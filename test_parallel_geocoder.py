@@ -0,0 +1,166 @@
+# test_parallel_geocoder.py
+"""
+測試多組查詢字串並行地理編碼（modules/geo/parallel_geocoder.py）
+
+執行方式：python test_parallel_geocoder.py
+"""
+
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append('.')
+
+from modules.geo import parallel_geocoder
+from modules.geo.parallel_geocoder import (
+    FULL_ADDRESS_SCORE, GeocodeUnavailable, geocode_queries, in_taiwan, register_provider, score_query,
+)
+
+
+def _fake(answers, delays=None, calls=None):
+    """Provider answering from *answers* after a per-query delay."""
+    lock = threading.Lock()
+
+    def geocode(query):
+        if calls is not None:
+            with lock:
+                calls.append(query)
+        time.sleep((delays or {}).get(query, 0.01))
+        return answers.get(query)
+    return geocode
+
+
+class TestScoreQuery(unittest.TestCase):
+
+    def test_lane_and_number_scoring(self):
+        self.assertEqual(score_query("明志路一段100巷5號", 0), 150)
+        self.assertEqual(score_query("明志路一段5號", 2), 123)
+        self.assertEqual(score_query("明志路一段", 1), 109)
+        self.assertEqual(score_query("泰山區", 3), 97)
+        self.assertGreaterEqual(score_query("明志路一段100巷5號", 12), FULL_ADDRESS_SCORE)
+
+    def test_in_taiwan(self):
+        self.assertTrue(in_taiwan((25.03, 121.56)))
+        self.assertFalse(in_taiwan((35.68, 139.76)))
+
+
+class TestGeocodeQueries(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = f"fake-{self.id()}"
+
+    def test_variants_run_concurrently(self):
+        queries = [f"q{i}" for i in range(4)]
+        register_provider(self.provider, _fake({"q3": (25.0, 121.5)}, {q: 0.3 for q in queries}),
+                          per_second=100, max_concurrency=4)
+        start = time.monotonic()
+        hit = geocode_queries(queries, provider=self.provider)
+        self.assertEqual(hit.coords, (25.0, 121.5))
+        self.assertLess(time.monotonic() - start, 0.9)
+
+    def test_best_score_wins_like_the_serial_loop(self):
+        # The lower-priority variant answers first but the first one scores higher
+        queries = ["信義路五段", "信義區"]
+        answers = {"信義路五段": (25.03, 121.56), "信義區": (25.04, 121.57)}
+        register_provider(self.provider, _fake(answers, {"信義路五段": 0.2, "信義區": 0.01}),
+                          per_second=100, max_concurrency=4)
+        hit = geocode_queries(queries, provider=self.provider)
+        self.assertEqual(hit.query, "信義路五段")
+
+    def test_full_address_hit_cancels_the_rest(self):
+        calls = []
+        queries = ["新北市泰山區明志路一段100巷5號"] + [f"泰山區{i}" for i in range(6)]
+        answers = {q: (25.05, 121.43) for q in queries}
+        register_provider(self.provider, _fake(answers, calls=calls), per_second=10, max_concurrency=1)
+        hit = geocode_queries(queries, provider=self.provider, accept_score=FULL_ADDRESS_SCORE)
+        self.assertEqual(hit.query, queries[0])
+        time.sleep(0.3)
+        self.assertLess(len(calls), len(queries))
+        stats = parallel_geocoder.get_stats()[self.provider]
+        self.assertEqual(stats["early_exits"], 1)
+        self.assertGreater(stats["skipped"], 0)
+
+    def test_first_in_order_wins_with_positional_scores(self):
+        queries = ["a", "b", "c"]
+        answers = {"b": (25.0, 121.0), "c": (24.0, 120.5)}
+        register_provider(self.provider, _fake(answers, {"c": 0.0, "b": 0.1}),
+                          per_second=100, max_concurrency=3)
+        hit = geocode_queries(queries, provider=self.provider, scores=[0, -1, -2])
+        self.assertEqual(hit.query, "b")
+
+    def test_validate_and_errors(self):
+        def geocode(query):
+            if query == "boom":
+                raise RuntimeError("provider down")
+            return {"tokyo": (35.68, 139.76), "taipei": (25.03, 121.56)}.get(query)
+
+        register_provider(self.provider, geocode, per_second=100, max_concurrency=3)
+        hit = geocode_queries(["boom", "tokyo", "taipei"], provider=self.provider, validate=in_taiwan)
+        self.assertEqual(hit.query, "taipei")
+        self.assertEqual(parallel_geocoder.get_stats()[self.provider]["errors"], 1)
+
+    def test_failures_without_a_hit_are_not_not_found(self):
+        def geocode(query):
+            if query == "boom":
+                raise RuntimeError("provider down")
+            return None
+
+        register_provider(self.provider, geocode, per_second=100, max_concurrency=3)
+        with self.assertRaises(GeocodeUnavailable):
+            geocode_queries(["boom", "nothing"], provider=self.provider)
+        self.assertIsNone(geocode_queries(["nothing", "still nothing"], provider=self.provider))
+
+    def test_deadline_without_a_hit_is_unavailable(self):
+        register_provider(self.provider, _fake({}, {"slow": 1.0}), per_second=100, max_concurrency=2)
+        with self.assertRaises(GeocodeUnavailable):
+            geocode_queries(["slow", "fast"], provider=self.provider, deadline=0.2)
+
+    def test_rate_limit_spaces_requests(self):
+        stamps = []
+
+        def geocode(query):
+            stamps.append(time.monotonic())
+            return None
+
+        register_provider(self.provider, geocode, per_second=10, max_concurrency=4)
+        self.assertIsNone(geocode_queries(["a", "b", "c"], provider=self.provider))
+        stamps.sort()
+        self.assertGreaterEqual(stamps[-1] - stamps[0], 0.18)
+
+    def test_deadline_returns_best_so_far(self):
+        register_provider(self.provider, _fake({"fast": (25.0, 121.0)}, {"slow": 1.0, "fast": 0.01}),
+                          per_second=100, max_concurrency=2)
+        start = time.monotonic()
+        hit = geocode_queries(["slow", "fast"], provider=self.provider, deadline=0.2)
+        self.assertEqual(hit.query, "fast")
+        self.assertLess(time.monotonic() - start, 0.8)
+
+    def test_duplicates_and_empty(self):
+        calls = []
+        register_provider(self.provider, _fake({}, calls=calls), per_second=100, max_concurrency=2)
+        self.assertIsNone(geocode_queries([], provider=self.provider))
+        geocode_queries(["同一地址", "同一地址", ""], provider=self.provider)
+        self.assertEqual(calls, ["同一地址"])
+
+    def test_rate_limited_provider_does_not_starve_others(self):
+        # Twelve queries wait on a 1 request/s provider in the background
+        register_provider(self.provider + "-slow", _fake({}), per_second=1, max_concurrency=2)
+        batch = threading.Thread(target=parallel_geocoder.geocode_many,
+                                 args=([f"slow{i}" for i in range(12)], self.provider + "-slow", 1.5))
+        batch.start()
+        try:
+            time.sleep(0.05)
+            slow_workers = [t for t in threading.enumerate() if t.name.startswith(f"geocode-{self.provider}-slow")]
+            self.assertLessEqual(len(slow_workers), 2)
+
+            register_provider(self.provider, _fake({"fast": (25.0, 121.0)}), per_second=100, max_concurrency=2)
+            start = time.monotonic()
+            self.assertEqual(geocode_queries(["fast"], provider=self.provider).query, "fast")
+            self.assertLess(time.monotonic() - start, 0.5)
+        finally:
+            batch.join()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
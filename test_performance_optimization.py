@@ -17,7 +17,7 @@ def test_cache_performance():
     print("=" * 60)
     
     try:
-        from modules.cache_manager import cache_manager
+        from modules.tiered_cache import tiered_cache
         from modules.google_maps import search_restaurants
         from modules.weather import get_weather_data
         from modules.dialog_analysis import analyze_user_request
@@ -66,13 +66,11 @@ def test_cache_performance():
         print(f"AI分析：{first_analysis_time:.2f}s → {second_analysis_time:.2f}s (提升 {((first_analysis_time - second_analysis_time) / first_analysis_time * 100):.1f}%)")
         
         # 顯示快取統計
-        stats = cache_manager.get_cache_stats()
+        stats = tiered_cache.get_stats()
         print(f"\n快取統計：")
-        print(f"總請求數：{stats['total_requests']}")
-        print(f"快取命中率：{stats['hit_rate']}")
-        print(f"餐廳快取：{stats['restaurant_cache_size']} 項目")
-        print(f"天氣快取：{stats['weather_cache_size']} 項目")
-        print(f"AI快取：{stats['ai_cache_size']} 項目")
+        for namespace, counts in stats["namespaces"].items():
+            print(f"{namespace}：{counts['total']} 次查詢，命中率 {counts['hit_ratio']:.1%}")
+        print(f"記憶體快取：{stats['l1']['entries']} 項目")
         
         return True
         
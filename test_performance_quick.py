@@ -16,32 +16,31 @@ def test_caching_system():
     print("=" * 50)
     
     try:
-        from modules.cache_manager import cache_manager
-        
-        # 清空快取
-        cache_manager.clear_cache()
-        
+        from modules.tiered_cache import TieredCache
+
+        # 僅記憶體層，不寫入 cache.db
+        cache = TieredCache(l2=None, record_metrics=False)
+
         # 測試餐廳快取
-        cache_manager.set_restaurant_cache("拉麵", "台北101", 5, [{"name": "測試餐廳"}])
-        cached = cache_manager.get_restaurant_cache("拉麵", "台北101", 5)
-        
+        cache.set("restaurant", ("拉麵", "台北101", 5, None), [{"name": "測試餐廳"}])
+        cached = cache.get("restaurant", ("拉麵", "台北101", 5, None))
+
         # 測試天氣快取
-        cache_manager.set_weather_cache("台北101", {"temperature": 25})
-        weather_cached = cache_manager.get_weather_cache("台北101")
-        
+        cache.set("weather", ("台北101",), {"temperature": 25})
+        weather_cached = cache.get("weather", ("台北101",))
+
         # 測試AI快取
-        cache_manager.set_ai_cache("測試輸入", {"result": "測試"})
-        ai_cached = cache_manager.get_ai_cache("測試輸入")
-        
+        cache.set("ai", ("測試輸入", "general"), {"result": "測試"})
+        ai_cached = cache.get("ai", ("測試輸入", "general"))
+
         # 檢查結果
-        stats = cache_manager.get_cache_stats()
-        
+        stats = cache.get_stats()
+
         print(f"餐廳快取: {'成功' if cached else '失敗'}")
-        print(f"天氣快取: {'成功' if weather_cached else '失敗'}")  
+        print(f"天氣快取: {'成功' if weather_cached else '失敗'}")
         print(f"AI快取: {'成功' if ai_cached else '失敗'}")
-        print(f"快取命中率: {stats['hit_rate']}")
-        print(f"總快取項目: {stats['restaurant_cache_size'] + stats['weather_cache_size'] + stats['ai_cache_size']}")
-        
+        print(f"總快取項目: {stats['l1']['entries']}")
+
         return cached and weather_cached and ai_cached
         
     except Exception as e:
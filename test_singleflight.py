@@ -0,0 +1,255 @@
+# test_singleflight.py
+"""
+測試相同請求合併（modules/singleflight.py）
+
+執行方式：python test_singleflight.py
+"""
+
+import asyncio
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append('.')
+
+from modules.singleflight import (
+    AsyncSingleFlight, SingleFlight, async_singleflight, normalize_location, singleflight,
+)
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Concurrent identical calls run once and share the result."""
+
+    def _run_concurrently(self, n, fn):
+        with ThreadPoolExecutor(max_workers=n) as pool:
+            futures = [pool.submit(fn) for _ in range(n)]
+            return [f.result() for f in futures]
+
+    def test_identical_calls_coalesce(self):
+        group = SingleFlight("test")
+        executions = []
+
+        def slow_search():
+            executions.append(1)
+            time.sleep(0.2)
+            return [{"name": "一蘭拉麵"}]
+
+        results = self._run_concurrently(8, lambda: group.do(("台北101", "拉麵"), slow_search))
+
+        self.assertEqual(len(executions), 1)
+        self.assertTrue(all(r == [{"name": "一蘭拉麵"}] for r in results))
+        self.assertEqual(group.stats["calls"], 8)
+        self.assertEqual(group.stats["executions"], 1)
+        self.assertEqual(group.stats["coalesced"], 7)
+        self.assertEqual(group.in_flight(), 0)
+        print(f"PASS: test_identical_calls_coalesce ({group.stats})")
+
+    def test_followers_get_private_copies(self):
+        """Mutating one caller's result must not leak into another's."""
+        group = SingleFlight("test")
+        results = self._run_concurrently(
+            4, lambda: group.do("k", lambda: (time.sleep(0.1), [{"name": "a"}])[1]),
+        )
+        results[0][0]["name"] = "mutated"
+        self.assertTrue(all(r[0]["name"] == "a" for r in results[1:]))
+        self.assertEqual(len({id(r) for r in results}), 4)
+        print("PASS: test_followers_get_private_copies")
+
+    def test_errors_are_shared(self):
+        group = SingleFlight("test")
+        barrier = threading.Event()
+
+        def failing():
+            barrier.wait(1)
+            raise ValueError("boom")
+
+        def call():
+            try:
+                group.do("k", failing)
+            except ValueError as e:
+                return str(e)
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [pool.submit(call) for _ in range(3)]
+            time.sleep(0.1)
+            barrier.set()
+            errors = [f.result() for f in futures]
+
+        self.assertEqual(errors, ["boom"] * 3)
+        self.assertEqual(group.stats["errors"], 1)
+        print("PASS: test_errors_are_shared")
+
+    def test_different_keys_run_separately(self):
+        group = SingleFlight("test")
+        group.do("a", lambda: 1)
+        group.do("b", lambda: 2)
+        group.do("a", lambda: 3)  # not in flight any more: runs again
+        self.assertEqual(group.stats["executions"], 3)
+        self.assertEqual(group.stats["coalesced"], 0)
+        print("PASS: test_different_keys_run_separately")
+
+    def test_follower_stops_waiting_on_hung_leader(self):
+        group = SingleFlight("test")
+        release = threading.Event()
+
+        def hung():
+            release.wait(5)
+            return "leader"
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(group.do, "k", hung)
+            while group.in_flight() == 0:
+                time.sleep(0.01)
+            started = time.monotonic()
+            result = group.do("k", lambda: "direct", wait_timeout=0.2)
+            self.assertEqual(result, "direct")
+            self.assertLess(time.monotonic() - started, 1)
+            release.set()
+            self.assertEqual(leader.result(), "leader")
+        self.assertEqual(group.stats["wait_timeouts"], 1)
+        print("PASS: test_follower_stops_waiting_on_hung_leader")
+
+    def test_decorator_normalizes_location(self):
+        executions = []
+
+        @singleflight("test_decorator", key=lambda keyword, location: (normalize_location(location), keyword))
+        def search(keyword, location):
+            executions.append(location)
+            time.sleep(0.2)
+            return keyword
+
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            futures = [
+                pool.submit(search, "拉麵", loc)
+                for loc in ("台北101", "我在台北101", "臺北 101")
+            ]
+            self.assertEqual([f.result() for f in futures], ["拉麵"] * 3)
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(search.singleflight_group.stats["coalesced"], 2)
+        print("PASS: test_decorator_normalizes_location")
+
+
+class TestCancellableFlight(unittest.TestCase):
+    """A cancellable flight is shared and stops only once every caller cancels."""
+
+    def setUp(self):
+        self.executions = []
+        self.started = threading.Event()
+
+        @singleflight(f"test_cancel_{self.id()}", key=lambda keyword, cancelled=None: keyword,
+                      cancel="cancelled")
+        def scrape(keyword, cancelled=None):
+            self.executions.append(keyword)
+            self.started.set()
+            if cancelled.wait(1.0):
+                return []
+            return [keyword]
+
+        self.scrape = scrape
+
+    def _start(self, pool, cancelled):
+        group = self.scrape.singleflight_group
+        calls = group.stats["calls"]
+        future = pool.submit(self.scrape, "拉麵", cancelled=cancelled)
+        self.started.wait(1)
+        while group.stats["calls"] == calls:
+            time.sleep(0.01)
+        return future
+
+    def test_stops_after_last_caller_cancels(self):
+        first, second = threading.Event(), threading.Event()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [self._start(pool, first), self._start(pool, second)]
+            first.set()
+            time.sleep(0.3)
+            self.assertFalse(futures[0].done())
+            started = time.monotonic()
+            second.set()
+            self.assertEqual([f.result() for f in futures], [[], []])
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(self.executions, ["拉麵"])
+        print("PASS: test_stops_after_last_caller_cancels")
+
+    def test_caller_without_event_keeps_flight_running(self):
+        speculative = threading.Event()
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [self._start(pool, speculative), self._start(pool, None)]
+            speculative.set()
+            self.assertEqual([f.result() for f in futures], [["拉麵"], ["拉麵"]])
+        self.assertEqual(self.executions, ["拉麵"])
+        print("PASS: test_caller_without_event_keeps_flight_running")
+
+
+class TestAsyncSingleFlight(unittest.TestCase):
+    """Concurrent awaits of the same coroutine run once."""
+
+    def test_identical_awaits_coalesce(self):
+        executions = []
+
+        @async_singleflight("test_async", key=lambda location: normalize_location(location))
+        async def analyze(location):
+            executions.append(location)
+            await asyncio.sleep(0.1)
+            return {"location": location}
+
+        async def main():
+            return await asyncio.gather(*(analyze(loc) for loc in ("台北101", "我在台北101", "臺北101")))
+
+        results = asyncio.run(main())
+        self.assertEqual(len(executions), 1)
+        self.assertEqual([r["location"] for r in results], ["台北101"] * 3)
+        # Shared results are private copies
+        results[0]["location"] = "changed"
+        self.assertEqual(results[1]["location"], "台北101")
+        self.assertEqual(analyze.singleflight_group.stats["coalesced"], 2)
+        self.assertEqual(analyze.singleflight_group.in_flight(), 0)
+        print("PASS: test_identical_awaits_coalesce")
+
+    def test_cancelled_caller_does_not_cancel_others(self):
+        group = AsyncSingleFlight("test_async_cancel")
+        finished = []
+
+        async def slow():
+            await asyncio.sleep(0.1)
+            finished.append(1)
+            return "ok"
+
+        async def main():
+            leader = asyncio.ensure_future(group.do("k", slow))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(group.do("k", slow))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        self.assertEqual(asyncio.run(main()), "ok")
+        self.assertEqual(finished, [1])
+        print("PASS: test_cancelled_caller_does_not_cancel_others")
+
+    def test_last_waiter_cancels_call(self):
+        group = AsyncSingleFlight("test_async_abandon")
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(1)
+                raise
+
+        async def main():
+            caller = asyncio.ensure_future(group.do("k", slow))
+            await asyncio.sleep(0.01)
+            caller.cancel()
+            await asyncio.sleep(0.01)
+
+        asyncio.run(main())
+        self.assertEqual(cancelled, [1])
+        self.assertEqual(group.in_flight(), 0)
+        print("PASS: test_last_waiter_cancels_call")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
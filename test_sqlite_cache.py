@@ -0,0 +1,281 @@
+# test_sqlite_cache.py
+"""
+測試 SQLiteCacheManager 的連線重用、批次存取紀錄、背景維護與資料編碼
+
+執行方式：python test_sqlite_cache.py
+"""
+
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append('.')
+
+from modules import cache_codecs
+from modules.sqlite_cache_manager import SQLiteCacheManager
+
+
+class _CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self._tmpdir.name, "cache.db")
+        self.cache = SQLiteCacheManager(db_path=self.db_path, max_size=100)
+
+    def tearDown(self):
+        self.cache.close()
+        self._tmpdir.cleanup()
+
+    def _db_row(self, sql, *params):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql, params).fetchone()
+        finally:
+            conn.close()
+
+
+class TestConnectionReuse(_CacheTestCase):
+
+    def test_one_connection_per_thread(self):
+        conn = self.cache._get_conn()
+        self.assertIs(self.cache._get_conn(), conn)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(self.cache._get_conn()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], conn)
+        print("PASS: test_one_connection_per_thread")
+
+    def test_dead_thread_connections_are_closed(self):
+        thread = threading.Thread(target=self.cache._get_conn)
+        thread.start()
+        thread.join()
+        dead_conn = self.cache._conns[thread.ident][1]
+
+        # The next thread prunes it (or takes it over if it reuses the id)
+        release = threading.Event()
+
+        def worker():
+            self.cache._get_conn()
+            release.wait()
+
+        thread2 = threading.Thread(target=worker)
+        thread2.start()
+        try:
+            while thread2.ident not in self.cache._conns:
+                pass
+            owners = [owner for owner, _conn in self.cache._conns.values()]
+            self.assertTrue(all(owner.is_alive() for owner in owners))
+            if self.cache._conns[thread2.ident][1] is not dead_conn:
+                with self.assertRaises(sqlite3.ProgrammingError):
+                    dead_conn.execute("SELECT 1")
+        finally:
+            release.set()
+            thread2.join()
+        print("PASS: test_dead_thread_connections_are_closed")
+
+
+class TestBatchedAccess(_CacheTestCase):
+
+    def test_hit_is_a_single_read(self):
+        self.cache.set_restaurant_cache("拉麵", "台北101", 5, [{"name": "一蘭"}])
+        statements = []
+        conn = self.cache._get_conn()
+        conn.set_trace_callback(statements.append)
+        try:
+            self.assertEqual(self.cache.get_restaurant_cache("拉麵", "台北101", 5), [{"name": "一蘭"}])
+        finally:
+            conn.set_trace_callback(None)
+        self.assertEqual(len(statements), 1, statements)
+        self.assertTrue(statements[0].strip().startswith("SELECT"))
+        print("PASS: test_hit_is_a_single_read")
+
+    def test_access_metadata_is_flushed_in_batches(self):
+        self.cache.set_weather_cache("台北", {"temperature": 30})
+        for _ in range(5):
+            self.assertIsNotNone(self.cache.get_weather_cache("台北"))
+        self.cache.get_weather_cache("高雄")  # miss
+
+        key = self.cache._generate_cache_key("weather", "台北")
+        self.cache.flush()
+        self.assertEqual(
+            self._db_row("SELECT access_count FROM cache_items WHERE cache_key = ?", key)[0], 5,
+        )
+        stats = self.cache.get_cache_stats()
+        self.assertEqual(stats["hits"], 5)
+        self.assertEqual(stats["weather_hits"], 5)
+        self.assertEqual(stats["misses"], 1)
+        print("PASS: test_access_metadata_is_flushed_in_batches")
+
+    def test_close_flushes_pending(self):
+        self.cache.set_ai_cache("輸入", {"ok": True})
+        self.cache.get_ai_cache("輸入")
+        self.cache.close()
+        self.assertEqual(
+            self._db_row("SELECT stat_value FROM cache_stats WHERE stat_name = 'ai_hits'")[0], 1,
+        )
+        print("PASS: test_close_flushes_pending")
+
+
+class TestMaintenance(_CacheTestCase):
+    """Expiry and eviction run in the background, not on every write."""
+
+    def test_write_is_a_single_insert(self):
+        statements = []
+        conn = self.cache._get_conn()
+        conn.set_trace_callback(statements.append)
+        try:
+            self.cache.set_weather_cache("台北", {"temperature": 30})
+        finally:
+            conn.set_trace_callback(None)
+        # The existence check is a primary-key read; the only write is the insert
+        writes = [s for s in statements if not s.lstrip().startswith(("BEGIN", "COMMIT", "SELECT"))]
+        self.assertEqual(len(writes), 1, statements)
+        self.assertIn("INSERT OR REPLACE", writes[0])
+        self.assertEqual(self.cache._approx_count, 1)
+        print("PASS: test_write_is_a_single_insert")
+
+    def test_expired_items_are_removed_in_batches(self):
+        for i in range(7):
+            self.cache._set_cache_item(f"old{i}", "weather", {}, {}, ttl_minutes=-1)
+        self.cache._set_cache_item("fresh", "weather", {"t": 1}, {}, ttl_minutes=60)
+        # Expired rows are invisible right away, even before maintenance runs
+        self.assertIsNone(self.cache._get_cache_item("old0"))
+
+        self.assertEqual(self.cache.maintain(batch_size=5), (5, 0))
+        self.assertEqual(self.cache.maintain(batch_size=5), (2, 0))
+        self.assertEqual(self._db_row("SELECT COUNT(*) FROM cache_items")[0], 1)
+        self.assertEqual(self.cache._approx_count, 1)
+        print("PASS: test_expired_items_are_removed_in_batches")
+
+    def test_eviction_removes_least_used_first(self):
+        for i in range(105):
+            self.cache._set_cache_item(f"k{i}", "ai", {"i": i}, {}, ttl_minutes=60)
+        for i in range(5):
+            self.cache._get_cache_item(f"k{i}")  # the first five are hot
+        self.cache.flush()
+
+        self.assertEqual(self.cache.maintain(), (0, 5))
+        self.assertEqual(self._db_row("SELECT COUNT(*) FROM cache_items")[0], 100)
+        for i in range(5):
+            self.assertIsNotNone(self.cache._get_cache_item(f"k{i}"))
+        print("PASS: test_eviction_removes_least_used_first")
+
+    def test_overwrites_do_not_inflate_count(self):
+        cache = SQLiteCacheManager(db_path=os.path.join(self._tmpdir.name, "small.db"), max_size=10)
+        try:
+            for i in range(8):
+                cache._set_cache_item(f"k{i}", "ai", {"i": i}, {}, ttl_minutes=60)
+            for _ in range(6):
+                cache._set_cache_item("k0", "ai", {"i": 0}, {}, ttl_minutes=60)
+            self.assertEqual(cache._approx_count, 8)
+            self.assertEqual(cache.maintain(), (0, 0))
+            # A drifted estimate is checked against COUNT(*) before evicting
+            cache._approx_count = 12
+            self.assertEqual(cache.maintain(), (0, 0))
+            self.assertEqual(cache._approx_count, 8)
+        finally:
+            cache.close()
+        print("PASS: test_overwrites_do_not_inflate_count")
+
+    def test_eviction_uses_index(self):
+        plan = self.cache._get_conn().execute(
+            "EXPLAIN QUERY PLAN SELECT rowid FROM cache_items "
+            "ORDER BY access_count ASC, last_accessed ASC LIMIT 10"
+        ).fetchall()
+        self.assertIn("idx_eviction", " ".join(str(row) for row in plan))
+        print("PASS: test_eviction_uses_index")
+
+    def test_high_water_wakes_maintenance(self):
+        for i in range(111):
+            self.cache._set_cache_item(f"k{i}", "ai", {}, {}, ttl_minutes=60)
+        self.assertTrue(self.cache._maintain_now.is_set())
+        deadline = time.time() + 5
+        while self.cache._approx_count > 100 and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(self._db_row("SELECT COUNT(*) FROM cache_items")[0], 100)
+        print("PASS: test_high_water_wakes_maintenance")
+
+
+class TestCodecs(_CacheTestCase):
+
+    def test_rows_are_tagged_and_compressed(self):
+        restaurants = [{"name": f"一蘭{i}", "address": "信義路五段7號"} for i in range(20)]
+        self.cache.set_restaurant_cache("拉麵", "台北101", 20, restaurants)
+        data, codec = self._db_row("SELECT data, codec FROM cache_items")
+        self.assertEqual(codec, cache_codecs.DEFAULT_CODEC)
+        self.assertLess(len(data), len(json.dumps(restaurants, ensure_ascii=False).encode()))
+        self.assertEqual(self.cache.get_restaurant_cache("拉麵", "台北101", 20), restaurants)
+        print("PASS: test_rows_are_tagged_and_compressed")
+
+    def test_untagged_json_rows_stay_readable(self):
+        key = self.cache._generate_cache_key("weather", "台北101")
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute(
+                "INSERT INTO cache_items (cache_key, cache_type, data, metadata, expires_at) "
+                "VALUES (?, 'weather', ?, '{}', '9999-12-31T00:00:00')",
+                (key, json.dumps({"temperature": 30}, ensure_ascii=False)),
+            )
+        conn.close()
+        self.assertEqual(self.cache.get_weather_cache("台北101"), {"temperature": 30})
+        print("PASS: test_untagged_json_rows_stay_readable")
+
+    def test_every_codec_round_trips(self):
+        payload = {"name": "阿陳便當", "rating": 4.5, "tags": ["便當", None, True]}
+        for name, codec in cache_codecs.available_codecs().items():
+            with self.subTest(codec=name):
+                self.assertEqual(cache_codecs.decode(codec.encode(payload), name), payload)
+        print("PASS: test_every_codec_round_trips")
+
+    def test_unknown_codec_row_is_a_miss(self):
+        self.cache.set_weather_cache("台北101", {"temperature": 30})
+        conn = sqlite3.connect(self.db_path)
+        with conn:
+            conn.execute("UPDATE cache_items SET codec = 'brotli-v9'")
+        conn.close()
+        self.assertIsNone(self.cache.get_weather_cache("台北101"))
+        print("PASS: test_unknown_codec_row_is_a_miss")
+
+    def test_codec_column_is_added_to_old_databases(self):
+        old_path = os.path.join(self._tmpdir.name, "old.db")
+        conn = sqlite3.connect(old_path)
+        with conn:
+            conn.execute(
+                "CREATE TABLE cache_items (cache_key TEXT PRIMARY KEY, cache_type TEXT NOT NULL, "
+                "data TEXT NOT NULL, metadata TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, "
+                "expires_at DATETIME NOT NULL, access_count INTEGER DEFAULT 0, "
+                "last_accessed DATETIME DEFAULT CURRENT_TIMESTAMP)"
+            )
+        conn.close()
+        old = SQLiteCacheManager(db_path=old_path, codec="json-zlib")
+        try:
+            old.set_ai_cache("輸入", {"ok": True})
+            self.assertEqual(old.get_ai_cache("輸入"), {"ok": True})
+        finally:
+            old.close()
+        print("PASS: test_codec_column_is_added_to_old_databases")
+
+    def test_unavailable_codec_falls_back(self):
+        path = os.path.join(self._tmpdir.name, "fallback.db")
+        with self.assertLogs("modules.cache_codecs", level="WARNING"):
+            cache = SQLiteCacheManager(db_path=path, codec="brotli-v9")
+        try:
+            self.assertEqual(cache.codec.name, cache_codecs.FALLBACK_CODEC)
+            cache.set_ai_cache("輸入", {"ok": True})
+            self.assertEqual(cache.get_ai_cache("輸入"), {"ok": True})
+        finally:
+            cache.close()
+        print("PASS: test_unavailable_codec_falls_back")
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,98 @@
+# test_station_index.py
+"""
+測試 CWA 測站空間索引（modules/station_index.py）
+
+執行方式：python test_station_index.py
+"""
+
+import random
+import sys
+import unittest
+
+sys.path.append('.')
+
+from cwa_test_data import observation_payload, random_observation_payload, station
+from modules.geo.geomath import haversine_km
+from modules.station_index import StationIndex, parse_reading, station_index_for
+
+
+class TestParseReading(unittest.TestCase):
+
+    def test_sentinels_and_garbage(self):
+        for value in (None, "", "-99", "-99.0", "-990", "-990.0", "X", "--"):
+            self.assertIsNone(parse_reading(value), value)
+        self.assertEqual(parse_reading("28.5"), 28.5)
+        self.assertEqual(parse_reading("-5.0"), -5.0)
+        self.assertEqual(parse_reading(0), 0.0)
+
+
+class TestStationIndex(unittest.TestCase):
+
+    def test_skips_invalid_stations(self):
+        index = StationIndex.from_payload(observation_payload([
+            station("無溫度", 25.03, 121.56, temp="-99.0"),
+            station("無濕度", 25.03, 121.56, humidity="-990"),
+            station("有效", 25.10, 121.60, wind="-99.0"),
+            {"StationName": "無座標", "WeatherElement": {"AirTemperature": "30", "RelativeHumidity": "70"}},
+        ]))
+        self.assertEqual(index.station_count, 4)
+        self.assertEqual(len(index), 1)
+        nearest = index.nearest(25.03, 121.56)
+        self.assertEqual(nearest["station_name"], "有效")
+        self.assertEqual(nearest["wind_speed"], 0)
+
+    def test_prefers_wgs84_and_falls_back_to_first_pair(self):
+        index = StationIndex.from_payload(observation_payload([
+            station("A", 25.0, 121.5),
+            station("B", 24.0, 120.5, wgs84=False),
+        ]))
+        self.assertEqual((index.lats[0], index.lngs[0]), (25.0, 121.5))
+        self.assertAlmostEqual(index.lats[1], 24.002)
+
+    def test_matches_brute_force(self):
+        index = StationIndex.from_payload(random_observation_payload(600))
+        rng = random.Random(11)
+        for _ in range(300):
+            lat, lng = rng.uniform(21.0, 26.5), rng.uniform(119.0, 123.0)
+            brute = sorted(
+                (haversine_km(lat, lng, index.lats[i], index.lngs[i]), index.names[i])
+                for i in range(len(index))
+            )
+            got = index.k_nearest(lat, lng, 4)
+            self.assertEqual([s["station_name"] for s in got], [name for _d, name in brute[:4]])
+            self.assertAlmostEqual(got[0]["distance_km"], brute[0][0])
+
+    def test_far_query_and_max_km(self):
+        index = StationIndex.from_payload(observation_payload([station("台北", 25.03, 121.56)]))
+        self.assertEqual(index.nearest(22.6, 120.3)["station_name"], "台北")
+        self.assertIsNone(index.nearest(22.6, 120.3, max_km=200))
+        self.assertEqual(index.k_nearest(25.0, 121.5, 3, max_km=50)[0]["station_name"], "台北")
+
+    def test_empty(self):
+        index = StationIndex.from_payload({})
+        self.assertIsNone(index.nearest(25.0, 121.5))
+        self.assertEqual(index.k_nearest(25.0, 121.5, 3), [])
+        self.assertIsNone(index.interpolate(25.0, 121.5))
+
+    def test_interpolate(self):
+        index = StationIndex.from_payload(observation_payload([
+            station("西", 25.0, 121.4, temp="30.0", humidity="60"),
+            station("東", 25.0, 121.6, temp="34.0", humidity="80"),
+        ]))
+        mid = index.interpolate(25.0, 121.5, k=2)
+        self.assertAlmostEqual(mid["temperature"], 32.0)
+        self.assertAlmostEqual(mid["humidity"], 70.0)
+        self.assertEqual(sorted(mid["stations"]), ["東", "西"])
+        near_west = index.interpolate(25.0, 121.42, k=2)
+        self.assertLess(near_west["temperature"], 31.0)
+        on_top = index.interpolate(25.0, 121.4, k=2)
+        self.assertEqual(on_top["temperature"], 30.0)
+
+    def test_index_is_reused_for_the_same_payload(self):
+        payload = random_observation_payload(50)
+        self.assertIs(station_index_for(payload), station_index_for(payload))
+        self.assertIsNot(station_index_for(payload), station_index_for(random_observation_payload(50)))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
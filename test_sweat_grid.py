@@ -0,0 +1,87 @@
+# test_sweat_grid.py
+"""
+測試預先計算的流汗指數表（modules/sweat_grid.py）
+
+執行方式：python test_sweat_grid.py
+"""
+
+import sys
+import unittest
+
+sys.path.append('.')
+
+from cwa_test_data import observation_payload, station
+from modules.station_index import StationIndex
+from modules.sweat_grid import (
+    SweatGrid,
+    build_profile,
+    recommend_walking_radius,
+    sweat_grid_for,
+    walking_radius,
+)
+from modules.sweat_index import calculate_heat_index, estimate_sweat_index
+from modules.tiered_cache import TieredCache
+from modules.weather_snapshot import ObservationSnapshot
+
+
+def _payload():
+    return observation_payload([
+        station("測站A", 25.03, 121.56, "24.0", "60", wind="1.0", station_id="A"),
+        station("測站B", 22.63, 120.30, "33.5", "80", wind="0.5", station_id="B"),
+        station("測站C", 24.15, 120.68, "29.0", "75", wind="1.0", station_id="C"),
+    ])
+
+
+class TestWalkingRadius(unittest.TestCase):
+
+    def test_thresholds(self):
+        self.assertEqual(recommend_walking_radius(None)["max_distance_km"], 0.8)
+        self.assertEqual(recommend_walking_radius(3.0)["max_distance_km"], 0.8)
+        self.assertEqual(recommend_walking_radius(5.0)["max_distance_km"], 0.6)
+        self.assertEqual(recommend_walking_radius(7.2)["max_distance_km"], 0.4)
+        rainy = recommend_walking_radius(3.0, "60%")
+        self.assertEqual(rainy["max_distance_km"], 0.4)
+        self.assertIn("降雨機率", rainy["reason"])
+        self.assertIn("流汗指數", recommend_walking_radius(8.0, 90)["reason"])
+        self.assertEqual(recommend_walking_radius(3.0, "N/A")["max_distance_km"], 0.8)
+
+    def test_rain_adjusts_precomputed_radius(self):
+        profile = build_profile(24.0, 60)
+        self.assertIs(walking_radius(profile, "20"), profile["walking_radius"])
+        self.assertEqual(walking_radius(profile, "70")["max_distance_km"], 0.4)
+
+
+class TestSweatGrid(unittest.TestCase):
+
+    def setUp(self):
+        self.index = StationIndex.from_payload(_payload())
+        self.grid = SweatGrid.from_index(self.index)
+
+    def test_profiles_match_direct_computation(self):
+        self.assertEqual(len(self.grid), 3)
+        for reading in self.index.k_nearest(24.0, 121.0, 3):
+            profile = self.grid.lookup(reading)
+            temp, humidity, wind = reading["temperature"], reading["humidity"], reading["wind_speed"]
+            self.assertEqual(profile["sweat_index"], estimate_sweat_index(temp, humidity, wind))
+            self.assertEqual(profile["heat_index"], calculate_heat_index(temp, humidity))
+            self.assertEqual(profile, build_profile(temp, humidity, wind))
+
+    def test_changed_reading_is_not_served(self):
+        reading = dict(self.index.nearest(25.03, 121.56), temperature=31.0)
+        self.assertIsNone(self.grid.lookup(reading))
+        self.assertIsNone(self.grid.lookup({"station_id": "X", "temperature": 24.0, "humidity": 60}))
+
+    def test_grid_is_rebuilt_when_snapshot_refreshes(self):
+        snapshot = ObservationSnapshot(fetch=_payload, ttl_seconds=0, stale_seconds=0,
+                                       cache=TieredCache(l2=None, record_metrics=False), shared=False)
+        built = []
+        snapshot.add_listener(lambda index: built.append(sweat_grid_for(index)))
+        first = snapshot.get_index()
+        second = snapshot.get_index()
+        self.assertIsNot(first, second)
+        self.assertEqual([grid.index for grid in built], [first, second])
+        self.assertIs(sweat_grid_for(second), built[1])
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
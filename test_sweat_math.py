@@ -0,0 +1,83 @@
+# test_sweat_math.py
+"""
+測試向量化流汗指數 / 體感溫度（modules/sweat_math.py）與純量版本結果一致
+
+執行方式：python test_sweat_math.py
+"""
+
+import math
+import random
+import sys
+import unittest
+
+sys.path.append('.')
+
+from modules import sweat_math
+from modules.sweat_index import calculate_heat_index, estimate_sweat_index, get_comfort_level
+
+
+def _readings(n, seed=3, decimals=True):
+    """CWA-like readings: 0.1 °C temperatures, integer humidity, 0.1 m/s wind."""
+    rng = random.Random(seed)
+    temps, humidities, winds = [], [], []
+    for _ in range(n):
+        temps.append(round(rng.uniform(5, 42), 1) if decimals else rng.uniform(5, 42))
+        humidities.append(float(rng.randint(10, 100)) if decimals else rng.uniform(10, 100))
+        winds.append(round(rng.uniform(0, 10), 1) if decimals else rng.uniform(0, 10))
+    return temps, humidities, winds
+
+
+class TestEquivalence(unittest.TestCase):
+
+    def _assert_matches_scalar(self, temps, humidities, winds):
+        sweat = sweat_math.to_list(sweat_math.sweat_index_many(temps, humidities, winds))
+        heat = sweat_math.to_list(sweat_math.heat_index_many(temps, humidities))
+        buckets = sweat_math.to_list(sweat_math.comfort_buckets(sweat))
+        for i, (t, h, w) in enumerate(zip(temps, humidities, winds)):
+            self.assertEqual(sweat[i], estimate_sweat_index(t, h, w), (t, h, w))
+            self.assertEqual(heat[i], calculate_heat_index(t, h), (t, h))
+            self.assertEqual(sweat_math.COMFORT_LEVELS[buckets[i]], get_comfort_level(sweat[i])["level"])
+
+    def test_station_like_readings(self):
+        self._assert_matches_scalar(*_readings(20000))
+
+    def test_unrounded_readings(self):
+        self._assert_matches_scalar(*_readings(20000, seed=5, decimals=False))
+
+    def test_boundaries(self):
+        # Around the 27 °C heat-index switch and each sweat-index breakpoint
+        temps = [26.9, 27.0, 27.1, 20.0, 20.1, 25.0, 30.0, 35.0, 35.1, 45.0, -5.0]
+        humidities = [60.0, 60.0, 61.0, 40.0, 60.0, 100.0, 0.0, 50.0, 95.0, 100.0, 30.0]
+        winds = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 3.3, 0.0, 0.0, 0.0, 12.0]
+        self._assert_matches_scalar(temps, humidities, winds)
+
+    def test_comfort_bucket_edges(self):
+        sweat = [0.0, 2.0, 2.1, 4.0, 4.1, 6.0, 6.1, 8.0, 8.1, 10.0]
+        levels = [sweat_math.COMFORT_LEVELS[b] for b in sweat_math.comfort_buckets(sweat)]
+        self.assertEqual(levels, [get_comfort_level(s)["level"] for s in sweat])
+
+    def test_default_wind_and_broadcasting(self):
+        temps, humidities, _winds = _readings(50)
+        self.assertEqual(
+            sweat_math.to_list(sweat_math.sweat_index_many(temps, humidities)),
+            [estimate_sweat_index(t, h) for t, h in zip(temps, humidities)],
+        )
+        # One humidity for a whole forecast row
+        row = sweat_math.to_list(sweat_math.sweat_index_many(temps, 75.0, 1.0))
+        self.assertEqual(row, [estimate_sweat_index(t, 75.0, 1.0) for t in temps])
+
+    def test_missing_readings_are_nan(self):
+        sweat = sweat_math.to_list(sweat_math.sweat_index_many([30.0, float("nan")], [70.0, 70.0]))
+        self.assertEqual(sweat[0], estimate_sweat_index(30.0, 70.0))
+        self.assertTrue(math.isnan(sweat[1]))
+
+    def test_profile_many(self):
+        temps, humidities, winds = _readings(10)
+        profile = sweat_math.sweat_profile_many(temps, humidities, winds)
+        self.assertEqual(set(profile), {"sweat_index", "heat_index", "comfort_bucket"})
+        self.assertEqual(len(profile["comfort_bucket"]), 10)
+
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
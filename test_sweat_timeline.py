@@ -0,0 +1,136 @@
+# test_sweat_timeline.py
+"""
+測試流汗指數預報時間軸（modules/sweat_timeline.py）
+
+執行方式：python test_sweat_timeline.py
+"""
+
+import sys
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.append('.')
+
+from cwa_test_data import forecast_document, forecast_element, forecast_location
+from modules import sweat_timeline
+from modules.forecast_store import TAIPEI_TZ, ForecastStore, TownForecast
+from modules.sweat_index import estimate_sweat_index
+
+START = datetime(2026, 7, 1, 9, 0, tzinfo=TAIPEI_TZ)
+TEMPS = ["25", "26", "27", "28", "29", "28", "27", "-99", "24"]
+HUMIDITIES = ["70", "70", "65", "65", "60", "60", "65", "70", "75"]
+POPS = ["10", "60", "20"]  # 3-hour slots starting 09:00, 12:00, 15:00
+
+
+def _hour(i):
+    return (START + timedelta(hours=i)).isoformat()
+
+
+def _series(name, key, values, hours=1, time_key="DataTime"):
+    return forecast_element(name, key, [_hour(i * hours) for i in range(len(values))], values, time_key)
+
+
+def _location(name):
+    return forecast_location(name, [
+        _series("溫度", "Temperature", TEMPS),
+        _series("相對濕度", "RelativeHumidity", HUMIDITIES),
+        _series("風速", "WindSpeed", ["1"] * len(TEMPS)),
+        _series("3小時降雨機率", "ProbabilityOfPrecipitation", POPS, hours=3, time_key="StartTime"),
+    ])
+
+
+def _document(*towns):
+    return forecast_document(*[_location(t) for t in towns])
+
+
+class TestBuildTimeline(unittest.TestCase):
+
+    def setUp(self):
+        self.forecast = TownForecast.from_location(_location("信義區"))
+        self.now = (START + timedelta(minutes=20)).timestamp()
+
+    def test_window_starts_at_nearest_step(self):
+        slots = sweat_timeline.build_timeline(self.forecast, hours=4, now=self.now)
+        self.assertEqual([s["time"] for s in slots], [_hour(i) for i in range(5)])
+        self.assertEqual(len(sweat_timeline.build_timeline(self.forecast, hours=24, now=self.now)), 9)
+
+    def test_values_match_point_in_time_formula(self):
+        for i, slot in enumerate(sweat_timeline.build_timeline(self.forecast, hours=6, now=self.now)):
+            self.assertEqual(slot["temperature"], float(TEMPS[i]))
+            self.assertEqual(slot["sweat_index"],
+                             estimate_sweat_index(float(TEMPS[i]), float(HUMIDITIES[i]), 1.0))
+            self.assertEqual(slot["pop"], POPS[i // 3])
+
+    def test_walking_radius_follows_rain(self):
+        slots = sweat_timeline.build_timeline(self.forecast, hours=24, now=self.now)
+        self.assertEqual(slots[2]["walking_radius"]["max_distance_km"], 0.8)
+        self.assertIn("降雨機率", slots[3]["walking_radius"]["reason"])
+        self.assertEqual(slots[3]["walking_radius"]["max_distance_km"], 0.4)
+
+    def test_missing_reading_is_null(self):
+        slot = sweat_timeline.build_timeline(self.forecast, hours=24, now=self.now)[7]
+        self.assertIsNone(slot["temperature"])
+        self.assertIsNone(slot["sweat_index"])
+        self.assertIsNone(slot["comfort_level"])
+
+    def test_best_slot(self):
+        slots = sweat_timeline.build_timeline(self.forecast, hours=24, now=self.now)
+        best = sweat_timeline.best_slot(slots)
+        self.assertEqual(best["time"], _hour(8))
+        self.assertIsNone(sweat_timeline.best_slot([]))
+
+    def test_empty_forecast(self):
+        empty = TownForecast.from_location({"LocationName": "某鄉"})
+        self.assertEqual(sweat_timeline.build_timeline(empty, now=self.now), [])
+
+
+class TestQueryTimeline(unittest.TestCase):
+
+    def setUp(self):
+        self.store = ForecastStore(fetch=lambda code: _document("中正區", "信義區", "大安區"),
+                                   prefetch_spacing=0)
+        patches = [
+            mock.patch.object(sweat_timeline, "forecast_store", self.store),
+            mock.patch("modules.sweat_index.get_location_coordinates",
+                       return_value=(25.0339, 121.5645, "台北101, 信義區, 臺北市")),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_town_from_display_name(self):
+        result = sweat_timeline.query_sweat_timeline_by_location("台北101", hours=12)
+        self.assertEqual((result["city"], result["town"]), ("台北市", "信義區"))
+        self.assertEqual(result["hours"], 12)
+        self.assertIn("slots", result)
+
+    def test_falls_back_to_main_town(self):
+        with mock.patch("modules.sweat_index.get_location_coordinates",
+                        return_value=(25.0339, 121.5645, "某地標")):
+            result = sweat_timeline.query_sweat_timeline_by_location("某地標")
+        self.assertEqual(result["town"], "中正區")
+
+    def test_unknown_location(self):
+        with mock.patch("modules.sweat_index.get_location_coordinates", return_value=None):
+            self.assertIn("error", sweat_timeline.query_sweat_timeline_by_location("不存在的地方"))
+
+    def test_internal_failure_raises(self):
+        # Only "not found" outcomes are error dicts; the endpoint maps exceptions to 500
+        with mock.patch("modules.weather.get_city_from_coordinates", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                sweat_timeline.query_sweat_timeline_by_location("台北101")
+
+    def test_pipeline_stage(self):
+        import asyncio
+        from modules import pipeline
+        from modules.metrics import metrics
+
+        result = asyncio.run(pipeline.fetch_sweat_timeline("台北101", 6))
+        self.assertEqual(result["town"], "信義區")
+        self.assertIn("sweat_timeline", metrics.summary()["stages"])
+        self.assertIn("sweat_timeline", pipeline.STAGE_TIMEOUTS)
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -76,6 +76,7 @@ class TestGeminiKeyPool(unittest.TestCase):
 
     def tearDown(self):
         """Remove the temporary database."""
+        self.pool.close()
         try:
             os.unlink(self.db_path)
         except OSError:
@@ -460,6 +461,108 @@ class TestIntentFallback(unittest.TestCase):
         print(f"PASS: test_fallback_weather_hot (secondary={secondary})")
 
 
+class TestIntentCacheKey(unittest.TestCase):
+    """Near-duplicate queries share a normalized intent cache key."""
+
+    def setUp(self):
+        from modules.ai import intent_analyzer
+        intent_analyzer._similar_intents.clear()
+
+    def test_near_duplicates_share_key(self):
+        from modules.ai.intent_analyzer import _build_cache_key
+        same = [
+            "我在101想吃拉麵",
+            "101附近 拉麵",
+            "台北101大樓附近有什麼拉麵？",
+        ]
+        keys = {_build_cache_key(q, None, 12) for q in same}
+        self.assertEqual(len(keys), 1, keys)
+        self.assertEqual(
+            _build_cache_key("北車 便當，預算100", None, 12),
+            _build_cache_key("台北車站附近便當 預算100", None, 12),
+        )
+        print(f"PASS: test_near_duplicates_share_key ({keys.pop()})")
+
+    def test_different_queries_keep_distinct_keys(self):
+        from modules.ai.intent_analyzer import _build_cache_key
+        base = _build_cache_key("101附近 拉麵", None, 12)
+        self.assertNotEqual(base, _build_cache_key("101附近 牛肉麵", None, 12))
+        self.assertNotEqual(base, _build_cache_key("信義區 拉麵", None, 12))
+        self.assertNotEqual(base, _build_cache_key("101附近 拉麵", None, 19))
+        self.assertNotEqual(base, _build_cache_key("101附近 拉麵", {"temperature": 34}, 12))
+        # 單字不是贅詞：「和牛」「酒吧」保持完整
+        self.assertIn("和牛", _build_cache_key("信義區 和牛", None, 12))
+        self.assertIn("酒吧", _build_cache_key("信義區 酒吧", None, 12))
+        print("PASS: test_different_queries_keep_distinct_keys")
+
+    def test_digits_and_negations_never_match_fuzzily(self):
+        from modules.ai import intent_analyzer
+        index = intent_analyzer._similar_intents
+        index.add("信義區 拉麵 200元以內", "lunch", "k200")
+        index.add("信義區 拉麵 不要太辣的", "lunch", "k-not-spicy")
+        self.assertIsNone(index.find("信義區 拉麵 300元以內", "lunch", 0.5))
+        self.assertIsNone(index.find("信義區 拉麵 要太辣的", "lunch", 0.5))
+        self.assertEqual(index.find("信義區 拉麵 200元以內喔", "lunch", 0.5), "k200")
+        print("PASS: test_digits_and_negations_never_match_fuzzily")
+
+    @patch("modules.ai.intent_analyzer._call_gemini")
+    def test_similar_query_hits_cache(self, mock_call_gemini):
+        import json
+        from modules.ai.intent_analyzer import analyze_intent
+
+        store = {}
+        mock_call_gemini.return_value = json.dumps({
+            "location": "101", "primary_keywords": ["拉麵", "豚骨拉麵"], "intent": "search_food_type",
+        })
+        with patch("modules.ai.intent_analyzer.get_ai_cache", side_effect=lambda k, analysis_type: store.get(k)), \
+             patch("modules.ai.intent_analyzer.set_ai_cache", side_effect=lambda k, v, analysis_type: store.__setitem__(k, v)):
+            first = analyze_intent("101附近 拉麵 不要太辣", None, 12)
+            # Canonical hit: fillers and location alias differ
+            second = analyze_intent("我在台北101想吃拉麵，不要太辣", None, 12)
+            # Similar hit: residual text differs slightly
+            third = analyze_intent("101 拉麵 不要太辣口味", None, 12)
+            # Different food: miss
+            analyze_intent("101附近 牛肉麵 不要太辣", None, 12)
+
+        self.assertEqual(mock_call_gemini.call_count, 2)
+        self.assertEqual(first["primary_keywords"], second["primary_keywords"])
+        self.assertEqual(third["primary_keywords"], first["primary_keywords"])
+        self.assertEqual(second["raw_input"], "我在台北101想吃拉麵，不要太辣")
+        print("PASS: test_similar_query_hits_cache")
+
+    def test_async_cache_access_stays_off_event_loop(self):
+        import asyncio
+        import json
+        import threading
+        from modules.ai import intent_analyzer
+
+        threads = []
+
+        def get_cache(key, analysis_type):
+            threads.append(threading.current_thread())
+            return None
+
+        def set_cache(key, value, analysis_type):
+            threads.append(threading.current_thread())
+
+        async def fake_gemini(user_message):
+            return json.dumps({"location": "101", "primary_keywords": ["拉麵", "豚骨拉麵"]})
+
+        async def run():
+            result = await intent_analyzer.analyze_intent_async("101附近 拉麵 濃郁湯頭", None, 12)
+            return result, threading.current_thread()
+
+        with patch("modules.ai.intent_analyzer.get_ai_cache", side_effect=get_cache), \
+             patch("modules.ai.intent_analyzer.set_ai_cache", side_effect=set_cache), \
+             patch("modules.ai.intent_analyzer._call_gemini_async", side_effect=fake_gemini):
+            result, loop_thread = asyncio.run(run())
+
+        self.assertEqual(result["primary_keywords"], ["拉麵", "豚骨拉麵"])
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(loop_thread, threads)
+        print("PASS: test_async_cache_access_stays_off_event_loop")
+
+
 # ===========================================================================
 # 4. Multi-Scenario Integration Tests
 # ===========================================================================
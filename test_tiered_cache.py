@@ -0,0 +1,205 @@
+# test_tiered_cache.py
+"""
+測試兩層快取（modules/tiered_cache.py）
+
+執行方式：python test_tiered_cache.py
+"""
+
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.append('.')
+
+from modules.sqlite_cache_manager import SQLiteCacheManager
+from modules.tiered_cache import LRUCache, TieredCache
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_evicts_least_recently_used_by_count(self):
+        lru = LRUCache(max_entries=2, max_bytes=10 ** 6)
+        far = time.time() + 60
+        lru.put("a", "ns", '"a"', far)
+        lru.put("b", "ns", '"b"', far)
+        lru.get("a")
+        lru.put("c", "ns", '"c"', far)
+        self.assertEqual(lru.get("a"), '"a"')
+        self.assertIsNone(lru.get("b"))
+        self.assertEqual(lru.stats()["evictions"], 1)
+
+    def test_bounded_by_bytes(self):
+        payload = '"' + "x" * 1000 + '"'
+        lru = LRUCache(max_entries=100, max_bytes=sys.getsizeof(payload) * 3)
+        for i in range(10):
+            lru.put(str(i), "ns", payload, time.time() + 60)
+        self.assertEqual(len(lru), 3)
+        self.assertLessEqual(lru.stats()["bytes"], lru.max_bytes)
+
+    def test_oversized_payload_is_not_stored(self):
+        lru = LRUCache(max_entries=10, max_bytes=100)
+        self.assertFalse(lru.put("big", "ns", "y" * 1000, time.time() + 60))
+        self.assertEqual(len(lru), 0)
+
+    def test_expired_entry_is_dropped(self):
+        lru = LRUCache(max_entries=10, max_bytes=10 ** 6)
+        lru.put("old", "ns", '"v"', time.time() - 1)
+        self.assertIsNone(lru.get("old"))
+        self.assertEqual(len(lru), 0)
+
+
+class TestTieredCache(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.l2 = SQLiteCacheManager(db_path=os.path.join(self._tmpdir.name, "cache.db"))
+        self.cache = TieredCache(l2=self.l2, record_metrics=False)
+
+    def tearDown(self):
+        self.l2.close()
+        self._tmpdir.cleanup()
+
+    def test_l1_then_l2_then_miss(self):
+        key = ("拉麵", "台北101", 5, None)
+        self.assertIsNone(self.cache.get("restaurant", key))
+        self.cache.set("restaurant", key, [{"name": "一蘭"}])
+        self.assertEqual(self.cache.get("restaurant", key), [{"name": "一蘭"}])
+
+        self.cache.l1.clear()
+        self.assertEqual(self.cache.get("restaurant", key), [{"name": "一蘭"}])
+        self.assertEqual(self.cache.get("restaurant", key), [{"name": "一蘭"}])
+
+        stats = self.cache.get_stats()["namespaces"]["restaurant"]
+        self.assertEqual((stats["l1_hits"], stats["l2_hits"], stats["misses"]), (2, 1, 1))
+
+    def test_shares_entries_with_sqlite_helpers(self):
+        self.l2.set_weather_cache("台北101", {"temperature": 30})
+        self.assertEqual(self.cache.get("weather", ("台北101",)), {"temperature": 30})
+        self.cache.set("ai", ("我想吃拉麵", "intent"), {"location": "台北"})
+        self.assertEqual(self.l2.get_ai_cache("我想吃拉麵", "intent"), {"location": "台北"})
+
+    def test_returns_private_copies(self):
+        self.cache.set("weather", ("台北",), {"temperature": 30})
+        self.cache.get("weather", ("台北",))["temperature"] = 0
+        self.assertEqual(self.cache.get("weather", ("台北",)), {"temperature": 30})
+
+    def test_l1_only_namespace_is_not_persisted(self):
+        self.cache.set("search", ("拉麵_台北",), [1, 2])
+        self.cache.l1.clear()
+        self.assertIsNone(self.cache.get("search", ("拉麵_台北",)))
+
+    def test_per_namespace_ttl(self):
+        cache = TieredCache(l2=None, ttl_minutes={"weather": 0}, record_metrics=False)
+        cache.set("weather", ("台北",), {"temperature": 30})
+        cache.set("ai", ("台北",), {"ok": True})
+        self.assertIsNone(cache.get("weather", ("台北",)))
+        self.assertEqual(cache.get("ai", ("台北",)), {"ok": True})
+
+    def test_clear_namespace(self):
+        self.cache.set("weather", ("台北",), {"temperature": 30})
+        self.cache.set("ai", ("台北",), {"ok": True})
+        self.cache.clear("weather")
+        self.assertIsNone(self.cache.get("weather", ("台北",)))
+        self.assertEqual(self.cache.get("ai", ("台北",)), {"ok": True})
+
+    def test_l2_loader_is_lazy(self):
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return self.l2
+
+        cache = TieredCache(l2=loader, record_metrics=False)
+        self.assertEqual(calls, [])
+        cache.set("weather", ("台北",), {"temperature": 30})
+        cache.get("weather", ("台北",))
+        self.assertEqual(calls, [1])
+
+
+class TestStaleWhileRevalidate(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.l2 = SQLiteCacheManager(db_path=os.path.join(self._tmpdir.name, "cache.db"))
+        # Fresh for 0 minutes, servable stale for 60
+        self.cache = TieredCache(
+            l2=self.l2, ttl_minutes={"restaurant": 0}, stale_minutes={"restaurant": 60},
+            record_metrics=False,
+        )
+        self.key = ("拉麵", "台北101", 5, None)
+
+    def tearDown(self):
+        self.cache.wait_for_refreshes()
+        self.l2.close()
+        self._tmpdir.cleanup()
+
+    def test_miss_loads_inline(self):
+        value, stale = self.cache.get_or_refresh("restaurant", self.key, lambda: [{"name": "一蘭"}])
+        self.assertEqual((value, stale), ([{"name": "一蘭"}], False))
+
+    def test_stale_entry_is_served_and_refreshed(self):
+        self.cache.set("restaurant", self.key, [{"name": "舊"}])
+        self.assertIsNone(self.cache.get("restaurant", self.key))
+
+        release = threading.Event()
+
+        def loader():
+            release.wait(5)
+            return [{"name": "新"}]
+
+        value, stale = self.cache.get_or_refresh("restaurant", self.key, loader)
+        self.assertEqual((value, stale), ([{"name": "舊"}], True))
+        release.set()
+        self.assertTrue(self.cache.wait_for_refreshes(5))
+        self.assertEqual(self.cache.lookup("restaurant", self.key), ([{"name": "新"}], True))
+
+        stats = self.cache.get_stats()["namespaces"]["restaurant"]
+        self.assertEqual(stats["refreshes"], 1)
+        self.assertGreaterEqual(stats["stale_hits"], 2)
+
+    def test_stale_entry_survives_in_l2(self):
+        self.cache.set("restaurant", self.key, [{"name": "舊"}])
+        self.cache.l1.clear()
+        self.assertEqual(self.cache.lookup("restaurant", self.key), ([{"name": "舊"}], True))
+
+    def test_one_refresh_per_key(self):
+        self.cache.set("restaurant", self.key, [{"name": "舊"}])
+        calls = []
+        release = threading.Event()
+
+        def loader():
+            calls.append(1)
+            release.wait(5)
+            return [{"name": "新"}]
+
+        for _ in range(5):
+            self.cache.get_or_refresh("restaurant", self.key, loader)
+        release.set()
+        self.cache.wait_for_refreshes(5)
+        self.assertEqual(len(calls), 1)
+
+    def test_failed_refresh_keeps_stale_entry(self):
+        self.cache.set("restaurant", self.key, [{"name": "舊"}])
+
+        def loader():
+            raise RuntimeError("scrape failed")
+
+        self.cache.get_or_refresh("restaurant", self.key, loader)
+        self.cache.wait_for_refreshes(5)
+        self.assertEqual(self.cache.lookup("restaurant", self.key), ([{"name": "舊"}], True))
+        self.assertEqual(self.cache.get_stats()["namespaces"]["restaurant"]["refresh_errors"], 1)
+
+    def test_uncacheable_result_is_not_stored(self):
+        value, stale = self.cache.get_or_refresh(
+            "weather", ("observation", 25.034, 121.565), lambda: {"error": "timeout"},
+            cacheable=lambda d: "error" not in d,
+        )
+        self.assertEqual(value, {"error": "timeout"})
+        self.assertIsNone(self.cache.lookup("weather", ("observation", 25.034, 121.565)))
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)
@@ -0,0 +1,103 @@
+# test_weather_snapshot.py
+"""
+測試共用的 CWA 觀測資料快照（modules/weather_snapshot.py）
+
+執行方式：python test_weather_snapshot.py
+"""
+
+import sys
+import threading
+import time
+import unittest
+
+sys.path.append('.')
+
+from cwa_test_data import observation_payload, station
+from modules.tiered_cache import TieredCache
+from modules.weather_snapshot import ObservationSnapshot, ObservationUnavailable
+
+
+class _FakeFetch:
+
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+        self.fail = False
+        self.temp = "30.0"
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise ObservationUnavailable("API狀態: unknown")
+        return observation_payload([
+            station("信義", 25.037, 121.564, temp=self.temp, wind="1.2", station_id="C0AC70"),
+        ])
+
+
+class TestObservationSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TieredCache(l2=None, record_metrics=False)
+        self.fetch = _FakeFetch()
+
+    def _snapshot(self, **kwargs):
+        kwargs.setdefault("ttl_seconds", 60)
+        kwargs.setdefault("stale_seconds", 60)
+        return ObservationSnapshot(fetch=self.fetch, cache=self.cache, **kwargs)
+
+    def test_one_download_serves_every_location(self):
+        snapshot = self._snapshot()
+        for lat, lng in [(25.03, 121.56), (25.05, 121.52), (24.99, 121.60)]:
+            self.assertEqual(snapshot.get_index().nearest(lat, lng)["station_name"], "信義")
+        self.assertEqual(self.fetch.calls, 1)
+        stats = snapshot.get_stats()
+        self.assertEqual((stats["downloads"], stats["memory_hits"]), (1, 2))
+
+    def test_concurrent_callers_share_one_download(self):
+        self.fetch.delay = 0.2
+        snapshot = self._snapshot()
+        threads = [threading.Thread(target=snapshot.get_index) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.fetch.calls, 1)
+
+    def test_shared_cache_is_reused_by_another_instance(self):
+        self._snapshot().get_index()
+        other = self._snapshot()
+        self.assertEqual(len(other.get_index()), 1)
+        self.assertEqual(self.fetch.calls, 1)
+        self.assertEqual(other.get_stats()["shared_loads"], 1)
+
+    def test_expired_snapshot_is_served_while_refreshing(self):
+        snapshot = self._snapshot(ttl_seconds=0.05, stale_seconds=60)
+        snapshot.get_index()
+        self.fetch.temp = "33.0"
+        time.sleep(0.1)
+        self.assertEqual(snapshot.get_index().temperatures[0], 30.0)
+        deadline = time.time() + 2
+        while snapshot.get_index().temperatures[0] != 33.0 and time.time() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(snapshot.get_index().temperatures[0], 33.0)
+        self.assertGreaterEqual(snapshot.get_stats()["stale_hits"], 1)
+
+    def test_failed_download_keeps_previous_snapshot(self):
+        snapshot = self._snapshot(ttl_seconds=0.01, stale_seconds=0, shared=False)
+        snapshot.get_index()
+        self.fetch.fail = True
+        time.sleep(0.02)
+        self.assertEqual(len(snapshot.get_index()), 1)
+        self.assertEqual(snapshot.get_stats()["failures"], 1)
+
+    def test_no_snapshot_raises(self):
+        self.fetch.fail = True
+        with self.assertRaises(ObservationUnavailable):
+            self._snapshot().get_index()
+
+
+if __name__ == "__main__":
+    unittest.main(verbosity=2)